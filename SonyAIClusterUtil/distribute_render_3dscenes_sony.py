@@ -7,6 +7,10 @@ Usage:
   python SonyAIClusterUtil/distribute_render_3dscenes_sony.py \
     --num_gpus 1 --workers_per_gpu 4 \
     --group_start 0 --group_end 50
+
+On SIGTERM (sent by SLURM when a sharedp job is preempted) the dispatcher drains: no new scene is started,
+running renders stop after their current view, and whatever still runs --drain_timeout seconds later is killed.
+The requeued job resumes the incomplete scenes from their missing views.
 """
 
 import argparse
@@ -14,13 +18,21 @@ import json
 import multiprocessing
 import os
 import signal
-import subprocess
 import sys
 
+# Make bpy_helper importable when run as SonyAIClusterUtil/distribute_render_3dscenes_sony.py
+_proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _proj_root not in sys.path:
+    sys.path.insert(0, _proj_root)
+
+from bpy_helper.checkpoint import DRAIN_EXIT_CODE
+from bpy_helper.dispatch import install_dispatcher_drain_handler, run_drainable, describe_returncode
+
 
 def worker(
     queue: multiprocessing.JoinableQueue,
     count: multiprocessing.Value,
+    stop_event: multiprocessing.Event,
     gpu: int,
     args: argparse.Namespace,
 ) -> None:
@@ -38,6 +50,10 @@ def worker(
             break
 
         scene_idx = item
+        if stop_event.is_set():
+            # Draining: leave the remaining scenes to the requeued job
+            queue.task_done()
+            continue
         print(f"[GPU {gpu}] Rendering scene {scene_idx}", flush=True)
 
         # Build Blender command
@@ -65,11 +81,12 @@ def worker(
         )
 
         try:
-            subprocess.run(command, shell=True, check=True)
-            with count.get_lock():
-                count.value += 1
-        except subprocess.CalledProcessError as e:
-            print(f"[GPU {gpu}] Failed to render scene {scene_idx}: {e}", flush=True)
+            returncode = run_drainable(command, stop_event, args.drain_timeout)
+            if returncode == 0:
+                with count.get_lock():
+                    count.value += 1
+            else:
+                print(f"[GPU {gpu}] Scene {scene_idx} {describe_returncode(returncode)}", flush=True)
         except Exception as e:
             print(f"[GPU {gpu}] Unexpected error for scene {scene_idx}: {e}", flush=True)
 
@@ -99,6 +116,7 @@ def main():
     parser.add_argument("--num_combined_lights", type=int, default=0)
     parser.add_argument("--proj_root", type=str, default="/music-shared-disk/group/ct/yiwen/codes/render_objaverse")
     parser.add_argument("--blender_bin", type=str, default=None, help="Path to Blender binary")
+    parser.add_argument("--drain_timeout", type=float, default=120, help="Seconds running renders get to finish their current view after SIGTERM")
     args = parser.parse_args()
 
     scene_indices = list(range(args.group_start, args.group_end))
@@ -109,12 +127,14 @@ def main():
 
     queue = multiprocessing.JoinableQueue()
     count = multiprocessing.Value("i", 0)
+    stop_event = multiprocessing.Event()
+    install_dispatcher_drain_handler(stop_event)
     processes = []
 
     # Start workers
     for gpu_i in range(args.num_gpus):
         for worker_i in range(args.workers_per_gpu):
-            process = multiprocessing.Process(target=worker, args=(queue, count, gpu_i, args))
+            process = multiprocessing.Process(target=worker, args=(queue, count, stop_event, gpu_i, args))
             process.daemon = True
             process.start()
             processes.append(process)
@@ -132,6 +152,9 @@ def main():
             queue.put(None)
 
         print(f"All done! Rendered {count.value}/{total} scenes.")
+        if stop_event.is_set():
+            print("Drained. The requeued job resumes the remaining scenes.", flush=True)
+            sys.exit(DRAIN_EXIT_CODE)
 
     except KeyboardInterrupt:
         print("Received interrupt. Terminating workers.")
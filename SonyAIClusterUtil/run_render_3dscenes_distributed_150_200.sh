@@ -16,6 +16,10 @@
 
 set -euo pipefail
 
+# On preemption SLURM sends SIGTERM to every process of the job. Keep this shell waiting so the
+# dispatcher can drain (finish the current views) instead of the job ending right away.
+trap : TERM
+
 mkdir -p slurm_logs
 export SDL_AUDIODRIVER=dummy
 
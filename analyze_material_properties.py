@@ -5,84 +5,165 @@
 import os
 import csv
 import json
+import struct
+import multiprocessing
 import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
 from typing import List, Tuple, Optional
-import pygltflib
 
-def find_glb_file(dataset_path: str, index: str, uid: str) -> Optional[str]:
+GLB_MAGIC = b'glTF'
+GLB_JSON_CHUNK = b'JSON'
+
+# 流式直方图的分箱：一维 3000 箱（50 箱直方图与分位数由它得到），二维 600x600（30x30 热力图与散点图由它得到）
+FINE_BINS = 3000
+FINE_BINS_2D = 600
+PLOT_BINS = 50
+PLOT_BINS_2D = 30
+
+CACHE_NAME = 'material_cache.jsonl'
+
+def read_glb_json(glb_path: str) -> dict:
     """
-    根据 index 和 uid 查找 GLB 文件路径
-    参考 render_3dmodels_dense.py 中的逻辑
+    只读取 GLB 文件的 JSON chunk：跳过 12 字节的文件头，读 8 字节的 chunk 头和 JSON 内容，不读取二进制缓冲区
+    （.gltf 文件整体就是 JSON）
     """
-    model_path = os.path.join(dataset_path, index, f'{uid}.glb')
-    if os.path.exists(model_path):
-        return model_path
-    return None
+    with open(glb_path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != GLB_MAGIC:
+            if glb_path.endswith('.gltf'):
+                f.seek(0)
+                return json.load(f)
+            raise ValueError(f"不是 GLB 文件: {glb_path}")
+        magic, version, length = struct.unpack('<4sII', header)
+        if version != 2:
+            raise ValueError(f"不支持的 GLB 版本 {version}: {glb_path}")
+        chunk_length, chunk_type = struct.unpack('<I4s', f.read(8))
+        if chunk_type != GLB_JSON_CHUNK:
+            raise ValueError(f"GLB 的第一个 chunk 不是 JSON: {glb_path}")
+        data = f.read(chunk_length)
+        if len(data) != chunk_length:
+            raise ValueError(f"GLB 的 JSON chunk 不完整: {glb_path}")
+    return json.loads(data)
 
-def extract_material_properties(glb_path: str) -> List[Tuple[float, float]]:
+def _factor(pbr: dict, name: str, default: float) -> float:
+    # 字段缺省时为 glTF 的默认值 1.0（与 pygltflib 相同），为 null 或无法转换时使用 default
+    value = pbr.get(name, 1.0)
+    if value is None:
+        return default
+    try:
+        # 确保值在有效范围内 [0, 1]
+        return max(0.0, min(1.0, float(value)))
+    except (ValueError, TypeError):
+        return default
+
+def material_properties(gltf: dict) -> List[Tuple[float, float]]:
     """
-    从 GLB 文件中提取 metallic 和 roughness 属性
-    
-    返回: List of (metallic, roughness) tuples
+    glTF JSON 中所有材质的 (metallic, roughness)，没有材质时返回一个默认值 (0.0, 1.0)
     """
+    materials = gltf.get('materials') or []
+    if not materials:
+        # 如果没有材质，返回一个默认值（表示该模型没有材质信息）
+        return [(0.0, 1.0)]
     properties = []
-    
-    try:
-        gltf = pygltflib.GLTF2.load(glb_path)
-        
-        # 遍历所有材质
-        if gltf.materials and len(gltf.materials) > 0:
-            for material in gltf.materials:
-                metallic = 0.0  # 默认值
-                roughness = 1.0  # 默认值
-                
-                # 检查 PBR 材质属性
-                if hasattr(material, 'pbrMetallicRoughness') and material.pbrMetallicRoughness:
-                    pbr = material.pbrMetallicRoughness
-                    
-                    # 获取 metallic 值
-                    if hasattr(pbr, 'metallicFactor') and pbr.metallicFactor is not None:
-                        try:
-                            metallic = float(pbr.metallicFactor)
-                            # 确保值在有效范围内 [0, 1]
-                            metallic = max(0.0, min(1.0, metallic))
-                        except (ValueError, TypeError):
-                            metallic = 0.0
-                    
-                    # 获取 roughness 值
-                    if hasattr(pbr, 'roughnessFactor') and pbr.roughnessFactor is not None:
-                        try:
-                            roughness = float(pbr.roughnessFactor)
-                            # 确保值在有效范围内 [0, 1]
-                            roughness = max(0.0, min(1.0, roughness))
-                        except (ValueError, TypeError):
-                            roughness = 1.0
-                    
-                    properties.append((metallic, roughness))
-                else:
-                    # 如果没有 PBR 属性，使用默认值
-                    properties.append((metallic, roughness))
+    for material in materials:
+        pbr = (material or {}).get('pbrMetallicRoughness')
+        if pbr is not None:
+            properties.append((_factor(pbr, 'metallicFactor', 0.0), _factor(pbr, 'roughnessFactor', 1.0)))
         else:
-            # 如果没有材质，返回一个默认值（表示该模型没有材质信息）
+            # 如果没有 PBR 属性，使用默认值
             properties.append((0.0, 1.0))
-            
-    except Exception as e:
-        print(f"处理文件 {glb_path} 时出错: {e}")
-        return []
-    
     return properties
 
-def analyze_materials_from_csv(csv_path: str, dataset_path: str) -> Tuple[List[float], List[float]]:
+def scan_glb(glb_path: str):
     """
-    从 CSV 文件中读取模型列表，提取所有材质的 metallic 和 roughness 值
-    
-    返回: (metallic_values, roughness_values)
+    进程池中的任务：返回 (路径, 文件大小, mtime_ns, 材质属性或 None, 错误信息或 None)
     """
-    metallic_values = []
-    roughness_values = []
+    try:
+        st = os.stat(glb_path)
+    except OSError as e:
+        return glb_path, None, None, None, f"{type(e).__name__}: {e}"
+    try:
+        return glb_path, st.st_size, st.st_mtime_ns, material_properties(read_glb_json(glb_path)), None
+    except Exception as e:
+        return glb_path, st.st_size, st.st_mtime_ns, None, f"{type(e).__name__}: {e}"
+
+class MaterialHistogram:
+    """
+    metallic / roughness 的流式统计：固定分箱的直方图、计数、和、平方和、最小值与最大值，不保存每个材质的值
+    """
+
+    def __init__(self):
+        self.hist_metallic = np.zeros(FINE_BINS, dtype=np.int64)
+        self.hist_roughness = np.zeros(FINE_BINS, dtype=np.int64)
+        self.hist_2d = np.zeros((FINE_BINS_2D, FINE_BINS_2D), dtype=np.int64)
+        self.count = 0
+        self.sums = np.zeros(2)
+        self.sq_sums = np.zeros(2)
+        self.mins = np.full(2, np.inf)
+        self.maxs = np.full(2, -np.inf)
+
+    def add(self, properties: List[Tuple[float, float]]) -> None:
+        values = np.asarray(properties, dtype=np.float64).reshape(-1, 2)
+        if len(values) == 0:
+            return
+        fine = np.minimum((values * FINE_BINS).astype(np.int64), FINE_BINS - 1)
+        np.add.at(self.hist_metallic, fine[:, 0], 1)
+        np.add.at(self.hist_roughness, fine[:, 1], 1)
+        fine_2d = np.minimum((values * FINE_BINS_2D).astype(np.int64), FINE_BINS_2D - 1)
+        np.add.at(self.hist_2d, (fine_2d[:, 0], fine_2d[:, 1]), 1)
+        self.count += len(values)
+        self.sums += values.sum(axis=0)
+        self.sq_sums += (values ** 2).sum(axis=0)
+        self.mins = np.minimum(self.mins, values.min(axis=0))
+        self.maxs = np.maximum(self.maxs, values.max(axis=0))
+
+    def summary(self, channel: int) -> dict:
+        """
+        channel 0 为 metallic，1 为 roughness；均值、标准差和范围是精确值，中位数和分位数是由细分直方图的累积分布插值得到的近似值
+        """
+        hist = self.hist_metallic if channel == 0 else self.hist_roughness
+        mean = self.sums[channel] / self.count
+        std = np.sqrt(max(self.sq_sums[channel] / self.count - mean ** 2, 0.0))
+        cdf = np.concatenate([[0], np.cumsum(hist)]) / self.count
+        edges = np.linspace(0, 1, FINE_BINS + 1)
+
+        def percentile(q):
+            value = float(np.interp(q / 100, cdf, edges))
+            return min(max(value, float(self.mins[channel])), float(self.maxs[channel]))
+
+        return {
+            'mean': float(mean),
+            'median': percentile(50),
+            'std': float(std),
+            'min': float(self.mins[channel]),
+            'max': float(self.maxs[channel]),
+            'percentiles': {str(q): percentile(q) for q in (25, 50, 75, 90, 95)},
+        }
+
+def _load_cache(cache_path: str) -> dict:
+    """
+    每个文件的结果缓存：路径 -> (大小, mtime_ns, 材质属性)，大小和 mtime 都不变时复用
+    """
+    cache = {}
+    if not os.path.exists(cache_path):
+        return cache
+    with open(cache_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:  # 被中断时写了一半的行
+                continue
+            cache[entry['path']] = (entry['size'], entry['mtime_ns'], [tuple(p) for p in entry['properties']])
+    return cache
+
+def analyze_materials_from_csv(csv_path: str, dataset_path: str, num_workers: int = 8,
+                               cache_path: Optional[str] = None) -> MaterialHistogram:
+    """
+    从 CSV 文件中读取模型列表，在进程池中提取所有材质的 metallic 和 roughness 值，流式统计到直方图中
     
+    返回: MaterialHistogram
+    """
     index_uid_list = []
     with open(csv_path, newline='', encoding='utf-8') as csvfile:
         reader = csv.reader(csvfile)
@@ -92,73 +173,109 @@ def analyze_materials_from_csv(csv_path: str, dataset_path: str) -> Tuple[List[f
                 index_uid_list.append((index.strip(), uid.strip()))
     
     print(f"从 CSV 加载了 {len(index_uid_list)} 个模型")
-    
+
+    histogram = MaterialHistogram()
+    cache = _load_cache(cache_path) if cache_path else {}
     processed = 0
     failed = 0
-    
-    for idx, (index, uid) in enumerate(index_uid_list):
-        glb_path = find_glb_file(dataset_path, index, uid)
-        
-        if glb_path is None:
-            print(f"[{idx+1}/{len(index_uid_list)}] 未找到文件: {index}/{uid}.glb")
-            failed += 1
-            continue
-        
-        if (idx + 1) % 100 == 0:
-            print(f"处理进度: {idx+1}/{len(index_uid_list)} (成功: {processed}, 失败: {failed})")
-        
-        properties = extract_material_properties(glb_path)
-        
-        if properties:
-            for metallic, roughness in properties:
-                metallic_values.append(metallic)
-                roughness_values.append(roughness)
-            processed += 1
-        else:
-            failed += 1
+    cached = 0
+
+    # 缓存命中（大小和 mtime 不变）的文件不再读取
+    to_scan = []
+    for index, uid in index_uid_list:
+        glb_path = os.path.join(dataset_path, index, f'{uid}.glb')
+        entry = cache.get(glb_path)
+        if entry is not None:
+            try:
+                st = os.stat(glb_path)
+            except OSError:
+                st = None
+            if st is not None and (st.st_size, st.st_mtime_ns) == entry[:2]:
+                histogram.add(entry[2])
+                processed += 1
+                cached += 1
+                continue
+        to_scan.append(glb_path)
+    print(f"缓存命中 {cached} 个模型，需要读取 {len(to_scan)} 个")
+
+    cache_file = open(cache_path, 'a', encoding='utf-8') if cache_path else None
+    pool = multiprocessing.Pool(num_workers) if num_workers > 0 else None
+    try:
+        results = pool.imap_unordered(scan_glb, to_scan, chunksize=16) if pool else map(scan_glb, to_scan)
+        for idx, (glb_path, size, mtime_ns, properties, error) in enumerate(results):
+            if properties is None:
+                if size is None:
+                    print(f"[{idx+1}/{len(to_scan)}] 未找到文件: {glb_path}")
+                else:
+                    print(f"处理文件 {glb_path} 时出错: {error}")
+                failed += 1
+            else:
+                histogram.add(properties)
+                processed += 1
+                if cache_file is not None:
+                    cache_file.write(json.dumps({'path': glb_path, 'size': size, 'mtime_ns': mtime_ns,
+                                                 'properties': properties}) + '\n')
+            if (idx + 1) % 1000 == 0:
+                print(f"处理进度: {idx+1}/{len(to_scan)} (成功: {processed}, 失败: {failed})")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if cache_file is not None:
+            cache_file.close()
     
     print(f"\n处理完成: 成功 {processed} 个模型, 失败 {failed} 个模型")
-    print(f"总共提取了 {len(metallic_values)} 个材质属性")
+    print(f"总共提取了 {histogram.count} 个材质属性")
     
-    return metallic_values, roughness_values
+    return histogram
 
-def plot_distributions(metallic_values: List[float], roughness_values: List[float], output_dir: str = "./output"):
+def plot_distributions(histogram: MaterialHistogram, output_dir: str = "./output"):
     """
-    绘制 metallic 和 roughness 的分布图
+    绘制 metallic 和 roughness 的分布图（由流式直方图得到，不需要每个材质的值）
     """
     os.makedirs(output_dir, exist_ok=True)
     
-    metallic_values = np.array(metallic_values)
-    roughness_values = np.array(roughness_values)
+    stats = {
+        'total_materials': histogram.count,
+        'metallic': histogram.summary(0),
+        'roughness': histogram.summary(1),
+    }
+    edges = np.linspace(0, 1, PLOT_BINS + 1)
+    hist_metallic = histogram.hist_metallic.reshape(PLOT_BINS, -1).sum(axis=1)
+    hist_roughness = histogram.hist_roughness.reshape(PLOT_BINS, -1).sum(axis=1)
     
     # 创建图表
     fig, axes = plt.subplots(2, 2, figsize=(15, 12))
     fig.suptitle('材质属性分布分析', fontsize=16, fontweight='bold')
     
     # 1. Metallic 直方图
-    axes[0, 0].hist(metallic_values, bins=50, edgecolor='black', alpha=0.7, color='skyblue')
+    axes[0, 0].stairs(hist_metallic, edges, fill=True, edgecolor='black', alpha=0.7, color='skyblue')
     axes[0, 0].set_xlabel('Metallic 值', fontsize=12)
     axes[0, 0].set_ylabel('频数', fontsize=12)
-    axes[0, 0].set_title(f'Metallic 分布 (均值: {metallic_values.mean():.3f}, 中位数: {np.median(metallic_values):.3f})', fontsize=12)
+    axes[0, 0].set_title(f"Metallic 分布 (均值: {stats['metallic']['mean']:.3f}, 中位数: {stats['metallic']['median']:.3f})", fontsize=12)
     axes[0, 0].grid(True, alpha=0.3)
     
     # 2. Roughness 直方图
-    axes[0, 1].hist(roughness_values, bins=50, edgecolor='black', alpha=0.7, color='lightcoral')
+    axes[0, 1].stairs(hist_roughness, edges, fill=True, edgecolor='black', alpha=0.7, color='lightcoral')
     axes[0, 1].set_xlabel('Roughness 值', fontsize=12)
     axes[0, 1].set_ylabel('频数', fontsize=12)
-    axes[0, 1].set_title(f'Roughness 分布 (均值: {roughness_values.mean():.3f}, 中位数: {np.median(roughness_values):.3f})', fontsize=12)
+    axes[0, 1].set_title(f"Roughness 分布 (均值: {stats['roughness']['mean']:.3f}, 中位数: {stats['roughness']['median']:.3f})", fontsize=12)
     axes[0, 1].grid(True, alpha=0.3)
     
-    # 3. Metallic vs Roughness 散点图
-    axes[1, 0].scatter(metallic_values, roughness_values, alpha=0.3, s=10, color='purple')
+    # 3. Metallic vs Roughness 散点图：二维细分直方图中非空的格子，点的大小随数量增长
+    cells_m, cells_r = np.nonzero(histogram.hist_2d)
+    counts = histogram.hist_2d[cells_m, cells_r]
+    axes[1, 0].scatter((cells_m + 0.5) / FINE_BINS_2D, (cells_r + 0.5) / FINE_BINS_2D, alpha=0.3,
+                       s=10 * np.sqrt(counts), color='purple')
     axes[1, 0].set_xlabel('Metallic 值', fontsize=12)
     axes[1, 0].set_ylabel('Roughness 值', fontsize=12)
     axes[1, 0].set_title('Metallic vs Roughness 散点图', fontsize=12)
     axes[1, 0].grid(True, alpha=0.3)
     
     # 4. 2D 直方图（热力图）
-    hist, xedges, yedges = np.histogram2d(metallic_values, roughness_values, bins=30)
-    extent = [xedges[0], xedges[-1], yedges[0], yedges[-1]]
+    block = FINE_BINS_2D // PLOT_BINS_2D
+    hist = histogram.hist_2d.reshape(PLOT_BINS_2D, block, PLOT_BINS_2D, block).sum(axis=(1, 3))
+    extent = [0, 1, 0, 1]
     im = axes[1, 1].imshow(hist.T, origin='lower', extent=extent, aspect='auto', cmap='hot', interpolation='nearest')
     axes[1, 1].set_xlabel('Metallic 值', fontsize=12)
     axes[1, 1].set_ylabel('Roughness 值', fontsize=12)
@@ -173,38 +290,6 @@ def plot_distributions(metallic_values: List[float], roughness_values: List[floa
     print(f"\n图表已保存到: {output_path}")
     
     # 保存统计信息
-    stats = {
-        'total_materials': len(metallic_values),
-        'metallic': {
-            'mean': float(metallic_values.mean()),
-            'median': float(np.median(metallic_values)),
-            'std': float(metallic_values.std()),
-            'min': float(metallic_values.min()),
-            'max': float(metallic_values.max()),
-            'percentiles': {
-                '25': float(np.percentile(metallic_values, 25)),
-                '50': float(np.percentile(metallic_values, 50)),
-                '75': float(np.percentile(metallic_values, 75)),
-                '90': float(np.percentile(metallic_values, 90)),
-                '95': float(np.percentile(metallic_values, 95)),
-            }
-        },
-        'roughness': {
-            'mean': float(roughness_values.mean()),
-            'median': float(np.median(roughness_values)),
-            'std': float(roughness_values.std()),
-            'min': float(roughness_values.min()),
-            'max': float(roughness_values.max()),
-            'percentiles': {
-                '25': float(np.percentile(roughness_values, 25)),
-                '50': float(np.percentile(roughness_values, 50)),
-                '75': float(np.percentile(roughness_values, 75)),
-                '90': float(np.percentile(roughness_values, 90)),
-                '95': float(np.percentile(roughness_values, 95)),
-            }
-        }
-    }
-    
     stats_path = os.path.join(output_dir, 'material_properties_stats.json')
     with open(stats_path, 'w', encoding='utf-8') as f:
         json.dump(stats, f, indent=2, ensure_ascii=False)
@@ -214,7 +299,7 @@ def plot_distributions(metallic_values: List[float], roughness_values: List[floa
     print("\n" + "="*60)
     print("统计摘要")
     print("="*60)
-    print(f"总材质数量: {len(metallic_values)}")
+    print(f"总材质数量: {histogram.count}")
     print(f"\nMetallic:")
     print(f"  均值: {stats['metallic']['mean']:.4f}")
     print(f"  中位数: {stats['metallic']['median']:.4f}")
@@ -238,6 +323,11 @@ def main():
                         help='数据集根目录路径 (默认: /projects/vig/Datasets/objaverse/hf-objaverse-v1/glbs/)')
     parser.add_argument('--output_dir', type=str, default='./output',
                         help='输出目录 (默认: ./output)')
+    parser.add_argument('--num_workers', type=int, default=8,
+                        help='读取 GLB 的进程数，0 表示在当前进程中读取 (默认: 8)')
+    parser.add_argument('--cache_path', type=str, default=None,
+                        help='每个文件结果的缓存，按文件大小和 mtime 复用 (默认: <output_dir>/material_cache.jsonl)')
+    parser.add_argument('--no_cache', action='store_true', help='不读取也不写入缓存')
     
     args = parser.parse_args()
     
@@ -247,18 +337,23 @@ def main():
     print(f"输出目录: {args.output_dir}")
     print("-" * 60)
     
+    os.makedirs(args.output_dir, exist_ok=True)
+    cache_path = None if args.no_cache else (args.cache_path or os.path.join(args.output_dir, CACHE_NAME))
+
     # 提取材质属性
-    metallic_values, roughness_values = analyze_materials_from_csv(
+    histogram = analyze_materials_from_csv(
         args.csv_path, 
-        args.dataset_path
+        args.dataset_path,
+        num_workers=args.num_workers,
+        cache_path=cache_path,
     )
     
-    if len(metallic_values) == 0:
+    if histogram.count == 0:
         print("错误: 未能提取到任何材质属性，请检查文件路径和格式")
         return
     
     # 绘制分布图
-    plot_distributions(metallic_values, roughness_values, args.output_dir)
+    plot_distributions(histogram, args.output_dir)
     
     print("\n分析完成！")
 
@@ -0,0 +1,396 @@
+"""Resumable concurrent downloader of Objaverse assets.
+
+Replaces ``objaverse.load_objects`` in download.py, download_lvis.py and sample_objects.py:
+
+    - at most ``num_workers`` downloads at a time (threads, the work is network bound)
+    - a download goes to ``<path>.part`` and resumes with an HTTP Range request after an interruption or a retry
+    - the size is checked against the server's, and the sha256 against the given hashes, or the server's ETag when it
+      is a sha256; a file is only renamed to its final path once verified
+    - files recorded in the asset index ``<download_dir>/downloaded.jsonl`` (path, size, sha256) are skipped while
+      they are still present with the same size; files without a record are kept as they are
+    - the bandwidth is reported while downloading
+
+The base URL is pluggable, e.g. to download from a local stand-in mirror of the dataset layout:
+
+    python asset_download.py serve --root /path/to/mirror --port 8000     # HTTP server with Range support
+
+    downloader = AssetDownloader(download_dir, base_url='http://localhost:8000/')
+    paths = downloader.download({uid: 'glbs/000-001/<uid>.glb'})          # uid -> local path
+"""
+
+import argparse
+import gzip
+import hashlib
+import http.client
+import http.server
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+HF_BASE_URL = 'https://huggingface.co/datasets/allenai/objaverse/resolve/main/'
+OBJECT_PATHS_NAME = 'object-paths.json.gz'
+INDEX_NAME = 'downloaded.jsonl'
+PART_SUFFIX = '.part'
+CHUNK_SIZE = 1 << 20
+
+_SHA256_RE = re.compile(r'^(?:W/)?"?([0-9a-f]{64})"?$')
+
+
+class VerificationError(IOError):
+    """A downloaded file does not have the expected size or sha256; its partial download is removed."""
+
+
+def object_path(folder: str, uid: str) -> str:
+    """
+    Relative path of an object in the hf-objaverse-v1 layout.
+
+    :param folder: folder of the object, e.g. '000-001'
+    :param uid: object uid
+    :return: e.g. 'glbs/000-001/<uid>.glb'
+    """
+
+    return f'glbs/{folder}/{uid}.glb'
+
+
+def _sha256_of(path: str, hasher=None):
+    hasher = hasher or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+class AssetDownloader:
+    """Downloads relative paths under a base URL into download_dir, keeping the same layout."""
+
+    def __init__(self, download_dir: str, base_url: str = HF_BASE_URL, num_workers: int = 8, retries: int = 3,
+                 timeout: float = 60, verify_hash: bool = True, report_interval: float = 10, backoff: float = 1):
+        """
+        :param download_dir: local root of the dataset layout, e.g. <base_path>/objaverse/hf-objaverse-v1
+        :param base_url: URL of the same layout, e.g. a local mirror 'http://localhost:8000/'
+        :param num_workers: concurrent downloads
+        :param retries: retries of a failed download, each resuming from the partial file
+        :param timeout: socket timeout in seconds
+        :param verify_hash: compute the sha256 of the downloads, checked when a hash is known
+        :param report_interval: seconds between bandwidth reports, 0 to disable
+        :param backoff: seconds before the first retry, doubled at every retry (at most 30)
+        """
+
+        self.download_dir = download_dir
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.num_workers = num_workers
+        self.retries = retries
+        self.timeout = timeout
+        self.verify_hash = verify_hash
+        self.report_interval = report_interval
+        self.backoff = backoff
+        self.index_path = os.path.join(download_dir, INDEX_NAME)
+        self.index = self._load_index()
+        self._lock = threading.Lock()
+        self.bytes_downloaded = 0
+
+    def _load_index(self) -> dict:
+        index = {}
+        if not os.path.exists(self.index_path):
+            return index
+        with open(self.index_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:  # a line cut short by a kill
+                    continue
+                index[entry['path']] = entry
+        return index
+
+    def _record(self, rel_path: str, size: int, sha256: Optional[str]) -> None:
+        entry = {'path': rel_path, 'size': size, 'sha256': sha256, 'time': time.time()}
+        with self._lock:
+            self.index[rel_path] = entry
+            with open(self.index_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def local_path(self, rel_path: str) -> str:
+        return os.path.join(self.download_dir, rel_path)
+
+    def is_present(self, rel_path: str, sha256: Optional[str] = None) -> bool:
+        """
+        Whether a file is already downloaded: it exists, and matches its index record (and the given hash).
+
+        :param rel_path: relative path
+        :param sha256: expected hash, if known
+        :return: whether it can be skipped
+        """
+
+        try:
+            size = os.path.getsize(self.local_path(rel_path))
+        except OSError:
+            return False
+        entry = self.index.get(rel_path)
+        if entry is None:
+            # downloaded before the index existed (e.g. by objaverse.load_objects), written atomically as well
+            if sha256 is None:
+                return size > 0
+            digest = _sha256_of(self.local_path(rel_path)).hexdigest()
+            if digest != sha256:
+                return False
+            self._record(rel_path, size, digest)
+            return True
+        return entry['size'] == size and (sha256 is None or entry.get('sha256') in (None, sha256))
+
+    def fetch(self, rel_path: str, sha256: Optional[str] = None, size: Optional[int] = None) -> str:
+        """
+        Download one file, resuming its partial download, with retries.
+
+        :param rel_path: relative path under base_url and download_dir
+        :param sha256: expected hash, default is the server's ETag when it is a sha256
+        :param size: expected size, default is the server's
+        :return: local path
+        """
+
+        for attempt in range(self.retries + 1):
+            try:
+                return self._fetch_once(rel_path, sha256, size)
+            except (OSError, http.client.HTTPException) as e:
+                # a VerificationError removed the partial file and the next attempt starts over, other errors resume
+                if attempt == self.retries or (isinstance(e, urllib.error.HTTPError) and e.code == 404):
+                    raise
+            time.sleep(min(self.backoff * 2 ** attempt, 30))
+
+    def _fetch_once(self, rel_path: str, sha256: Optional[str], size: Optional[int]) -> str:
+        path = self.local_path(rel_path)
+        part_path = path + PART_SUFFIX
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        request = urllib.request.Request(self.base_url + rel_path)
+        if offset:
+            request.add_header('Range', f'bytes={offset}-')
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code != 416 or not offset:
+                raise
+            # nothing past the partial file: it is complete unless it is larger than the file
+            total = _content_range_total(e.headers.get('Content-Range'))
+            if total is not None and total != offset:
+                os.remove(part_path)
+                raise VerificationError(f"{rel_path}: partial download of {offset} bytes, the file has {total}")
+            return self._finalize(rel_path, part_path, path, offset, sha256 or _etag_sha256(e.headers), size, None)
+
+        with response:
+            if response.status == 206:
+                total = _content_range_total(response.headers.get('Content-Range'))
+            else:
+                # the server ignored the range: start over
+                offset = 0
+                length = response.headers.get('Content-Length')
+                total = int(length) if length is not None else None
+            sha256 = sha256 or _etag_sha256(response.headers)
+            if size is not None and total is not None and size != total:
+                raise VerificationError(f"{rel_path}: the server has {total} bytes, expected {size}")
+            hasher = _sha256_of(part_path) if self.verify_hash and offset else (hashlib.sha256() if self.verify_hash else None)
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    f.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    with self._lock:
+                        self.bytes_downloaded += len(chunk)
+        return self._finalize(rel_path, part_path, path, total, sha256, size, hasher)
+
+    def _finalize(self, rel_path, part_path, path, total, sha256, size, hasher) -> str:
+        actual_size = os.path.getsize(part_path)
+        expected_size = size if size is not None else total
+        if expected_size is not None and actual_size != expected_size:
+            if actual_size > expected_size:
+                os.remove(part_path)
+                raise VerificationError(f"{rel_path}: {actual_size} bytes downloaded, expected {expected_size}")
+            # cut short: kept to be resumed by the next attempt
+            raise IOError(f"{rel_path}: {actual_size} of {expected_size} bytes downloaded")
+        digest = None
+        if self.verify_hash:
+            digest = (hasher or _sha256_of(part_path)).hexdigest()
+            if sha256 is not None and digest != sha256:
+                os.remove(part_path)
+                raise VerificationError(f"{rel_path}: sha256 {digest}, expected {sha256}")
+        os.replace(part_path, path)
+        self._record(rel_path, actual_size, digest)
+        return path
+
+    def download(self, rel_paths: Dict[str, str], hashes: Optional[Dict[str, str]] = None,
+                 sizes: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+        """
+        Download the missing files concurrently. A failed file is reported and left out of the result.
+
+        :param rel_paths: key (e.g. uid) -> relative path
+        :param hashes: optional key -> sha256
+        :param sizes: optional key -> size in bytes
+        :return: key -> local path of the files present after the download
+        """
+
+        hashes = hashes or {}
+        sizes = sizes or {}
+        paths = {}
+        todo = {}
+        for key, rel_path in rel_paths.items():
+            if self.is_present(rel_path, hashes.get(key)):
+                paths[key] = self.local_path(rel_path)
+            else:
+                todo[key] = rel_path
+        print(f"{len(paths)} of {len(rel_paths)} files already present, {len(todo)} to download from {self.base_url}")
+        if not todo:
+            return paths
+
+        failed = {}
+        start_time = last_report = time.time()
+        start_bytes = self.bytes_downloaded
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            futures = {pool.submit(self.fetch, rel_path, hashes.get(key), sizes.get(key)): key
+                       for key, rel_path in todo.items()}
+            remaining = set(futures)
+            while remaining:
+                done, remaining = wait(remaining, timeout=self.report_interval or None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = futures[future]
+                    try:
+                        paths[key] = future.result()
+                    except Exception as e:
+                        failed[key] = f"{type(e).__name__}: {e}"
+                        print(f"Failed {todo[key]}: {failed[key]}")
+                if self.report_interval and time.time() - last_report >= self.report_interval:
+                    last_report = time.time()
+                    self._report(len(todo) - len(remaining), len(todo), start_time, start_bytes)
+        self._report(len(todo) - len(failed), len(todo), start_time, start_bytes, done=True)
+        return paths
+
+    def _report(self, num_done, total, start_time, start_bytes, done=False):
+        elapsed = max(time.time() - start_time, 1e-6)
+        downloaded = self.bytes_downloaded - start_bytes
+        print(f"{'Downloaded' if done else 'Downloading'} {num_done}/{total} files, {downloaded / 2 ** 20:.1f} MiB "
+              f"in {elapsed:.1f} s ({downloaded / 2 ** 20 / elapsed:.2f} MiB/s)")
+
+    def object_paths(self) -> Dict[str, str]:
+        """
+        uid -> relative path of every object, from the object-paths.json.gz of the dataset (downloaded once).
+
+        :return: dict
+        """
+
+        path = self.local_path(OBJECT_PATHS_NAME)
+        if not os.path.exists(path):
+            self.fetch(OBJECT_PATHS_NAME)
+        with gzip.open(path, 'rt') as f:
+            return json.load(f)
+
+
+def _content_range_total(value: Optional[str]) -> Optional[int]:
+    # 'bytes 100-199/200' or 'bytes */200'
+    if not value or '/' not in value:
+        return None
+    total = value.rsplit('/', 1)[1]
+    return int(total) if total.isdigit() else None
+
+
+def _etag_sha256(headers) -> Optional[str]:
+    for name in ('X-Linked-ETag', 'ETag'):
+        match = _SHA256_RE.match(headers.get(name, '') or '')
+        if match:
+            return match.group(1)
+    return None
+
+
+# --------------------------------------------------------------------------- #
+# Local stand-in mirror                                                       #
+# --------------------------------------------------------------------------- #
+
+
+class MirrorRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Static files with single-range requests and a sha256 ETag, the parts of the dataset server the downloader
+    relies on. ``max_bytes`` cuts every response short, to simulate interrupted downloads."""
+
+    max_bytes = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{_sha256_of(path).hexdigest()}"')
+        self.end_headers()
+        f = open(path, 'rb')
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        limit = self._remaining if self.max_bytes is None else min(self._remaining, self.max_bytes)
+        try:
+            outputfile.write(source.read(limit))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        if limit < self._remaining:
+            # drop the connection mid-file
+            self.close_connection = True
+
+
+def serve_mirror(root: str, port: int = 0, max_bytes: Optional[int] = None):
+    """
+    Serve a directory as a stand-in mirror on a background thread.
+
+    :param root: directory with the dataset layout
+    :param port: port, 0 picks a free one
+    :param max_bytes: cut every response after this many bytes
+    :return: (server, base URL); call server.shutdown() to stop it
+    """
+
+    handler = type('Handler', (MirrorRequestHandler,), {'max_bytes': max_bytes})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), lambda *a: handler(*a, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Objaverse asset downloader / local mirror")
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help="serve a directory as a stand-in mirror (Range requests, sha256 ETags)")
+    serve.add_argument('--root', type=str, required=True)
+    serve.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    server, base_url = serve_mirror(args.root, args.port)
+    print(f"Serving {args.root} at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+import signal
+
+# Exit code of a render process that stopped early because of a drain request (EX_TEMPFAIL: rerun to resume)
+DRAIN_EXIT_CODE = 75
+
+_drain_signal = None
+
+
+def tmp_path_for(path: str) -> str:
+    """
+    Get the temporary path used while an output file is being written. The temporary file lives next to the final
+    file (so the final rename stays on the same filesystem), is hidden, and keeps the original extension so Blender and
+    imageio pick the right format. Hidden files are not matched by ``glob('*.png')``, so partial outputs are never
+    counted as finished views.
+
+    :param path: final output path
+    :return: temporary output path
+    """
+
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, f'.tmp_{basename}')
+
+
+def atomic_replace(tmp_path: str, path: str) -> None:
+    """
+    Atomically move a fully written temporary file to its final path.
+
+    :param tmp_path: temporary file path
+    :param path: final file path
+    """
+
+    os.replace(tmp_path, path)
+
+
+def atomic_json_dump(obj, path: str, indent: int = 4) -> None:
+    """
+    Dump an object as json, making sure readers never see a partially written file.
+
+    :param obj: json serializable object
+    :param path: output path
+    :param indent: json indent, default is 4
+    """
+
+    tmp_path = tmp_path_for(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    atomic_replace(tmp_path, path)
+
+
+def atomic_write_text(text: str, path: str) -> None:
+    """
+    Write a small text file (e.g. a completion marker) atomically.
+
+    :param text: file content
+    :param path: output path
+    """
+
+    tmp_path = tmp_path_for(path)
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    atomic_replace(tmp_path, path)
+
+
+def atomic_copy(src: str, dst: str) -> None:
+    """
+    Copy a file so that ``dst`` only appears once its content is complete.
+
+    :param src: source path
+    :param dst: destination path
+    """
+
+    tmp_path = tmp_path_for(dst)
+    shutil.copy(src, tmp_path)
+    atomic_replace(tmp_path, dst)
+
+
+def load_json_or_none(path: str):
+    """
+    Load a json file written by :func:`atomic_json_dump`, returning None if it does not exist or cannot be parsed.
+
+    :param path: json path
+    :return: the loaded object or None
+    """
+
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Failed to load {path}: {e}")
+        return None
+
+
+def exclusive_json_dump(obj, path: str, indent: int = 4) -> bool:
+    """
+    Dump an object as json only if ``path`` does not exist yet. When several processes race to create the same file
+    (e.g. shards of one scene preparing its description), exactly one of them wins and all readers see the winner's
+    complete content.
+
+    :param obj: json serializable object
+    :param path: output path
+    :param indent: json indent, default is 4
+    :return: True if this call created the file, False if it already existed
+    """
+
+    tmp_path = tmp_path_for(f'{path}.{os.getpid()}')
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp_path)
+
+
+def _handle_drain_signal(signum, frame) -> None:
+    global _drain_signal
+    if _drain_signal is None:
+        print(f"Received {signal.Signals(signum).name}, stopping after the current view", flush=True)
+    _drain_signal = signum
+
+
+def install_drain_handler(signums=(signal.SIGTERM,)) -> None:
+    """
+    Turn the given signals into a drain request instead of killing the process. The handler only records the request,
+    so a render in progress finishes its view, and the render loop polls :func:`drain_requested` between views.
+    Since every view is written atomically, the stopped scene resumes from the missing views on the next run.
+
+    :param signums: signals to handle, default is SIGTERM (sent by SLURM on preemption)
+    """
+
+    for signum in signums:
+        signal.signal(signum, _handle_drain_signal)
+
+
+def drain_requested() -> bool:
+    """
+    Check whether a signal installed by :func:`install_drain_handler` has been received.
+
+    :return: True if the process should stop before starting new work
+    """
+
+    return _drain_signal is not None
+
+
+def exit_if_drain_requested(message: str = '') -> None:
+    """
+    Exit with :data:`DRAIN_EXIT_CODE` if a drain was requested. Call it between views, after the outputs of the last
+    view were written.
+
+    :param message: what was left unfinished, printed before exiting
+    """
+
+    if drain_requested():
+        print(f"Drained{': ' + message if message else ''}", flush=True)
+        raise SystemExit(DRAIN_EXIT_CODE)
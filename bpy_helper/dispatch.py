@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import signal
+import subprocess
+import time
+
+from bpy_helper.checkpoint import DRAIN_EXIT_CODE
+
+
+def install_dispatcher_drain_handler(stop_event: multiprocessing.Event, signums=(signal.SIGTERM,)) -> None:
+    """
+    Make a dispatcher drain instead of dying on the given signals: the handler sets ``stop_event``, so workers stop
+    claiming new work and ask their running render processes to stop after the current view. Install it before
+    starting the worker processes, they inherit the handler and also drain when signalled directly (SLURM signals
+    every process of the job on preemption).
+
+    :param stop_event: event shared with the worker processes
+    :param signums: signals to handle, default is SIGTERM
+    """
+
+    def handler(signum, frame):
+        if not stop_event.is_set() and multiprocessing.parent_process() is None:
+            print(f"Received {signal.Signals(signum).name}, draining: no new work is started", flush=True)
+        stop_event.set()
+
+    for signum in signums:
+        signal.signal(signum, handler)
+
+
+def run_drainable(command: str, stop_event: multiprocessing.Event, drain_timeout: float, poll_interval: float = 1.0) -> int:
+    """
+    Run a shell command in its own process group. Once ``stop_event`` is set, the group gets SIGTERM (the render
+    scripts then stop after the current view and exit with :data:`DRAIN_EXIT_CODE`), and SIGKILL if it is still
+    running ``drain_timeout`` seconds later.
+
+    :param command: shell command
+    :param stop_event: drain event set by :func:`install_dispatcher_drain_handler`
+    :param drain_timeout: seconds granted to the command between SIGTERM and SIGKILL
+    :param poll_interval: seconds between checks of ``stop_event``
+    :return: the return code of the command
+    """
+
+    # The shell traps SIGTERM so that it keeps waiting for the render process and returns its exit code
+    proc = subprocess.Popen(f'trap : TERM; {command}', shell=True, start_new_session=True)
+    deadline = None
+    try:
+        while True:
+            try:
+                return proc.wait(timeout=poll_interval)
+            except subprocess.TimeoutExpired:
+                pass
+            if deadline is None and stop_event.is_set():
+                deadline = time.monotonic() + drain_timeout
+                os.killpg(proc.pid, signal.SIGTERM)
+            if deadline is not None and time.monotonic() > deadline:
+                print(f"Drain timeout of {drain_timeout}s exceeded, killing: {command}", flush=True)
+                os.killpg(proc.pid, signal.SIGKILL)
+                return proc.wait()
+    except BaseException:
+        # e.g. KeyboardInterrupt: the command is not in our process group, so it has to be killed explicitly
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        raise
+
+
+def describe_returncode(returncode: int) -> str:
+    """
+    Describe how a render command ended.
+
+    :param returncode: return code from :func:`run_drainable`
+    :return: 'done', 'drained' or 'failed (exit code N)'
+    """
+
+    if returncode == 0:
+        return 'done'
+    if returncode == DRAIN_EXIT_CODE:
+        return 'drained'
+    return f'failed (exit code {returncode})'
@@ -107,12 +107,18 @@ def render_depth_map(output_dir, file_prefix='depth') -> None:
     bpy.context.view_layer.use_pass_z = False
 
 
-def render_normal_map(output_dir, file_prefix="normal") -> None:
+def render_normal_map(output_dir, file_prefix="normal", c2w: Optional[np.ndarray] = None) -> None:
     """
     Render normal map
 
+    Without ``c2w``, world-space normals are written mapped from [-1, 1] to [0, 1]. With ``c2w``, the compositor
+    rotates the normal pass into camera space (by the inverse of the c2w rotation, one dot product per output
+    channel) and the normals are written as is, in [-1, 1], the format of
+    :func:`transform_normals_to_camera_space`, without the EXR round trip.
+
     :param output_dir: output directory
     :param file_prefix: file prefix, default is 'normal'
+    :param c2w: optional 4x4 camera-to-world matrix of the rendered view
     """
 
     # disable material override
@@ -132,21 +138,49 @@ def render_normal_map(output_dir, file_prefix="normal") -> None:
     # Separate into RGB
     separate_rgba = tree.nodes.new("CompositorNodeSepRGBA")
     links.new(render_layer_node.outputs["Normal"], separate_rgba.inputs["Image"])
+    created_nodes = [separate_rgba]
 
     combine_rgba = tree.nodes.new("CompositorNodeCombRGBA")
-    for row_index in range(3):
-        map_range = tree.nodes.new("CompositorNodeMapRange")
-        map_range.inputs["From Min"].default_value = -1.0
-        map_range.inputs["From Max"].default_value = 1.0
-        map_range.inputs["To Min"].default_value = 0.0
-        map_range.inputs["To Max"].default_value = 1.0
-        links.new(separate_rgba.outputs[row_index], map_range.inputs["Value"])
-        links.new(map_range.outputs["Value"], combine_rgba.inputs[row_index])
+    created_nodes.append(combine_rgba)
+    if c2w is None:
+        for row_index in range(3):
+            map_range = tree.nodes.new("CompositorNodeMapRange")
+            map_range.inputs["From Min"].default_value = -1.0
+            map_range.inputs["From Max"].default_value = 1.0
+            map_range.inputs["To Min"].default_value = 0.0
+            map_range.inputs["To Max"].default_value = 1.0
+            links.new(separate_rgba.outputs[row_index], map_range.inputs["Value"])
+            links.new(map_range.outputs["Value"], combine_rgba.inputs[row_index])
+            created_nodes.append(map_range)
+    else:
+        # n_cam[row] = sum_col R_inv[row, col] * n_world[col]
+        R_inv = np.linalg.inv(np.asarray(c2w, dtype=np.float64)[:3, :3])
+        for row_index in range(3):
+            row_sum = None
+            for col_index in range(3):
+                multiply = tree.nodes.new("CompositorNodeMath")
+                multiply.operation = 'MULTIPLY'
+                links.new(separate_rgba.outputs[col_index], multiply.inputs[0])
+                multiply.inputs[1].default_value = float(R_inv[row_index, col_index])
+                created_nodes.append(multiply)
+                if row_sum is None:
+                    row_sum = multiply
+                else:
+                    add = tree.nodes.new("CompositorNodeMath")
+                    add.operation = 'ADD'
+                    links.new(row_sum.outputs["Value"], add.inputs[0])
+                    links.new(multiply.outputs["Value"], add.inputs[1])
+                    created_nodes.append(add)
+                    row_sum = add
+            links.new(row_sum.outputs["Value"], combine_rgba.inputs[row_index])
 
     # Build output node
     output_file = tree.nodes.new("CompositorNodeOutputFile")
     output_file.base_path = output_dir
     output_file.format.file_format = "OPEN_EXR"
+    if c2w is not None:
+        output_file.format.color_mode = 'RGBA'
+        output_file.format.color_depth = '32'
     # set a different path (in case overwrite last file)
     bpy.context.scene.render.filepath = f'{output_dir}/rgb_for_{file_prefix}.png'
     output_file.file_slots.values()[0].path = file_prefix
@@ -159,6 +193,9 @@ def render_normal_map(output_dir, file_prefix="normal") -> None:
     for link in output_file.inputs[0].links:
         links.remove(link)
     tree.nodes.remove(output_file)
+    # the rotation nodes are specific to this view, and left-over nodes would pile up over the views
+    for node in created_nodes:
+        tree.nodes.remove(node)
     bpy.context.scene.render.use_compositing = False
     bpy.context.scene.use_nodes = False
     bpy.context.view_layer.use_pass_normal = False
@@ -204,33 +241,195 @@ def render_albedo_map(output_dir, file_prefix="albedo") -> None:
     bpy.context.scene.use_nodes = False
     bpy.context.view_layer.use_pass_diffuse_color = False
 
-def _read_exr_with_bpy(path: str) -> np.ndarray:
+class PixelBuffer:
+    """
+    Reusable float32 buffer for moving pixels between Blender images and numpy with ``foreach_get`` /
+    ``foreach_set``, which copy straight from / to the numpy memory (``img.pixels[:]`` builds a Python list of every
+    float). The buffer is (re)allocated only when an image of a larger size comes along, so reading or writing many
+    images of the same size does not allocate.
+
+    Arrays returned by :meth:`read` are views of the buffer, in Blender row order (bottom row first) unless
+    ``flip=True``; they are overwritten by the next call. Copy them to keep them.
+    """
+
+    def __init__(self):
+        self.data = np.empty(0, dtype=np.float32)
+
+    def _flat(self, size: int) -> np.ndarray:
+        if self.data.size < size:
+            self.data = np.empty(size, dtype=np.float32)
+        return self.data[:size]
+
+    def read(self, img: bpy.types.Image, flip: bool = False) -> np.ndarray:
+        """
+        Read the pixels of an image.
+
+        :param img: Blender image (loaded file, generated image or the 'Viewer Node' image)
+        :param flip: return the rows top row first (a strided view, no copy)
+        :return: [H, W, C] float32 view of the buffer
+        """
+
+        w, h = img.size
+        ch = img.channels
+        flat = self._flat(w * h * ch)
+        img.pixels.foreach_get(flat)
+        arr = flat.reshape((h, w, ch))
+        return arr[::-1] if flip else arr
+
+    def write(self, img: bpy.types.Image, data: np.ndarray, flip: bool = False) -> None:
+        """
+        Write an array into an image of the same size. Missing channels are filled: gray to RGB, alpha to 1.
+
+        :param img: Blender image
+        :param data: [H, W], [H, W, C] array
+        :param flip: ``data`` has the top row first
+        """
+
+        w, h = img.size
+        ch = img.channels
+        if data.ndim == 2:
+            data = data[:, :, np.newaxis]
+        if data.shape[:2] != (h, w):
+            raise ValueError(f"Array of shape {data.shape} does not match the image size {w}x{h}")
+        if flip:
+            data = data[::-1]
+        if data.shape[2] == ch and data.dtype == np.float32 and data.flags.c_contiguous:
+            # already in Blender layout: no copy at all
+            img.pixels.foreach_set(data.reshape(-1))
+            return
+        arr = self._flat(w * h * ch).reshape((h, w, ch))
+        data_ch = data.shape[2]
+        if data_ch == 1:
+            arr[..., :min(ch, 3)] = data
+        else:
+            arr[..., :min(ch, data_ch)] = data[..., :ch]
+        if 1 < data_ch < min(ch, 3):
+            arr[..., data_ch:min(ch, 3)] = 0.0
+        if ch == 4 and data_ch < 4:
+            arr[..., 3] = 1.0
+        img.pixels.foreach_set(arr.reshape(-1))
+
+
+# shared by the helpers below, Blender scripts are single threaded
+_pixel_buffer = PixelBuffer()
+
+
+def channel_view(arr: np.ndarray, channels: str = 'rgb') -> np.ndarray:
+    """
+    View of some channels of an [H, W, C] array, without copying.
+
+    :param arr: pixel array, e.g. from :meth:`PixelBuffer.read`
+    :param channels: 'rgb', 'rgba', 'a', 'r', 'g' or 'b'; a single channel gives an [H, W] view
+    :return: the view
+    """
+
+    index = {'r': 0, 'g': 1, 'b': 2, 'a': 3}
+    if len(channels) == 1:
+        return arr[..., index[channels]]
+    start = index[channels[0]]
+    return arr[..., start:start + len(channels)]
+
+
+def read_image_pixels(img: bpy.types.Image, out: Optional[PixelBuffer] = None, flip: bool = False) -> np.ndarray:
+    """
+    Read the pixels of a Blender image into a reusable buffer (see :class:`PixelBuffer`).
+
+    :param img: Blender image
+    :param out: buffer to use, default is a module-level buffer shared by these helpers
+    :param flip: return the rows top row first
+    :return: [H, W, C] float32 view of the buffer
+    """
+
+    return (out or _pixel_buffer).read(img, flip=flip)
+
+
+def write_image_pixels(img: bpy.types.Image, data: np.ndarray, out: Optional[PixelBuffer] = None, flip: bool = False) -> None:
+    """
+    Write an array into a Blender image of the same size (see :meth:`PixelBuffer.write`).
+
+    :param img: Blender image
+    :param data: [H, W] or [H, W, C] array
+    :param out: staging buffer to use, default is a module-level buffer shared by these helpers
+    :param flip: ``data`` has the top row first
+    """
+
+    (out or _pixel_buffer).write(img, data, flip=flip)
+    img.update()
+
+
+def read_viewer_pixels(out: Optional[PixelBuffer] = None, flip: bool = False) -> np.ndarray:
+    """
+    Read the last composited image of the 'Viewer Node' image, e.g. a render pass or AOV linked to a
+    CompositorNodeViewer with :func:`link_pass_to_viewer`. The 'Render Result' image has no readable pixels, the
+    viewer is the way to get render outputs without writing a file.
+
+    :param out: buffer to use
+    :param flip: return the rows top row first
+    :return: [H, W, 4] float32 view of the buffer
+    """
+
+    return read_image_pixels(bpy.data.images['Viewer Node'], out=out, flip=flip)
+
+
+def link_pass_to_viewer(pass_name: str) -> bpy.types.Node:
+    """
+    Link an output of the render layer node (e.g. 'Image', 'Depth', 'Normal', 'DiffCol' or an AOV name) to a viewer
+    node, so that after the next render :func:`read_viewer_pixels` returns it. The pass must be enabled on the view
+    layer. Remove the returned node when done.
+
+    :param pass_name: output socket name of the render layer node
+    :return: the viewer node
+    """
+
+    bpy.context.scene.render.use_compositing = True
+    bpy.context.scene.use_nodes = True
+    tree = bpy.context.scene.node_tree
+    render_layer_node = get_the_one_node_with_type(tree.nodes, 'CompositorNodeRLayers')
+    viewer = tree.nodes.new('CompositorNodeViewer')
+    viewer.use_alpha = True
+    tree.links.new(render_layer_node.outputs[pass_name], viewer.inputs['Image'])
+    return viewer
+
+
+def _read_exr_with_bpy(path: str, out: Optional[PixelBuffer] = None) -> np.ndarray:
     """Load EXR using Blender's native loader (no imageio EXR backend needed)."""
     img = bpy.data.images.load(path, check_existing=False)
-    w, h = img.size
-    ch = img.channels
-    arr = np.array(img.pixels[:], dtype=np.float32).reshape((h, w, ch))
+    # without a caller buffer the result must outlive the next call: read into a fresh array
+    arr = read_image_pixels(img, out=out or PixelBuffer())
     bpy.data.images.remove(img, do_unlink=True)
     return arr
 
 
-def _write_exr_with_bpy(path: str, data: np.ndarray) -> None:
+def _write_exr_with_bpy(path: str, data: np.ndarray, out: Optional[PixelBuffer] = None) -> None:
     """Save float image as EXR using Blender (no imageio EXR backend needed)."""
     h, w = data.shape[0], data.shape[1]
-    ch = data.shape[2] if data.ndim == 3 else 1
-    if data.ndim == 2:
-        data = data[:, :, np.newaxis]
-    if ch == 3:
-        data = np.concatenate([data, np.ones((h, w, 1), dtype=np.float32)], axis=-1)
-        ch = 4
-    img = bpy.data.images.new("_exr_tmp", width=w, height=h, alpha=(ch == 4))
-    img.pixels.foreach_set(data.astype(np.float32).ravel())
+    # saved as RGBA, a missing alpha is 1; a float buffer keeps values outside [0, 1] (e.g. camera-space normals)
+    img = bpy.data.images.new("_exr_tmp", width=w, height=h, alpha=True, float_buffer=True)
+    write_image_pixels(img, data, out=out)
     img.filepath_raw = path
     img.file_format = "OPEN_EXR"
     img.save()
     bpy.data.images.remove(img, do_unlink=True)
 
 
+def image_from_array(data: np.ndarray, name: str) -> bpy.types.Image:
+    """
+    Create a float Blender image from an array, in memory (no file is written or loaded).
+
+    :param data: [H, W], [H, W, 3] or [H, W, 4] array in image row order (top row first), float values are linear
+    :param name: name of the Blender image, an existing image with this name is replaced
+    :return: the image
+    """
+
+    h, w = data.shape[:2]
+    if name in bpy.data.images:
+        bpy.data.images.remove(bpy.data.images[name], do_unlink=True)
+    img = bpy.data.images.new(name, width=w, height=h, alpha=True, float_buffer=True)
+    # Blender stores the bottom row first
+    write_image_pixels(img, data, flip=True)
+    return img
+
+
 def transform_normals_to_camera_space(normals_path, c2w, output_path):
     """
     Transforms world-space normals to camera space using c2w matrix.
@@ -5,7 +5,7 @@ import bpy
 import numpy as np
 from mathutils import Euler, Vector
 
-from bpy_helper.io import get_the_one_node_with_type
+from bpy_helper.io import get_the_one_node_with_type, image_from_array
 
 
 def remove_all_lights() -> None:
@@ -123,12 +123,13 @@ def create_directional_light(location, power=800., rgb=(1., 1., 1.), keep_other_
     return light_obj
 
 
-def set_env_light(path_to_hdr_file: str, strength: float = 1.0,
+def set_env_light(path_to_hdr_file: Union[str, np.ndarray], strength: float = 1.0,
                   rotation_euler: Union[list, Euler, np.ndarray] = None, keep_other_lights: bool = False) -> None:
     """
     Sets the world background to the given hdr_file.
 
-    :param path_to_hdr_file: Path to the .exr file
+    :param path_to_hdr_file: Path to the .exr file, or a linear float32 [H, W, 3] envmap array, which is uploaded to
+        Blender in memory
     :param strength: The brightness of the background.
     :param rotation_euler: The euler angles of the background.
     :param keep_other_lights: If true, the other lights will not be removed.
@@ -145,12 +146,16 @@ def set_env_light(path_to_hdr_file: str, strength: float = 1.0,
     if rotation_euler is None:
         rotation_euler = [0.0, 0.0, 0.0]
 
-    if not os.path.exists(path_to_hdr_file):
-        raise FileNotFoundError(f"The given path does not exists: {path_to_hdr_file}")
+    if isinstance(path_to_hdr_file, np.ndarray):
+        image = image_from_array(path_to_hdr_file, "env_light")
+    else:
+        if not os.path.exists(path_to_hdr_file):
+            raise FileNotFoundError(f"The given path does not exists: {path_to_hdr_file}")
+        image = bpy.data.images.load(path_to_hdr_file, check_existing=True)
 
-    # add a texture node and load the image and link it
+    # add a texture node with the image and link it
     texture_node = nodes.new(type="ShaderNodeTexEnvironment")
-    texture_node.image = bpy.data.images.load(path_to_hdr_file, check_existing=True)
+    texture_node.image = image
 
     # get the one background node of the world shader
     background_node = get_the_one_node_with_type(nodes, "Background")
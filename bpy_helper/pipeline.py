@@ -0,0 +1,180 @@
+import json
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Sequence
+
+
+@dataclass
+class Stage:
+    """
+    One per-asset step of a pipeline.
+
+    ``run(asset, token)`` does the work and returns True on success, ``token`` is the slot it was given (e.g. a GPU
+    id). ``is_done(asset)`` tells whether the outputs of the stage already exist; stages without checkable outputs
+    leave it None and are tracked by the journal only.
+    """
+    name: str
+    slot: str
+    run: Callable[[Any, Any], bool]
+    is_done: Optional[Callable[[Any], bool]] = None
+    deps: Sequence[str] = field(default_factory=tuple)
+
+
+class PipelineRunner:
+    """
+    Run a DAG of stages over many assets. Every (asset, stage) task starts as soon as the stages it depends on are
+    done for that asset and a slot of its pool is free, so assets flow downstream one by one instead of in batch
+    phases. Finished tasks are appended to a jsonl journal. A rerun skips the tasks whose outputs already exist, and
+    the tasks of stages without checkable outputs that the journal records as done.
+    """
+
+    def __init__(self, stages: Sequence[Stage], slots: dict, journal_path: str, stop_event=None):
+        """
+        :param stages: stages, dependencies must be listed before their dependents
+        :param slots: pool name -> list of slot tokens, the length of the list is the concurrency of the pool
+        :param journal_path: jsonl file recording finished tasks
+        :param stop_event: optional event (see bpy_helper.dispatch), once set no new task is started
+        """
+
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        for stage in stages:
+            for dep in stage.deps:
+                if self.order.index(dep) >= self.order.index(stage.name):
+                    raise ValueError(f"Stage {stage.name} depends on {dep}, which must be listed before it")
+            if stage.slot not in slots:
+                raise ValueError(f"No slots given for pool {stage.slot} of stage {stage.name}")
+        self.slots = slots
+        self.journal_path = journal_path
+        self.stop_event = stop_event
+        self.journal = self._load_journal()
+
+    def _load_journal(self) -> dict:
+        journal = {}
+        if not os.path.exists(self.journal_path):
+            return journal
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a line cut short by a kill
+                    continue
+                journal[(entry['asset'], entry['stage'])] = entry['status']
+        return journal
+
+    def _record(self, key: str, stage_name: str, status: str) -> None:
+        self.journal[(key, stage_name)] = status
+        with open(self.journal_path, 'a') as f:
+            f.write(json.dumps({'asset': key, 'stage': stage_name, 'status': status, 'time': time.time()}) + '\n')
+            f.flush()
+
+    def _already_done(self, asset, key: str, stage: Stage) -> bool:
+        if stage.is_done is not None:
+            return stage.is_done(asset)
+        return self.journal.get((key, stage.name)) == 'done'
+
+    def run(self, assets: Sequence, key: Callable[[Any], str] = str) -> dict:
+        """
+        Run all stages over the assets.
+
+        :param assets: assets, passed to the stage callables
+        :param key: asset -> unique string used in the journal
+        :return: stage name -> {status: count}, status is one of done, skipped, failed, blocked, drained
+        """
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        summary = {name: {} for name in self.order}
+        finished = queue.Queue()
+        tokens = {pool: queue.Queue() for pool in self.slots}
+        for pool, pool_tokens in self.slots.items():
+            for token in pool_tokens:
+                tokens[pool].put(token)
+        executors = {pool: ThreadPoolExecutor(max_workers=len(pool_tokens)) for pool, pool_tokens in self.slots.items()}
+
+        def count(stage_name, status):
+            summary[stage_name][status] = summary[stage_name].get(status, 0) + 1
+
+        def execute(asset, stage):
+            token = tokens[stage.slot].get()
+            try:
+                if self.stop_event is not None and self.stop_event.is_set():
+                    return 'drained'
+                if stage.run(asset, token):
+                    return 'done'
+                # a command stopped by the drain is not a failure, it is resumed by the next run
+                return 'drained' if self.stop_event is not None and self.stop_event.is_set() else 'failed'
+            except Exception as e:
+                print(f"[{stage.name}] {key(asset)}: {e}", flush=True)
+                return 'failed'
+            finally:
+                tokens[stage.slot].put(token)
+
+        def submit(asset, stage):
+            future = executors[stage.slot].submit(execute, asset, stage)
+            future.add_done_callback(lambda f: finished.put((asset, stage.name, f.result())))
+
+        # Per asset: the stages that are done and the stages still waiting for their dependencies
+        state = {}
+        in_flight = 0
+
+        def advance(asset):
+            """Start (or skip) every stage of the asset whose dependencies are done."""
+            nonlocal in_flight
+            done, waiting = state[key(asset)]
+            progressed = True
+            while progressed:
+                progressed = False
+                for stage_name in list(waiting):
+                    stage = self.stages[stage_name]
+                    if not all(dep in done for dep in stage.deps):
+                        continue
+                    waiting.remove(stage_name)
+                    if self._already_done(asset, key(asset), stage):
+                        done.add(stage_name)
+                        count(stage_name, 'skipped')
+                        progressed = True
+                    elif self.stop_event is not None and self.stop_event.is_set():
+                        count(stage_name, 'drained')
+                    else:
+                        submit(asset, stage)
+                        in_flight += 1
+
+        try:
+            for asset in assets:
+                state[key(asset)] = (set(), list(self.order))
+                advance(asset)
+
+            while in_flight:
+                asset, stage_name, status = finished.get()
+                in_flight -= 1
+                count(stage_name, status)
+                if status == 'drained':
+                    continue
+                self._record(key(asset), stage_name, status)
+                done, waiting = state[key(asset)]
+                if status == 'done':
+                    done.add(stage_name)
+                    advance(asset)
+                else:
+                    # everything downstream of a failed stage is blocked until the next run
+                    for blocked in [name for name in waiting if self._depends_on(name, stage_name)]:
+                        waiting.remove(blocked)
+                        count(blocked, 'blocked')
+        except KeyboardInterrupt:
+            # let the running commands drain instead of waiting for them to finish
+            if self.stop_event is not None:
+                self.stop_event.set()
+            raise
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        return summary
+
+    def _depends_on(self, stage_name: str, upstream: str) -> bool:
+        deps = self.stages[stage_name].deps
+        return upstream in deps or any(self._depends_on(dep, upstream) for dep in deps)
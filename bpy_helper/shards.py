@@ -0,0 +1,245 @@
+import glob
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from bpy_helper.checkpoint import tmp_path_for, atomic_replace, atomic_json_dump
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def _padded(size: int) -> int:
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+
+
+def load_shard_index(index_path: str) -> list:
+    """
+    Load the sidecar index of a tar shard. Each line describes one complete member:
+    ``{"name", "offset", "data_offset", "size"}``, where ``offset`` is the position of the member header and
+    ``data_offset`` the position of its content, so readers can seek to a member without scanning the tar.
+
+    :param index_path: path of the ``.idx`` sidecar
+    :return: list of index entries, in write order
+    """
+
+    entries = []
+    if not os.path.exists(index_path):
+        return entries
+    with open(index_path, 'r') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # the last line may be cut short by a kill
+                break
+    return entries
+
+
+def read_shard_member(shard_path: str, entry: dict) -> bytes:
+    """
+    Read one member of a tar shard using its index entry.
+
+    :param shard_path: tar shard path
+    :param entry: index entry from :func:`load_shard_index`
+    :return: member content
+    """
+
+    with open(shard_path, 'rb') as f:
+        f.seek(entry['data_offset'])
+        return f.read(entry['size'])
+
+
+class TarShardWriter:
+    """
+    Stream files into WebDataset-style tar shards (``<prefix>-000000.tar``, ``<prefix>-000001.tar``, ...), each with
+    a ``.idx`` sidecar listing its members with their offsets. A member is added to the index only after its content
+    was written, so the index never points at partial data. On open, the shards of earlier runs with the same prefix
+    are indexed (:meth:`__contains__` lets the resume logic skip their members), a shard cut short by a kill is
+    truncated after its last indexed member and closed, and writing continues in a new shard.
+    """
+
+    def __init__(self, shard_dir: str, prefix: str, max_members: int = 10000, max_bytes: int = 1 << 30):
+        """
+        :param shard_dir: directory of the shards
+        :param prefix: shard name prefix
+        :param max_members: start a new shard after this many members
+        :param max_bytes: start a new shard once the current one is this large
+        """
+
+        self.shard_dir = shard_dir
+        self.prefix = prefix
+        self.max_members = max_members
+        self.max_bytes = max_bytes
+        os.makedirs(shard_dir, exist_ok=True)
+
+        self.members = {}
+        shard_paths = sorted(glob.glob(os.path.join(shard_dir, f'{prefix}-[0-9]*.tar')))
+        for shard_path in shard_paths:
+            entries = load_shard_index(shard_path + '.idx')
+            self._repair(shard_path, entries)
+            for entry in entries:
+                self.members[entry['name']] = (shard_path, entry)
+        self.next_shard_id = int(shard_paths[-1][-10:-4]) + 1 if shard_paths else 0
+
+        self.shard = None
+        self.index = None
+        self.shard_path = None
+        self.shard_members = 0
+
+    @staticmethod
+    def _repair(shard_path: str, entries: list) -> None:
+        end = entries[-1]['data_offset'] + _padded(entries[-1]['size']) if entries else 0
+        with open(shard_path, 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == end + 2 * BLOCK_SIZE:
+                return
+            print(f"Repairing {shard_path}: keeping {len(entries)} indexed members")
+            f.truncate(end)
+            f.seek(end)
+            f.write(b'\0' * (2 * BLOCK_SIZE))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.members
+
+    def _open_shard(self) -> None:
+        self.shard_path = os.path.join(self.shard_dir, f'{self.prefix}-{self.next_shard_id:06d}.tar')
+        self.next_shard_id += 1
+        self.shard = open(self.shard_path, 'wb')
+        self.index = open(self.shard_path + '.idx', 'w')
+        self.shard_members = 0
+
+    def _close_shard(self) -> None:
+        if self.shard is None:
+            return
+        self.shard.write(b'\0' * (2 * BLOCK_SIZE))
+        for f in (self.shard, self.index):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        self.shard = None
+        self.index = None
+
+    def add_bytes(self, name: str, data: bytes) -> None:
+        """
+        Append a member to the current shard, starting a new shard when the current one is full.
+
+        :param name: member name, e.g. ``<scene>/<split>/<lighting>/gt_0.png``
+        :param data: member content
+        """
+
+        if self.shard is not None and (self.shard_members >= self.max_members or self.shard.tell() >= self.max_bytes):
+            self._close_shard()
+        if self.shard is None:
+            self._open_shard()
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        offset = self.shard.tell()
+        self.shard.write(header)
+        self.shard.write(data)
+        self.shard.write(b'\0' * (_padded(len(data)) - len(data)))
+        self.shard.flush()
+
+        entry = {'name': name, 'offset': offset, 'data_offset': offset + len(header), 'size': len(data)}
+        self.index.write(json.dumps(entry) + '\n')
+        self.index.flush()
+        self.members[name] = (self.shard_path, entry)
+        self.shard_members += 1
+
+    def add_file(self, name: str, path: str) -> None:
+        """
+        Append the content of a file as a member.
+
+        :param name: member name
+        :param path: file to read
+        """
+
+        with open(path, 'rb') as f:
+            self.add_bytes(name, f.read())
+
+    def close(self) -> None:
+        """
+        Finish the current shard (end-of-archive blocks, fsync of the shard and its index).
+        """
+
+        self._close_shard()
+
+
+class DirectorySink:
+    """
+    Output sink writing one file per output, each through a hidden temporary file next to it. An output sink tells
+    the renderer where to write temporary files (:meth:`work_dir`, :meth:`tmp_path`), whether an output already
+    exists (:meth:`exists`) and makes a finished temporary file the output (:meth:`commit`).
+    """
+
+    def work_dir(self, path: str) -> str:
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def tmp_path(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return tmp_path_for(path)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def commit(self, tmp_path: str, path: str) -> None:
+        atomic_replace(tmp_path, path)
+
+    def commit_json(self, obj, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_json_dump(obj, path)
+
+    def close(self) -> None:
+        pass
+
+
+class ShardSink:
+    """
+    Output sink streaming every output into tar shards. Outputs are named by their path relative to ``root``, and
+    temporary files live in a local scratch directory, so no small file is created under ``root``.
+    """
+
+    def __init__(self, root: str, writer: TarShardWriter, scratch_dir: str = None):
+        """
+        :param root: output root, member names are paths relative to it
+        :param writer: shard writer
+        :param scratch_dir: directory for temporary files, default is a new directory in the system temp dir
+        """
+
+        self.root = root
+        self.writer = writer
+        self.scratch_dir = scratch_dir or tempfile.mkdtemp(prefix='render_shards_')
+        os.makedirs(self.scratch_dir, exist_ok=True)
+
+    def member_name(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def work_dir(self, path: str) -> str:
+        work_dir = os.path.join(self.scratch_dir, self.member_name(path).replace('/', '_'))
+        os.makedirs(work_dir, exist_ok=True)
+        return work_dir
+
+    def tmp_path(self, path: str) -> str:
+        return os.path.join(self.scratch_dir, self.member_name(path).replace('/', '_'))
+
+    def exists(self, path: str) -> bool:
+        return self.member_name(path) in self.writer or os.path.exists(path)
+
+    def commit(self, tmp_path: str, path: str) -> None:
+        self.writer.add_file(self.member_name(path), tmp_path)
+        os.remove(tmp_path)
+
+    def commit_json(self, obj, path: str) -> None:
+        self.writer.add_bytes(self.member_name(path), json.dumps(obj, indent=4).encode())
+
+    def close(self) -> None:
+        self.writer.close()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
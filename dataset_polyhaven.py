@@ -1,5 +1,8 @@
 import os
 import json
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import imageio.v3 as imageio
 
 import torch
@@ -9,6 +12,8 @@ from torch.utils.data import Dataset
 from torchvision import transforms
 import torch.nn.functional as F
 
+import envmap_codec
+import exr_io
 from dataset_colmap import (
     generate_directional_embeddings,
     generate_plucker_rays,
@@ -27,26 +32,58 @@ def reconstruct_hdr_from_pngs(envmap_dir, frame_idx=0):
         _ldr.png = uint8( raw.clip(0,1) ** (1/2.2) * 255 )
         _hdr.png = uint8( log1p(10*raw) / max(log1p(10*raw)) * 255 )
 
-    We invert both and use non-saturated LDR pixels to recover the unknown max_log scale.
+    We invert both and use non-saturated LDR pixels to recover the unknown max_log scale (see envmap_codec).
     """
     hdr_path = os.path.join(envmap_dir, f"{frame_idx:05d}_hdr.png")
     ldr_path = os.path.join(envmap_dir, f"{frame_idx:05d}_ldr.png")
+    return envmap_codec.read_pair(hdr_path, ldr_path)
 
-    hdr_png = imageio.imread(hdr_path)[..., :3].astype(np.float64) / 255.0
-    ldr_png = imageio.imread(ldr_path)[..., :3].astype(np.float64) / 255.0
 
-    ldr_linear = ldr_png ** 2.2
+def _w2c_to_frame_transform(w2c):
+    """Convert OpenCV w2c (4x4) to the frame_transform used by the pipeline.
 
-    hdr_norm = hdr_png  # = log1p(10*raw) / max_log
+    COLMAP stores R_c2w and t_w2c separately, then flips Y/Z.
+    OpenCV w2c gives R_w2c and t_w2c directly, so we just transpose R.
+    """
+    w2c = np.array(w2c)
+    R_c2w = w2c[:3, :3].T
+    t_w2c = w2c[:3, 3]
+
+    Rt = np.zeros((4, 4))
+    Rt[:3, :3] = R_c2w
+    Rt[:3, 3] = t_w2c
+    Rt[:3, 1:3] *= -1
+    Rt[3, 3] = 1.0
+    return torch.tensor(Rt, dtype=torch.float32)
+
+
+@functools.lru_cache(maxsize=4096)
+def _frame_geometry(fxfycxcy, resolution, img_hw, w2c, aspect, near, far):
+    """Plucker rays and MVP encoding of one camera, memoized: they only depend on the (hashable) arguments.
 
-    non_sat = (ldr_linear > 0.01) & (ldr_linear < 0.95) & (hdr_norm > 0.01)
-    if non_sat.any():
-        max_log = np.median(np.log1p(10.0 * ldr_linear[non_sat]) / hdr_norm[non_sat])
-    else:
-        max_log = np.log1p(10.0)
+    The returned tensors are shared between calls, do not modify them in place.
+    """
+    fx, fy, cx, cy = fxfycxcy
+    h_orig, w_orig = resolution
+    FovX = focal2fov(fx, w_orig)
+    FovY = focal2fov(fy, h_orig)
+
+    frame_transform = _w2c_to_frame_transform(w2c)
+    mv = torch.linalg.inv(frame_transform)
 
-    raw_hdr = np.expm1(hdr_norm * max_log) / 10.0
-    return raw_hdr.astype(np.float32)
+    pluckers = torch.tensor(
+        generate_plucker_rays(frame_transform, img_hw, [FovX, FovY])
+    )
+
+    proj = perspective(FovY, aspect, near, far)
+    mv = mv @ rotate_x(-np.pi / 2)
+    mvp = proj @ mv
+    t = mvp[:3, 3]
+    r = torch.linalg.norm(t)
+    theta = torch.arccos(t[2] / r)
+    phi = torch.arctan2(t[1], t[0])
+    mvp = torch.tensor([theta, torch.sin(phi), torch.cos(phi), r])
+    return pluckers, mvp
 
 
 class DatasetPolyhaven(Dataset):
@@ -79,7 +116,10 @@ class DatasetPolyhaven(Dataset):
             print(f"Reconstructed HDR envmap from {envmap_path} "
                   f"(range [{self.envmap.min():.3f}, {self.envmap.max():.3f}])")
         else:
-            self.envmap = imageio.imread(envmap_path)[..., :3]
+            try:
+                self.envmap = exr_io.read_exr(envmap_path)[..., :3]
+            except ValueError:  # not an EXR, or a compression exr_io does not decode
+                self.envmap = imageio.imread(envmap_path)[..., :3]
 
         #todo: check if this is to the right or to theleft, Align with polyhaven convention: rotate envmap 90° left (rightmost 1/4 → leftmost)
         w = self.envmap.shape[1]
@@ -113,85 +153,89 @@ class DatasetPolyhaven(Dataset):
             generate_directional_embeddings(), dtype=torch.float32
         ).permute(2, 0, 1)
 
+        # Frame decoding: a thread pool (imageio / PIL release the GIL while decoding) and an optional on-disk
+        # cache of the resized, padded frames, so that later epochs skip decoding and resizing
+        self.decode_threads = getattr(args, "decode_threads", min(8, os.cpu_count() or 1))
+        self.frame_cache_dir = getattr(args, "frame_cache_dir", None)
+        if self.frame_cache_dir:
+            os.makedirs(self.frame_cache_dir, exist_ok=True)
+
         print(f"DatasetPolyhaven: {self.n_images} images from '{scene_name}', "
               f"shape [{self.resolution[0]}, {self.resolution[1]}], downsample {self.downsample}")
 
     def _w2c_to_frame_transform(self, w2c):
-        """Convert OpenCV w2c (4x4) to the frame_transform used by the pipeline.
-
-        COLMAP stores R_c2w and t_w2c separately, then flips Y/Z.
-        OpenCV w2c gives R_w2c and t_w2c directly, so we just transpose R.
-        """
-        w2c = np.array(w2c)
-        R_c2w = w2c[:3, :3].T
-        t_w2c = w2c[:3, 3]
-
-        Rt = np.zeros((4, 4))
-        Rt[:3, :3] = R_c2w
-        Rt[:3, 3] = t_w2c
-        Rt[:3, 1:3] *= -1
-        Rt[3, 3] = 1.0
-        return torch.tensor(Rt, dtype=torch.float32)
+        return _w2c_to_frame_transform(w2c)
+
+    def _frame_cache_path(self, image_path):
+        """Cache file of a frame, keyed by the image file (path, size, mtime) and the target size."""
+        st = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}:{st.st_size}:{st.st_mtime_ns}:{self.h}x{self.w}"
+        return os.path.join(self.frame_cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".pt")
+
+    def _decode_frame(self, image_path):
+        raw_img = imageio.imread(image_path)
+        raw_img = torch.from_numpy(raw_img).float() / 255.0
+
+        raw_img = self.resize(raw_img.permute(2, 0, 1))
+
+        if raw_img.shape[0] == 4:
+            alpha = raw_img[3:4]
+            img = raw_img[:3]
+            mask = alpha.expand(3, -1, -1)
+        else:
+            img = raw_img
+            mask = torch.ones_like(img)
+
+        img = pad_to_multiple(img, multiple=8)
+        mask = pad_to_multiple(mask, multiple=8)
+        img = img * mask
+        img = 2 * (img - 0.5)
+        return img, mask
+
+    def _load_frame(self, i):
+        image_path = self.frames[i]["image_path"]
+        if not self.frame_cache_dir:
+            return self._decode_frame(image_path)
+
+        cache_path = self._frame_cache_path(image_path)
+        if os.path.exists(cache_path):
+            try:
+                cached = torch.load(cache_path)
+                return cached["img"], cached["mask"]
+            except Exception as e:
+                print(f"Ignoring unreadable frame cache {cache_path}: {e}")
+        img, mask = self._decode_frame(image_path)
+        tmp_path = os.path.join(self.frame_cache_dir, f".tmp_{os.getpid()}_{os.path.basename(cache_path)}")
+        torch.save({"img": img, "mask": mask.contiguous()}, tmp_path)
+        os.replace(tmp_path, cache_path)
+        return img, mask
 
     def _parse_frame(self, cam_near_far=[0.1, 1000.0]):
-        imgs, masks, mvps = [], [], []
-        envs_darker, envs_brighter, dir_embeds, pluckers = [], [], [], []
-
-        for i in range(self.n_images):
-            frame = self.frames[i]
-            raw_img = imageio.imread(frame["image_path"])
-            raw_img = torch.tensor(raw_img / 255.0, dtype=torch.float32)
-
-            raw_img = self.resize(raw_img.permute(2, 0, 1))
-
-            if raw_img.shape[0] == 4:
-                alpha = raw_img[3:4]
-                img = raw_img[:3]
-                mask = alpha.expand(3, -1, -1)
-            else:
-                img = raw_img
-                mask = torch.ones_like(img)
-
-            img = pad_to_multiple(img, multiple=8)
-            mask = pad_to_multiple(mask, multiple=8)
-            img = img * mask
-            img = 2 * (img - 0.5)
-
-            fx, fy, cx, cy = frame["fxfycxcy"]
-            h_orig, w_orig = self.resolution
-            FovX = focal2fov(fx, w_orig)
-            FovY = focal2fov(fy, h_orig)
-
-            frame_transform = self._w2c_to_frame_transform(frame["w2c"])
-            mv = torch.linalg.inv(frame_transform)
-
-            frame_pluckers = torch.tensor(
-                generate_plucker_rays(
-                    frame_transform, img.shape[1:3], [FovX, FovY]
-                )
-            )
+        if self.decode_threads > 1:
+            with ThreadPoolExecutor(max_workers=self.decode_threads) as pool:
+                frames = list(pool.map(self._load_frame, range(self.n_images)))
+        else:
+            frames = [self._load_frame(i) for i in range(self.n_images)]
 
+        imgs, masks, mvps, pluckers = [], [], [], []
+        for frame, (img, mask) in zip(self.frames, frames):
+            frame_pluckers, mvp = _frame_geometry(
+                tuple(frame["fxfycxcy"]), tuple(self.resolution), tuple(img.shape[1:3]),
+                tuple(map(tuple, frame["w2c"])), self.aspect, cam_near_far[0], cam_near_far[1],
+            )
             imgs.append(img)
             masks.append(mask)
-            dir_embeds.append(self.dir_embeds)
             pluckers.append(frame_pluckers)
-            envs_darker.append(self.env_darker)
-            envs_brighter.append(self.env_brighter)
-
-            proj = perspective(FovY, self.aspect, cam_near_far[0], cam_near_far[1])
-            mv = mv @ rotate_x(-np.pi / 2)
-            mvp = proj @ mv
-            t = mvp[:3, 3]
-            r = torch.linalg.norm(t)
-            theta = torch.arccos(t[2] / r)
-            phi = torch.arctan2(t[1], t[0])
-            mvp = torch.tensor([theta, torch.sin(phi), torch.cos(phi), r])
             mvps.append(mvp)
 
+        # the env maps and direction embeddings are the same for every frame: broadcast instead of copying
+        n = self.n_images
         return (
             torch.stack(imgs), torch.stack(masks), torch.stack(mvps),
-            torch.stack(envs_darker), torch.stack(envs_brighter),
-            torch.stack(dir_embeds), torch.stack(pluckers),
+            self.env_darker.unsqueeze(0).expand(n, *self.env_darker.shape),
+            self.env_brighter.unsqueeze(0).expand(n, *self.env_brighter.shape),
+            self.dir_embeds.unsqueeze(0).expand(n, *self.dir_embeds.shape),
+            torch.stack(pluckers),
         )
 
     def __len__(self):
@@ -0,0 +1,368 @@
+"""Relighting dataset over our own render outputs.
+
+Reads the scenes written by render_3dscenes_dense.py / render_3dmodels_dense*.py:
+
+    <root>/<uid>/normalize.json, lights.json (or scene.json['lights'])
+    <root>/<uid>/{train,test}/cameras.json
+    <root>/<uid>/{train,test}/<lighting>/gt_{eye_idx}.png   (or <lighting>.tar, or tar shards in <root>/shards)
+    <root>/<uid>/{train,test}/{depth,normal,albedo}/...
+    <root>/<uid>.npack                                       (scene packs from scene_pack.py, used when present)
+
+Every sample is a relighting triplet: one view of a scene under two different lightings. The index of all scenes
+(cameras, light plan, which images exist) is built once and cached next to the data, images are decoded lazily and
+kept in a bounded LRU, and scenes are sharded across DataLoader workers so each worker only touches its own scenes.
+
+Benchmark:
+    python dataset_rendered.py --root <rendered_dir> --num_workers 8 --batch_size 16
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import IterableDataset, DataLoader, get_worker_info
+
+from bpy_helper.checkpoint import atomic_replace, tmp_path_for
+from scene_pack import INTRINSICS, RenderedSceneReader, ScenePack, load_shard_members
+
+INDEX_VERSION = 1
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+        self.misses += 1
+        value = load()
+        if self.max_items > 0:
+            self.items[key] = value
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+        return value
+
+
+def _index_scene(source, split, shard_members):
+    """Index record of one scene: cameras, light plan and the (view, lighting) images that exist."""
+    if source.endswith(".npack"):
+        pack = ScenePack(source)
+        try:
+            if split not in pack.attrs["splits"] or f"{split}/valid" not in pack:
+                return None
+            plan = pack.attrs["splits"][split]
+            lights = [{"name": n, "kind": k, "info": i}
+                      for n, k, i in zip(plan["lights"], plan["light_kinds"], plan["light_info"])]
+            return {
+                "uid": pack.attrs["uid"],
+                "eye_idx": pack[f"{split}/eye_idx"][:],
+                "c2w": pack[f"{split}/c2w"][:],
+                "fov": pack[f"{split}/fov"][:],
+                "valid": pack[f"{split}/valid"][:],
+                "lights": lights,
+            }
+        finally:
+            pack.close()
+
+    reader = RenderedSceneReader(source, shard_members)
+    cameras = reader.read_json(f"{split}/cameras.json")
+    if cameras is None:
+        return None
+    lights = reader.light_plan(split)
+    eye_ids = [cam["eye_idx"] for cam in cameras]
+    valid = np.array([[reader.has(f"{split}/{light['name']}/gt_{eye_idx}.png") for light in lights]
+                      for eye_idx in eye_ids], dtype=bool).reshape(len(eye_ids), len(lights))
+    return {
+        "uid": reader.uid,
+        "eye_idx": np.array(eye_ids, dtype=np.int32),
+        "c2w": np.array([cam["c2w"] for cam in cameras], dtype=np.float32).reshape(-1, 4, 4),
+        "fov": np.array([cam["fov"] for cam in cameras], dtype=np.float32),
+        "valid": valid,
+        "lights": lights,
+    }
+
+
+def _compact(records, sources):
+    """Concatenate per-scene records into flat arrays with per-scene offsets."""
+    view_counts = [len(r["eye_idx"]) for r in records]
+    valid_counts = [r["valid"].size for r in records]
+    return {
+        "version": np.array(INDEX_VERSION),
+        "sources": np.array(sources, dtype=str),
+        "uids": np.array([r["uid"] for r in records], dtype=str),
+        "view_offsets": np.concatenate([[0], np.cumsum(view_counts)]).astype(np.int64),
+        "valid_offsets": np.concatenate([[0], np.cumsum(valid_counts)]).astype(np.int64),
+        "num_lights": np.array([len(r["lights"]) for r in records], dtype=np.int32),
+        "eye_idx": np.concatenate([r["eye_idx"] for r in records] or [np.zeros(0, np.int32)]).astype(np.int32),
+        "c2w": np.concatenate([r["c2w"] for r in records] or [np.zeros((0, 4, 4), np.float32)]).astype(np.float32),
+        "fov": np.concatenate([r["fov"] for r in records] or [np.zeros(0, np.float32)]).astype(np.float32),
+        "valid": np.concatenate([r["valid"].ravel() for r in records] or [np.zeros(0, bool)]),
+        # the light plans are small, heterogeneous dicts: one json string per scene
+        "lights": np.array([json.dumps(r["lights"]) for r in records], dtype=str),
+    }
+
+
+def _split_records(index):
+    """Inverse of _compact: source -> per-scene record."""
+    records = {}
+    for s, source in enumerate(index["sources"]):
+        v0, v1 = index["view_offsets"][s], index["view_offsets"][s + 1]
+        k0, k1 = index["valid_offsets"][s], index["valid_offsets"][s + 1]
+        records[str(source)] = {
+            "uid": str(index["uids"][s]),
+            "eye_idx": index["eye_idx"][v0:v1],
+            "c2w": index["c2w"][v0:v1],
+            "fov": index["fov"][v0:v1],
+            "valid": index["valid"][k0:k1].reshape(v1 - v0, int(index["num_lights"][s])),
+            "lights": json.loads(str(index["lights"][s])),
+        }
+    return records
+
+
+def find_scenes(root):
+    """Scene sources under root: <uid>.npack packs, and the finished scene directories that have no pack."""
+    packs = {os.path.basename(p)[:-len(".npack")]: p for p in glob.glob(os.path.join(root, "*.npack"))}
+    dirs = {os.path.basename(os.path.dirname(p)): os.path.dirname(p) for p in glob.glob(os.path.join(root, "*", "done.txt"))}
+    dirs.update(packs)
+    return [dirs[uid] for uid in sorted(dirs)]
+
+
+def load_index(root, split, index_path=None, rebuild=False, shard_members=None):
+    """Load the cached index of root, indexing only the scenes added since it was written."""
+    index_path = index_path or os.path.join(root, f"dataset_index_{split}.npz")
+    sources = find_scenes(root)
+
+    cached = {}
+    if not rebuild and os.path.exists(index_path):
+        with np.load(index_path) as f:
+            index = dict(f)
+        if int(index["version"]) == INDEX_VERSION:
+            if list(index["sources"]) == sources:
+                return index
+            cached = _split_records(index)
+
+    records, kept = [], []
+    for source in sources:
+        record = cached.get(source)
+        if record is None:
+            try:
+                record = _index_scene(source, split, shard_members)
+            except Exception as e:
+                print(f"Skipping {source}: {e}")
+                continue
+        if record is not None:
+            records.append(record)
+            kept.append(source)
+    print(f"Indexed {len(kept)} scenes ({len(kept) - len(set(kept) & set(cached))} new)")
+
+    index = _compact(records, kept)
+    tmp_path = tmp_path_for(index_path)
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **index)
+    atomic_replace(tmp_path, index_path)
+    return index
+
+
+class DatasetRendered(IterableDataset):
+    """Random (view, lighting, lighting) relighting triplets over rendered scenes.
+
+    Each sample holds the same view of a scene under lighting a (the input) and lighting b (the target):
+        img_a, img_b    (3, H, W) in [-1, 1], premultiplied by the mask
+        mask            (3, H, W) from the alpha channel of img_a
+        c2w, fov        camera of the view
+        light_a/b       indices into the light plan of the scene, see light_info()
+        depth, normal, albedo   only with load_intrinsics
+    """
+
+    def __init__(self, root, split="train", resolution=None, samples_per_scene=64, light_kinds=None,
+                 load_intrinsics=False, cache_items=512, open_scenes=8, seed=0, rank=0, world_size=1,
+                 index_path=None, rebuild_index=False):
+        self.root = root
+        self.split = split
+        self.resolution = resolution
+        self.samples_per_scene = samples_per_scene
+        self.load_intrinsics = load_intrinsics
+        self.seed = seed
+        self.epoch = 0
+        self.rank = rank
+        self.world_size = world_size
+        self.cache_items = cache_items
+        self.open_scenes = open_scenes
+
+        self.shard_members = load_shard_members(os.path.join(root, "shards"))
+        self.index = load_index(root, split, index_path, rebuild_index, self.shard_members)
+        self.light_plans = [json.loads(str(lights)) for lights in self.index["lights"]]
+
+        # lightings usable as a or b, per scene
+        self.light_masks = []
+        for plan in self.light_plans:
+            self.light_masks.append(np.array([light_kinds is None or light["kind"] in light_kinds for light in plan], dtype=bool))
+        self.scenes = [s for s in range(len(self.light_plans)) if len(self._views_with_pairs(s))]
+
+        # created lazily in each worker
+        self.images = None
+        self.sources = None
+
+        print(f"DatasetRendered: {len(self.scenes)} scenes with relighting pairs in '{root}' ({split})")
+
+    def _valid(self, s):
+        k0, k1 = self.index["valid_offsets"][s], self.index["valid_offsets"][s + 1]
+        return self.index["valid"][k0:k1].reshape(-1, int(self.index["num_lights"][s])) & self.light_masks[s]
+
+    def _views_with_pairs(self, s):
+        return np.flatnonzero(self._valid(s).sum(axis=1) >= 2)
+
+    def light_info(self, scene, light):
+        return self.light_plans[scene][light]
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.scenes[self.rank::self.world_size]) * self.samples_per_scene
+
+    def _open(self, s):
+        def load():
+            source = str(self.index["sources"][s])
+            if source.endswith(".npack"):
+                return ScenePack(source)
+            return RenderedSceneReader(source, self.shard_members)
+        return self.sources.get(s, load)
+
+    def _to_tensor(self, img):
+        img = torch.from_numpy(np.ascontiguousarray(img))
+        img = img.float() / 255.0 if img.dtype == torch.uint8 else img.float()
+        img = img.permute(2, 0, 1) if img.ndim == 3 else img[None]
+        if self.resolution is not None:
+            img = F.interpolate(img[None], size=tuple(self.resolution), mode="bilinear", antialias=True, align_corners=False)[0]
+        return img
+
+    def _image(self, s, view, light):
+        def load():
+            source = self._open(s)
+            if isinstance(source, ScenePack):
+                img = source[f"{self.split}/rgb"][view, light]
+            else:
+                eye_idx = self.index["eye_idx"][self.index["view_offsets"][s] + view]
+                img = source.read_image(f"{self.split}/{self.light_plans[s][light]['name']}/gt_{eye_idx}.png")
+            return self._to_tensor(img)
+        return self.images.get((s, "rgb", view, light), load)
+
+    def _intrinsic(self, s, view, key):
+        def load():
+            source = self._open(s)
+            if isinstance(source, ScenePack):
+                img = source[f"{self.split}/{key}"][view]
+            else:
+                folder, pattern = INTRINSICS[key]
+                eye_idx = self.index["eye_idx"][self.index["view_offsets"][s] + view]
+                img = source.read_image(f"{self.split}/{folder}/{pattern.format(eye_idx)}")
+                if key == "depth" and img.ndim == 3:
+                    img = img[..., 0]
+                if key == "normal":
+                    img = img[..., :3]
+            return self._to_tensor(img)
+        return self.images.get((s, key, view), load)
+
+    def sample(self, s, view, light_a, light_b):
+        """Build the sample of one triplet."""
+        img_a = self._image(s, view, light_a)
+        img_b = self._image(s, view, light_b)
+        if img_a.shape[0] == 4:
+            mask = img_a[3:4].expand(3, -1, -1)
+        else:
+            mask = torch.ones_like(img_a[:3])
+        v = self.index["view_offsets"][s] + view
+        item = {
+            "img_a": 2 * (img_a[:3] * mask - 0.5),
+            "img_b": 2 * (img_b[:3] * mask - 0.5),
+            "mask": mask,
+            "c2w": torch.from_numpy(self.index["c2w"][v]),
+            "fov": torch.tensor(self.index["fov"][v]),
+            "scene": s,
+            "view": view,
+            "light_a": light_a,
+            "light_b": light_b,
+        }
+        if self.load_intrinsics:
+            for key in INTRINSICS:
+                item[key] = self._intrinsic(s, view, key)
+        return item
+
+    def _shard(self):
+        """Scenes of this (rank, worker), in a per-epoch random order shared by all workers."""
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+        order = np.random.default_rng((self.seed, self.epoch)).permutation(self.scenes)
+        num_shards = self.world_size * num_workers
+        return order[self.rank * num_workers + worker_id::num_shards], worker_id
+
+    def __iter__(self):
+        if self.images is None:
+            self.images = LRUCache(self.cache_items)
+            self.sources = LRUCache(self.open_scenes)
+        scenes, worker_id = self._shard()
+        rng = np.random.default_rng((self.seed, self.epoch, self.rank, worker_id))
+        # Drawing all samples of a scene in a row keeps its decoded images in the LRU
+        for s in scenes:
+            s = int(s)
+            valid = self._valid(s)
+            views = self._views_with_pairs(s)
+            for _ in range(self.samples_per_scene):
+                view = int(rng.choice(views))
+                light_a, light_b = rng.choice(np.flatnonzero(valid[view]), size=2, replace=False)
+                yield self.sample(s, view, int(light_a), int(light_b))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the throughput of DatasetRendered")
+    parser.add_argument("--root", type=str, required=True, help="Directory of rendered scenes (and scene packs)")
+    parser.add_argument("--split", type=str, default="train")
+    parser.add_argument("--resolution", type=int, nargs=2, default=None, help="Resize to H W")
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--num_batches", type=int, default=200)
+    parser.add_argument("--samples_per_scene", type=int, default=64)
+    parser.add_argument("--cache_items", type=int, default=512)
+    parser.add_argument("--load_intrinsics", action="store_true")
+    parser.add_argument("--rebuild_index", action="store_true")
+    args = parser.parse_args()
+
+    start = time.time()
+    dataset = DatasetRendered(args.root, args.split, resolution=args.resolution, samples_per_scene=args.samples_per_scene,
+                              load_intrinsics=args.load_intrinsics, cache_items=args.cache_items,
+                              rebuild_index=args.rebuild_index)
+    print(f"Index ready in {time.time() - start:.2f}s")
+    if args.resolution is None:
+        print("No --resolution given: scenes must all have the same image size to be batched")
+
+    # no persistent workers: set_epoch has to reach the worker copies of the dataset
+    loader = DataLoader(dataset, batch_size=args.batch_size, num_workers=args.num_workers)
+    for epoch in range(2):
+        dataset.set_epoch(epoch)
+        num_samples, start = 0, None
+        for i, batch in enumerate(loader):
+            if i == 0:
+                # the first batch includes the worker startup
+                start = time.time()
+                continue
+            num_samples += len(batch["scene"])
+            if i >= args.num_batches:
+                break
+        elapsed = time.time() - start if start is not None else 0.0
+        rate = num_samples / elapsed if elapsed > 0 else 0.0
+        print(f"Epoch {epoch}: {num_samples} samples in {elapsed:.2f}s, {rate:.1f} samples/sec")
@@ -1,11 +1,10 @@
-import objaverse
-print(objaverse.__version__)
-print('successfully imported objaverse')
 import os
+import sys
 import json
-import objaverse.xl as oxl
 import argparse
 
+from asset_download import HF_BASE_URL, AssetDownloader, object_path
+
 # Parse command-line arguments
 parser = argparse.ArgumentParser(description="Objaverse Loader Script with Custom Base Path")
 parser.add_argument(
@@ -32,14 +31,29 @@ parser.add_argument(
     default='all_objaverse_filtered_data.json', 
     help="which list to download, default is all_objaverse_filtered_data.json"
 )
+parser.add_argument(
+    "--num_workers", 
+    type=int, 
+    default=16, 
+    help="Number of concurrent downloads"
+)
+parser.add_argument(
+    "--base_url", 
+    type=str, 
+    default=HF_BASE_URL, 
+    help="URL of the hf-objaverse-v1 layout, e.g. a local mirror (python asset_download.py serve)"
+)
+parser.add_argument(
+    "--retries", 
+    type=int, 
+    default=3, 
+    help="Retries of a failed download, each resuming the partial file"
+)
 
 args = parser.parse_args()
 
-# Set base path
-objaverse.BASE_PATH = os.path.join(args.base_path, "objaverse")
-
-__version__ = "<REPLACE_WITH_VERSION>"
-objaverse._VERSIONED_PATH = os.path.join(objaverse.BASE_PATH, "hf-objaverse-v1")
+# Set base path, same layout as objaverse.load_objects
+download_dir = os.path.join(args.base_path, "objaverse", "hf-objaverse-v1")
 
 # uids = objaverse.load_uids()
 # print('successfully loaded uids')
@@ -47,9 +61,6 @@ objaverse._VERSIONED_PATH = os.path.join(objaverse.BASE_PATH, "hf-objaverse-v1")
 # print('successfully loaded annotations')
 # cc_by_uids = [uid for uid, annotation in annotations.items() if annotation["license"] == "by"]
 # print('successfully filtered cc by uids')
-import multiprocessing
-processes = multiprocessing.cpu_count()
-print(f'number of processes: {processes}')
 # Download a random sample of 100 object uids
 import random
 random.seed(42)
@@ -69,6 +80,8 @@ if args.obj_list.endswith('.json'):
     # Preview
     print(f"Loaded {len(index_uid_list)} entries")
     download_uids = index_uid_list[args.begin_uid:args.end_uid]
+    # uid -> relative path, e.g. "glbs/000-019/2d0dcf63909f40b0b4546726606414e7.glb"
+    download_paths = {uid: obj_list[uid] for uid in download_uids}
 
 elif args.obj_list.endswith('.csv'):
     import csv
@@ -84,9 +97,9 @@ elif args.obj_list.endswith('.csv'):
     print(f"Loaded {len(index_uid_list)} entries")
 
     download_uids = [uid for index, uid in index_uid_list[args.begin_uid:args.end_uid]]
-objects = objaverse.load_objects(
-    uids=download_uids,
-    download_processes=16,
-)
-print('successfully loaded objects')
-print(objects)
\ No newline at end of file
+    download_paths = {uid: object_path(index, uid) for index, uid in index_uid_list[args.begin_uid:args.end_uid]}
+downloader = AssetDownloader(download_dir, base_url=args.base_url, num_workers=args.num_workers, retries=args.retries)
+objects = downloader.download(download_paths)
+print(f'successfully loaded {len(objects)} of {len(download_uids)} objects')
+if len(objects) < len(download_uids):
+    sys.exit(1)
\ No newline at end of file
@@ -9,6 +9,9 @@
         --begin_uid 0 \
         --end_uid 100 \
         --download_processes 2
+
+    # 从本地镜像下载（python asset_download.py serve --root <镜像目录>）
+    python download_lvis.py --base_url http://localhost:8000/
 """
 
 import argparse
@@ -16,7 +19,7 @@ import csv
 import os
 import sys
 
-import objaverse
+from asset_download import HF_BASE_URL, AssetDownloader, object_path
 
 
 def parse_args():
@@ -51,7 +54,19 @@ def parse_args():
         "--download_processes",
         type=int,
         default=2,
-        help="下载进程数"
+        help="同时下载的文件数"
+    )
+    parser.add_argument(
+        "--base_url",
+        type=str,
+        default=HF_BASE_URL,
+        help="hf-objaverse-v1 目录结构的 URL，例如本地镜像"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="下载失败时的重试次数（从已下载的部分继续）"
     )
     return parser.parse_args()
 
@@ -59,13 +74,11 @@ def parse_args():
 def main():
     args = parse_args()
 
-    # 设置 objaverse 路径
-    objaverse.BASE_PATH = os.path.join(args.base_path, "objaverse")
-    objaverse._VERSIONED_PATH = os.path.join(objaverse.BASE_PATH, "hf-objaverse-v1")
+    # 与 objaverse.load_objects 相同的目录结构
+    download_dir = os.path.join(args.base_path, "objaverse", "hf-objaverse-v1")
 
-    print(f"Objaverse 版本: {objaverse.__version__}")
-    print(f"Base path: {objaverse.BASE_PATH}")
-    print(f"Versioned path: {objaverse._VERSIONED_PATH}")
+    print(f"Download dir: {download_dir}")
+    print(f"Base URL: {args.base_url}")
 
     # 读取 CSV 文件
     if not os.path.exists(args.csv_path):
@@ -95,21 +108,21 @@ def main():
         print(f"错误: begin_uid ({args.begin_uid}) >= end_uid ({args.end_uid})", file=sys.stderr)
         return 1
 
-    # 提取要下载的 UID 列表
-    download_uids = [uid for folder, uid in index_uid_list[args.begin_uid:args.end_uid]]
+    # 提取要下载的 UID 列表，CSV 中的 folder 给出了文件的相对路径
+    download_paths = {uid: object_path(folder, uid) for folder, uid in index_uid_list[args.begin_uid:args.end_uid]}
+    download_uids = list(download_paths)
 
     print(f"准备下载 {len(download_uids)} 个模型 (索引 {args.begin_uid} 到 {args.end_uid})")
-    print(f"下载进程数: {args.download_processes}")
+    print(f"同时下载的文件数: {args.download_processes}")
 
-    # 下载模型
+    # 下载模型（已存在的文件跳过，中断的下载会继续）
     try:
-        objects = objaverse.load_objects(
-            uids=download_uids,
-            download_processes=args.download_processes,
-        )
+        downloader = AssetDownloader(download_dir, base_url=args.base_url, num_workers=args.download_processes,
+                                     retries=args.retries)
+        objects = downloader.download(download_paths)
         print(f"成功下载 {len(objects)} 个对象")
         print(f"下载的对象: {list(objects.keys())[:10]}..." if len(objects) > 10 else f"下载的对象: {list(objects.keys())}")
-        return 0
+        return 0 if len(objects) == len(download_uids) else 1
     except Exception as e:
         print(f"下载过程中出错: {e}", file=sys.stderr)
         return 1
@@ -0,0 +1,153 @@
+"""Read-only envmap arena shared by preprocessing workers.
+
+All envmaps are packed into one memory-mapped data file with a name -> (offset, shape) index next to it
+(``<path>.json``). Workers map the file instead of inheriting per-envmap arrays from the parent, so every page is
+backed by the page cache once, whatever the number of workers; a forked copy-on-write dict of tensors instead gets
+its pages duplicated as soon as refcounts or tensor headers around them are touched.
+
+The index records the size and mtime of every source file (including the ones that could not be read), and a later
+run reuses the arena when they still match. The data file is named after these inputs (``<path stem>.<key><ext>``)
+and referenced by the index, which is replaced last: a reader always pairs an index with the data it was built with,
+even while another process rebuilds the arena. Data files of other inputs are removed after a rebuild; processes that
+already mapped one keep their mapping.
+
+    arena = EnvmapArena.build('envmaps.bin', {name: path}, read_fn, dtype='float16')
+    envmap = arena[name]    # [H, W, 3] view into the mapping
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from bpy_helper.checkpoint import atomic_replace, tmp_path_for
+
+
+def _source_stats(paths):
+    stats = {}
+    for name, path in paths.items():
+        st = os.stat(path)
+        stats[name] = [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def _data_name(path, dtype, stats):
+    """Name of the data file built from these sources, next to the index."""
+    key = hashlib.sha1(json.dumps([np.dtype(dtype).name, stats], sort_keys=True).encode()).hexdigest()[:16]
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return f'{stem}.{key}{ext}'
+
+
+def _remove_stale_data(path, data_name):
+    """Remove the data files of other inputs, and the unversioned data file of arenas built before them (at path)."""
+    stem, ext = os.path.splitext(os.path.abspath(path))
+    pattern = re.compile(re.escape(os.path.basename(stem)) + r'\.[0-9a-f]{16}' + re.escape(ext) + '$')
+    stale = [data_path for data_path in glob.glob(f'{glob.escape(stem)}.*{ext}')
+             if os.path.basename(data_path) != data_name and pattern.match(os.path.basename(data_path))]
+    for data_path in stale + [os.path.abspath(path)]:
+        try:
+            os.remove(data_path)
+        except FileNotFoundError:
+            pass
+
+
+class EnvmapArena:
+    """Memory-mapped envmaps, opened lazily in every process that reads them."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + '.json') as f:
+            index = json.load(f)
+        self.dtype = np.dtype(index['dtype'])
+        self.entries = {name: (offset, tuple(shape)) for name, (offset, shape) in index['entries'].items()}
+        self.sources = index.get('sources', {})
+        self.unreadable = index.get('unreadable', [])
+        # arenas built before the data file was versioned keep their data at path
+        self.data_path = os.path.join(os.path.dirname(os.path.abspath(path)), index.get('data', os.path.basename(path)))
+        self._data = None
+
+    @classmethod
+    def build(cls, path, paths, read_fn, dtype='float32', reuse=True):
+        """
+        Pack envmaps into an arena file, or reuse the existing one if it was built from the same files.
+
+        :param path: arena path, the index goes to path + '.json' and the data next to it
+        :param paths: dict envmap name -> source file
+        :param read_fn: reads a source file to an [H, W, C] float array, None if it cannot be read
+        :param dtype: 'float32' or 'float16'
+        :param reuse: reuse an up-to-date arena
+        :return: EnvmapArena
+        """
+
+        stats = _source_stats(paths)
+        if reuse and os.path.exists(path + '.json'):
+            arena = cls(path)
+            if arena.sources == stats and arena.dtype == np.dtype(dtype) and os.path.exists(arena.data_path):
+                print(f"Reusing envmap arena {path} ({len(arena)} envmaps)")
+                return arena
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        data_name = _data_name(path, dtype, stats)
+        data_path = os.path.join(dirname, data_name)
+        # per-process temporary files, concurrent builders do not write into each other's
+        tmp_path = tmp_path_for(f'{data_path}.{os.getpid()}')
+        entries, unreadable, offset = {}, [], 0
+        with open(tmp_path, 'wb') as f:
+            for name, source in paths.items():
+                envmap = read_fn(source)
+                if envmap is None:
+                    unreadable.append(name)
+                    continue
+                data = np.ascontiguousarray(envmap, dtype=dtype)
+                f.write(data.tobytes())
+                entries[name] = [offset, list(data.shape)]
+                offset += data.nbytes
+        atomic_replace(tmp_path, data_path)
+
+        # the index is replaced last, so an interrupted build is never reused and readers never see an index without
+        # its data
+        index_path = os.path.abspath(path) + '.json'
+        tmp_index_path = tmp_path_for(f'{index_path}.{os.getpid()}')
+        with open(tmp_index_path, 'w') as f:
+            json.dump({'dtype': np.dtype(dtype).name, 'data': data_name, 'entries': entries, 'sources': stats,
+                       'unreadable': unreadable}, f)
+        atomic_replace(tmp_index_path, index_path)
+        _remove_stale_data(path, data_name)
+        print(f"Packed {len(entries)} envmaps into {data_path} ({offset / 2 ** 30:.2f} GiB)"
+              + (f", {len(unreadable)} could not be read" if unreadable else ''))
+        return cls(path)
+
+    def __getstate__(self):
+        # spawned workers map the file themselves instead of receiving the data
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def _mapping(self):
+        # a mapping inherited through fork is reused as is
+        if self._data is None:
+            size = os.path.getsize(self.data_path)
+            # copy-on-write mode gives writable views (torch.from_numpy needs them) that never write to the file
+            self._data = np.memmap(self.data_path, dtype=np.uint8, mode='c', shape=(size,)) if size else np.zeros(0, np.uint8)
+        return self._data
+
+    def __getitem__(self, name):
+        offset, shape = self.entries[name]
+        nbytes = int(np.prod(shape)) * self.dtype.itemsize
+        return self._mapping()[offset:offset + nbytes].view(self.dtype).reshape(shape)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def items(self):
+        return ((name, self[name]) for name in self.entries)
@@ -0,0 +1,113 @@
+"""Paired LDR / log-HDR envmap codec.
+
+The preprocessing scripts (neuralGaufferRendering/scripts/preprocess_environment_map.py, preprocess_objaverse) store
+a linear HDR envmap ``raw`` as two 8-bit images:
+
+    ldr = uint8( clip(raw, 0, 1) ** (1/2.2) * 255 )
+    hdr = uint8( log1p(10*raw) / max_log * 255 ),   max_log = max(log1p(10*raw))
+
+``max_log`` is not stored. Decoding recovers it from the pixels whose LDR value is not saturated: there
+``log1p(10 * ldr_linear) / hdr_norm`` estimates ``max_log``, and the median over those pixels is used.
+
+Both inputs are 8-bit, so every per-pixel quantity is a function of one code (or of an (ldr, hdr) code pair) and is
+read from a lookup table. The median is taken from a 65536-bin histogram of the code pairs instead of sorting the
+pixels, and ``decode_batch`` decodes many envmaps with one histogram pass.
+"""
+
+import numpy as np
+
+LDR_GAMMA = 2.2
+HDR_SCALE = 10.0
+# LDR pixels outside (LOW, HIGH) in linear space, or with a normalized HDR value below HDR_MIN, do not take part in
+# the max_log estimate
+LDR_LINEAR_LOW = 0.01
+LDR_LINEAR_HIGH = 0.95
+HDR_NORM_MIN = 0.01
+FALLBACK_MAX_LOG = float(np.log1p(HDR_SCALE))
+
+_codes = np.arange(256, dtype=np.float64) / 255.0
+LDR_TO_LINEAR = (_codes ** LDR_GAMMA).astype(np.float32)
+HDR_TO_NORM = _codes.astype(np.float32)
+
+# max_log estimate of every (ldr code, hdr code) pair, flattened as ldr * 256 + hdr, sorted once for the medians
+_pair_valid = (
+    ((_codes ** LDR_GAMMA > LDR_LINEAR_LOW) & (_codes ** LDR_GAMMA < LDR_LINEAR_HIGH))[:, None]
+    & (_codes > HDR_NORM_MIN)[None, :]
+).ravel()
+with np.errstate(divide="ignore", invalid="ignore"):
+    _pair_ratio = (np.log1p(HDR_SCALE * _codes ** LDR_GAMMA)[:, None] / _codes[None, :]).ravel()
+_pair_order = np.flatnonzero(_pair_valid)[np.argsort(_pair_ratio[_pair_valid], kind="stable")]
+_pair_sorted = _pair_ratio[_pair_order]
+
+
+def _as_codes(img: np.ndarray, name: str) -> np.ndarray:
+    img = np.asarray(img)
+    if img.dtype != np.uint8:
+        raise ValueError(f"{name} must be 8-bit, got {img.dtype}")
+    return img[..., :3]
+
+
+def _median_from_counts(counts: np.ndarray) -> float:
+    """Median of the pair estimates, given how many valid pixels have each (ldr, hdr) code pair."""
+    cum = np.cumsum(counts[_pair_order])
+    n = int(cum[-1]) if len(cum) else 0
+    if n == 0:
+        return FALLBACK_MAX_LOG
+    # same as np.median: the mean of the two middle values for an even count
+    lo = np.searchsorted(cum, (n - 1) // 2, side="right")
+    hi = np.searchsorted(cum, n // 2, side="right")
+    return float((_pair_sorted[lo] + _pair_sorted[hi]) / 2)
+
+
+def estimate_max_log(hdr: np.ndarray, ldr: np.ndarray) -> float:
+    """Recover the max_log used to encode the hdr image, from an 8-bit (hdr, ldr) pair."""
+    pairs = _as_codes(ldr, "ldr").astype(np.int32) * 256 + _as_codes(hdr, "hdr")
+    return _median_from_counts(np.bincount(pairs.ravel(), minlength=256 * 256))
+
+
+def hdr_lut(max_log: float) -> np.ndarray:
+    """Linear value of every 8-bit hdr code for the given max_log (float32, 256 entries)."""
+    return (np.expm1(HDR_TO_NORM.astype(np.float64) * max_log) / HDR_SCALE).astype(np.float32)
+
+
+def decode(hdr: np.ndarray, ldr: np.ndarray) -> np.ndarray:
+    """Decode one 8-bit (hdr, ldr) pair to a linear float32 HDR envmap [H, W, 3]."""
+    hdr = _as_codes(hdr, "hdr")
+    return hdr_lut(estimate_max_log(hdr, ldr))[hdr]
+
+
+def decode_batch(hdr: np.ndarray, ldr: np.ndarray) -> np.ndarray:
+    """Decode a stack of 8-bit (hdr, ldr) pairs [N, H, W, C] to linear float32 HDR envmaps [N, H, W, 3]."""
+    hdr = _as_codes(hdr, "hdr")
+    ldr = _as_codes(ldr, "ldr")
+    n = hdr.shape[0]
+    pairs = (np.arange(n, dtype=np.int64)[:, None, None, None] * 65536 + ldr.astype(np.int64) * 256 + hdr)
+    counts = np.bincount(pairs.ravel(), minlength=n * 65536).reshape(n, 65536)
+    luts = np.stack([hdr_lut(_median_from_counts(c)) for c in counts])
+    return luts[np.arange(n)[:, None, None, None], hdr]
+
+
+def encode(raw: np.ndarray):
+    """Encode a linear HDR envmap [H, W, 3] as the 8-bit (hdr, ldr) pair. Returns (hdr, ldr, max_log)."""
+    raw = np.asarray(raw, dtype=np.float32)
+    ldr = np.uint8(raw.clip(0, 1) ** (1 / LDR_GAMMA) * 255)
+    log_hdr = np.log1p(HDR_SCALE * raw)
+    max_log = float(np.max(log_hdr))
+    hdr = np.uint8((log_hdr / max_log).clip(0, 1) * 255)
+    return hdr, ldr, max_log
+
+
+def encode_batch(raw: np.ndarray):
+    """Encode a stack of linear HDR envmaps [N, H, W, 3], each with its own max_log. Returns (hdr, ldr, max_log[N])."""
+    raw = np.asarray(raw, dtype=np.float32)
+    ldr = np.uint8(raw.clip(0, 1) ** (1 / LDR_GAMMA) * 255)
+    log_hdr = np.log1p(HDR_SCALE * raw)
+    max_log = log_hdr.reshape(len(raw), -1).max(axis=1)
+    hdr = np.uint8((log_hdr / max_log[:, None, None, None]).clip(0, 1) * 255)
+    return hdr, ldr, max_log
+
+
+def read_pair(hdr_path: str, ldr_path: str) -> np.ndarray:
+    """Read and decode an (hdr png, ldr png/jpg) pair from disk."""
+    import imageio.v3 as iio
+    return decode(iio.imread(hdr_path), iio.imread(ldr_path))
@@ -0,0 +1,263 @@
+"""Spherical-harmonic lighting descriptors of equirectangular envmaps.
+
+An envmap is projected once onto real SH up to ``order`` ((order + 1) ** 2 coefficients per color channel), using
+the per-pixel solid angles of ``generate_envir_map_dir`` in neuralGaufferRendering/scripts/preprocess_environment_map.py
+and the same pixel <-> direction mapping. A camera then only rotates the coefficients: the rotation matrices of all
+bands are built analytically (Ivanic & Ruedenberg recurrence, vectorized over cameras) instead of resampling the
+envmap, so a per-view lighting vector takes microseconds to compute and (order + 1) ** 2 * 3 floats to store.
+
+    coeffs = project(envmap, order=3)                  # [16, 3]
+    view_coeffs = rotate(coeffs, view_rotation(w2c))   # [V, 16, 3] for w2c [V, 3, 4]
+
+``view_rotation`` follows ``rotate_and_preprcess_envir_map``: the rotated coefficients are those of the rotated
+envmap that preprocess_environment_map.py writes for the view.
+
+Project the Poly Haven HDRIs listed by the renderers:
+    python envmap_sh.py --env_map_dir <hdris> --output assets/hdri/polyhaven_sh.npz --order 3 --num_workers 8
+"""
+
+import argparse
+import functools
+import json
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+from bpy_helper.checkpoint import atomic_replace, tmp_path_for
+
+# Blender's convention, as in rotate_and_preprcess_envir_map
+AXIS_ALIGNED_TRANSFORM = np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]], dtype=np.float64)
+
+
+def num_coeffs(order: int) -> int:
+    return (order + 1) ** 2
+
+
+def envmap_directions(envmap_h: int, envmap_w: int):
+    """
+    Pixel directions and solid angles of an equirectangular envmap, numpy version of generate_envir_map_dir.
+
+    :param envmap_h: envmap height
+    :param envmap_w: envmap width
+    :return: (directions [H, W, 3], solid angles [H, W] summing to 4 pi)
+    """
+
+    lat_step_size = np.pi / envmap_h
+    lng_step_size = 2 * np.pi / envmap_w
+    theta, phi = np.meshgrid(np.linspace(np.pi / 2 - 0.5 * lat_step_size, -np.pi / 2 + 0.5 * lat_step_size, envmap_h),
+                             np.linspace(np.pi - 0.5 * lng_step_size, -np.pi + 0.5 * lng_step_size, envmap_w), indexing='ij')
+    sin_theta = np.sin(np.pi / 2 - theta)
+    light_area_weight = 4 * np.pi * sin_theta / np.sum(sin_theta)
+    view_dirs = np.stack([np.cos(phi) * np.cos(theta), np.sin(phi) * np.cos(theta), np.sin(theta)], axis=-1)
+    return view_dirs, light_area_weight
+
+
+def sh_basis(dirs: np.ndarray, order: int) -> np.ndarray:
+    """
+    Real SH basis (orthonormal, without the Condon-Shortley phase) at unit directions.
+
+    :param dirs: [..., 3] unit directions
+    :param order: maximum band
+    :return: [..., (order + 1) ** 2], coefficient l * (l + 1) + m holds Y_l^m
+    """
+
+    dirs = np.asarray(dirs, dtype=np.float64)
+    x, y, z = dirs[..., 0], dirs[..., 1], dirs[..., 2]
+    out = np.empty(dirs.shape[:-1] + (num_coeffs(order),), dtype=np.float64)
+
+    # cos(m phi) sin^m(theta) and sin(m phi) sin^m(theta) as polynomials of x, y
+    cos_m, sin_m = [np.ones_like(x)], [np.zeros_like(x)]
+    for m in range(1, order + 1):
+        c, s = cos_m[-1], sin_m[-1]
+        cos_m.append(c * x - s * y)
+        sin_m.append(s * x + c * y)
+
+    for m in range(order + 1):
+        # associated Legendre P_l^m(z) / sin^m(theta), without the (-1)^m phase
+        p_mm = np.full_like(z, float(np.prod(np.arange(1, 2 * m, 2))) if m else 1.0)
+        p_prev, p = None, p_mm
+        for l in range(m, order + 1):
+            if l == m + 1:
+                p_prev, p = p, (2 * m + 1) * z * p
+            elif l > m + 1:
+                p_prev, p = p, ((2 * l - 1) * z * p - (l + m - 1) * p_prev) / (l - m)
+            k = math.sqrt((2 * l + 1) / (4 * math.pi) * math.factorial(l - m) / math.factorial(l + m))
+            if m == 0:
+                out[..., l * (l + 1)] = k * p
+            else:
+                out[..., l * (l + 1) + m] = math.sqrt(2) * k * p * cos_m[m]
+                out[..., l * (l + 1) - m] = math.sqrt(2) * k * p * sin_m[m]
+    return out
+
+
+def project(envmap: np.ndarray, order: int = 3) -> np.ndarray:
+    """
+    Project a linear HDR envmap onto SH, weighting every pixel by its solid angle.
+
+    :param envmap: [H, W, C] equirectangular envmap
+    :param order: maximum band
+    :return: [(order + 1) ** 2, C] float32 coefficients
+    """
+
+    envmap = np.asarray(envmap, dtype=np.float64)
+    view_dirs, light_area_weight = envmap_directions(envmap.shape[0], envmap.shape[1])
+    basis = sh_basis(view_dirs, order) * light_area_weight[..., None]
+    return np.einsum('hwk,hwc->kc', basis, envmap).astype(np.float32)
+
+
+def evaluate(coeffs: np.ndarray, envmap_h: int, envmap_w: int) -> np.ndarray:
+    """Reconstruct an [H, W, C] envmap from its SH coefficients, e.g. to look at a descriptor."""
+    order = int(round(math.sqrt(len(coeffs)))) - 1
+    view_dirs, _ = envmap_directions(envmap_h, envmap_w)
+    return (sh_basis(view_dirs, order) @ np.asarray(coeffs, dtype=np.float64)).astype(np.float32)
+
+
+@functools.lru_cache(maxsize=None)
+def _band_tables(l):
+    """Coefficients u, v, w [2l+1, 2l+1] of the band l recurrence and the rows (index a + l) and factors of the
+    P(1, a, n) / P(-1, a, n) terms that make up V and W."""
+    m = np.arange(-l, l + 1)[:, None]
+    n = np.arange(-l, l + 1)[None, :]
+    d = (m == 0).astype(np.float64)
+    denom = np.where(np.abs(n) < l, (l + n) * (l - n), 2 * l * (2 * l - 1)).astype(np.float64)
+    u = np.sqrt((l + m) * (l - m) / denom)
+    v = 0.5 * np.sqrt((1 + d) * (l + np.abs(m) - 1) * (l + np.abs(m)) / denom) * (1 - 2 * d)
+    w = -0.5 * np.sqrt(np.maximum(l - np.abs(m) - 1, 0) * (l - np.abs(m)) / denom) * (1 - d)
+
+    m = m[:, 0]
+    v_rows = np.where(m == 0, 1, np.where(m > 0, m - 1, m + 1)), np.where(m == 0, -1, np.where(m > 0, -m + 1, -m - 1))
+    v_factors = (np.where(m == 0, 1.0, np.where(m > 0, np.sqrt(1 + (m == 1)), 1.0 - (m == -1))),
+                 np.where(m == 0, 1.0, np.where(m > 0, -(1.0 - (m == 1)), np.sqrt(1 + (m == -1)))))
+    w_rows = np.where(m > 0, m + 1, m - 1), np.where(m > 0, -m - 1, -m + 1)
+    w_factors = np.ones(len(m)), np.where(m > 0, 1.0, -1.0)
+    # rows outside the band only occur where the coefficient is 0
+    clip = lambda rows: np.clip(rows + l, 0, 2 * l)
+    return (u, v, w, clip(v_rows[0]), v_factors[0][:, None], clip(v_rows[1]), v_factors[1][:, None],
+            clip(w_rows[0]), w_factors[0][:, None], clip(w_rows[1]), w_factors[1][:, None])
+
+
+def rotation_matrices(rotations: np.ndarray, order: int) -> np.ndarray:
+    """
+    SH rotation matrices (block diagonal, one Wigner-D block per band) of a batch of 3x3 rotations.
+
+    For f'(d) = f(R^T d), the coefficients are ``coeffs' = D(R) @ coeffs``.
+
+    :param rotations: [3, 3] or [V, 3, 3] rotation matrices
+    :param order: maximum band
+    :return: [(order + 1) ** 2] ** 2 or [V, (order + 1) ** 2, (order + 1) ** 2]
+    """
+
+    rotations = np.asarray(rotations, dtype=np.float64)
+    single = rotations.ndim == 2
+    rotations = rotations.reshape(-1, 3, 3)
+    num = len(rotations)
+    out = np.zeros((num, num_coeffs(order), num_coeffs(order)), dtype=np.float64)
+    out[:, 0, 0] = 1.0
+    if order >= 1:
+        # band 1 is (y, z, x)
+        r1 = rotations[:, [1, 2, 0]][:, :, [1, 2, 0]]
+        out[:, 1:4, 1:4] = r1
+        prev = r1
+
+    for l in range(2, order + 1):
+        u, v, w, v_rows0, v_factors0, v_rows1, v_factors1, w_rows0, w_factors0, w_rows1, w_factors1 = _band_tables(l)
+        # P(i, a, b) for i = -1, 0, 1, rows a = -l..l (zero outside band l - 1) and columns b = -l..l
+        p = np.zeros((num, 3, 2 * l + 1, 2 * l + 1), dtype=np.float64)
+        r_minus, r_zero, r_plus = r1[:, :, 0, None], r1[:, :, 1, None, None], r1[:, :, 2, None]
+        p[:, :, 1:-1, 1:-1] = r_zero * prev[:, None]
+        p[:, :, 1:-1, -1] = r_plus * prev[:, None, :, -1] - r_minus * prev[:, None, :, 0]
+        p[:, :, 1:-1, 0] = r_plus * prev[:, None, :, 0] + r_minus * prev[:, None, :, -1]
+        p_minus, p_zero, p_plus = p[:, 0], p[:, 1], p[:, 2]
+
+        band = u * p_zero
+        band += v * (p_plus[:, v_rows0] * v_factors0 + p_minus[:, v_rows1] * v_factors1)
+        band += w * (p_plus[:, w_rows0] * w_factors0 + p_minus[:, w_rows1] * w_factors1)
+        out[:, l * l:(l + 1) ** 2, l * l:(l + 1) ** 2] = band
+        prev = band
+    return out[0] if single else out
+
+
+def view_rotation(w2c: np.ndarray) -> np.ndarray:
+    """Rotation that takes the envmap to the view of camera(s) w2c [..., 3 or 4, 4], as in rotate_and_preprcess_envir_map."""
+    w2c = np.asarray(w2c, dtype=np.float64)
+    return AXIS_ALIGNED_TRANSFORM @ w2c[..., :3, :3]
+
+
+def rotate(coeffs: np.ndarray, rotations: np.ndarray) -> np.ndarray:
+    """
+    Rotate SH coefficients: f'(d) = f(R^T d).
+
+    :param coeffs: [(order + 1) ** 2, C]
+    :param rotations: [3, 3] or [V, 3, 3]
+    :return: [(order + 1) ** 2, C] or [V, (order + 1) ** 2, C] float32
+    """
+
+    coeffs = np.asarray(coeffs)
+    order = int(round(math.sqrt(len(coeffs)))) - 1
+    return (rotation_matrices(rotations, order) @ coeffs.astype(np.float64)).astype(np.float32)
+
+
+def _downsample(envmap, max_height):
+    """Box-filter a large envmap to at most max_height rows (integer factor), enough for a low order projection."""
+    factor = max(1, envmap.shape[0] // max_height)
+    while factor > 1 and (envmap.shape[0] % factor or envmap.shape[1] % factor):
+        factor -= 1
+    if factor == 1:
+        return envmap
+    h, w, c = envmap.shape
+    return envmap.reshape(h // factor, factor, w // factor, factor, c).mean(axis=(1, 3))
+
+
+def _project_file(job):
+    name, path, order, max_height = job
+    import exr_io
+
+    try:
+        envmap = exr_io.read_exr(path)[..., :3]
+    except exr_io.UnsupportedCompression:
+        import imageio.v3 as imageio
+        envmap = imageio.imread(path)[..., :3]
+    except OSError as e:
+        print(f"Error reading {path}: {e}")
+        return name, None
+    return name, project(_downsample(envmap.astype(np.float32), max_height), order)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project the Poly Haven HDRIs onto spherical harmonics")
+    parser.add_argument('--env_map_list_json', type=str, default='./assets/hdri/polyhaven_hdris.json')
+    parser.add_argument('--env_map_dir', type=str, required=True)
+    parser.add_argument('--pattern', type=str, default='{}_8k.exr', help="File name of an HDRI, {} is its name")
+    parser.add_argument('--output', type=str, default='./assets/hdri/polyhaven_sh.npz')
+    parser.add_argument('--order', type=int, default=3)
+    parser.add_argument('--max_height', type=int, default=256, help="HDRIs are box-filtered to at most this height")
+    parser.add_argument('--num_workers', type=int, default=8)
+    args = parser.parse_args()
+
+    with open(args.env_map_list_json) as f:
+        names = json.load(f)
+    jobs = [(name, os.path.join(args.env_map_dir, args.pattern.format(name)), args.order, args.max_height) for name in names]
+    jobs = [job for job in jobs if os.path.exists(job[1])]
+    print(f"Projecting {len(jobs)} of {len(names)} HDRIs onto order {args.order} SH")
+
+    results = {}
+    with multiprocessing.Pool(args.num_workers) as pool:
+        for i, (name, coeffs) in enumerate(pool.imap_unordered(_project_file, jobs)):
+            if coeffs is not None:
+                results[name] = coeffs
+            if (i + 1) % 50 == 0:
+                print(f"{i + 1}/{len(jobs)}")
+
+    names = sorted(results)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmp_path = tmp_path_for(os.path.abspath(args.output))
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, names=np.array(names), coeffs=np.stack([results[name] for name in names]), order=args.order)
+    atomic_replace(tmp_path, args.output)
+    print(f"Wrote {len(names)} SH descriptors to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
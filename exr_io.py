@@ -0,0 +1,676 @@
+"""Pure-numpy OpenEXR reader / writer for the tools that run outside Blender.
+
+Supports single-part scanline images with HALF, FLOAT or UINT channels (no subsampling):
+
+    read   NONE, RLE, ZIPS, ZIP, PIZ
+    write  NONE, ZIPS, ZIP
+
+Files are memory-mapped and chunks are decompressed in a thread pool (zlib releases the GIL); uncompressed files are
+decoded straight from the memory map. Only numpy and the standard library are needed, so no imageio EXR plugin,
+FreeImage download, pyexr or OpenCV build flag.
+
+    img = read_exr(path)                      # [H, W, C] float32, channels ordered R, G, B, A (or Y)
+    channels = read_exr_channels(path)        # name -> [H, W] array in the stored type
+    write_exr(path, img, pixel_type='half', compression='zip')
+
+Benchmark against the other installed backends:
+    python exr_io.py --size 1024
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bpy_helper.checkpoint import atomic_replace, tmp_path_for
+
+MAGIC = 20000630
+VERSION = 2
+TILED_FLAG = 0x200
+LONG_NAMES_FLAG = 0x400
+NON_IMAGE_FLAG = 0x800
+MULTIPART_FLAG = 0x1000
+
+PIXEL_TYPES = {0: np.dtype('<u4'), 1: np.dtype('<f2'), 2: np.dtype('<f4')}
+PIXEL_TYPE_IDS = {'uint': 0, 'half': 1, 'float': 2}
+COMPRESSIONS = {0: 'none', 1: 'rle', 2: 'zips', 3: 'zip', 4: 'piz', 5: 'pxr24', 6: 'b44', 7: 'b44a', 8: 'dwaa', 9: 'dwab'}
+COMPRESSION_IDS = {name: i for i, name in COMPRESSIONS.items()}
+LINES_PER_CHUNK = {'none': 1, 'rle': 1, 'zips': 1, 'zip': 16, 'piz': 32}
+WRITE_COMPRESSIONS = ('none', 'zips', 'zip')
+
+# channel order of the arrays returned by read_exr
+CHANNEL_ORDER = ('R', 'G', 'B', 'A', 'Y')
+
+
+class UnsupportedCompression(ValueError):
+    """The file uses a compression exr_io does not decode (PXR24, B44, DWA); fall back to another backend."""
+
+
+# --------------------------------------------------------------------------- #
+# Header                                                                      #
+# --------------------------------------------------------------------------- #
+
+
+def _read_cstr(buf, pos):
+    end = buf.find(b'\0', pos)
+    return bytes(buf[pos:end]).decode('latin-1'), end + 1
+
+
+def _parse_channels(value):
+    channels, pos = [], 0
+    while value[pos:pos + 1] != b'\0':
+        name, pos = _read_cstr(value, pos)
+        pixel_type, _p_linear, x_sampling, y_sampling = struct.unpack_from('<iB3xii', value, pos)
+        pos += 16
+        channels.append({'name': name, 'type': pixel_type, 'x_sampling': x_sampling, 'y_sampling': y_sampling})
+    return channels
+
+
+def _parse_header(buf):
+    magic, version = struct.unpack_from('<ii', buf, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an OpenEXR file")
+    if version & 0xff != VERSION:
+        raise ValueError(f"Unsupported OpenEXR version {version & 0xff}")
+    if version & (TILED_FLAG | NON_IMAGE_FLAG | MULTIPART_FLAG):
+        raise ValueError("Only single-part scanline OpenEXR files are supported")
+
+    header, pos = {}, 8
+    while buf[pos:pos + 1] != b'\0':
+        name, pos = _read_cstr(buf, pos)
+        type_name, pos = _read_cstr(buf, pos)
+        size, = struct.unpack_from('<i', buf, pos)
+        pos += 4
+        value = bytes(buf[pos:pos + size])
+        pos += size
+        if type_name == 'chlist':
+            header[name] = _parse_channels(value)
+        elif type_name == 'compression':
+            header[name] = COMPRESSIONS.get(value[0], str(value[0]))
+        elif type_name == 'box2i':
+            header[name] = struct.unpack('<iiii', value)
+        elif type_name == 'lineOrder':
+            header[name] = value[0]
+        elif type_name == 'float':
+            header[name] = struct.unpack('<f', value)[0]
+        elif type_name == 'int':
+            header[name] = struct.unpack('<i', value)[0]
+        elif type_name == 'v2f':
+            header[name] = struct.unpack('<ff', value)
+        elif type_name == 'string':
+            header[name] = value.decode('latin-1')
+        else:
+            header[name] = value
+    header['_offset_table'] = pos + 1
+    return header
+
+
+def read_header(path):
+    """Header attributes of an EXR file (channels, compression, dataWindow, ...)."""
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return _parse_header(buf)
+        finally:
+            buf.close()
+
+
+# --------------------------------------------------------------------------- #
+# ZIP / RLE                                                                   #
+# --------------------------------------------------------------------------- #
+
+
+def _unpredict_and_interleave(data):
+    """Undo the byte predictor and the even/odd byte split applied before ZIP and RLE compression."""
+    t = np.frombuffer(data, dtype=np.uint8).copy()
+    t[1:] -= 128
+    t = np.cumsum(t, dtype=np.uint8)
+    out = np.empty_like(t)
+    half = (len(t) + 1) // 2
+    out[0::2] = t[:half]
+    out[1::2] = t[half:]
+    return out
+
+
+def _split_and_predict(data):
+    t = np.frombuffer(data, dtype=np.uint8)
+    t = np.concatenate([t[0::2], t[1::2]])
+    out = t.copy()
+    out[1:] = t[1:] - t[:-1] + 128
+    return out.tobytes()
+
+
+def _rle_decompress(data, raw_size):
+    out = bytearray()
+    src = np.frombuffer(data, dtype=np.int8)
+    pos = 0
+    while pos < len(src):
+        count = int(src[pos])
+        if count < 0:
+            out += data[pos + 1:pos + 1 - count]
+            pos += 1 - count
+        else:
+            out += bytes((data[pos + 1],)) * (count + 1)
+            pos += 2
+    if len(out) != raw_size:
+        raise ValueError("Corrupt RLE chunk")
+    return bytes(out)
+
+
+# --------------------------------------------------------------------------- #
+# PIZ (Huffman + Haar wavelet + LUT)                                          #
+# --------------------------------------------------------------------------- #
+
+HUF_ENCBITS = 16
+HUF_DECBITS = 14
+HUF_ENCSIZE = (1 << HUF_ENCBITS) + 1
+HUF_DECMASK = (1 << HUF_DECBITS) - 1
+SHORT_ZEROCODE_RUN = 59
+LONG_ZEROCODE_RUN = 63
+SHORTEST_LONG_RUN = 2 + LONG_ZEROCODE_RUN - SHORT_ZEROCODE_RUN
+BITMAP_SIZE = 1 << 13
+
+
+def _huf_unpack_enc_table(data, pos, im, iM):
+    """Code lengths of the symbols im..iM, followed by the canonical codes (code << 6 | length)."""
+    hcode = np.zeros(HUF_ENCSIZE, dtype=np.int64)
+    c = lc = 0
+    while im <= iM:
+        while lc < 6:
+            c = ((c << 8) | data[pos]) & 0xffffffff
+            pos += 1
+            lc += 8
+        lc -= 6
+        length = (c >> lc) & 63
+        if length == LONG_ZEROCODE_RUN:
+            while lc < 8:
+                c = ((c << 8) | data[pos]) & 0xffffffff
+                pos += 1
+                lc += 8
+            lc -= 8
+            zerun = ((c >> lc) & 0xff) + SHORTEST_LONG_RUN
+            if im + zerun > iM + 1:
+                raise ValueError("Corrupt PIZ Huffman table")
+            im += zerun
+        elif length >= SHORT_ZEROCODE_RUN:
+            zerun = length - SHORT_ZEROCODE_RUN + 2
+            if im + zerun > iM + 1:
+                raise ValueError("Corrupt PIZ Huffman table")
+            im += zerun
+        else:
+            hcode[im] = length
+            im += 1
+
+    # canonical codes: the shortest codes get the highest code values
+    counts = np.bincount(hcode, minlength=59)[:59]
+    start = np.zeros(59, dtype=np.int64)
+    c = 0
+    for length in range(58, 0, -1):
+        start[length] = c
+        c = (c + counts[length]) >> 1
+    lengths = hcode
+    codes = np.zeros(HUF_ENCSIZE, dtype=np.int64)
+    for symbol in np.flatnonzero(lengths):
+        length = lengths[symbol]
+        codes[symbol] = start[length]
+        start[length] += 1
+    return codes, lengths, pos
+
+
+def _huf_decode(data, pos, n_bits, codes, lengths, rlc, n_raw):
+    """Decode n_raw symbols; symbol rlc is followed by an 8-bit count of repetitions of the previous symbol."""
+    dec_len = np.zeros(1 << HUF_DECBITS, dtype=np.int64)
+    dec_lit = np.zeros(1 << HUF_DECBITS, dtype=np.int64)
+    long_codes = {}
+    for symbol in np.flatnonzero(lengths):
+        length, code = int(lengths[symbol]), int(codes[symbol])
+        if code >> length:
+            raise ValueError("Corrupt PIZ Huffman code")
+        if length > HUF_DECBITS:
+            long_codes.setdefault(code >> (length - HUF_DECBITS), []).append((int(symbol), length, code))
+        else:
+            first = code << (HUF_DECBITS - length)
+            dec_len[first:first + (1 << (HUF_DECBITS - length))] = length
+            dec_lit[first:first + (1 << (HUF_DECBITS - length))] = symbol
+    dec_len = dec_len.tolist()
+    dec_lit = dec_lit.tolist()
+
+    out = np.empty(n_raw, dtype=np.uint16)
+    n_out = 0
+    c = lc = 0
+    end = pos + (n_bits + 7) // 8
+
+    def emit(symbol):
+        nonlocal c, lc, n_out, pos
+        if symbol == rlc:
+            if lc < 8:
+                c = (c << 8) | data[pos]
+                pos += 1
+                lc += 8
+            lc -= 8
+            count = (c >> lc) & 0xff
+            if n_out + count > n_raw or n_out < 1:
+                raise ValueError("Corrupt PIZ data")
+            out[n_out:n_out + count] = out[n_out - 1]
+            n_out += count
+        else:
+            if n_out >= n_raw:
+                raise ValueError("Corrupt PIZ data")
+            out[n_out] = symbol
+            n_out += 1
+
+    while pos < end:
+        c = ((c << 8) | data[pos]) & 0xffffffffffff
+        pos += 1
+        lc += 8
+        while lc >= HUF_DECBITS:
+            index = (c >> (lc - HUF_DECBITS)) & HUF_DECMASK
+            length = dec_len[index]
+            if length:
+                lc -= length
+                emit(dec_lit[index])
+                continue
+            for symbol, length, code in long_codes.get(index, ()):
+                while lc < length and pos < end:
+                    c = ((c << 8) | data[pos]) & 0xffffffffffffffff
+                    pos += 1
+                    lc += 8
+                if lc >= length and ((c >> (lc - length)) & ((1 << length) - 1)) == code:
+                    lc -= length
+                    emit(symbol)
+                    break
+            else:
+                raise ValueError("Corrupt PIZ data: unknown Huffman code")
+
+    # the remaining bits hold short codes
+    i = (8 - n_bits) & 7
+    c >>= i
+    lc -= i
+    while lc > 0:
+        index = (c << (HUF_DECBITS - lc)) & HUF_DECMASK
+        length = dec_len[index]
+        if not length:
+            raise ValueError("Corrupt PIZ data")
+        lc -= length
+        emit(dec_lit[index])
+    if n_out != n_raw:
+        raise ValueError("Corrupt PIZ data: wrong number of values")
+    return out
+
+
+def _huf_uncompress(data, pos, n_compressed, n_raw):
+    if n_compressed == 0:
+        if n_raw:
+            raise ValueError("Corrupt PIZ data")
+        return np.zeros(0, dtype=np.uint16)
+    im, iM, _table_length, n_bits = struct.unpack_from('<IIII', data, pos)
+    if im >= HUF_ENCSIZE or iM >= HUF_ENCSIZE:
+        raise ValueError("Corrupt PIZ Huffman header")
+    codes, lengths, table_end = _huf_unpack_enc_table(data, pos + 20, im, iM)
+    if n_bits > 8 * (n_compressed - (table_end - pos)):
+        raise ValueError("Corrupt PIZ data")
+    return _huf_decode(data, table_end, n_bits, codes, lengths, iM, n_raw)
+
+
+def _wdec14(l, h):
+    ls = l.astype(np.int16).astype(np.int32)
+    hs = h.astype(np.int16).astype(np.int32)
+    ai = ls + (hs & 1) + (hs >> 1)
+    return ai.astype(np.uint16), (ai - hs).astype(np.uint16)
+
+
+def _wdec16(l, h):
+    m = l.astype(np.int32)
+    d = h.astype(np.int32)
+    b = (m - (d >> 1)) & 0xffff
+    a = (d + b - (1 << 15)) & 0xffff
+    return a.astype(np.uint16), b.astype(np.uint16)
+
+
+def _wav2_decode(a, max_value):
+    """Inverse 2D Haar wavelet of a [ny, nx] uint16 array, in place (vectorized over the blocks of each level)."""
+    ny, nx = a.shape
+    wdec = _wdec14 if max_value < (1 << 14) else _wdec16
+    n = min(nx, ny)
+    p = 1
+    while p <= n:
+        p <<= 1
+    p >>= 1
+    p2 = p
+    p >>= 1
+    while p >= 1:
+        rows = (ny - p2) // p2 + 1
+        cols = (nx - p2) // p2 + 1
+        y_end, x_end = rows * p2, cols * p2
+        ys, xs = slice(0, y_end, p2), slice(0, x_end, p2)
+        ys1, xs1 = slice(p, y_end, p2), slice(p, x_end, p2)
+
+        i00, i10 = wdec(a[ys, xs], a[ys1, xs])
+        i01, i11 = wdec(a[ys, xs1], a[ys1, xs1])
+        a[ys, xs], a[ys, xs1] = wdec(i00, i01)
+        a[ys1, xs], a[ys1, xs1] = wdec(i10, i11)
+
+        if nx & p:
+            a[ys, x_end], a[ys1, x_end] = wdec(a[ys, x_end], a[ys1, x_end])
+        if ny & p:
+            a[y_end, xs], a[y_end, xs1] = wdec(a[y_end, xs], a[y_end, xs1])
+
+        p2 = p
+        p >>= 1
+
+
+def _piz_decompress(data, channels, width, num_lines):
+    """Decompress a PIZ chunk to the raw scanline bytes of its lines."""
+    sizes = [PIXEL_TYPES[ch['type']].itemsize // 2 for ch in channels]
+    n_raw = sum(width * num_lines * size for size in sizes)
+
+    min_non_zero, max_non_zero = struct.unpack_from('<HH', data, 0)
+    pos = 4
+    if max_non_zero >= BITMAP_SIZE:
+        raise ValueError("Corrupt PIZ bitmap")
+    bitmap = np.zeros(BITMAP_SIZE, dtype=np.uint8)
+    if min_non_zero <= max_non_zero:
+        count = max_non_zero - min_non_zero + 1
+        bitmap[min_non_zero:max_non_zero + 1] = np.frombuffer(data, dtype=np.uint8, count=count, offset=pos)
+        pos += count
+
+    # values present in the bitmap (0 always is) are numbered 0..max_value, the LUT maps them back
+    present = np.unpackbits(bitmap, bitorder='little').astype(bool)
+    present[0] = True
+    lut = np.flatnonzero(present).astype(np.uint16)
+    max_value = len(lut) - 1
+
+    length, = struct.unpack_from('<i', data, pos)
+    pos += 4
+    values = _huf_uncompress(data, pos, length, n_raw)
+
+    planes, offset = [], 0
+    for size in sizes:
+        plane = values[offset:offset + width * num_lines * size].reshape(num_lines, width, size)
+        offset += plane.size
+        for j in range(size):
+            component = np.ascontiguousarray(plane[..., j])
+            _wav2_decode(component, max_value)
+            plane[..., j] = component
+        planes.append(lut[plane])
+
+    # planar per channel -> scanline order (line, channel, pixel)
+    lines = [np.concatenate([plane[y].reshape(-1) for plane in planes]) for y in range(num_lines)]
+    return np.concatenate(lines).astype('<u2').tobytes()
+
+
+# --------------------------------------------------------------------------- #
+# Reading                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+def _decode_chunk(buf, offset, header, channels, width, y_min, y_max):
+    y, size = struct.unpack_from('<ii', buf, offset)
+    num_lines = min(LINES_PER_CHUNK[header['compression']], y_max - y + 1)
+    raw_size = num_lines * width * sum(PIXEL_TYPES[ch['type']].itemsize for ch in channels)
+    data = buf[offset + 8:offset + 8 + size]
+    compression = header['compression']
+    if size == raw_size or compression == 'none':
+        raw = data
+    elif compression in ('zip', 'zips'):
+        raw = _unpredict_and_interleave(zlib.decompress(data))
+    elif compression == 'rle':
+        raw = _unpredict_and_interleave(_rle_decompress(data, raw_size))
+    elif compression == 'piz':
+        raw = _piz_decompress(data, channels, width, num_lines)
+    else:
+        raise ValueError(f"Unsupported compression {compression}")
+    return y - y_min, num_lines, raw
+
+
+def read_exr_channels(path, channels=None, num_threads=None):
+    """
+    Read the channels of an EXR file.
+
+    :param path: EXR file, or its contents as bytes
+    :param channels: names of the channels to return, default is all
+    :param num_threads: decompression threads, default is min(8, cpu count)
+    :return: dict channel name -> [H, W] array in the stored pixel type (float16, float32 or uint32)
+    """
+
+    if isinstance(path, (bytes, bytearray)):
+        buf, path = path, '<bytes>'
+    else:
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        header = _parse_header(buf)
+        compression = header['compression']
+        if compression not in LINES_PER_CHUNK:
+            raise UnsupportedCompression(f"Unsupported compression {compression} in {path}")
+        file_channels = header['channels']
+        if any(ch['x_sampling'] != 1 or ch['y_sampling'] != 1 for ch in file_channels):
+            raise ValueError(f"Subsampled channels are not supported: {path}")
+        x_min, y_min, x_max, y_max = header['dataWindow']
+        width, height = x_max - x_min + 1, y_max - y_min + 1
+        lines_per_chunk = LINES_PER_CHUNK[compression]
+        num_chunks = (height + lines_per_chunk - 1) // lines_per_chunk
+        offsets = np.frombuffer(buf, dtype='<u8', count=num_chunks, offset=header['_offset_table']).tolist()
+
+        wanted = [ch['name'] for ch in file_channels] if channels is None else list(channels)
+        missing = set(wanted) - {ch['name'] for ch in file_channels}
+        if missing:
+            raise KeyError(f"Channels {sorted(missing)} not in {path}")
+
+        # one structured record per scanline: every channel is a [width] field
+        line_dtype = np.dtype([(ch['name'], PIXEL_TYPES[ch['type']], (width,)) for ch in file_channels])
+        out = {name: np.empty((height, width), dtype=line_dtype[name].base) for name in wanted}
+
+        def decode(offset):
+            row, num_lines, raw = _decode_chunk(buf, offset, header, file_channels, width, y_min, y_max)
+            lines = np.frombuffer(raw, dtype=line_dtype, count=num_lines)
+            for name in wanted:
+                out[name][row:row + num_lines] = lines[name]
+
+        num_threads = num_threads or min(8, os.cpu_count() or 1)
+        if compression == 'none' or num_threads <= 1 or num_chunks == 1:
+            for offset in offsets:
+                decode(offset)
+        else:
+            with ThreadPoolExecutor(max_workers=num_threads) as pool:
+                list(pool.map(decode, offsets))
+        return out
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+
+def read_exr(path, dtype=np.float32, num_threads=None):
+    """
+    Read an EXR file as an [H, W, C] array, channels ordered R, G, B, A (then Y and any other channel by name).
+
+    :param path: EXR file, or its contents as bytes
+    :param dtype: output dtype, None keeps the stored pixel type (all channels must share it)
+    :param num_threads: decompression threads
+    :return: [H, W, C] array ([H, W] for single channel files)
+    """
+
+    channels = read_exr_channels(path, num_threads=num_threads)
+    names = sorted(channels, key=lambda n: (CHANNEL_ORDER.index(n) if n in CHANNEL_ORDER else len(CHANNEL_ORDER), n))
+    arrays = [channels[name] for name in names]
+    if dtype is not None:
+        arrays = [a.astype(dtype, copy=False) for a in arrays]
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.stack(arrays, axis=-1)
+
+
+# --------------------------------------------------------------------------- #
+# Writing                                                                     #
+# --------------------------------------------------------------------------- #
+
+
+def _attribute(name, type_name, value):
+    return name.encode() + b'\0' + type_name.encode() + b'\0' + struct.pack('<i', len(value)) + value
+
+
+def write_exr(path, img, pixel_type='half', compression='zip', channel_names=None, num_threads=None):
+    """
+    Write an [H, W] or [H, W, C] array as a scanline EXR file.
+
+    :param path: output path
+    :param img: image, channels are named R, G, B(, A) for 3 and 4 channels, Y for one
+    :param pixel_type: 'half', 'float' or 'uint'
+    :param compression: 'none', 'zips' or 'zip'
+    :param channel_names: names of the C channels, overrides the default naming
+    :param num_threads: compression threads, default is min(8, cpu count)
+    """
+
+    if compression not in WRITE_COMPRESSIONS:
+        raise ValueError(f"Unsupported compression {compression}, expected one of {WRITE_COMPRESSIONS}")
+    img = np.asarray(img)
+    if img.ndim == 2:
+        img = img[:, :, np.newaxis]
+    height, width, num_channels = img.shape
+    if channel_names is None:
+        channel_names = {1: ['Y'], 2: ['Y', 'A'], 3: ['R', 'G', 'B'], 4: ['R', 'G', 'B', 'A']}.get(num_channels)
+        if channel_names is None:
+            raise ValueError(f"Give channel_names for {num_channels} channels")
+    type_id = PIXEL_TYPE_IDS[pixel_type]
+    dtype = PIXEL_TYPES[type_id]
+
+    # channels are stored in alphabetical order
+    order = sorted(range(num_channels), key=lambda i: channel_names[i])
+    chlist = b''.join(channel_names[i].encode() + b'\0' + struct.pack('<iB3xii', type_id, 0, 1, 1) for i in order) + b'\0'
+    header = b''.join([
+        struct.pack('<ii', MAGIC, VERSION),
+        _attribute('channels', 'chlist', chlist),
+        _attribute('compression', 'compression', bytes([COMPRESSION_IDS[compression]])),
+        _attribute('dataWindow', 'box2i', struct.pack('<iiii', 0, 0, width - 1, height - 1)),
+        _attribute('displayWindow', 'box2i', struct.pack('<iiii', 0, 0, width - 1, height - 1)),
+        _attribute('lineOrder', 'lineOrder', b'\0'),
+        _attribute('pixelAspectRatio', 'float', struct.pack('<f', 1.0)),
+        _attribute('screenWindowCenter', 'v2f', struct.pack('<ff', 0.0, 0.0)),
+        _attribute('screenWindowWidth', 'float', struct.pack('<f', 1.0)),
+        b'\0',
+    ])
+
+    # scanline layout: for every line, every channel's [width] values
+    lines = np.ascontiguousarray(img[:, :, order].astype(dtype).transpose(0, 2, 1))
+    lines_per_chunk = LINES_PER_CHUNK[compression]
+    starts = list(range(0, height, lines_per_chunk))
+
+    def encode(y):
+        raw = lines[y:y + lines_per_chunk].tobytes()
+        if compression != 'none':
+            packed = zlib.compress(_split_and_predict(raw), 6)
+            if len(packed) < len(raw):
+                raw = packed
+        return struct.pack('<ii', y, len(raw)) + raw
+
+    num_threads = num_threads or min(8, os.cpu_count() or 1)
+    if compression == 'none' or num_threads <= 1 or len(starts) == 1:
+        chunks = [encode(y) for y in starts]
+    else:
+        with ThreadPoolExecutor(max_workers=num_threads) as pool:
+            chunks = list(pool.map(encode, starts))
+
+    offsets, pos = [], len(header) + 8 * len(chunks)
+    for chunk in chunks:
+        offsets.append(pos)
+        pos += len(chunk)
+
+    tmp_path = tmp_path_for(os.path.abspath(path))
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(np.array(offsets, dtype='<u8').tobytes())
+        for chunk in chunks:
+            f.write(chunk)
+    atomic_replace(tmp_path, path)
+
+
+# --------------------------------------------------------------------------- #
+# Benchmark                                                                   #
+# --------------------------------------------------------------------------- #
+
+
+def _backends():
+    """(name, read(path), write(path, img)) of the other EXR backends that are installed."""
+    backends = []
+    try:
+        import OpenEXR
+
+        def openexr_read(path):
+            with OpenEXR.File(path) as f:
+                return f.channels()
+
+        def openexr_write(path, img):
+            OpenEXR.File({'compression': OpenEXR.ZIP_COMPRESSION, 'type': OpenEXR.scanlineimage},
+                         {'RGB': img}).write(path)
+        backends.append(('OpenEXR', openexr_read, openexr_write))
+    except (ImportError, AttributeError):
+        pass
+    try:
+        import pyexr
+        backends.append(('pyexr', pyexr.read, lambda path, img: pyexr.write(path, img)))
+    except ImportError:
+        pass
+    try:
+        os.environ.setdefault('OPENCV_IO_ENABLE_OPENEXR', '1')
+        import cv2
+        backends.append(('cv2', lambda path: cv2.imread(path, cv2.IMREAD_UNCHANGED), cv2.imwrite))
+    except ImportError:
+        pass
+    try:
+        import imageio.v3 as iio
+        backends.append(('imageio', iio.imread, lambda path, img: iio.imwrite(path, img, extension='.exr')))
+    except ImportError:
+        pass
+    return backends
+
+
+def _time(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark exr_io against the installed EXR backends")
+    parser.add_argument('--size', type=int, default=1024, help="Image height, the width is twice as large")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--num_threads', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    img = (rng.gamma(0.5, 1.0, size=(args.size, 2 * args.size, 3)) * np.linspace(0, 4, 2 * args.size)[None, :, None]).astype(np.float32)
+    tmp_dir = tempfile.mkdtemp(prefix='exr_io_bench_')
+
+    print(f"{args.size}x{2 * args.size} RGB, ms per call")
+    for pixel_type in ('half', 'float'):
+        for compression in WRITE_COMPRESSIONS:
+            path = os.path.join(tmp_dir, f'{pixel_type}_{compression}.exr')
+            write_ms = _time(lambda: write_exr(path, img, pixel_type, compression, num_threads=args.num_threads), args.repeat)
+            read_ms = _time(lambda: read_exr(path, num_threads=args.num_threads), args.repeat)
+            print(f"exr_io   {pixel_type:<5} {compression:<5} write {write_ms:8.1f}  read {read_ms:8.1f}  "
+                  f"({os.path.getsize(path) / 2 ** 20:.1f} MB)")
+
+    for name, read, write in _backends():
+        path = os.path.join(tmp_dir, f'{name}.exr')
+        try:
+            write_ms = _time(lambda: write(path, img), args.repeat)
+            read_ms = _time(lambda: read(path), args.repeat)
+            ours_ms = _time(lambda: read_exr(path, num_threads=args.num_threads), args.repeat)
+        except Exception as e:
+            print(f"{name:<8} failed: {e}")
+            continue
+        header = read_header(path)
+        print(f"{name:<8} {header['compression']:<11} write {write_ms:8.1f}  read {read_ms:8.1f}  "
+              f"exr_io read of the same file {ours_ms:8.1f}")
+        os.remove(path)
+    for name in os.listdir(tmp_dir):
+        os.remove(os.path.join(tmp_dir, name))
+    os.rmdir(tmp_dir)
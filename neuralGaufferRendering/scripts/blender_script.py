@@ -25,6 +25,10 @@ from mathutils import Vector
 from glob import glob
 import traceback
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from render_derivatives import DerivativeWriter, parse_derivatives
+from bpy_helper.checkpoint import atomic_json_dump
+
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "--object_path",
@@ -52,6 +56,16 @@ parser.add_argument(
     default="/home/hj453/Dataset",
     help="directory containing the test (novel) light probes",
 )
+parser.add_argument(
+    "--derivatives",
+    type=str,
+    nargs="*",
+    default=[],
+    help="derivatives written from every render, kind[@size][=template] with kind white (composite on white with "
+         "the mask of the view), rgba or alpha (the mask of the view, written once per view), e.g. "
+         "'white@256={output_dir}/../preprocessed/{object}/{name}'; see render_derivatives.py",
+)
+parser.add_argument("--derivative_threads", type=int, default=1, help="threads computing and writing derivatives")
 
     
 argv = sys.argv[sys.argv.index("--") + 1 :]
@@ -419,7 +433,31 @@ def transform_from_xyz_to_degree(pos):
     
     return elevation, azimuth, distance
 
+def read_render(path):
+    """Reads back the render just written (Blender's PNG decoder, from the page cache) as [H, W, C] uint8, top row
+    first; the Render Result image has no readable pixels."""
+    img = bpy.data.images.load(path, check_existing=False)
+    w, h = img.size
+    pixels = np.empty(w * h * img.channels, dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+    bpy.data.images.remove(img, do_unlink=True)
+    return np.rint(pixels.reshape(h, w, -1)[::-1] * 255.).astype(np.uint8)
+
+def write_lighting_record(object_dir, view_RTs, images):
+    """Records the lighting of every render in <object_dir>/lighting.json (merged with the renders of earlier runs):
+    the w2c of every view, and the envmap, its rotation and strength of every image, keyed by the image name without
+    extension. The lighting conditioning is derived from it instead of from the file names."""
+    record_path = os.path.join(object_dir, "lighting.json")
+    record = {"views": {}, "images": {}}
+    if os.path.exists(record_path):
+        with open(record_path) as f:
+            record = json.load(f)
+    record["views"].update({f"{view:03d}": {"w2c": RT.tolist()} for view, RT in view_RTs.items()})
+    record["images"].update(images)
+    atomic_json_dump(record, record_path, indent=1)
+
 def save_images(object_file: str) -> None:
+    derivatives = DerivativeWriter(parse_derivatives(args.derivatives), num_threads=args.derivative_threads)
     try:
         """Saves rendered images of the object in the scene."""
         object_uid = os.path.basename(object_file).split(".")[0]
@@ -454,6 +492,9 @@ def save_images(object_file: str) -> None:
         bpy.context.scene.render.film_transparent = True
         # remove_unwanted_objects()
         camera_list = []
+        view_masks = {}
+        view_RTs = {}
+        lighting_images = {}
         for i in range(args.view_starting_idx, args.num_images):
             elevation = random.uniform(-60., 90.)
             azimuth = random.uniform(0., 360)
@@ -494,6 +535,14 @@ def save_images(object_file: str) -> None:
                 args.output_dir, object_uid, f"{i:03d}_RT.npy" )
             if not os.path.exists(RT_path):
                 np.save(RT_path, RT)
+            view_RTs[i] = np.array(RT)
+
+            # the mask of the view, the lighting renders below have no transparent film
+            if derivatives.specs:
+                rgba = read_render(render_path)
+                view_masks[i] = rgba[..., 3]
+                derivatives.submit(rgba, kinds=('alpha',), output_dir=args.output_dir, object=object_uid, view=i,
+                                   name=f"{i:03d}_alpha.png")
 
         reset_area_lighting()
         remove_unwanted_objects()
@@ -515,12 +564,26 @@ def save_images(object_file: str) -> None:
                 )
 
 
-                add_light_env(env=envmap_path, strength = 1.0)
+                rotation_euler = (0.0, 0.0, 0.0)
+                strength = 1.0
+                add_light_env(env=envmap_path, strength=strength, rot_vec_rad=rotation_euler)
 
                 scene.render.filepath = render_path
                 
                 bpy.ops.render.render(write_still=True)
-
+                lighting_images[os.path.basename(render_path)[:-4]] = {
+                    "view": i, "lighting": lighting_idx + args.lighting_starting_idx,
+                    "envmap": envir_map_name.split('.')[0], "envmap_path": envmap_path,
+                    "rotation_euler": list(rotation_euler), "strength": strength,
+                }
+
+                if derivatives.wants('white', 'rgba'):
+                    derivatives.submit(read_render(render_path), view_masks[i], kinds=('white', 'rgba'),
+                                       output_dir=args.output_dir, object=object_uid, view=i,
+                                       name=os.path.basename(render_path))
+
+        write_lighting_record(os.path.join(args.output_dir, object_uid), view_RTs, lighting_images)
+        derivatives.close()
             
     except Exception as e:
         # echo error message to a file and which line of code caused the error'
@@ -5,13 +5,15 @@ import shutil
 import subprocess
 import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Tuple
 import os
 import random
+import shlex
 import boto3
 import tyro
 import wandb
 import signal
+import threading
 from multiprocessing import Process, Queue
 
 @dataclass
@@ -39,12 +41,41 @@ class Args:
     num_gpus: int = -1
     """number of gpus to use. -1 means all available gpus"""
 
+    derivatives: Tuple[str, ...] = ()
+    """derivatives written at render time, e.g. 'white@256={output_dir}/../preprocessed/{object}/{name}' 'alpha@256'
+    (see render_derivatives.py); preprocess_rendered_image.py is not needed for them"""
+
+    conditioning_lighting_dir: Optional[str] = None
+    """envmaps of the lighting conditioning (the --lighting_dir of preprocess_environment_map.py). If set, the
+    conditioning of every rendered object is computed on background processes while the next objects render"""
+
+    conditioning_output_dir: Optional[str] = None
+    """output directory of the lighting conditioning. If None, uses {output_dir}/preprocessed_environment"""
+
+    conditioning_workers: int = 2
+    """number of background processes computing the lighting conditioning"""
+
+    conditioning_sh_order: int = 0
+    """order of the SH lighting descriptors written with the conditioning, 0 disables them"""
+
+
+def submit_rendered(rendered_queue: Optional[multiprocessing.Queue], view_path: str, returncode: int = 0) -> None:
+    """Hands a rendered object to the lighting conditioning, only when blender_script.py finished it: a failed or
+    partial render has no lighting.json and would be recorded as done with missing views"""
+    if rendered_queue is None:
+        return
+    if returncode != 0 or not os.path.exists(os.path.join(view_path, "lighting.json")):
+        print('========', view_path, f'not fully rendered (return code {returncode}), no lighting conditioning', '========')
+        return
+    rendered_queue.put(os.path.basename(view_path))
+
 
 def worker(
     queue: multiprocessing.JoinableQueue,
     count: multiprocessing.Value,
     gpu: int,
     s3: Optional[boto3.client],
+    rendered_queue: Optional[multiprocessing.Queue] = None,
 ) -> None:
     while True:
         item = queue.get()
@@ -55,6 +86,7 @@ def worker(
         # print(view_path)
         if os.path.exists(view_path):
 
+            submit_rendered(rendered_queue, view_path)
             queue.task_done()
             print('========', item, 'rendered', '========')
             continue
@@ -74,10 +106,13 @@ def worker(
             f" --test_light_dir {lighting_dir} "
             
         )
+        if args.derivatives:
+            command += " --derivatives " + " ".join(shlex.quote(spec) for spec in args.derivatives)
         
 
 
-        subprocess.run(command, shell=True)
+        result = subprocess.run(command, shell=True)
+        submit_rendered(rendered_queue, view_path, result.returncode)
 
         with count.get_lock():
             count.value += 1
@@ -96,13 +131,40 @@ if __name__ == "__main__":
 
     if args.log_to_wandb:
         wandb.init(project="objaverse-rendering", entity="prior-ai2")
+
+    # lighting conditioning of every rendered object on background processes, while the GPUs render the next ones
+    rendered_queue = conditioning = forwarder = None
+    if args.conditioning_lighting_dir is not None:
+        from preprocess_environment_map import make_environment_map_worker
+        from preprocess_runner import BackgroundRunner
+
+        conditioning_output_dir = args.conditioning_output_dir or os.path.join(OUT_DIR, "preprocessed_environment")
+        make_conditioning_worker = make_environment_map_worker(
+            input_dir=OUT_DIR,
+            output_dir=conditioning_output_dir,
+            lighting_dir=args.conditioning_lighting_dir,
+            sh_order=args.conditioning_sh_order,
+            # blender_script.py defaults
+            total_view=12,
+            lighting_per_view=16,
+        )
+        conditioning = BackgroundRunner(make_conditioning_worker, conditioning_output_dir, args.conditioning_workers)
+        rendered_queue = multiprocessing.Queue()
+
+        def forward_rendered():
+            for object_id in iter(rendered_queue.get, None):
+                conditioning.submit(object_id)
+
+        forwarder = threading.Thread(target=forward_rendered, daemon=True)
+        forwarder.start()
+
     processes = []
     # Start worker processes on each of the GPUs
     for gpu_i in range(args.num_gpus):
         for worker_i in range(args.workers_per_gpu):
             worker_i = gpu_i * args.workers_per_gpu + worker_i
             process = multiprocessing.Process(
-                target=worker, args=(queue, count, gpu_i, s3)
+                target=worker, args=(queue, count, gpu_i, s3, rendered_queue)
             )
             process.daemon = True
             process.start()
@@ -145,6 +207,14 @@ if __name__ == "__main__":
         # Add sentinels to the queue to stop the worker processes
         for i in range(args.num_gpus * args.workers_per_gpu):
             queue.put(None)
+
+        if conditioning is not None:
+            # the last objects a worker put on rendered_queue are flushed by its feeder thread when it exits
+            for p in processes:
+                p.join()
+            rendered_queue.put(None)
+            forwarder.join()
+            conditioning.close()
     except KeyboardInterrupt:
         print("Received keyboard interrupt. Terminating processes.")
         for p in processes:
@@ -1,8 +1,8 @@
-import multiprocessing
-import pyexr
-from multiprocessing import Manager, Lock, Queue
+import functools
+import json
+import sys
+from collections import OrderedDict
 import numpy as np
-import time
 import torch
 import cv2
 import torch.nn.functional as F
@@ -11,15 +11,21 @@ import os
 import argparse
 from glob import glob
 from tqdm import tqdm
-from multiprocessing import Pool
 
-os.environ["OPENCV_IO_ENABLE_OPENEXR"]="1"
+from preprocess_runner import ObjectListing, add_runner_args, run_objects
+
+# exr_io, envmap_arena, envmap_codec and envmap_sh live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import envmap_codec
+import envmap_sh
+import exr_io
+from envmap_arena import EnvmapArena
+from bpy_helper.checkpoint import atomic_replace, tmp_path_for
 
-# Create a manager
-manager = Manager()
+os.environ["OPENCV_IO_ENABLE_OPENEXR"]="1"
 
-# Create a queue for progress bar updates
-progress_queue = Queue()
+# written next to the renders by blender_script.py
+LIGHTING_RECORD_NAME = 'lighting.json'
 
 def generate_envir_map_dir(envmap_h, envmap_w):
     lat_step_size = np.pi / envmap_h
@@ -44,12 +50,17 @@ def read_hdr(path):
     """Reads an HDR map from disk.
 
     Args:
-        path (str): Path to the .hdr file.
+        path (str): Path to the .hdr or .exr file.
 
     Returns:
         numpy.ndarray: Loaded (float) HDR map with RGB channels in order.
     """
     try:
+        if path.endswith('.exr'):
+            try:
+                return exr_io.read_exr(path)[..., :3]
+            except exr_io.UnsupportedCompression:
+                pass
         with open(path, 'rb') as h:
             buffer_ = np.frombuffer(h.read(), np.uint8)
         bgr = cv2.imdecode(buffer_, cv2.IMREAD_UNCHANGED)
@@ -144,99 +155,246 @@ def rotate_and_preprcess_envir_map(envir_map, aligned_RT, light_area_weight=None
 
     return envir_map_ldr, envir_map_hdr, envir_map_hdr_raw
 
+AXIS_ALIGNED_TRANSFORM = torch.tensor([[1, 0, 0], [0, 0, -1], [0, 1, 0]], dtype=torch.float64) # Blender's convention
+
+def rotation_grids(aligned_RTs, view_dirs, env_hw):
+    """Sampling grids of the rotated envmaps for a batch of cameras, same mapping as get_light.
+
+    Args:
+        aligned_RTs (numpy.ndarray): [V, 3, 4] w2c, Blender's convention.
+        view_dirs (torch.Tensor): [envH * envW, 3] from generate_envir_map_dir.
+        env_hw (tuple): (envH, envW).
+
+    Returns:
+        torch.Tensor: [V, envH, envW, 2] grids for F.grid_sample.
+    """
+    axis_aligned_R = AXIS_ALIGNED_TRANSFORM @ torch.as_tensor(np.asarray(aligned_RTs)[:, :3, :3], dtype=torch.float64) # [V, 3, 3]
+    view_dirs_world = torch.matmul(view_dirs.double(), axis_aligned_R).clamp(-1, 1) # [V, envH * envW, 3]
+    theta = torch.arccos(view_dirs_world[..., 2]) # top to bottom: 0 to pi
+    phi = torch.atan2(view_dirs_world[..., 1], view_dirs_world[..., 0]) # left to right: pi to -pi
+    query_y = ((theta / np.pi) * 2 - 1).clamp(-1+10e-8, 1-10e-8)
+    query_x = (-phi / np.pi).clamp(-1+10e-8, 1-10e-8)
+    return torch.stack((query_x, query_y), dim=-1).reshape(len(axis_aligned_R), env_hw[0], env_hw[1], 2).float()
+
+def sample_envir_map(envir_map, grids):
+    """Samples one envmap [H, W, 3] (tensor, or array e.g. from the EnvmapArena) at a batch of grids [V, h, w, 2]
+    with a single grid_sample.
+
+    Returns:
+        numpy.ndarray: [V, h, w, 3] float32 rotated HDR maps.
+    """
+    num_views, h, w, _ = grids.shape
+    envir_map = torch.as_tensor(envir_map).permute(2, 0, 1).unsqueeze(0).float() # [1, 3, H, W]
+    light_rgbs = F.grid_sample(envir_map, grids.reshape(1, 1, -1, 2), align_corners=True) # [1, 3, 1, V * h * w]
+    return light_rgbs.reshape(3, num_views, h, w).permute(1, 2, 3, 0).numpy()
+
+def encode_envir_maps(rotated_hdr_rgbs, output_hw):
+    """LDR and rescaled log-HDR encodings of a batch of rotated maps, same as rotate_and_preprcess_envir_map.
 
+    Returns:
+        (list, list): PIL LDR and HDR images resized to output_hw.
+    """
+    if np.isnan(rotated_hdr_rgbs).any():
+        print('rotated envir_map has nan')
+    envir_maps_hdr, envir_maps_ldr, _ = envmap_codec.encode_batch(rotated_hdr_rgbs)
+    # PIL's bilinear resize of uint8 images is cheaper than a batched float resize
+    envir_maps_ldr = [Image.fromarray(ldr).resize(output_hw, Image.BILINEAR) for ldr in envir_maps_ldr]
+    envir_maps_hdr = [Image.fromarray(hdr).resize(output_hw, Image.BILINEAR) for hdr in envir_maps_hdr]
+    return envir_maps_ldr, envir_maps_hdr
 
+class EnvironmentMapPreprocessor:
+    """Per-process worker of preprocess_runner: rotated LDR / HDR envmaps (and SH vectors) of one object per call."""
 
-# Define multiprocessing class
-class DataPreprocessingProcess(multiprocessing.Process):
     def __init__(
-                 self, start_index, end_index, output,
+                 self,
                  input_dir,
-                 input_file_paths,
                  output_dir,
-                 lighting_dir = None,
+                 envir_maps,
+                 envir_map_sh = None,
                  total_view = 12,
                  lighting_per_view = 8,
                  output_hw = (256, 256),
+                 rotation_cache_size = 256,
+                 sh_order = 0,
+                 skip_images = False,
                  ):
-        super(DataPreprocessingProcess, self).__init__()
-        self.start_index = start_index
-        self.end_index = end_index
-        self.output = output
         self.input_dir = input_dir
-        self.input_file_paths = input_file_paths
         self.output_dir = output_dir
-        self.lighting_dir = lighting_dir
+        # envir map name -> [H, W, 3] HDR map, an EnvmapArena
+        self.envir_maps = envir_maps
         self.total_view = total_view
         self.lighting_per_view = lighting_per_view
         self.output_hw = output_hw
-        
-        self.envir_map_paths = dict()
-        self.light_area_weight, self.view_dirs = generate_envir_map_dir(256, 512)
-        
 
-    def run(self):
-        self.preprocess_data(self.start_index, self.end_index)
-
-    # Define data preprocessing function
-    def preprocess_data(self, start_index, end_index):
-        try:
-            for cur_object_idx in range(start_index, end_index):
-                
-                filename = os.path.join(self.input_dir, self.input_file_paths[cur_object_idx])
-                saved_folder_ldr = os.path.join(self.output_dir, 'LDR', self.input_file_paths[cur_object_idx])
-                saved_folder_hdr = os.path.join(self.output_dir, 'HDR_rescaled',self.input_file_paths[cur_object_idx])
-                saved_folder_hdr_raw = os.path.join(self.output_dir, 'HDR_raw',self.input_file_paths[cur_object_idx])
-                if not os.path.exists(saved_folder_ldr):
-                    os.makedirs(saved_folder_ldr)
-                    if not os.path.exists(saved_folder_hdr):
-                        os.makedirs(saved_folder_hdr)
-                    if not os.path.exists(saved_folder_hdr_raw):
-                        os.makedirs(saved_folder_hdr_raw)
-                    for cur_view_idx in range(self.total_view):
-                        # target_RT_path_temp = glob(os.path.join(filename, '%03d_%03d_*.png' % (cur_view_idx, 0)))[0]
-                        target_RT_path = os.path.join(filename,  '%03d_RT.npy' % (cur_view_idx))
-                        target_RT = np.load(target_RT_path)
-
-                        target_image_path = glob(os.path.join(filename, '%03d_%03d_*.png' % (cur_view_idx, 0)))[0]
-                            # target image has a name like 000_000_cannon_2k_225.png, the envir map name is cannon_2k_225
-                        target_envir_map_name = os.path.basename(target_image_path)[8:-4]
-                
-                        for cur_lighting_idx in range(self.lighting_per_view):
-                            # print('Processing view %d, lighting %d' % (cur_view_idx, cur_lighting_idx))
-                            target_image_path = glob(os.path.join(filename, '%03d_%03d_*.png' % (cur_view_idx, cur_lighting_idx)))[0]
-                                # target image has a name like 000_000_cannon_2k_225.png, the envir map name is cannon_2k_225
-                            target_envir_map_name = os.path.basename(target_image_path)[8:-4]
-                            
-                            if os.path.exists(target_RT_path) and os.path.exists(target_image_path):
-                                
-                                target_envir_map = envir_map_hdr_values[target_envir_map_name]
-                                target_envir_map_ldr, target_envir_map_hdr, envir_map_hdr_raw = rotate_and_preprcess_envir_map(target_envir_map, target_RT, light_area_weight=self.light_area_weight, view_dirs=self.view_dirs)
-                                target_envir_map_ldr = target_envir_map_ldr.resize(self.output_hw, Image.BILINEAR)
-                                target_envir_map_hdr = target_envir_map_hdr.resize(self.output_hw, Image.BILINEAR)
-                                saved_path_ldr = os.path.join(saved_folder_ldr, os.path.basename(target_image_path)[:-4] + '.png')
-                                saved_path_hdr = os.path.join(saved_folder_hdr, os.path.basename(target_image_path)[:-4] + '.png')
-                                target_envir_map_ldr.save(saved_path_ldr)
-                                target_envir_map_hdr.save(saved_path_hdr)
-                                # save hdr raw as exr file
-                                # saved_path_hdr_raw = os.path.join(saved_folder_hdr_raw, os.path.basename(target_image_path)[:-4] + '.exr')
-                                # pyexr.write(saved_path_hdr_raw, envir_map_hdr_raw, precision=pyexr.FLOAT)
-                            else:
-                                print("Processing %s" % filename)
-                                print('Target_RT_path or target_envir_map_path does not exist !!!')
-                                continue
-                    
-                            
-                    
-                # Increment the counter and update the progress bar
-                with lock:
-                    counter.value += 1
-                    progress_queue.put(1)
-            
-        except Exception as e:
-            # print(f"Error in data preprocessing: {e}")
-            os.system(f'echo "Error in data preprocessing: {e}"')
-            return
+        self.env_hw = (256, 512)
+        self.light_area_weight, self.view_dirs = generate_envir_map_dir(*self.env_hw)
+        # (envir map name, rotation) -> resized (ldr, hdr) maps; many objects share camera rigs
+        self.rotation_cache = OrderedDict()
+        self.rotation_cache_size = rotation_cache_size
+        # per-view SH lighting vectors, rotated analytically from the per-envmap coefficients in envir_map_sh
+        self.envir_map_sh = envir_map_sh or dict()
+        self.sh_order = sh_order
+        self.skip_images = skip_images
+
+    def __call__(self, object_id):
+        saved_folder_ldr = os.path.join(self.output_dir, 'LDR', object_id)
+        saved_folder_hdr = os.path.join(self.output_dir, 'HDR_rescaled', object_id)
+        saved_folder_hdr_raw = os.path.join(self.output_dir, 'HDR_raw', object_id)
+        for folder in (saved_folder_ldr, saved_folder_hdr, saved_folder_hdr_raw):
+            os.makedirs(folder, exist_ok=True)
+        saved_path_sh = os.path.join(self.output_dir, 'SH', object_id + '.npz')
+        return self.preprocess_object(ObjectListing(os.path.join(self.input_dir, object_id)), saved_folder_ldr, saved_folder_hdr, saved_path_sh)
+
+    def listed_jobs(self, listing):
+        """(view, lighting) jobs of an object folder from the file names of its images and the %03d_RT.npy files.
+
+        Returns:
+            (dict, dict, int): view -> [3, 4] w2c, envir map name -> [(view, saved image name)], number of missing
+            (view, lighting) inputs.
+        """
+        target_RTs = dict()
+        jobs = dict()
+        missing_inputs = 0
+        for cur_view_idx in range(self.total_view):
+            target_RT_name = '%03d_RT.npy' % (cur_view_idx)
+            for cur_lighting_idx in range(self.lighting_per_view):
+                # target image has a name like 000_000_cannon_2k_225.png, the envir map name is cannon_2k_225
+                target_image_name = listing.target_image(cur_view_idx, cur_lighting_idx)
+                if target_image_name is None or target_RT_name not in listing:
+                    missing_inputs += 1
+                    continue
+                if cur_view_idx not in target_RTs:
+                    target_RTs[cur_view_idx] = np.load(listing.path(target_RT_name))
+                jobs.setdefault(target_image_name[8:-4], []).append((cur_view_idx, target_image_name[:-4]))
+        return target_RTs, jobs, missing_inputs
+
+    def recorded_jobs(self, listing):
+        """(view, lighting) jobs of an object folder from the lighting.json written by blender_script.py at render
+        time: the envmap and w2c of every image as rendered, no file name parsing. Same return value as listed_jobs.
+        """
+        with open(listing.path(LIGHTING_RECORD_NAME)) as f:
+            record = json.load(f)
+        target_RTs = dict()
+        jobs = dict()
+        recorded = set()
+        for saved_name, image in record['images'].items():
+            view, lighting = image['view'], image['lighting']
+            if view >= self.total_view or lighting >= self.lighting_per_view:
+                continue
+            if image['rotation_euler'] != [0.0, 0.0, 0.0]:
+                raise ValueError(f"{saved_name} was rendered with a rotated envmap, the conditioning maps are not rotated")
+            if view not in target_RTs:
+                target_RTs[view] = np.array(record['views']['%03d' % view]['w2c'])
+            jobs.setdefault(image['envmap'], []).append((view, saved_name))
+            recorded.add((view, lighting))
+        return target_RTs, jobs, self.total_view * self.lighting_per_view - len(recorded)
+
+    def preprocess_object(self, listing, saved_folder_ldr, saved_folder_hdr, saved_path_sh=None):
+        """Rotates and encodes the envmaps of every (view, lighting) of one object.
+
+        Each unique envmap is sampled once for all the views lit by it; results are memoized by (envmap, rotation).
+        With sh_order > 0 the SH lighting vector of every (view, lighting) goes to saved_path_sh, keyed like the images.
+
+        Returns:
+            dict: number of images written and of missing (view, lighting) inputs, for the manifest.
+        """
+        if LIGHTING_RECORD_NAME in listing:
+            target_RTs, jobs, missing_inputs = self.recorded_jobs(listing)
+        else:
+            target_RTs, jobs, missing_inputs = self.listed_jobs(listing)
+        if not jobs:
+            raise FileNotFoundError(f"No '%03d_%03d_*.png' images with a %03d_RT.npy in {listing.folder}")
+        unknown = [name for name in jobs if name not in self.envir_maps]
+        if unknown:
+            raise KeyError(f"Environment maps not found in lighting_dir: {unknown}")
+
+        views = sorted(target_RTs)
+        if self.sh_order > 0 and saved_path_sh is not None:
+            view_sh_rotations = envmap_sh.rotation_matrices(envmap_sh.view_rotation(np.stack([target_RTs[view] for view in views])), self.sh_order)
+            sh_vectors = {saved_name: (view_sh_rotations[views.index(view)] @ self.envir_map_sh[target_envir_map_name]).astype(np.float32)
+                          for target_envir_map_name, envir_map_jobs in jobs.items() for view, saved_name in envir_map_jobs}
+            os.makedirs(os.path.dirname(saved_path_sh), exist_ok=True)
+            tmp_path_sh = tmp_path_for(saved_path_sh)
+            with open(tmp_path_sh, 'wb') as f:
+                np.savez(f, **sh_vectors)
+            atomic_replace(tmp_path_sh, saved_path_sh)
+        num_images = sum(len(envir_map_jobs) for envir_map_jobs in jobs.values())
+        if self.skip_images:
+            return {'images': 0, 'sh_vectors': num_images, 'missing': missing_inputs}
+
+        grids = None
+        for target_envir_map_name, envir_map_jobs in jobs.items():
+            keys = [(target_envir_map_name, target_RTs[view][:3, :3].tobytes()) for view, _ in envir_map_jobs]
+            results = {key: self.rotation_cache[key] for key in keys if key in self.rotation_cache}
+            for key in results:
+                self.rotation_cache.move_to_end(key)
+            missing = dict()
+            for key, (view, _) in zip(keys, envir_map_jobs):
+                if key not in results:
+                    missing.setdefault(key, view)
+            if missing:
+                if grids is None:
+                    # one grid for all the view rotations of the object
+                    grids = rotation_grids(np.stack([target_RTs[view] for view in views]), self.view_dirs, self.env_hw)
+                view_grids = grids[[views.index(view) for view in missing.values()]]
+                rotated_hdr_rgbs = sample_envir_map(self.envir_maps[target_envir_map_name], view_grids)
+                envir_maps_ldr, envir_maps_hdr = encode_envir_maps(rotated_hdr_rgbs, self.output_hw)
+                for key, envir_map_ldr, envir_map_hdr in zip(missing, envir_maps_ldr, envir_maps_hdr):
+                    results[key] = (envir_map_ldr, envir_map_hdr)
+                    if self.rotation_cache_size > 0:
+                        self.rotation_cache[key] = results[key]
+                while len(self.rotation_cache) > self.rotation_cache_size:
+                    self.rotation_cache.popitem(last=False)
+
+            for key, (_, saved_name) in zip(keys, envir_map_jobs):
+                envir_map_ldr, envir_map_hdr = results[key]
+                envir_map_ldr.save(os.path.join(saved_folder_ldr, saved_name + '.png'))
+                envir_map_hdr.save(os.path.join(saved_folder_hdr, saved_name + '.png'))
+        return {'images': num_images, 'sh_vectors': num_images if self.sh_order > 0 else 0, 'missing': missing_inputs}
+
+def make_environment_map_worker(input_dir, output_dir, lighting_dir, envmap_arena=None, envmap_dtype='float32', sh_order=0, **kwargs):
+    """Loads the envmaps of lighting_dir once (the memory-mapped arena, and the SH coefficients with sh_order > 0) and
+    returns the picklable worker factory for preprocess_runner. Also used by distribute-general-rendering.py to run the
+    preprocessing of every object right after it is rendered.
+
+    Args:
+        input_dir (str): folder of the object folders (renders, lighting.json or %03d_RT.npy).
+        output_dir (str): output folder of LDR, HDR_rescaled and SH.
+        lighting_dir (str): folder of the '*/*.exr' conditioning envmaps.
+        envmap_arena (str): arena file, default <output_dir>/envmap_arena.bin.
+        envmap_dtype (str): 'float32' or 'float16'.
+        sh_order (int): SH order of the per-view lighting vectors, 0 to disable.
+        **kwargs: other arguments of EnvironmentMapPreprocessor.
+
+    Returns:
+        functools.partial: EnvironmentMapPreprocessor factory.
+    """
+    envir_map_paths = dict()
+
+    cur_envir_map_paths = glob(os.path.join(lighting_dir, '*/*.exr'))
+    for envir_map_path in cur_envir_map_paths:
+        envir_map_name = os.path.basename(envir_map_path)[:-4]
+        if envir_map_name not in envir_map_paths:
+            envir_map_paths[envir_map_name] = envir_map_path
+    # one memory-mapped arena instead of a dict of tensors: forked workers would duplicate its pages
+    envir_map_arena_path = envmap_arena or os.path.join(output_dir, 'envmap_arena.bin')
+    envir_map_hdr_values = EnvmapArena.build(envir_map_arena_path, envir_map_paths, read_hdr, dtype=envmap_dtype)
+    # SH coefficients of every envmap, projected once; workers only rotate them per view
+    envir_map_sh = dict()
+    if sh_order > 0:
+        for envir_map_name, target_envir_map in tqdm(envir_map_hdr_values.items(), total=len(envir_map_hdr_values)):
+            envir_map_sh[envir_map_name] = envmap_sh.project(target_envir_map, sh_order)
+
+    return functools.partial(
+                            EnvironmentMapPreprocessor,
+                            input_dir=input_dir,
+                            output_dir=output_dir,
+                            envir_maps=envir_map_hdr_values,
+                            envir_map_sh=envir_map_sh,
+                            sh_order=sh_order,
+                            **kwargs,
+                        )
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Data Preprocessing for HDR environment map")
     # parser.add_argument("--img_dir", type=str, default="/scratch/datasets/hj453/objaverse-rendering/hf-objaverse-v1-last-700-val/views_whole_sphere", help="path to the folder containing environment maps")
@@ -252,88 +410,27 @@ if __name__ == "__main__":
     parser.add_argument("--num_workers", type=int, default=32, help="number of workers for multiprocessing")
     parser.add_argument("--total_view", type=int, default=12)
     parser.add_argument("--lighting_per_view", type=int, default=16)
-    
-    img_paths = []
+    parser.add_argument("--rotation_cache_size", type=int, default=256, help="rotated envmaps memoized per worker, by (envmap, rotation)")
+    parser.add_argument("--envmap_arena", type=str, default=None, help="memory-mapped envmap arena, default <output_dir>/envmap_arena.bin; reused while the EXRs are unchanged")
+    parser.add_argument("--envmap_dtype", type=str, default="float32", choices=["float32", "float16"], help="float16 halves the arena")
+    parser.add_argument("--sh_order", type=int, default=0, help="also write per-view SH lighting vectors of this order to <output_dir>/SH/<object>.npz, 0 to disable")
+    parser.add_argument("--skip_images", action="store_true", help="only write the SH lighting vectors, not the rotated LDR/HDR images")
+    add_runner_args(parser)
+
     args = parser.parse_args()
     # include all folders
-    for folder in os.listdir(args.img_dir):
-        if os.path.isdir(os.path.join(args.img_dir, folder)):
-            img_paths.append(folder)
-    
-    
-    # Define the number of processes
-    num_processes = args.num_workers
-
-    # Calculate the data range for each process
-    data_size = len(img_paths)
-    chunk_size = data_size // num_processes
-    ranges = [(i * chunk_size, (i + 1) * chunk_size) for i in range(num_processes - 1)]
-    ranges.append(((num_processes - 1) * chunk_size, data_size))
-    
-    envir_map_paths = dict()
-
-    cur_envir_map_paths = glob(os.path.join(args.lighting_dir, '*/*.exr'))
-    for envir_map_path in cur_envir_map_paths:
-        envir_map_name = os.path.basename(envir_map_path)[:-4]
-        if envir_map_name not in envir_map_paths:
-            envir_map_paths[envir_map_name] = envir_map_path
-    envir_map_hdr_values = dict()
-    for envir_map_name, envir_map_path in tqdm(envir_map_paths.items()):
-
-        target_envir_map = read_hdr(envir_map_path)
-        target_envir_map = torch.from_numpy(target_envir_map)
-        envir_map_hdr_values[envir_map_name] = target_envir_map
-    # import ipdb; ipdb.set_trace()
-    # Create a shared counter
-    counter = manager.Value('i', 0)
-
-    # Create a lock
-    lock = Lock()
-
-    # Create a progress bar
-    pbar = tqdm(total=data_size)
-
-    
-    # Create a process pool and an output queue
-    output_queue = multiprocessing.Queue()
-    processes = [   
-                    DataPreprocessingProcess(  
-                                            start, 
-                                            end, 
-                                            None, 
-                                            input_dir=args.img_dir, 
-                                            input_file_paths=img_paths, 
-                                            output_dir=args.output_dir, 
-                                            lighting_dir=args.lighting_dir, 
-                                            lighting_per_view=args.lighting_per_view,
-                                            total_view=args.total_view                        
-                                        ) 
-                    for (start, end) in ranges
-                ]
-
-    # Start processes
-    start_time = time.time()
-    for process in processes:
-        process.start()
-
-    # Update the progress bar based on the updates in the queue
-    while True:
-        pbar.update(progress_queue.get())
-        with lock:
-            if counter.value == data_size:
-                break
-
-    # Wait for all processes to complete
-    for process in processes:
-        process.join()
-
-    # Close the progress bar
-    pbar.close()
-
-    # Collect processed data
-    processed_data = []
-    while not output_queue.empty():
-        processed_data.extend(output_queue.get())
-
-    end_time = time.time()
-    print(f"Multiprocessing data preprocessing completed, time taken: {end_time - start_time} seconds")
\ No newline at end of file
+    img_paths = sorted(entry.name for entry in os.scandir(args.img_dir) if entry.is_dir())
+
+    make_worker = make_environment_map_worker(
+                                    input_dir=args.img_dir,
+                                    output_dir=args.output_dir,
+                                    lighting_dir=args.lighting_dir,
+                                    lighting_per_view=args.lighting_per_view,
+                                    total_view=args.total_view,
+                                    rotation_cache_size=args.rotation_cache_size,
+                                    envmap_arena=args.envmap_arena,
+                                    envmap_dtype=args.envmap_dtype,
+                                    sh_order=args.sh_order,
+                                    skip_images=args.skip_images,
+                                )
+    run_objects(make_worker, img_paths, args.output_dir, args.num_workers, rerun=args.rerun, skip_failed=args.skip_failed)
@@ -1,25 +1,22 @@
 # fix the previous performance drop
 
-import multiprocessing
-from multiprocessing import Manager, Lock, Queue
-import time
+import functools
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import os
 import argparse
-from glob import glob
+import cv2
 # from envmap import EnvironmentMap
-from tqdm import tqdm
-from PIL import Image
 import json
 import matplotlib.pyplot as plt
 import numpy as np
-import random
 
-# Create a manager
-manager = Manager()
+from preprocess_runner import ObjectListing, add_runner_args, run_objects
 
-# Create a queue for progress bar updates
-progress_queue = Queue()
+# render_derivatives lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from render_derivatives import white_composite, white_weights
 
 def safe_l2_normalize_numpy(x, dim=-1, eps=1e-6):
     return x / np.linalg.norm(x, axis=dim, keepdims=True).clip(eps, None)
@@ -37,86 +34,106 @@ def get_cond_normals_map(normals_path, RT):
     img = Image.fromarray(np.uint8(normals_map_new * 255.))
     return img
 
-# Define multiprocessing class
-class DataPreprocessingProcess(multiprocessing.Process):
+def read_image_uint8(path):
+    """Decodes a PNG straight to uint8 RGB(A) (16-bit images are scaled down to 8 bits)."""
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise IOError(f"Cannot decode {path}")
+    if img.dtype == np.uint16:
+        img = (img.astype(np.uint32) * 255 // 65535).astype(np.uint8)
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA if img.shape[-1] == 4 else cv2.COLOR_BGR2RGB)
+    return img
+
+def write_png(path, rgb, compression=6):
+    ok, buffer_ = cv2.imencode('.png', np.ascontiguousarray(rgb[..., ::-1]), [cv2.IMWRITE_PNG_COMPRESSION, compression])
+    if not ok:
+        raise IOError(f"Cannot encode {path}")
+    buffer_.tofile(path)
+
+class RenderedImagePreprocessor:
+    """Per-process worker of preprocess_runner: white-background composites of one object's renderings per call."""
+
     def __init__(
-                 self, start_index, end_index, output,
+                 self,
                  input_dir,
-                 input_file_paths,
                  output_dir,
                  starting_view = 0,
                  starting_lighting = 0,
                  total_view = 16,
                  lighting_per_view = 8,
                  output_hw = (256, 256),
+                 io_threads = 4,
+                 png_compression = 6,
                  ):
-        super(DataPreprocessingProcess, self).__init__()
-        self.start_index = start_index
-        self.end_index = end_index
-        self.output = output
         self.input_dir = input_dir
-        self.input_file_paths = input_file_paths
         self.output_dir = output_dir
         self.total_view = total_view
         self.lighting_per_view = lighting_per_view
         self.output_hw = output_hw
         self.starting_view = starting_view
         self.starting_lighting = starting_lighting
-
-    def run(self):
-        self.preprocess_data(self.start_index, self.end_index)
-
-    # Define data preprocessing function
-    def preprocess_data(self, start_index, end_index):
-        for cur_object_idx in range(start_index, end_index):
-
-            filename = os.path.join(self.input_dir, self.input_file_paths[cur_object_idx])
-            saved_folder = os.path.join(self.output_dir, self.input_file_paths[cur_object_idx])
-            # if not os.path.exists(saved_folder) or len(os.listdir(saved_folder)) != 108:
-            # if not os.path.exists(saved_folder):
-            os.makedirs(saved_folder, exist_ok=True)
-            if len(os.listdir(saved_folder)) != (192+4*9):
-
-                for cur_view_idx in range(self.starting_view, self.total_view):
-
-                    # normals_image_path = os.path.join(filename, 'normal_%03d_0001.png' % cur_view_idx)
-                    # target_RT_path = os.path.join(filename, '%03d_RT.npy' % (cur_view_idx))
-                    # target_RT = np.load(target_RT_path) # w2c
-                    # camera_normals_map = get_cond_normals_map(normals_image_path, target_RT)
-                    # camera_normals_map = camera_normals_map.resize(self.output_hw, Image.Resampling.BILINEAR)
-                    # saved_path = os.path.join(saved_folder, '%03d_normals.png' % (cur_view_idx))
-                    # camera_normals_map.save(saved_path)
-
-                    alpha_image_path = os.path.join(filename, '%03d_alpha.png' % cur_view_idx)
-                    random_lighting_image = plt.imread(alpha_image_path)
-
-                    target_mask = random_lighting_image[..., -1] # [H, W]
+        self.png_compression = png_compression
+        # decoding and encoding release the GIL
+        self.io_pool = ThreadPoolExecutor(max_workers=io_threads)
+
+    def process_image(self, target_image_path, saved_path, weights):
+        img = read_image_uint8(target_image_path)
+        if img.ndim != 3 or img.shape[:2] != weights.shape[:2]:
+            raise ValueError(f"{target_image_path} is {img.shape}, its mask is {weights.shape[:2]}")
+        # alpha blending with white background, the same composite as the render-time derivatives
+        img = white_composite(img[..., :3], weights=weights)
+        if img.shape[:2] != (self.output_hw[1], self.output_hw[0]):
+            # area filter: box average of the covered pixels when downsampling
+            img = cv2.resize(img, tuple(self.output_hw), interpolation=cv2.INTER_AREA)
+        write_png(saved_path, img, self.png_compression)
+
+    def __call__(self, object_id):
+        """Composites and resizes the (view, lighting) images of one object.
+
+        Returns:
+            dict: number of images written and of missing (view, lighting) images, for the manifest.
+        """
+        listing = ObjectListing(os.path.join(self.input_dir, object_id))
+        saved_folder = os.path.join(self.output_dir, object_id)
+        os.makedirs(saved_folder, exist_ok=True)
+        num_images = missing = 0
+
+        for cur_view_idx in range(self.starting_view, self.total_view):
+
+            # normals_image_path = os.path.join(filename, 'normal_%03d_0001.png' % cur_view_idx)
+            # target_RT_path = os.path.join(filename, '%03d_RT.npy' % (cur_view_idx))
+            # target_RT = np.load(target_RT_path) # w2c
+            # camera_normals_map = get_cond_normals_map(normals_image_path, target_RT)
+            # camera_normals_map = camera_normals_map.resize(self.output_hw, Image.Resampling.BILINEAR)
+            # saved_path = os.path.join(saved_folder, '%03d_normals.png' % (cur_view_idx))
+            # camera_normals_map.save(saved_path)
+
+            alpha_image = read_image_uint8(listing.path('%03d_alpha.png' % cur_view_idx))
+            target_mask = alpha_image[..., -1] if alpha_image.ndim == 3 else alpha_image # [H, W]
+
+            # all the lightings of the view share the mask and its blend weights; decode, composite, resize and
+            # encode of the images run on the thread pool
+            weights = white_weights(target_mask)
+            target_image_names = []
+            for cur_lighting_idx in range(self.starting_lighting,  self.lighting_per_view):
+                target_image_name = listing.target_image(cur_view_idx, cur_lighting_idx)
+                if target_image_name is None:
+                    missing += 1
+                    continue
+                target_image_names.append(target_image_name)
+
+            list(self.io_pool.map(self.process_image,
+                                  [listing.path(name) for name in target_image_names],
+                                  [os.path.join(saved_folder, name) for name in target_image_names],
+                                  [weights] * len(target_image_names)))
+            num_images += len(target_image_names)
+
+        if num_images == 0:
+            raise FileNotFoundError(f"No '%03d_%03d_*.png' images in {listing.folder}")
+        return {'images': num_images, 'missing': missing}
 
 
-                    for cur_lighting_idx in range(self.starting_lighting,  self.lighting_per_view):
-                        target_image_path = glob(os.path.join(filename, '%03d_%03d_*.png' % (cur_view_idx, cur_lighting_idx)))[0]
-
-                        if os.path.exists(target_image_path):
-
-                            img = plt.imread(target_image_path)
-                            img = img[:, :, :3] * target_mask[:, :, None] + np.array([1., 1., 1.]) * (1 - target_mask[:, :, None])
-                            img = Image.fromarray(np.uint8(img[:, :, :3] * 255.))        
-                            
-                            img = img.resize(self.output_hw, Image.Resampling.BILINEAR)
-                            saved_path = os.path.join(saved_folder, os.path.basename(target_image_path))
-                            img.save(saved_path)
-
-                        else:
-                            print("Processing %s" % filename)
-                            print('Target_RT_path or target_envir_map_path does not exist !!!')
-                            continue
-            
-
-            with lock:
-                counter.value += 1
-                progress_queue.put(1)
-             
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Data Preprocessing for HDR environment map")
     # parser.add_argument("--img_dir", type=str, default="/scratch/datasets/hj453/objaverse-rendering/hf-objaverse-v1-50000/views_whole_sphere", help="path to the folder containing environment maps")
@@ -138,92 +155,24 @@ if __name__ == "__main__":
     parser.add_argument("--lighting_per_view", type=int, default=16)
     parser.add_argument("--starting_view", type=int, default=0)
     parser.add_argument("--starting_lighting", type=int, default=0)
+    parser.add_argument("--io_threads", type=int, default=4, help="decode / encode threads per worker")
+    parser.add_argument("--png_compression", type=int, default=6, help="PNG compression level of the outputs (0-9)")
     
-    img_paths = []
+    add_runner_args(parser)
+
     args = parser.parse_args()
-    
-    to_preocess_obj_ids = json.load(open(args.input_json, 'r'))
-    to_preocess_obj_ids = to_preocess_obj_ids.keys()
-    for obj_id in to_preocess_obj_ids:
-        img_paths.append(obj_id)
-    
-    random.shuffle(img_paths)
 
-    
-    # Define the number of processes
-    num_processes = args.num_workers
-
-    # Calculate the data range for each process
-    data_size = len(img_paths)
-    chunk_size = data_size // num_processes
-    ranges = [(i * chunk_size, (i + 1) * chunk_size) for i in range(num_processes - 1)]
-    ranges.append(((num_processes - 1) * chunk_size, data_size))
-    
-    
-    # Create a shared counter
-    counter = manager.Value('i', 0)
-
-    # Create a lock
-    lock = Lock()
-
-    # Create a progress bar
-    pbar = tqdm(total=data_size)
-
-    # temp = DataPreprocessingProcess(  
-    #                                         0, 
-    #                                         data_size, 
-    #                                         None, 
-    #                                         input_dir=args.img_dir, 
-    #                                         input_file_paths=img_paths, 
-    #                                         output_dir=args.output_dir, 
-    #                                         lighting_per_view=args.lighting_per_view,
-    #                                         starting_view=args.starting_view,
-    #                                         starting_lighting=args.starting_lighting,
-    #                                         total_view=args.total_view                        
-    #                                     ) 
-    # temp.run()
-
-
-    # Create a process pool and an output queue
-    output_queue = multiprocessing.Queue()
-    processes = [   DataPreprocessingProcess(  
-                                            start, 
-                                            end, 
-                                            None, 
-                                            input_dir=args.img_dir, 
-                                            input_file_paths=img_paths, 
-                                            output_dir=args.output_dir, 
-                                            lighting_per_view=args.lighting_per_view,
-                                            starting_view=args.starting_view,
-                                            starting_lighting=args.starting_lighting,
-                                            total_view=args.total_view                        
-                                        ) 
-                    for (start, end) in ranges
-                ]
-
-    # Start processes
-    start_time = time.time()
-    for process in processes:
-        process.start()
-
-    # Update the progress bar based on the updates in the queue
-    while True:
-        pbar.update(progress_queue.get())
-        with lock:
-            if counter.value == data_size:
-                break
-
-    # Wait for all processes to complete
-    for process in processes:
-        process.join()
-
-    # Close the progress bar
-    pbar.close()
-
-    # Collect processed data
-    processed_data = []
-    while not output_queue.empty():
-        processed_data.extend(output_queue.get())
-
-    end_time = time.time()
-    print(f"Multiprocessing data preprocessing completed, time taken: {end_time - start_time} seconds")
\ No newline at end of file
+    img_paths = list(json.load(open(args.input_json, 'r')).keys())
+
+    make_worker = functools.partial(
+                                    RenderedImagePreprocessor,
+                                    input_dir=args.img_dir,
+                                    output_dir=args.output_dir,
+                                    lighting_per_view=args.lighting_per_view,
+                                    starting_view=args.starting_view,
+                                    starting_lighting=args.starting_lighting,
+                                    total_view=args.total_view,
+                                    io_threads=args.io_threads,
+                                    png_compression=args.png_compression,
+                                )
+    run_objects(make_worker, img_paths, args.output_dir, args.num_workers, rerun=args.rerun, skip_failed=args.skip_failed)
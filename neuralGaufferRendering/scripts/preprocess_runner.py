@@ -0,0 +1,327 @@
+"""Shared runner for the per-object preprocessing scripts (preprocess_environment_map.py, preprocess_rendered_image.py).
+
+Objects are handed out one at a time from a dynamic queue (at most one object per worker in flight), so a slow object
+only holds up its own worker instead of a whole static range. Every object runs in isolation: an exception is
+recorded for that object and the worker moves on. A worker that dies (OOM kill, segfault in cv2 / torch) breaks the
+whole process pool; the pool is rebuilt and the objects that were in flight are rerun one at a time, so only the
+object that crashes again on its own is recorded as failed.
+
+Progress is kept in ``<output_dir>/manifest.jsonl``, one record per finished object (the last record of an object
+wins); a rerun skips the objects that are done and retries the failed ones. Failures also go to
+``<output_dir>/errors.jsonl`` with the exception, traceback, worker pid and time spent.
+
+A script provides a picklable worker factory (e.g. a functools.partial of a class) whose instances are called with
+an object id, and may return a dict of stats that is stored in the manifest record. ``run_objects`` processes a
+known list of objects; ``BackgroundRunner`` takes objects as they come, e.g. from a renderer once they are rendered.
+"""
+
+import collections
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from tqdm import tqdm
+
+MANIFEST_NAME = 'manifest.jsonl'
+ERRORS_NAME = 'errors.jsonl'
+
+
+class ObjectListing:
+    """One directory listing of an object folder, to look up its '%03d_%03d_*.png' images without globbing."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        try:
+            self.names = sorted(os.listdir(folder))
+        except FileNotFoundError:
+            self.names = []
+        self._names = set(self.names)
+        self._images = None
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def target_images(self):
+        """(view, lighting) -> name of the first '%03d_%03d_*.png' image of the folder."""
+        if self._images is None:
+            self._images = dict()
+            for name in self.names:
+                if not name.endswith('.png') or len(name) < 13 or name[3] != '_' or name[7] != '_':
+                    continue
+                try:
+                    key = (int(name[:3]), int(name[4:7]))
+                except ValueError:
+                    continue
+                self._images.setdefault(key, name)
+        return self._images
+
+    def target_image(self, view_idx, lighting_idx):
+        return self.target_images().get((view_idx, lighting_idx))
+
+
+class CompletionManifest:
+    """Append-only record of the finished objects, written by the parent process only."""
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.errors_path = os.path.join(output_dir, ERRORS_NAME)
+        self.status = dict()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:  # a line cut short by a kill
+                        continue
+                    self.status[record['object']] = record['status']
+
+    def is_done(self, object_id):
+        return self.status.get(object_id) == 'done'
+
+    def has_failed(self, object_id):
+        return self.status.get(object_id) == 'failed'
+
+    def add(self, record):
+        self.status[record['object']] = record['status']
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        if record['status'] == 'failed':
+            with open(self.errors_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+
+_worker = None
+
+
+def _init_worker(make_worker):
+    global _worker
+    _worker = make_worker()
+
+
+def _finish_record(record, start):
+    record['seconds'] = round(time.time() - start, 3)
+    record['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    return record
+
+
+def _run_object(object_id):
+    start = time.time()
+    record = {'object': object_id, 'pid': os.getpid()}
+    try:
+        stats = _worker(object_id)
+        record['status'] = 'done'
+        if stats:
+            record.update(stats)
+    except Exception as e:
+        record.update(status='failed', error=type(e).__name__, message=str(e), traceback=traceback.format_exc())
+    return _finish_record(record, start)
+
+
+def _crash_record(object_id, start):
+    return _finish_record({'object': object_id, 'pid': None, 'status': 'failed', 'error': 'BrokenProcessPool',
+                           'message': 'the worker process died (killed, e.g. out of memory, or crashed)',
+                           'traceback': ''}, start)
+
+
+def _run_queue(make_worker, object_queue, num_workers, on_record):
+    """
+    Process the objects of object_queue until its None sentinel on a pool of num_workers processes, with at most one
+    object per worker in flight, and call on_record(record) from this thread for every object.
+
+    A dead worker breaks the ProcessPoolExecutor and fails every future in flight with BrokenProcessPool. The pool
+    is rebuilt, and those objects are rerun alone on it, one at a time: an object that breaks the pool on its own is
+    recorded as failed, the others complete normally.
+
+    :param make_worker: picklable callable that returns the per-process worker, called as worker(object_id)
+    :param object_queue: queue.Queue of object ids, ended by None
+    :param num_workers: number of processes
+    :param on_record: callable receiving the manifest record of every object
+    """
+
+    pool = None
+    in_flight = dict()  # future -> (object id, start time)
+    pending = collections.deque()  # taken from the queue, not submitted yet
+    suspects = collections.deque()  # in flight when the pool broke
+    closed = False
+    try:
+        while not closed or pending or in_flight or suspects:
+            if pool is None:
+                pool = ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(make_worker,))
+
+            if suspects:
+                object_id = suspects.popleft()
+                start = time.time()
+                try:
+                    on_record(pool.submit(_run_object, object_id).result())
+                except BrokenProcessPool:
+                    on_record(_crash_record(object_id, start))
+                    pool.shutdown(wait=True)
+                    pool = None
+                continue
+
+            broken = False
+            while len(in_flight) < num_workers:
+                if not pending:
+                    if closed:
+                        break
+                    try:
+                        object_id = object_queue.get(block=not in_flight)
+                    except queue.Empty:
+                        break
+                    if object_id is None:
+                        closed = True
+                        break
+                    pending.append(object_id)
+                try:
+                    future = pool.submit(_run_object, pending[0])
+                except BrokenProcessPool:
+                    broken = True
+                    break
+                in_flight[future] = (pending.popleft(), time.time())
+            if not in_flight:
+                if broken:
+                    pool.shutdown(wait=True)
+                    pool = None
+                continue
+
+            # wake up now and then to hand out objects queued meanwhile to idle workers
+            polling = not closed and not pending and len(in_flight) < num_workers
+            done, _ = wait(in_flight, timeout=1. if polling else None, return_when=FIRST_COMPLETED)
+            broken = broken or any(isinstance(future.exception(), BrokenProcessPool) for future in done)
+            if broken:
+                # every future in flight fails with the pool
+                done, _ = wait(in_flight)
+            for future in done:
+                object_id, start = in_flight.pop(future)
+                if isinstance(future.exception(), BrokenProcessPool):
+                    suspects.append(object_id)
+                else:
+                    on_record(future.result())
+            if broken:
+                print(f"A worker process died, rerunning {len(suspects)} objects one at a time")
+                pool.shutdown(wait=True)
+                pool = None
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+class BackgroundRunner:
+    """Processes objects on a pool of processes as they are submitted, recording progress in the completion manifest.
+
+    The manifest is written from the runner's dispatch thread, the only writer.
+    """
+
+    def __init__(self, make_worker, output_dir, num_workers, rerun=False, skip_failed=False):
+        """
+        :param make_worker: picklable callable that returns the per-process worker, called as worker(object_id)
+        :param output_dir: directory of manifest.jsonl and errors.jsonl
+        :param num_workers: number of processes
+        :param rerun: process the objects the manifest lists as done as well
+        :param skip_failed: do not retry the objects that failed before
+        """
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.manifest = CompletionManifest(output_dir)
+        self.rerun = rerun
+        self.skip_failed = skip_failed
+        self.num_done = self.num_failed = 0
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=_run_queue, args=(make_worker, self.queue, num_workers, self._record),
+                                       daemon=True)
+        self.thread.start()
+
+    def submit(self, object_id):
+        """
+        Queue an object, unless the manifest lists it as done (or as failed, with skip_failed).
+
+        :param object_id: object to process
+        :return: whether it was queued
+        """
+
+        if not self.rerun and (self.manifest.is_done(object_id)
+                               or (self.skip_failed and self.manifest.has_failed(object_id))):
+            return False
+        self.queue.put(object_id)
+        return True
+
+    def _record(self, record):
+        self.manifest.add(record)
+        if record['status'] == 'done':
+            self.num_done += 1
+        else:
+            self.num_failed += 1
+            print(f"Failed {record['object']}: {record['error']}: {record['message']}")
+
+    def close(self):
+        """
+        Wait for the queued objects.
+
+        :return: (number done, number failed)
+        """
+
+        self.queue.put(None)
+        self.thread.join()
+        print(f"Processed {self.num_done} objects, {self.num_failed} failed (see {self.manifest.errors_path})")
+        return self.num_done, self.num_failed
+
+
+def add_runner_args(parser):
+    parser.add_argument("--rerun", action="store_true", help="ignore the completion manifest and process every object again")
+    parser.add_argument("--skip_failed", action="store_true", help="do not retry the objects that failed in a previous run")
+
+
+def run_objects(make_worker, object_ids, output_dir, num_workers, rerun=False, skip_failed=False):
+    """
+    Process objects on a dynamic queue of num_workers processes, recording progress in the completion manifest.
+
+    :param make_worker: picklable callable that returns the per-process worker, called as worker(object_id)
+    :param object_ids: objects to process
+    :param output_dir: directory of manifest.jsonl and errors.jsonl
+    :param num_workers: number of processes, 0 runs in this process
+    :param rerun: process the objects the manifest lists as done as well
+    :param skip_failed: do not retry the objects that failed before
+    :return: (number done, number failed)
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = CompletionManifest(output_dir)
+    todo = [object_id for object_id in object_ids
+            if rerun or not (manifest.is_done(object_id) or (skip_failed and manifest.has_failed(object_id)))]
+    print(f"{len(object_ids) - len(todo)} of {len(object_ids)} objects already processed, {len(todo)} to go")
+
+    num_done = num_failed = 0
+    start_time = time.time()
+    with tqdm(total=len(todo)) as pbar:
+        def record_object(record):
+            nonlocal num_done, num_failed
+            manifest.add(record)
+            if record['status'] == 'done':
+                num_done += 1
+            else:
+                num_failed += 1
+                tqdm.write(f"Failed {record['object']}: {record['error']}: {record['message']}")
+            pbar.update(1)
+
+        if num_workers > 0:
+            object_queue = queue.Queue()
+            for object_id in todo:
+                object_queue.put(object_id)
+            object_queue.put(None)
+            _run_queue(make_worker, object_queue, num_workers, record_object)
+        else:
+            _init_worker(make_worker)
+            for object_id in todo:
+                record_object(_run_object(object_id))
+
+    print(f"Processed {num_done} objects, {num_failed} failed (see {manifest.errors_path}), "
+          f"time taken: {time.time() - start_time:.1f} seconds")
+    return num_done, num_failed
@@ -1,10 +1,14 @@
 import os
+import sys
 from envmap import EnvironmentMap
 from glob import glob
 from tqdm import tqdm
 # import imageio
 import numpy as np
-import pyexr
+
+# exr_io lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import exr_io
 
 
 
@@ -37,7 +41,7 @@ for envir_path in tqdm(exr_dir):
     sub_dir = os.path.dirname(saved_path)
     if os.path.exists(sub_dir) is False:
         os.makedirs(sub_dir)
-    pyexr.write(saved_path, resized_envir.data, precision=pyexr.FLOAT)
+    exr_io.write_exr(saved_path, resized_envir.data, pixel_type='float')
     # imageio.imwrite(saved_path, resized_envir.data.astype(np.float32))
 
     
@@ -5,12 +5,13 @@ from dataclasses import dataclass
 import random
 from typing import Optional
 import sys
-import glob
 
 import imageio
 import numpy as np
 import simple_parsing
-import shutil
+
+from bpy_helper.checkpoint import tmp_path_for, atomic_replace, atomic_json_dump, atomic_write_text, atomic_copy, exclusive_json_dump, load_json_or_none, install_drain_handler, exit_if_drain_requested
+
 error_list = []
 
 @dataclass
@@ -41,13 +42,114 @@ class Options:
     rho_min: float = 0.8  # Min framing coefficient for camera distance
     rho_max: float = 1.0  # Max framing coefficient for camera distance
 
+    # Sharding: a scene is described once (scene.json), its (lighting pass, split, view range) work items can then be
+    # rendered by different processes / nodes, and a merge step finalizes the outputs.
+    stage: str = 'all'  # 'all': prepare + render + merge, 'prepare': only save scene.json, 'render': render the selected work items, 'merge': validate and finalize
+    light_names: str = ''  # Comma separated lighting passes to render, e.g. 'white_env_0,env_1' (empty for all)
+    split: str = ''  # Split to render, 'train' or 'test' (empty for both)
+    view_start: int = 0  # First view index to render
+    view_end: int = -1  # End view index (exclusive) to render, -1 for all
+
+
+SPLITS = ('train', 'test')
+
+
+def get_res_dir(args: Options) -> str:
+    return f"{args.output_dir}/{args.three_d_model_path.split('/')[-1].split('.')[0]}"
+
+
+def intrinsics_paths(view_path, eye_idx):
+    return (
+        os.path.join(view_path, 'depth', f'depth_{eye_idx}.exr'),
+        os.path.join(view_path, 'normal', f'normal_cam_{eye_idx}.exr'),
+        os.path.join(view_path, 'albedo', f'albedo_cam_{eye_idx}.png'),
+    )
+
+
+def light_json_paths(res_dir, light):
+    # the light json goes next to the test views (and the train views for combined lighting)
+    json_splits = SPLITS if light['kind'] == 'combined' else ('test',)
+    return [f'{res_dir}/{split}/{light["name"]}/{light["kind"]}.json' for split in json_splits]
+
+
+def select_work_items(args: Options, scene_desc):
+    """
+    Yield the (light, split, camera) work items selected by --light_names, --split and --view_start/--view_end.
+    """
+    light_names = [name for name in args.light_names.split(',') if name]
+    for light in scene_desc['lights']:
+        if light_names and light['name'] not in light_names:
+            continue
+        for split in SPLITS:
+            if args.split and split != args.split:
+                continue
+            for cam in scene_desc['cameras'][split]:
+                if cam['eye_idx'] < args.view_start or (args.view_end >= 0 and cam['eye_idx'] >= args.view_end):
+                    continue
+                yield light, split, cam
+
+
+def find_missing_outputs(res_dir, scene_desc) -> list:
+    """
+    List the rendered files of a scene that do not exist yet. A lighting folder packed as <lighting>.tar counts as
+    complete.
+    """
+    missing = []
+    for light in scene_desc['lights']:
+        for split in SPLITS:
+            env_path = f'{res_dir}/{split}/{light["name"]}'
+            if os.path.exists(env_path + '.tar'):
+                continue
+            for cam in scene_desc['cameras'][split]:
+                gt_path = os.path.join(env_path, f'gt_{cam["eye_idx"]}.png')
+                if not os.path.exists(gt_path):
+                    missing.append(gt_path)
+                if light['name'] == scene_desc['intrinsics_light']:
+                    missing.extend(p for p in intrinsics_paths(f'{res_dir}/{split}', cam['eye_idx']) if not os.path.exists(p))
+    return missing
+
+
+def merge_scene(res_dir) -> bool:
+    """
+    Validate that every work item of a (possibly sharded) scene has been rendered, then write cameras.json, the
+    per-light json files and done.txt.
+
+    :return: True if the scene is complete
+    """
+    scene_desc = load_json_or_none(os.path.join(res_dir, 'scene.json'))
+    if scene_desc is None:
+        print(f"Cannot merge {res_dir}: scene.json not found")
+        return False
+
+    missing = find_missing_outputs(res_dir, scene_desc)
+    if missing:
+        print(f"Cannot merge {res_dir}: {len(missing)} outputs missing, e.g. {missing[:3]}")
+        return False
+
+    # === Save all camera info in a single file per split ===
+    for split in SPLITS:
+        os.makedirs(f'{res_dir}/{split}', exist_ok=True)
+        atomic_json_dump(scene_desc['cameras'][split], f'{res_dir}/{split}/cameras.json')
+
+    # save the light info
+    for light in scene_desc['lights']:
+        for json_path in light_json_paths(res_dir, light):
+            if os.path.exists(os.path.dirname(json_path) + '.tar'):
+                continue
+            atomic_json_dump(light['info'], json_path)
+
+    # store a file indicating the end of the rendering
+    atomic_write_text('done', os.path.join(res_dir, 'done.txt'))
+    print(f"Merged {res_dir}")
+    return True
+
 
 def render_core(args: Options, groups_id = 0):
     import bpy
     from mathutils import Matrix, Vector
 
     from bpy_helper.camera import create_camera, look_at_to_c2w
-    from bpy_helper.io import render_depth_map, mat2list, array2list, render_normal_map, render_albedo_map, transform_normals_to_camera_space
+    from bpy_helper.io import render_depth_map, mat2list, array2list, render_normal_map, render_albedo_map
     from bpy_helper.light import create_point_light, set_env_light, create_area_light
     from bpy_helper.material import create_white_diffuse_material, create_specular_ggx_material, clear_emission_and_alpha_nodes
     from bpy_helper.random import gen_random_pts_around_origin
@@ -62,18 +164,50 @@ def render_core(args: Options, groups_id = 0):
         bpy.context.view_layer.objects.active = new_object
         bpy.context.view_layer.update()
 
+        # Render to a hidden temporary file first, so an interrupted render never leaves a truncated gt_{idx}.png
+        gt_path = os.path.join(output_path, f'gt_{idx}.png')
+        gt_tmp_path = tmp_path_for(gt_path)
+
         bpy.context.scene.view_layers["ViewLayer"].material_override = None
         bpy.context.scene.render.image_settings.file_format = 'PNG'  # set output to png (with tonemapping)
-        bpy.context.scene.render.filepath = os.path.join(output_path, f'gt_{idx}.png')
+        bpy.context.scene.render.filepath = gt_tmp_path
         
         # with stdout_redirected():
         bpy.ops.render.render(write_still=True)
         bpy.context.view_layer.update()
 
-        img = imageio.v3.imread(os.path.join(output_path, f'gt_{idx}.png')) / 255.
+        img = imageio.v3.imread(gt_tmp_path) / 255.
         if img.shape[-1] == 4:
             img = img[..., :3] * img[..., 3:]  # fix edge aliasing
-        imageio.v3.imwrite(os.path.join(output_path, 'gt_{idx}.png'), (img * 255).clip(0, 255).astype(np.uint8))
+        imageio.v3.imwrite(gt_tmp_path, (img * 255).clip(0, 255).astype(np.uint8))
+        atomic_replace(gt_tmp_path, gt_path)
+
+    def render_intrinsics(view_path, eye_idx, c2w):
+        # Per-view file names, since shards of the same scene may render intrinsics into view_path concurrently
+        with stdout_redirected():
+            render_depth_map(view_path, file_prefix=f'depth_{eye_idx}')
+            # camera-space normals straight from the compositor
+            render_normal_map(view_path, file_prefix=f'normal_{eye_idx}', c2w=c2w)
+            render_albedo_map(view_path, file_prefix=f'albedo_{eye_idx}')
+        depth_cam_path, normals_cam_path, albedo_cam_path = intrinsics_paths(view_path, eye_idx)
+        # copy the depth map to a different name
+        os.makedirs(os.path.dirname(depth_cam_path), exist_ok=True)
+        depth_path = os.path.join(view_path, f'depth_{eye_idx}0001.exr')
+        atomic_copy(depth_path, depth_cam_path)
+        normals_path = os.path.join(view_path, f'normal_{eye_idx}0001.exr')
+        os.makedirs(os.path.dirname(normals_cam_path), exist_ok=True)
+        atomic_replace(normals_path, normals_cam_path)
+        albedo_path = os.path.join(view_path, f'albedo_{eye_idx}0001.png')
+        os.makedirs(os.path.dirname(albedo_cam_path), exist_ok=True)
+        atomic_copy(albedo_path, albedo_cam_path)
+        # clean up the files before they got moved:
+        os.remove(depth_path)
+        os.remove(albedo_path)
+        # remove the "rgb_for_" files of this view
+        for prefix in ['depth', 'normal', 'albedo']:
+            rgb_for_path = os.path.join(view_path, f'rgb_for_{prefix}_{eye_idx}.png')
+            if os.path.exists(rgb_for_path):
+                os.remove(rgb_for_path)
 
     def configure_blender():
         # Set the render resolution
@@ -89,51 +223,28 @@ def render_core(args: Options, groups_id = 0):
         bpy.context.scene.render.film_transparent = True
         bpy.context.scene.render.image_settings.color_mode = 'RGBA'
 
-    reset_scene()
-
-    #& 1.preparing the scene
-    #* 1.1 prepare the 3d model
     file_path = args.three_d_model_path
-    with stdout_redirected():
-        import_3d_model(file_path)
-    scale, offset = normalize_scene(use_bounding_sphere=True)
-    # normalize_scene scales meshes to a bounding sphere radius of 0.5 by default.
-    # Apply an additional random scale so final object radius is sampled in [0.1, 5.0].
-    sampled_object_radius = random.uniform(0.1, 5.0)
-    post_normalize_scale = sampled_object_radius / 0.5
-    for obj in bpy.context.scene.objects:
-        if obj.type == 'MESH':
-            obj.scale = [s * post_normalize_scale for s in obj.scale]
-    bpy.context.view_layer.update()
-    # Recenter after post scaling: if mesh origins aren't centered, scaling can shift the bbox center.
-    _recenter_scale, recenter_offset = normalize_scene(scale=1.0, offset=None, use_bounding_sphere=False)
-    clear_emission_and_alpha_nodes()
-
-    # Configure blender
-    configure_blender()
-
-    # Load env map list
-    env_map_list = json.load(open(args.env_map_list_json, 'r'))
-
-    # Render GT images & hints
-    seed_view = None if args.seed is None else args.seed
-    seed_white_pl = None if args.seed is None else args.seed + 1
-    seed_rgb_pl = None if args.seed is None else args.seed + 2
-    seed_multi_pl = None if args.seed is None else args.seed + 3
-    seed_area = None if args.seed is None else args.seed + 4
-    seed_combined = None if args.seed is None else args.seed + 5
-    res_dir = f"{args.output_dir}/{file_path.split('/')[-1].split('.')[0]}"
-    os.makedirs(res_dir, exist_ok=True)
-    res_dir = os.path.join(res_dir)
-    if not os.path.exists(res_dir):
-        os.makedirs(res_dir)
 
-    # normalize.json is written after bbox is computed below (includes bbox-derived radius and camera ranges).
-
-    #* 1.2 prepare the cameras
-    # Check if cameras.json exists in train and test folders
-    train_cam_path = os.path.join(res_dir, 'train', 'cameras.json')
-    test_cam_path = os.path.join(res_dir, 'test', 'cameras.json')
+    def load_model(sampled_object_radius):
+        """
+        Import and normalize the 3d model. Given the same sampled radius this is deterministic, which is what makes
+        the scene reproducible across shards.
+        """
+        reset_scene()
+        with stdout_redirected():
+            import_3d_model(file_path)
+        scale, offset = normalize_scene(use_bounding_sphere=True)
+        # normalize_scene scales meshes to a bounding sphere radius of 0.5 by default.
+        # Apply an additional random scale so final object radius is sampled in [0.1, 5.0].
+        post_normalize_scale = sampled_object_radius / 0.5
+        for obj in bpy.context.scene.objects:
+            if obj.type == 'MESH':
+                obj.scale = [s * post_normalize_scale for s in obj.scale]
+        bpy.context.view_layer.update()
+        # Recenter after post scaling: if mesh origins aren't centered, scaling can shift the bbox center.
+        _recenter_scale, recenter_offset = normalize_scene(scale=1.0, offset=None, use_bounding_sphere=False)
+        clear_emission_and_alpha_nodes()
+        return scale, offset, post_normalize_scale, recenter_offset
 
     def get_scene_bbox_world():
         bbox_min = np.array([np.inf, np.inf, np.inf], dtype=np.float32)
@@ -154,29 +265,6 @@ def render_core(args: Options, groups_id = 0):
 
         return bbox_min, bbox_max
 
-    # Use the *actual* bbox after scaling+recenter to define a robust scene radius.
-    scene_bbox_min, scene_bbox_max = get_scene_bbox_world()
-    scene_center = (scene_bbox_min + scene_bbox_max) * 0.5
-    scene_radius = float(0.5 * np.linalg.norm(scene_bbox_max - scene_bbox_min))  # half diagonal
-    scene_radius = max(scene_radius, 1e-4)
-
-    # Update normalize.json with bbox-derived scale info (overwrite earlier minimal dump).
-    json.dump(
-        {
-            'scale': scale,
-            'offset': array2list(offset),
-            'sampled_object_radius': sampled_object_radius,
-            'post_normalize_scale': post_normalize_scale,
-            'recenter_offset': array2list(recenter_offset),
-            'scene_bbox_min': array2list(scene_bbox_min),
-            'scene_bbox_max': array2list(scene_bbox_max),
-            'scene_center': array2list(scene_center),
-            'scene_radius': scene_radius,
-        },
-        open(f'{res_dir}/normalize.json', 'w'),
-        indent=4
-    )
-
     def sample_target_in_bbox(bbox_min, bbox_max):
         return [
             random.uniform(float(bbox_min[0]), float(bbox_max[0])),
@@ -207,35 +295,15 @@ def render_core(args: Options, groups_id = 0):
             return np.array([0.0, 0.0, 1.0], dtype=np.float32)
         return vec_np / norm
     
-    cameras = []
-    cameras_test = []
-    loaded_existing_cameras = False
-
-    if os.path.exists(train_cam_path) and os.path.exists(test_cam_path):
-        print(f"Loading existing cameras from {res_dir}")
-        try:
-            with open(train_cam_path, 'r') as f:
-                train_cams_data = json.load(f)
-            for cam in train_cams_data:
-                # Convert list back to Matrix if needed, but create_camera usually handles it.
-                # However, to be safe and consistent with generation, we keep it as list or convert to Matrix.
-                # bpy_helper.camera.create_camera likely expects Matrix or compatible.
-                # Let's convert to Matrix to be safe.
-                c2w = Matrix(cam['c2w'])
-                cameras.append((cam['eye_idx'], c2w, cam['fov']))
-            
-            with open(test_cam_path, 'r') as f:
-                test_cams_data = json.load(f)
-            for cam in test_cams_data:
-                c2w = Matrix(cam['c2w'])
-                cameras_test.append((cam['eye_idx'], c2w, cam['fov']))
-            
-            loaded_existing_cameras = True
-        except Exception as e:
-            print(f"Failed to load existing cameras: {e}. Generating new ones.")
-            loaded_existing_cameras = False
+    # Render GT images & hints
+    seed_view = None if args.seed is None else args.seed
+    seed_white_pl = None if args.seed is None else args.seed + 1
+    seed_rgb_pl = None if args.seed is None else args.seed + 2
+    seed_multi_pl = None if args.seed is None else args.seed + 3
+    seed_area = None if args.seed is None else args.seed + 4
+    seed_combined = None if args.seed is None else args.seed + 5
 
-    if not loaded_existing_cameras:
+    def sample_cameras(normalize_info, scene_bbox_min, scene_bbox_max, scene_radius):
         scene_fov = random.uniform(20.0, 75.0)
         rho_min = args.rho_min
         rho_max = args.rho_max
@@ -249,13 +317,7 @@ def render_core(args: Options, groups_id = 0):
         max_eye_dist = scene_radius / (rho_min * math.tan(fov_rad))
 
         # Record camera distance range for reproducibility/debugging.
-        try:
-            _norm_path = f'{res_dir}/normalize.json'
-            _norm = json.load(open(_norm_path, 'r'))
-            _norm.update({'d_min': float(min_eye_dist), 'd_max': float(max_eye_dist), 'rho_min': rho_min, 'rho_max': rho_max, 'scene_fov': float(scene_fov)})
-            json.dump(_norm, open(_norm_path, 'w'), indent=4)
-        except Exception as _e:
-            print(f"Warning: failed to update normalize.json with d_min/d_max: {_e}")
+        normalize_info.update({'d_min': float(min_eye_dist), 'd_max': float(max_eye_dist), 'rho_min': rho_min, 'rho_max': rho_max, 'scene_fov': float(scene_fov)})
 
         eyes = gen_random_pts_around_origin(
             seed=seed_view,
@@ -309,644 +371,362 @@ def render_core(args: Options, groups_id = 0):
                 c2w_interp = interpolate_c2w_pose(start_c2w, end_c2w, t)
                 cameras_test.append((eye_idx, c2w_interp, fov))
     
-    #& 2. start rendering
-    # If we loaded existing cameras, we assume intrinsics might be done, but let's be careful.
-    # The user said: "if at least one lighting variation is already rendered, we should not be rendering the intrinsics again"
-    # If loaded_existing_cameras is True, it means we have cameras.json, which implies at least one light render pass finished.
-    if loaded_existing_cameras:
-        intrinsics_saved = True
-    else:
-        intrinsics_saved = not args.save_intrinsics
-    
-    def is_folder_populated(path, num_expected):
-        # Check if tar file exists
-        if os.path.exists(path + '.tar'):
-            return True
-            
-        if not os.path.exists(path):
-            return False
-        # Check for png files. User mentioned n+1, but we check for at least n to be safe.
-        png_files = glob.glob(os.path.join(path, '*.png'))
-        return len(png_files) >= num_expected
-
-    #* 2.1 render the white env lighting first
-    for env_idx in range(args.num_white_envs):
-        train_env_path = f'{res_dir}/train/white_env_{env_idx}'
-        test_env_path = f'{res_dir}/test/white_env_{env_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: white_env_{env_idx}")
-            continue
-
-        # Use the white environment map we created
-        env_map_path = f'{args.white_env_map_dir_path}/white_env_8k.exr'
-        rotation_euler = [0, 0, random.uniform(-math.pi, math.pi)]
-        strength = 1.0
-        set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-
-        all_cams = []  # <-- Collect all cams for this env
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            if not intrinsics_saved:
-                with stdout_redirected():
-                    render_depth_map(view_path, file_prefix=f'depth_{eye_idx}')
-                    render_normal_map(view_path)
-                    render_albedo_map(view_path)
-                # copy the depth map to a different name
-                depth_folder = os.path.join(view_path, 'depth')
-                os.makedirs(depth_folder, exist_ok=True)
-                depth_path = os.path.join(view_path, f'depth_{eye_idx}0001.exr')
-                depth_cam_path = os.path.join(depth_folder, f'depth_{eye_idx}.exr')
-                shutil.copy(depth_path, depth_cam_path)
-                # Transform normals to camera space
-                normals_path = os.path.join(view_path, 'normal0001.exr')
-                normal_folder = os.path.join(view_path, 'normal')
-                os.makedirs(normal_folder, exist_ok=True)
-                normals_cam_path = os.path.join(normal_folder, f'normal_cam_{eye_idx}.exr')
-                transform_normals_to_camera_space(normals_path, c2w, normals_cam_path)
-                albedo_path = os.path.join(view_path, 'albedo0001.png')
-                albedo_folder = os.path.join(view_path, 'albedo')
-                os.makedirs(albedo_folder, exist_ok=True)
-                albedo_cam_path = os.path.join(albedo_folder, f'albedo_cam_{eye_idx}.png')
-                shutil.copy(albedo_path, albedo_cam_path)
-                # clean up the files before they got moved:
-                os.remove(os.path.join(view_path, f'depth_{eye_idx}0001.exr'))
-                os.remove(os.path.join(view_path, 'normal0001.exr'))
-                os.remove(os.path.join(view_path, 'albedo0001.png'))
-                # remove ant files with "rgb_for_" prefix
-                for file in os.listdir(view_path):
-                    if file.startswith('rgb_for_'):
-                        os.remove(os.path.join(view_path, file))
-
-            # Instead of saving cam.json per view, collect the info:
-            cam_entry = {
+        return {
+            split: [{
                 'eye_idx': eye_idx,
                 'c2w': mat2list(c2w),
                 'fov': fov,
-            }
-            all_cams.append(cam_entry)
-
-            env_path = f'{view_path}/white_env_{env_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # === Save all camera info for this env in a single file ===
-        cameras_json_path = os.path.join(view_path, f'cameras.json')
-        json.dump(all_cams, open(cameras_json_path, 'w'), indent=4)
-
-        #* render the test views for white env lighting
-        all_cams_test = []
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            if not intrinsics_saved:
-                with stdout_redirected():
-                    render_depth_map(view_path, file_prefix=f'depth_{eye_idx}')
-                    render_normal_map(view_path)
-                    render_albedo_map(view_path)
-                # copy the depth map to a different name
-                depth_folder = os.path.join(view_path, 'depth')
-                os.makedirs(depth_folder, exist_ok=True)
-                depth_path = os.path.join(view_path, f'depth_{eye_idx}0001.exr')
-                depth_cam_path = os.path.join(depth_folder, f'depth_{eye_idx}.exr')
-                shutil.copy(depth_path, depth_cam_path)
-                # Transform normals to camera space
-                normals_path = os.path.join(view_path, 'normal0001.exr')
-                normal_folder = os.path.join(view_path, 'normal')
-                os.makedirs(normal_folder, exist_ok=True)
-                normals_cam_path = os.path.join(normal_folder, f'normal_cam_{eye_idx}.exr')
-                transform_normals_to_camera_space(normals_path, c2w, normals_cam_path)
-                albedo_path = os.path.join(view_path, 'albedo0001.png')
-                albedo_folder = os.path.join(view_path, 'albedo')
-                os.makedirs(albedo_folder, exist_ok=True)
-                albedo_cam_path = os.path.join(albedo_folder, f'albedo_cam_{eye_idx}.png')
-                shutil.copy(albedo_path, albedo_cam_path)
-                # clean up the files before they got moved:
-                os.remove(os.path.join(view_path, f'depth_{eye_idx}0001.exr'))
-                os.remove(os.path.join(view_path, 'normal0001.exr'))
-                os.remove(os.path.join(view_path, 'albedo0001.png'))
-                # remove ant files with "rgb_for_" prefix
-                for file in os.listdir(view_path):
-                    if file.startswith('rgb_for_'):
-                        os.remove(os.path.join(view_path, file))
-
-            # Instead of saving cam.json per view, collect the info:
-            cam_entry = {
-                'eye_idx': eye_idx,
-                'c2w': mat2list(c2w),
-                'fov': fov,
-            }
-            all_cams_test.append(cam_entry)
-
-            env_path = f'{view_path}/white_env_{env_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-            
-        # === Save all camera info for this env in a single file ===
-        cameras_json_path = os.path.join(view_path, f'cameras.json')
-        json.dump(all_cams_test, open(cameras_json_path, 'w'), indent=4)
-
-        # save the env map
-        json.dump({
-            'env_map': 'white_env_8k.exr',
-            'rotation_euler': rotation_euler,
-            'strength': strength,
-            }, open(f'{env_path}/white_env.json', 'w'), indent=4)
-
-        intrinsics_saved = True
-
-    light_min_dist = 6.0 * scene_radius
-    light_max_dist = 20.0 * scene_radius
-
-    #* 2.2 render the white point lighting
-    white_pls = gen_random_pts_around_origin(
-        seed=seed_white_pl,
-        N=args.num_white_pls,
-        min_dist_to_origin=light_min_dist,
-        max_dist_to_origin=light_max_dist,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-    for white_pl_idx in range(args.num_white_pls):
-        train_env_path = f'{res_dir}/train/white_pl_{white_pl_idx}'
-        test_env_path = f'{res_dir}/test/white_pl_{white_pl_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: white_pl_{white_pl_idx}")
-            continue
-
-        pl = white_pls[white_pl_idx]
-        power = random.uniform(500, 1500)
-        _point_light = create_point_light(pl, power)
-        
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/white_pl_{white_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for white point lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/white_pl_{white_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # save the point light info
-        json.dump({
-            'pos': array2list(pl),
-            'power': power,
-        }, open(f'{env_path}/white_pl.json', 'w'), indent=4)
-
-    #* 2.3 render the RGB point lighting
-    rgb_pls = gen_random_pts_around_origin(
-        seed=seed_rgb_pl,
-        N=args.num_rgb_pls,
-        min_dist_to_origin=light_min_dist,
-        max_dist_to_origin=light_max_dist,
-        min_theta_in_degree=0,
-        max_theta_in_degree=60
-    )
-    for rgb_pl_idx in range(args.num_rgb_pls):
-        train_env_path = f'{res_dir}/train/rgb_pl_{rgb_pl_idx}'
-        test_env_path = f'{res_dir}/test/rgb_pl_{rgb_pl_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: rgb_pl_{rgb_pl_idx}")
-            continue
-
-        pl = rgb_pls[rgb_pl_idx]
-        power = random.uniform(900, 1500)  # slightly brighter than white light
-        rgb = [random.uniform(0, 1) for _ in range(3)]
-        create_point_light(pl, power, rgb=rgb)
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/rgb_pl_{rgb_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for RGB point lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/rgb_pl_{rgb_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # save the RGB point light info
-        json.dump({
-            'pos': array2list(pl),
-            'power': power,
-            'color': rgb,
-        }, open(f'{env_path}/rgb_pl.json', 'w'), indent=4)
-
-    #* 2.4 render the multi point lighting
-    multi_pls = gen_random_pts_around_origin(
-        seed=seed_multi_pl,
-        N=args.num_multi_pls * args.max_pl_num,
-        min_dist_to_origin=light_min_dist,
-        max_dist_to_origin=light_max_dist,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-
-    for multi_pl_idx in range(args.num_multi_pls):
-        train_env_path = f'{res_dir}/train/multi_pl_{multi_pl_idx}'
-        test_env_path = f'{res_dir}/test/multi_pl_{multi_pl_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: multi_pl_{multi_pl_idx}")
-            continue
+            } for eye_idx, c2w, fov in split_cameras]
+            for split, split_cameras in zip(SPLITS, [cameras, cameras_test])
+        }
+
+    def build_light_plan(scene_radius):
+        """
+        Sample the parameters of every lighting condition, in the same order as they are rendered. Each entry is
+        {'name': folder name, 'kind': light type (also the json file name), 'info': the light json content}.
+        """
+        # Load env map list
+        env_map_list = json.load(open(args.env_map_list_json, 'r'))
+        light_plan = []
+
+        # white env lighting
+        for env_idx in range(args.num_white_envs):
+            # Use the white environment map we created
+            light_plan.append({'name': f'white_env_{env_idx}', 'kind': 'white_env', 'info': {
+                'env_map': 'white_env_8k.exr',
+                'rotation_euler': [0, 0, random.uniform(-math.pi, math.pi)],
+                'strength': 1.0,
+            }})
+
+        light_min_dist = 6.0 * scene_radius
+        light_max_dist = 20.0 * scene_radius
+
+        # white point lighting
+        white_pls = gen_random_pts_around_origin(
+            seed=seed_white_pl,
+            N=args.num_white_pls,
+            min_dist_to_origin=light_min_dist,
+            max_dist_to_origin=light_max_dist,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
+        for white_pl_idx in range(args.num_white_pls):
+            light_plan.append({'name': f'white_pl_{white_pl_idx}', 'kind': 'white_pl', 'info': {
+                'pos': array2list(white_pls[white_pl_idx]),
+                'power': random.uniform(500, 1500),
+            }})
+
+        # RGB point lighting
+        rgb_pls = gen_random_pts_around_origin(
+            seed=seed_rgb_pl,
+            N=args.num_rgb_pls,
+            min_dist_to_origin=light_min_dist,
+            max_dist_to_origin=light_max_dist,
+            min_theta_in_degree=0,
+            max_theta_in_degree=60
+        )
+        for rgb_pl_idx in range(args.num_rgb_pls):
+            light_plan.append({'name': f'rgb_pl_{rgb_pl_idx}', 'kind': 'rgb_pl', 'info': {
+                'pos': array2list(rgb_pls[rgb_pl_idx]),
+                'power': random.uniform(900, 1500),  # slightly brighter than white light
+                'color': [random.uniform(0, 1) for _ in range(3)],
+            }})
+
+        # multi point lighting
+        multi_pls = gen_random_pts_around_origin(
+            seed=seed_multi_pl,
+            N=args.num_multi_pls * args.max_pl_num,
+            min_dist_to_origin=light_min_dist,
+            max_dist_to_origin=light_max_dist,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
 
-        pls = multi_pls[multi_pl_idx * args.max_pl_num: (multi_pl_idx + 1) * args.max_pl_num]
-        powers = [random.uniform(500, 1500) for _ in range(args.max_pl_num)]
-        colors = []
-        for pl_idx in range(args.max_pl_num):
-            if random.random() < 0.5:
-                rgb = [1.0, 1.0, 1.0]  # white
+        for multi_pl_idx in range(args.num_multi_pls):
+            pls = multi_pls[multi_pl_idx * args.max_pl_num: (multi_pl_idx + 1) * args.max_pl_num]
+            powers = [random.uniform(500, 1500) for _ in range(args.max_pl_num)]
+            colors = []
+            for pl_idx in range(args.max_pl_num):
+                if random.random() < 0.5:
+                    rgb = [1.0, 1.0, 1.0]  # white
+                else:
+                    rgb = [random.uniform(0.4, 1.0) for _ in range(3)]  # colored
+                colors.append(rgb)
+            light_plan.append({'name': f'multi_pl_{multi_pl_idx}', 'kind': 'multi_pl', 'info': {
+                'pos': mat2list(pls),
+                'power': powers,
+                'color': colors,
+            }})
+
+        # colored env lighting
+        for env_map_idx in range(args.num_env_lights):
+            light_plan.append({'name': f'env_{env_map_idx}', 'kind': 'env', 'info': {
+                'env_map': random.choice(env_map_list),
+                'rotation_euler': [0, 0, random.uniform(-math.pi, math.pi)],
+                'strength': 1.0,
+            }})
+
+        # area lighting
+        area_light_positions = gen_random_pts_around_origin(
+            seed=seed_area,
+            N=args.num_area_lights,
+            min_dist_to_origin=light_min_dist,
+            max_dist_to_origin=light_max_dist,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
+        for area_light_idx in range(args.num_area_lights):
+            area_light_power = random.uniform(700, 1500)
+            area_light_size = random.uniform(5., 10.)
+            if random.random() < 0.75:
+                color = [1.0, 1.0, 1.0]  # white
             else:
-                rgb = [random.uniform(0.4, 1.0) for _ in range(3)]  # colored
-            colors.append(rgb)
-            create_point_light(pls[pl_idx], powers[pl_idx], rgb=rgb, keep_other_lights=pl_idx > 0)
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/multi_pl_{multi_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for multi point lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/multi_pl_{multi_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # save the multi point light info
-        json.dump({
-            'pos': mat2list(pls),
-            'power': powers,
-            'color': colors,
-        }, open(f'{env_path}/multi_pl.json', 'w'), indent=4)
-
-    #* 2.5 render the colored env lighting
-    for env_map_idx in range(args.num_env_lights):
-        train_env_path = f'{res_dir}/train/env_{env_map_idx}'
-        test_env_path = f'{res_dir}/test/env_{env_map_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: env_{env_map_idx}")
-            continue
-
-        env_map = random.choice(env_map_list)
-        env_map_path = f'{args.env_map_dir_path}/{env_map}_8k.exr'
-        rotation_euler = [0, 0, random.uniform(-math.pi, math.pi)]
-        strength = 1.0
-        set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/env_{env_map_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for colored env lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/env_{env_map_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # save the env map
-        json.dump({
-            'env_map': env_map,
-            'rotation_euler': rotation_euler,
-            'strength': strength,
-        }, open(f'{env_path}/env.json', 'w'), indent=4)
-
-    #* 2.6 render the area lighting
-    area_light_positions = gen_random_pts_around_origin(
-        seed=seed_area,
-        N=args.num_area_lights,
-        min_dist_to_origin=light_min_dist,
-        max_dist_to_origin=light_max_dist,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-    for area_light_idx in range(args.num_area_lights):
-        train_env_path = f'{res_dir}/train/area_{area_light_idx}'
-        test_env_path = f'{res_dir}/test/area_{area_light_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: area_{area_light_idx}")
-            continue
-
-        area_light_pos = area_light_positions[area_light_idx]
-        area_light_power = random.uniform(700, 1500)
-        area_light_size = random.uniform(5., 10.)
-        if random.random() < 0.75:
-            color = [1.0, 1.0, 1.0]  # white
-        else:
-            color = [random.uniform(0.4, 1.0) for _ in range(3)]  # colored
-
-        _area_light = create_area_light(area_light_pos, area_light_power, area_light_size, color=color)
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/area_{area_light_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for area lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/area_{area_light_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
+                color = [random.uniform(0.4, 1.0) for _ in range(3)]  # colored
+            light_plan.append({'name': f'area_{area_light_idx}', 'kind': 'area', 'info': {
+                'pos': array2list(area_light_positions[area_light_idx]),
+                'power': area_light_power,
+                'size': area_light_size,
+                'color': color,
+            }})
+
+        # combined lighting (progressive: env -> +point1 -> +point2 -> +area)
+        # Generate positions for point lights and area light
+        num_point_lights = min(2, args.max_pl_num)  # Use up to 2 point lights
+        combined_pls = gen_random_pts_around_origin(
+            seed=seed_combined,
+            N=num_point_lights,
+            min_dist_to_origin=light_min_dist,
+            max_dist_to_origin=light_max_dist,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
+        area_light_positions = gen_random_pts_around_origin(
+            seed=seed_combined + 100 if seed_combined is not None else None,
+            N=1,
+            min_dist_to_origin=light_min_dist,
+            max_dist_to_origin=light_max_dist,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
 
-            bpy.data.objects.remove(camera, do_unlink=True)
+        if args.num_combined_lights > 0:
+            # Setup: Choose env map parameters (shared across all progressive stages)
+            env_map = random.choice(env_map_list)
+            rotation_euler = [0, 0, random.uniform(-math.pi, math.pi)]
+            strength = 1.0
+
+            # Generate light parameters
+            point_powers = [random.uniform(300, 1500) for _ in range(num_point_lights)]
+            point_colors = [[1.0, 1.0, 1.0] for _ in range(num_point_lights)]
+
+            area_light = {
+                'pos': array2list(area_light_positions[0]),
+                'power': random.uniform(300, 1500),
+                'size': random.uniform(5., 10.),
+                'color': [1.0, 1.0, 1.0],  # white area light
+            }
 
-        # save the area light info
-        json.dump({
-            'pos': array2list(area_light_pos),
-            'power': area_light_power,
-            'size': area_light_size,
-            'color': color,
-        }, open(f'{env_path}/area.json', 'w'), indent=4)
-
-    #* 2.7 render the combined lighting (progressive: env -> +point1 -> +point2 -> +area)
-    # Generate positions for point lights and area light
-    num_point_lights = min(2, args.max_pl_num)  # Use up to 2 point lights
-    combined_pls = gen_random_pts_around_origin(
-        seed=seed_combined,
-        N=num_point_lights,
-        min_dist_to_origin=light_min_dist,
-        max_dist_to_origin=light_max_dist,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-    area_light_positions = gen_random_pts_around_origin(
-        seed=seed_combined + 100 if seed_combined is not None else None,
-        N=1,
-        min_dist_to_origin=light_min_dist,
-        max_dist_to_origin=light_max_dist,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-    
-    if args.num_combined_lights > 0:
-        # Setup: Choose env map parameters (shared across all progressive stages)
-        env_map = random.choice(env_map_list)
-        env_map_path = f'{args.env_map_dir_path}/{env_map}_8k.exr'
-        rotation_euler = [0, 0, random.uniform(-math.pi, math.pi)]
-        strength = 1.0
-        
-        # Generate light parameters
-        point_powers = [random.uniform(300, 1500) for _ in range(num_point_lights)]
-        point_colors = [[1.0, 1.0, 1.0] for _ in range(num_point_lights)]
-        
-        area_light_pos = area_light_positions[0]
-        area_light_power = random.uniform(300, 1500)
-        area_light_size = random.uniform(5., 10.)
-        area_light_color = [1.0, 1.0, 1.0]  # white area light
-        
-        # Progressive rendering stages
-        # Stage 0: env map only
-        # Stage 1: env + 1st point light
-        # Stage 2: env + 1st point + 2nd point light
-        # Stage 3: env + 1st point + 2nd point + area light
-        max_stages = 1 + num_point_lights + 1  # env + points + area
-        num_stages = min(args.num_combined_lights, max_stages)
-        
-        for stage_idx in range(num_stages):
-            train_env_path = f'{res_dir}/train/combined_{stage_idx}'
-            test_env_path = f'{res_dir}/test/combined_{stage_idx}'
-            
-            if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-                print(f"Skipping existing light: combined_{stage_idx}")
-                continue
-            
-            # Stage 0: Set env light
-            if stage_idx == 0:
-                set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-                light_info = {
-                    'stage': 0,
-                    'description': 'env_only',
+            # Progressive rendering stages
+            # Stage 0: env map only
+            # Stage 1: env + 1st point light
+            # Stage 2: env + 1st point + 2nd point light
+            # Stage 3: env + 1st point + 2nd point + area light
+            max_stages = 1 + num_point_lights + 1  # env + points + area
+            num_stages = min(args.num_combined_lights, max_stages)
+
+            for stage_idx in range(num_stages):
+                if stage_idx == 0:
+                    light_info = {'stage': 0, 'description': 'env_only'}
+                elif stage_idx < 1 + num_point_lights:
+                    light_info = {'stage': stage_idx, 'description': f'env + {stage_idx} point light' + ('s' if stage_idx > 1 else '')}
+                else:
+                    light_info = {'stage': 3, 'description': f'env + {num_point_lights} point lights + area light'}
+                light_info.update({
                     'env_map': env_map,
                     'rotation_euler': rotation_euler,
                     'strength': strength,
-                }
-            
-            # Stage 1: Add 1st point light
-            elif stage_idx == 1:
-                set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-                create_point_light(combined_pls[0], point_powers[0], rgb=point_colors[0], keep_other_lights=True)
-                light_info = {
-                    'stage': 1,
-                    'description': 'env + 1 point light',
-                    'env_map': env_map,
-                    'has_env_light': True,
-                    'rotation_euler': rotation_euler,
-                    'strength': strength,
-                    'point_lights': {
-                        'pos': [array2list(combined_pls[0])],
-                        'power': [point_powers[0]],
-                        'color': [point_colors[0]],
+                })
+                if stage_idx > 0:
+                    light_info['has_env_light'] = True
+                if 0 < stage_idx < 1 + num_point_lights:
+                    light_info['point_lights'] = {
+                        'pos': [array2list(combined_pls[i]) for i in range(stage_idx)],
+                        'power': point_powers[:stage_idx],
+                        'color': point_colors[:stage_idx],
                     }
-                }
+                elif stage_idx >= 1 + num_point_lights:
+                    light_info['point_lights'] = {
+                        'pos': [array2list(combined_pls[i]) for i in range(num_point_lights)],
+                        'power': point_powers[:num_point_lights],
+                        'color': point_colors[:num_point_lights],
+                    } if num_point_lights > 0 else None
+                    light_info['area_light'] = area_light
+                light_plan.append({'name': f'combined_{stage_idx}', 'kind': 'combined', 'info': light_info})
             
-            # Stage 2: Add 2nd point light (if available)
-            elif stage_idx == 2 and num_point_lights >= 2:
-                set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-                create_point_light(combined_pls[0], point_powers[0], rgb=point_colors[0], keep_other_lights=True)
-                create_point_light(combined_pls[1], point_powers[1], rgb=point_colors[1], keep_other_lights=True)
-                light_info = {
-                    'stage': 2,
-                    'description': 'env + 2 point lights',
-                    'env_map': env_map,
-                    'has_env_light': True,
-                    'rotation_euler': rotation_euler,
-                    'strength': strength,
-                    'point_lights': {
-                        'pos': [array2list(combined_pls[0]), array2list(combined_pls[1])],
-                        'power': [point_powers[0], point_powers[1]],
-                        'color': [point_colors[0], point_colors[1]],
-                    }
-                }
+        return light_plan
+            
+    def describe_scene(sampled_object_radius, scale, offset, post_normalize_scale, recenter_offset):
+        """
+        Sample everything random about the scene (cameras and lights) into a json-serializable description.
+        """
+        # Use the *actual* bbox after scaling+recenter to define a robust scene radius.
+        scene_bbox_min, scene_bbox_max = get_scene_bbox_world()
+        scene_center = (scene_bbox_min + scene_bbox_max) * 0.5
+        scene_radius = float(0.5 * np.linalg.norm(scene_bbox_max - scene_bbox_min))  # half diagonal
+        scene_radius = max(scene_radius, 1e-4)
             
-            # Stage 3+: Add area light
-            elif stage_idx >= 3 or (stage_idx == 2 and num_point_lights < 2):
-                set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-                # Add all available point lights
-                for pl_idx in range(num_point_lights):
-                    create_point_light(combined_pls[pl_idx], point_powers[pl_idx], rgb=point_colors[pl_idx], keep_other_lights=True)
-                # Add area light
-                create_area_light(area_light_pos, area_light_power, area_light_size, color=area_light_color, keep_other_lights=True)
+        normalize_info = {
+            'scale': scale,
+            'offset': array2list(offset),
+            'sampled_object_radius': sampled_object_radius,
+            'post_normalize_scale': post_normalize_scale,
+            'recenter_offset': array2list(recenter_offset),
+            'scene_bbox_min': array2list(scene_bbox_min),
+            'scene_bbox_max': array2list(scene_bbox_max),
+            'scene_center': array2list(scene_center),
+            'scene_radius': scene_radius,
+        }
                 
-                point_lights_data = {
-                    'pos': [array2list(combined_pls[i]) for i in range(num_point_lights)],
-                    'power': point_powers[:num_point_lights],
-                    'color': point_colors[:num_point_lights],
-                } if num_point_lights > 0 else None
+        #* 1.2 prepare the cameras
+        # Reuse cameras.json from an earlier (pre scene.json) render if present
+        train_cam_path = os.path.join(res_dir, 'train', 'cameras.json')
+        test_cam_path = os.path.join(res_dir, 'test', 'cameras.json')
+        cameras = None
+        if os.path.exists(train_cam_path) and os.path.exists(test_cam_path):
+            print(f"Loading existing cameras from {res_dir}")
+            cameras = {'train': load_json_or_none(train_cam_path), 'test': load_json_or_none(test_cam_path)}
+            if cameras['train'] is None or cameras['test'] is None:
+                print("Failed to load existing cameras. Generating new ones.")
+                cameras = None
+        if cameras is None:
+            cameras = sample_cameras(normalize_info, scene_bbox_min, scene_bbox_max, scene_radius)
                 
-                light_info = {
-                    'stage': 3,
-                    'description': f'env + {num_point_lights} point lights + area light',
-                    'env_map': env_map,
-                    'rotation_euler': rotation_euler,
-                    'has_env_light': True,
-                    'strength': strength,
-                    'point_lights': point_lights_data,
-                    'area_light': {
-                        'pos': array2list(area_light_pos),
-                        'power': area_light_power,
-                        'size': area_light_size,
-                        'color': area_light_color,
-                    }
-                }
+        #* 1.3 prepare the lighting
+        lights = build_light_plan(scene_radius)
             
-            # Render train views
-            for eye_idx, c2w, fov in cameras:
-                camera = create_camera(c2w, fov)
-                bpy.context.scene.camera = camera
-                view_path = f'{res_dir}/train'
-                if not os.path.exists(view_path):
-                    os.makedirs(view_path)
-
-                env_path = f'{view_path}/combined_{stage_idx}'
-                os.makedirs(env_path, exist_ok=True)
-                with stdout_redirected():
-                    render_rgb_and_hint(f'{env_path}', eye_idx)
+        # Depth / normal / albedo do not depend on lighting, they are rendered together with the first white env
+        intrinsics_light = None
+        if args.save_intrinsics and args.num_white_envs > 0:
+            intrinsics_light = 'white_env_0'
+
+        return {
+            'model_path': file_path,
+            'normalize': normalize_info,
+            'cameras': cameras,
+            'lights': lights,
+            'intrinsics_light': intrinsics_light,
+        }
+
+    def apply_lighting(light):
+        """
+        Set up the blender lights for one entry of the light plan.
+        """
+        kind, info = light['kind'], light['info']
+        if kind == 'white_env':
+            set_env_light(f'{args.white_env_map_dir_path}/{info["env_map"]}', rotation_euler=info['rotation_euler'], strength=info['strength'])
+        elif kind == 'env':
+            set_env_light(f'{args.env_map_dir_path}/{info["env_map"]}_8k.exr', rotation_euler=info['rotation_euler'], strength=info['strength'])
+        elif kind == 'white_pl':
+            create_point_light(info['pos'], info['power'])
+        elif kind == 'rgb_pl':
+            create_point_light(info['pos'], info['power'], rgb=info['color'])
+        elif kind == 'multi_pl':
+            for pl_idx, (pos, power, rgb) in enumerate(zip(info['pos'], info['power'], info['color'])):
+                create_point_light(pos, power, rgb=rgb, keep_other_lights=pl_idx > 0)
+        elif kind == 'area':
+            create_area_light(info['pos'], info['power'], info['size'], color=info['color'])
+        elif kind == 'combined':
+            set_env_light(f'{args.env_map_dir_path}/{info["env_map"]}_8k.exr', rotation_euler=info['rotation_euler'], strength=info['strength'])
+            point_lights = info.get('point_lights') or {'pos': [], 'power': [], 'color': []}
+            for pos, power, rgb in zip(point_lights['pos'], point_lights['power'], point_lights['color']):
+                create_point_light(pos, power, rgb=rgb, keep_other_lights=True)
+            if 'area_light' in info:
+                area_light = info['area_light']
+                create_area_light(area_light['pos'], area_light['power'], area_light['size'], color=area_light['color'], keep_other_lights=True)
+        else:
+            raise ValueError(f"Unknown light kind: {kind}")
+
+    #& 1.preparing the scene
+    #* 1.1 prepare the 3d model
+    res_dir = get_res_dir(args)
+    os.makedirs(res_dir, exist_ok=True)
+
+    scene_json_path = os.path.join(res_dir, 'scene.json')
+    scene_desc = load_json_or_none(scene_json_path)
+    if scene_desc is not None and args.stage == 'prepare':
+        print(f"Scene already prepared: {scene_json_path}")
+        return
+
+    if scene_desc is None:
+        sampled_object_radius = random.uniform(0.1, 5.0)
+        scene_desc = describe_scene(sampled_object_radius, *load_model(sampled_object_radius))
+        # Several shards may prepare the same scene at once, only the first description is kept
+        if exclusive_json_dump(scene_desc, scene_json_path):
+            atomic_json_dump(scene_desc['normalize'], f'{res_dir}/normalize.json')
+        else:
+            print(f"{scene_json_path} was written by another worker, using it instead")
+            scene_desc = load_json_or_none(scene_json_path)
+            load_model(scene_desc['normalize']['sampled_object_radius'])
+    else:
+        print(f"Loading scene description from {scene_json_path}")
+        load_model(scene_desc['normalize']['sampled_object_radius'])
 
-                bpy.data.objects.remove(camera, do_unlink=True)
+    if args.stage == 'prepare':
+        return
 
-            # Save light info for train
-            train_env_path = f'{res_dir}/train/combined_{stage_idx}'
-            json.dump(light_info, open(f'{train_env_path}/combined.json', 'w'), indent=4)
+    # Configure blender
+    configure_blender()
+
+    #& 2. start rendering
+    # Collect the selected work items that are still missing, grouped by lighting
+    pending = {}
+    for light, split, cam in select_work_items(args, scene_desc):
+        view_path = f'{res_dir}/{split}'
+        env_path = f'{view_path}/{light["name"]}'
+        if os.path.exists(env_path + '.tar'):
+            continue
+        need_rgb = not os.path.exists(os.path.join(env_path, f'gt_{cam["eye_idx"]}.png'))
+        need_intrinsics = light['name'] == scene_desc['intrinsics_light'] and \
+            not all(os.path.exists(p) for p in intrinsics_paths(view_path, cam['eye_idx']))
+        if need_rgb or need_intrinsics:
+            pending.setdefault(light['name'], []).append((split, cam, need_rgb, need_intrinsics))
+
+    for light in scene_desc['lights']:
+        items = pending.get(light['name'])
+        if not items:
+            continue
+        print(f"Rendering {len(items)} missing views for light: {light['name']}")
+        apply_lighting(light)
 
-            # Render test views
-            for eye_idx, c2w, fov in cameras_test:
-                camera = create_camera(c2w, fov)
-                bpy.context.scene.camera = camera
-                view_path = f'{res_dir}/test'
-                if not os.path.exists(view_path):
-                    os.makedirs(view_path)
+        for split, cam, need_rgb, need_intrinsics in items:
+            # On preemption, stop between views; the finished views are kept and the rest resumes on requeue
+            exit_if_drain_requested(f'{res_dir} stopped at {light["name"]} {split} view {cam["eye_idx"]}')
+            eye_idx, c2w, fov = cam['eye_idx'], np.array(cam['c2w']), cam['fov']
+            camera = create_camera(c2w, fov)
+            bpy.context.scene.camera = camera
+            view_path = f'{res_dir}/{split}'
+            os.makedirs(view_path, exist_ok=True)
 
-                env_path = f'{view_path}/combined_{stage_idx}'
+            if need_intrinsics:
+                render_intrinsics(view_path, eye_idx, c2w)
+
+            if need_rgb:
+                env_path = f'{view_path}/{light["name"]}'
                 os.makedirs(env_path, exist_ok=True)
                 with stdout_redirected():
                     render_rgb_and_hint(f'{env_path}', eye_idx)
 
-                bpy.data.objects.remove(camera, do_unlink=True)
-
-            # Save light info for test
-            test_env_path = f'{res_dir}/test/combined_{stage_idx}'
-            json.dump(light_info, open(f'{test_env_path}/combined.json', 'w'), indent=4)
+            bpy.data.objects.remove(camera, do_unlink=True)
 
-    # store a file indicating the end of the rendering
-    with open(os.path.join(res_dir, 'done.txt'), 'w') as f:
-        f.write('done')
-        f.close()
+    if args.stage == 'all':
+        merge_scene(res_dir)
 
 
 if __name__ == '__main__':
     dataset_path = '/projects/vig/Datasets/objaverse/hf-objaverse-v1/glbs/'
 
     args: Options = simple_parsing.parse(Options)
+    install_drain_handler()
     print(Options)
     import csv
     index_uid_list = []
@@ -959,6 +739,8 @@ if __name__ == '__main__':
     # Preview
     print(f"Loaded {len(index_uid_list)} entries")
 
+    merge_failed = []
+
     for i in range(args.group_start, args.group_end):
         index, uid = index_uid_list[i]
         # index = '000-027'
@@ -983,6 +765,15 @@ if __name__ == '__main__':
             print('rendering group:', j)
             # if os.path.exists(os.path.join(args.output_dir, uid, 'done.txt')):
             #     continue
+            if args.stage == 'merge':
+                if not merge_scene(get_res_dir(args)):
+                    merge_failed.append(uid)
+                continue
+            exit_if_drain_requested(f'{uid} not started')
             render_core(args, j)
             print('render progress:', i, 'of range', args.group_start, '~', args.group_end)
         
+
+    if merge_failed:
+        print(f"Failed to merge {len(merge_failed)} models: {merge_failed}")
+        sys.exit(1)
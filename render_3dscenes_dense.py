@@ -56,29 +56,48 @@ class Options:
     # Random seed for scene composition
     scene_seed: Optional[int] = None
 
+    # Only compose the scene (scene.json, cameras, lights.json and a .blend snapshot) without rendering, so that a
+    # separate render process can open the prepared snapshot instead of importing every model again
+    prepare_only: bool = False
 
-def render_core(args: Options, groups_id = 0):
+    # Stream the rendered images, intrinsics and light jsons into WebDataset-style tar shards under
+    # <output_dir>/shards (one shard series per --group_start/--group_end range) instead of one file per output.
+    # The scene state (scene.json, lights.json, cameras.json, done.txt) stays on disk.
+    shard_output: bool = False
+    shard_max_members: int = 10000  # Start a new shard after this many members
+    shard_max_bytes: int = 1 << 30  # Start a new shard once the current one is this large
+
+
+def render_core(args: Options, groups_id = 0, sink = None):
     import bpy
     import mathutils
     from mathutils import Matrix
 
     from bpy_helper.camera import create_camera, look_at_to_c2w
-    from bpy_helper.io import render_depth_map, mat2list, array2list, render_normal_map, render_albedo_map, transform_normals_to_camera_space
+    from bpy_helper.checkpoint import tmp_path_for, atomic_replace, atomic_json_dump, atomic_write_text, load_json_or_none, exit_if_drain_requested
+    from bpy_helper.io import save_blend_file, render_depth_map, mat2list, array2list, render_normal_map, render_albedo_map
     from bpy_helper.light import create_point_light, set_env_light, create_area_light
     from bpy_helper.material import create_white_diffuse_material, create_specular_ggx_material, clear_emission_and_alpha_nodes
     from bpy_helper.random import gen_random_pts_around_origin, gen_pt_traj_around_origin
     from bpy_helper.scene import import_3d_model, normalize_scene, reset_scene
+    from bpy_helper.shards import DirectorySink
     from bpy_helper.utils import stdout_redirected
 
-    def add_textured_plane(texture_dir):
-        # Create a large plane
-        size = random.uniform(30.0, 50.0)
-        bpy.ops.mesh.primitive_plane_add(size=size)
-        plane = bpy.context.active_object
-        plane.name = "GroundPlane"
+    # Where the rendered outputs go: one file each (default) or tar shards (see --shard_output)
+    if sink is None:
+        sink = DirectorySink()
         
-        # Rotate arbitrarily around up axis
-        plane.rotation_euler = [0, 0, random.uniform(0, 2*math.pi)]
+    def sample_ground_plane(texture_dir):
+        """
+        Sample the ground plane parameters. The result is stored in scene.json so that a resumed render rebuilds
+        exactly the same plane.
+        """
+        plane_spec = {
+            'size': random.uniform(30.0, 50.0),
+            # Rotate arbitrarily around up axis
+            'rotation_z': random.uniform(0, 2*math.pi),
+            'texture_path': None,
+        }
         
         # 50% chance to apply texture, 50% chance to leave it without texture
         apply_texture = random.random() < 0.5
@@ -99,35 +118,50 @@ def render_core(args: Options, groups_id = 0):
                     diff_candidates = [f for f in candidates if any(k in f.lower() for k in ['diff', 'col', 'albedo'])]
                     
                     if diff_candidates:
-                        texture_path = random.choice(diff_candidates)
-                        
-                        mat = bpy.data.materials.new(name="PlaneMaterial")
-                        mat.use_nodes = True
-                        nodes = mat.node_tree.nodes
-                        links = mat.node_tree.links
-                        bsdf = nodes.get("Principled BSDF")
-                        
-                        tex_image = nodes.new('ShaderNodeTexImage')
-                        try:
-                            img = bpy.data.images.load(texture_path)
-                            tex_image.image = img
-                            links.new(tex_image.outputs['Color'], bsdf.inputs['Base Color'])
-                            print(f"Applied texture to plane: {texture_path}")
-                        except Exception as e:
-                            print(f"Could not load texture {texture_path}: {e}")
-                            
-                        if plane.data.materials:
-                            plane.data.materials[0] = mat
-                        else:
-                            plane.data.materials.append(mat)
-                            
-                        bpy.ops.object.mode_set(mode='EDIT')
-                        bpy.ops.uv.smart_project()
-                        bpy.ops.object.mode_set(mode='OBJECT')
+                        plane_spec['texture_path'] = random.choice(diff_candidates)
             except Exception as e:
                 print(f"Error applying texture to plane: {e}")
         else:
             print(f"Ground plane created without texture (apply_texture={apply_texture})")
+        return plane_spec
+
+    def add_textured_plane(plane_spec):
+        # Create a large plane
+        bpy.ops.mesh.primitive_plane_add(size=plane_spec['size'])
+        plane = bpy.context.active_object
+        plane.name = "GroundPlane"
+        plane.rotation_euler = [0, 0, plane_spec['rotation_z']]
+
+        texture_path = plane_spec.get('texture_path')
+        if not texture_path:
+            return
+
+        try:
+            mat = bpy.data.materials.new(name="PlaneMaterial")
+            mat.use_nodes = True
+            nodes = mat.node_tree.nodes
+            links = mat.node_tree.links
+            bsdf = nodes.get("Principled BSDF")
+
+            tex_image = nodes.new('ShaderNodeTexImage')
+            try:
+                img = bpy.data.images.load(texture_path)
+                tex_image.image = img
+                links.new(tex_image.outputs['Color'], bsdf.inputs['Base Color'])
+                print(f"Applied texture to plane: {texture_path}")
+            except Exception as e:
+                print(f"Could not load texture {texture_path}: {e}")
+
+            if plane.data.materials:
+                plane.data.materials[0] = mat
+            else:
+                plane.data.materials.append(mat)
+
+            bpy.ops.object.mode_set(mode='EDIT')
+            bpy.ops.uv.smart_project()
+            bpy.ops.object.mode_set(mode='OBJECT')
+        except Exception as e:
+            print(f"Error applying texture to plane: {e}")
 
     def get_world_bbox(obj):
         """
@@ -305,14 +339,46 @@ def render_core(args: Options, groups_id = 0):
                         obj.location = original_locations[obj] + fallback_offset
                  bpy.context.view_layer.update()
 
+    def root_transforms(model_objects):
+        """
+        Collect the world matrices of the root objects of a placed model, keyed by object name.
+        """
+        return {obj.name: mat2list(obj.matrix_world) for obj in model_objects if obj.parent is None}
+
+    def apply_root_transforms(model_objects, transforms):
+        """
+        Restore the world matrices recorded by root_transforms. Object names are deterministic because models are
+        re-imported in the same order into a freshly reset scene.
+        """
+        for obj in model_objects:
+            if obj.parent is not None:
+                continue
+            if obj.name not in transforms:
+                print(f"WARNING: no recorded transform for {obj.name}, leaving it in place")
+                continue
+            obj.matrix_world = Matrix(transforms[obj.name])
+        bpy.context.view_layer.update()
+
+    def load_lq_objects(filepath):
+        # Load objects from .blend file
+        with bpy.data.libraries.load(filepath) as (data_from, data_to):
+            data_to.objects = data_from.objects
+
+        lq_objects = []
+        for obj in data_to.objects:
+            if obj is not None:
+                bpy.context.collection.objects.link(obj)
+                lq_objects.append(obj)
+        return lq_objects
+
     def add_lq_model(model_dir, lq_candidates, existing_objects=[]):
         if not os.path.exists(model_dir):
             print(f"LQ Model dir {model_dir} does not exist.")
-            return []
+            return [], None
 
         if not lq_candidates:
             print("No LQ candidates provided")
-            return []
+            return [], None
         
         # Pick one random LQ model
         model_id = random.choice(lq_candidates)
@@ -324,7 +390,7 @@ def render_core(args: Options, groups_id = 0):
         
         if not files:
             print(f"Could not find .blend file for {model_id} in {os.path.join(model_dir, model_id)}")
-            return []
+            return [], None
             
         # Prefer 4k, then 1k, then whatever
         filepath = None
@@ -342,28 +408,17 @@ def render_core(args: Options, groups_id = 0):
         
         print(f"Loading LQ model: {model_id} from {filepath}")
         
-        # Load objects from .blend file
-        with bpy.data.libraries.load(filepath) as (data_from, data_to):
-            data_to.objects = data_from.objects
-            
-        lq_objects = []
-        for obj in data_to.objects:
-            if obj is not None:
-                bpy.context.collection.objects.link(obj)
-                lq_objects.append(obj)
+        lq_objects = load_lq_objects(filepath)
                 
         if not lq_objects:
             print("No objects loaded from .blend file")
-            return []
+            return [], None
 
         place_object_randomly(lq_objects, existing_objects, scale_range=(0.8, 1.2))
-        return lq_objects
+        model_spec = {'type': 'lq', 'model_id': model_id, 'path': filepath, 'transforms': root_transforms(lq_objects)}
+        return lq_objects, model_spec
 
-    def add_glb_model(filepath, existing_objects=[], scale_range=(0.7, 1.0)):
-        if not os.path.exists(filepath):
-            print(f"GLB file not found: {filepath}")
-            return []
-            
+    def import_glb_objects(filepath):
         # Capture objects before import
         objs_before = set(bpy.context.scene.objects)
         
@@ -371,12 +426,89 @@ def render_core(args: Options, groups_id = 0):
             import_3d_model(filepath)
             
         objs_after = set(bpy.context.scene.objects)
-        new_objects = list(objs_after - objs_before)
+        return list(objs_after - objs_before)
         
-        if new_objects:
-            place_object_randomly(new_objects, existing_objects, scale_range=scale_range)
+    def add_glb_model(filepath, existing_objects=[], scale_range=(0.7, 1.0)):
+        if not os.path.exists(filepath):
+            print(f"GLB file not found: {filepath}")
+            return [], None
             
-        return new_objects
+        new_objects = import_glb_objects(filepath)
+
+        if not new_objects:
+            return [], None
+
+        place_object_randomly(new_objects, existing_objects, scale_range=scale_range)
+        model_spec = {'type': 'glb', 'path': filepath, 'transforms': root_transforms(new_objects)}
+        return new_objects, model_spec
+
+    def compose_scene():
+        """
+        Randomly compose the scene (ground plane, 1 LQ object and 2-7 GLB objects) and return its description.
+        """
+        plane_spec = sample_ground_plane(args.texture_dir)
+        add_textured_plane(plane_spec)
+        scene_spec = {'ground_plane': plane_spec, 'models': []}
+
+        # Track all objects in the scene to avoid collisions
+        # Start with ground plane
+        existing_objects = [obj for obj in bpy.context.scene.objects if obj.name == "GroundPlane"]
+
+        # --- Load LQ Object (1) ---
+        # Load curated LQ list
+        lq_candidates = []
+        if os.path.exists(args.lq_list_path):
+            try:
+                with open(args.lq_list_path, 'r') as f:
+                    lq_candidates = json.load(f)
+            except Exception as e:
+                print(f"Error loading LQ list: {e}")
+
+        if lq_candidates:
+            print("Loading 1 LQ object")
+            new_objs, model_spec = add_lq_model(args.model_lq_dir, lq_candidates, existing_objects)
+            if new_objs:
+                existing_objects.extend(new_objs)
+                scene_spec['models'].append(model_spec)
+
+        # --- Load Additional GLB Objects (0-7) ---
+        # Load curated GLB list
+        glb_candidates = []
+        if os.path.exists(args.glb_list_path):
+            try:
+                with open(args.glb_list_path, 'r') as f:
+                    reader = csv.reader(f)
+                    for row in reader:
+                        if len(row) >= 2:
+                            glb_candidates.append((row[0].strip(), row[1].strip()))
+            except Exception as e:
+                print(f"Error loading GLB list: {e}")
+
+        if glb_candidates:
+            num_glbs = random.randint(2, 7)
+            print(f"Loading {num_glbs} additional GLB objects")
+            for _ in range(num_glbs):
+                idx, uid = random.choice(glb_candidates)
+                glb_path = os.path.join(args.glbs_root_path, idx, f"{uid}.glb")
+                new_objs, model_spec = add_glb_model(glb_path, existing_objects, scale_range=(0.5, 1.0))
+                if new_objs:
+                    existing_objects.extend(new_objs)
+                    scene_spec['models'].append(model_spec)
+        return scene_spec
+
+    def rebuild_scene(scene_spec):
+        """
+        Rebuild a scene from the description saved by compose_scene, without consuming any randomness.
+        """
+        add_textured_plane(scene_spec['ground_plane'])
+        for model_spec in scene_spec['models']:
+            if model_spec['type'] == 'lq':
+                print(f"Reloading LQ model: {model_spec['model_id']} from {model_spec['path']}")
+                model_objects = load_lq_objects(model_spec['path'])
+            else:
+                print(f"Reloading GLB model: {model_spec['path']}")
+                model_objects = import_glb_objects(model_spec['path'])
+            apply_root_transforms(model_objects, model_spec['transforms'])
 
     def render_rgb_and_hint(output_path,idx = 0):
         # Get the last added object (assuming the new object is the most recently added one)
@@ -386,18 +518,57 @@ def render_core(args: Options, groups_id = 0):
         # bpy.context.view_layer.objects.active = new_object
         # bpy.context.view_layer.update()
 
+        # Render to a hidden temporary file first, so an interrupted render never leaves a truncated gt_{idx}.png
+        gt_path = os.path.join(output_path, f'gt_{idx}.png')
+        gt_tmp_path = sink.tmp_path(gt_path)
+
         bpy.context.scene.view_layers["ViewLayer"].material_override = None
         bpy.context.scene.render.image_settings.file_format = 'PNG'  # set output to png (with tonemapping)
-        bpy.context.scene.render.filepath = os.path.join(output_path, f'gt_{idx}.png')
+        bpy.context.scene.render.filepath = gt_tmp_path
         
         # with stdout_redirected():
         bpy.ops.render.render(write_still=True)
         bpy.context.view_layer.update()
 
-        img = imageio.v3.imread(os.path.join(output_path, f'gt_{idx}.png')) / 255.
+        img = imageio.v3.imread(gt_tmp_path) / 255.
         if img.shape[-1] == 4:
             img = img[..., :3] * img[..., 3:]  # fix edge aliasing
-        imageio.v3.imwrite(os.path.join(output_path, 'gt_{idx}.png'), (img * 255).clip(0, 255).astype(np.uint8))
+        imageio.v3.imwrite(gt_tmp_path, (img * 255).clip(0, 255).astype(np.uint8))
+        sink.commit(gt_tmp_path, gt_path)
+
+    def intrinsics_paths(view_path, eye_idx):
+        return (
+            os.path.join(view_path, 'depth', f'depth_{eye_idx}.exr'),
+            os.path.join(view_path, 'normal', f'normal_cam_{eye_idx}.exr'),
+            os.path.join(view_path, 'albedo', f'albedo_cam_{eye_idx}.png'),
+        )
+
+    def render_intrinsics(view_path, eye_idx, c2w):
+        # Blender writes the raw passes to the work dir (the view dir, or local scratch when writing shards)
+        work_dir = sink.work_dir(view_path)
+        with stdout_redirected():
+            render_depth_map(work_dir, file_prefix=f'depth_{eye_idx}')
+            # camera-space normals straight from the compositor
+            render_normal_map(work_dir, c2w=c2w)
+            render_albedo_map(work_dir)
+        depth_cam_path, normals_cam_path, albedo_cam_path = intrinsics_paths(view_path, eye_idx)
+        # move the depth map to a different name
+        depth_path = os.path.join(work_dir, f'depth_{eye_idx}0001.exr')
+        depth_cam_tmp_path = sink.tmp_path(depth_cam_path)
+        os.replace(depth_path, depth_cam_tmp_path)
+        sink.commit(depth_cam_tmp_path, depth_cam_path)
+        normals_path = os.path.join(work_dir, 'normal0001.exr')
+        normals_cam_tmp_path = sink.tmp_path(normals_cam_path)
+        os.replace(normals_path, normals_cam_tmp_path)
+        sink.commit(normals_cam_tmp_path, normals_cam_path)
+        albedo_path = os.path.join(work_dir, 'albedo0001.png')
+        albedo_cam_tmp_path = sink.tmp_path(albedo_cam_path)
+        os.replace(albedo_path, albedo_cam_tmp_path)
+        sink.commit(albedo_cam_tmp_path, albedo_cam_path)
+        # remove ant files with "rgb_for_" prefix
+        for file in os.listdir(work_dir):
+            if file.startswith('rgb_for_'):
+                os.remove(os.path.join(work_dir, file))
 
     def configure_blender():
         # Set the render resolution
@@ -416,7 +587,11 @@ def render_core(args: Options, groups_id = 0):
         bpy.context.scene.render.film_transparent = True
         bpy.context.scene.render.image_settings.color_mode = 'RGBA'
 
-    reset_scene()
+    # file_path is not defined here, we should use args.three_d_model_path or extract the UID
+    # The original code used file_path which was args.three_d_model_path
+    file_path = args.three_d_model_path
+    res_dir = f"{args.output_dir}/{file_path.split('/')[-1].split('.')[0]}"
+    os.makedirs(res_dir, exist_ok=True)
 
     #& 1.preparing the scene
     #* 1.1 prepare the 3d model
@@ -428,51 +603,29 @@ def render_core(args: Options, groups_id = 0):
         # compute the output_dir str into a seed integer based on the hash of the string:
         current_seed = int(hashlib.sha256(args.output_dir.encode()).hexdigest(), 16) % 1000000
     
-    # Add ground plane first
-    add_textured_plane(args.texture_dir)
-    
-    # Track all objects in the scene to avoid collisions
-    # Start with ground plane
-    existing_objects = [obj for obj in bpy.context.scene.objects if obj.name == "GroundPlane"]
-    
-    # --- Load LQ Object (1) ---
-    # Load curated LQ list
-    lq_candidates = []
-    if os.path.exists(args.lq_list_path):
-        try:
-            with open(args.lq_list_path, 'r') as f:
-                lq_candidates = json.load(f)
-        except Exception as e:
-            print(f"Error loading LQ list: {e}")
-            
-    if lq_candidates:
-        print("Loading 1 LQ object")
-        new_objs = add_lq_model(args.model_lq_dir, lq_candidates, existing_objects)
-        if new_objs:
-            existing_objects.extend(new_objs)
-
-    # --- Load Additional GLB Objects (0-7) ---
-    # Load curated GLB list
-    glb_candidates = []
-    if os.path.exists(args.glb_list_path):
-        try:
-            with open(args.glb_list_path, 'r') as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    if len(row) >= 2:
-                        glb_candidates.append((row[0].strip(), row[1].strip()))
-        except Exception as e:
-            print(f"Error loading GLB list: {e}")
+    # The scene composition is persisted before any rendering, so an interrupted job can rebuild the exact same
+    # scene and only render the missing views.
+    # A prepared .blend snapshot (see --prepare_only) skips model import and placement altogether.
+    scene_json_path = os.path.join(res_dir, 'scene.json')
+    snapshot_path = os.path.join(res_dir, '.scene_snapshot.blend')
+    scene_spec = load_json_or_none(scene_json_path)
+    if scene_spec is not None and os.path.exists(snapshot_path) and not args.prepare_only:
+        print(f"Opening prepared scene {snapshot_path}")
+        import_3d_model(snapshot_path)
+    elif scene_spec is not None:
+        print(f"Rebuilding scene from {scene_json_path}")
+        reset_scene()
+        rebuild_scene(scene_spec)
+    else:
+        reset_scene()
+        scene_spec = compose_scene()
+        atomic_json_dump(scene_spec, scene_json_path)
     
-    if glb_candidates:
-        num_glbs = random.randint(2, 7)
-        print(f"Loading {num_glbs} additional GLB objects")
-        for _ in range(num_glbs):
-            idx, uid = random.choice(glb_candidates)
-            glb_path = os.path.join(args.glbs_root_path, idx, f"{uid}.glb")
-            new_objs = add_glb_model(glb_path, existing_objects, scale_range=(0.5, 1.0))
-            if new_objs:
-                existing_objects.extend(new_objs)
+    if args.prepare_only and not os.path.exists(snapshot_path):
+        snapshot_tmp_path = tmp_path_for(snapshot_path)
+        with stdout_redirected():
+            save_blend_file(snapshot_tmp_path)
+        atomic_replace(snapshot_tmp_path, snapshot_path)
     
     # Debug: Print all objects final locations
     for obj in bpy.context.scene.objects:
@@ -490,9 +643,6 @@ def render_core(args: Options, groups_id = 0):
     # Configure blender
     configure_blender()
 
-    # Load env map list
-    env_map_list = json.load(open(args.env_map_list_json, 'r'))
-
     # Render GT images & hints
     seed_view = None if args.seed is None else args.seed
     seed_white_pl = None if args.seed is None else args.seed + 1
@@ -500,16 +650,8 @@ def render_core(args: Options, groups_id = 0):
     seed_multi_pl = None if args.seed is None else args.seed + 3
     seed_area = None if args.seed is None else args.seed + 4
     seed_combined = None if args.seed is None else args.seed + 5
-    # file_path is not defined here, we should use args.three_d_model_path or extract the UID
-    # The original code used file_path which was args.three_d_model_path
-    file_path = args.three_d_model_path
-    res_dir = f"{args.output_dir}/{file_path.split('/')[-1].split('.')[0]}"
-    os.makedirs(res_dir, exist_ok=True)
-    res_dir = os.path.join(res_dir)
-    if not os.path.exists(res_dir):
-        os.makedirs(res_dir)
 
-    json.dump({'scale': scale, 'offset': array2list(offset)}, open(f'{res_dir}/normalize.json', 'w'), indent=4)
+    atomic_json_dump({'scale': scale, 'offset': array2list(offset)}, f'{res_dir}/normalize.json')
 
     #* 1.2 prepare the cameras
     # Check if cameras.json exists in train and test folders
@@ -526,17 +668,15 @@ def render_core(args: Options, groups_id = 0):
             with open(train_cam_path, 'r') as f:
                 train_cams_data = json.load(f)
             for cam in train_cams_data:
-                # Convert list back to Matrix if needed, but create_camera usually handles it.
-                # However, to be safe and consistent with generation, we keep it as list or convert to Matrix.
-                # bpy_helper.camera.create_camera likely expects Matrix or compatible.
-                # Let's convert to Matrix to be safe.
-                c2w = Matrix(cam['c2w'])
+                # Keep c2w as a numpy array: create_camera accepts it and render_normal_map needs its rotation
+                # when intrinsics of a resumed scene are still missing.
+                c2w = np.array(cam['c2w'])
                 cameras.append((cam['eye_idx'], c2w, cam['fov']))
             
             with open(test_cam_path, 'r') as f:
                 test_cams_data = json.load(f)
             for cam in test_cams_data:
-                c2w = Matrix(cam['c2w'])
+                c2w = np.array(cam['c2w'])
                 cameras_test.append((cam['eye_idx'], c2w, cam['fov']))
             
             loaded_existing_cameras = True
@@ -579,632 +719,297 @@ def render_core(args: Options, groups_id = 0):
             c2w = look_at_to_c2w(eye)
             cameras_test.append((eye_idx, c2w, fov))
     
-    #& 2. start rendering
-    # If we loaded existing cameras, we assume intrinsics might be done, but let's be careful.
-    # The user said: "if at least one lighting variation is already rendered, we should not be rendering the intrinsics again"
-    # If loaded_existing_cameras is True, it means we have cameras.json, which implies at least one light render pass finished.
-    if loaded_existing_cameras:
-        intrinsics_saved = True
-    else:
-        intrinsics_saved = not args.save_intrinsics
-    
-    def is_folder_populated(path, num_expected):
-        # Check if tar file exists
-        if os.path.exists(path + '.tar'):
-            return True
-            
-        if not os.path.exists(path):
-            return False
-        # Check for png files. User mentioned n+1, but we check for at least n to be safe.
-        png_files = glob.glob(os.path.join(path, '*.png'))
-        return len(png_files) >= num_expected
-
-    #* 2.1 render the white env lighting first
-    for env_idx in range(args.num_white_envs):
-        train_env_path = f'{res_dir}/train/white_env_{env_idx}'
-        test_env_path = f'{res_dir}/test/white_env_{env_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: white_env_{env_idx}")
-            continue
-
-        # Use the white environment map we created
-        env_map_path = f'{args.white_env_map_dir_path}/white_env_8k.exr'
-        rotation_euler = [0, 0, random.uniform(-math.pi, math.pi)]
-        strength = 1.0
-        set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-
-        all_cams = []  # <-- Collect all cams for this env
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            if not intrinsics_saved:
-                with stdout_redirected():
-                    render_depth_map(view_path, file_prefix=f'depth_{eye_idx}')
-                    render_normal_map(view_path)
-                    render_albedo_map(view_path)
-                # copy the depth map to a different name
-                depth_folder = os.path.join(view_path, 'depth')
-                os.makedirs(depth_folder, exist_ok=True)
-                depth_path = os.path.join(view_path, f'depth_{eye_idx}0001.exr')
-                depth_cam_path = os.path.join(depth_folder, f'depth_{eye_idx}.exr')
-                shutil.copy(depth_path, depth_cam_path)
-                # Transform normals to camera space
-                normals_path = os.path.join(view_path, 'normal0001.exr')
-                normal_folder = os.path.join(view_path, 'normal')
-                os.makedirs(normal_folder, exist_ok=True)
-                normals_cam_path = os.path.join(normal_folder, f'normal_cam_{eye_idx}.exr')
-                transform_normals_to_camera_space(normals_path, c2w, normals_cam_path)
-                albedo_path = os.path.join(view_path, 'albedo0001.png')
-                albedo_folder = os.path.join(view_path, 'albedo')
-                os.makedirs(albedo_folder, exist_ok=True)
-                albedo_cam_path = os.path.join(albedo_folder, f'albedo_cam_{eye_idx}.png')
-                shutil.copy(albedo_path, albedo_cam_path)
-                # clean up the files before they got moved:
-                os.remove(os.path.join(view_path, f'depth_{eye_idx}0001.exr'))
-                os.remove(os.path.join(view_path, 'normal0001.exr'))
-                os.remove(os.path.join(view_path, 'albedo0001.png'))
-                # remove ant files with "rgb_for_" prefix
-                for file in os.listdir(view_path):
-                    if file.startswith('rgb_for_'):
-                        os.remove(os.path.join(view_path, file))
-
-            # Instead of saving cam.json per view, collect the info:
-            cam_entry = {
-                'eye_idx': eye_idx,
-                'c2w': mat2list(c2w),
-                'fov': fov,
-            }
-            all_cams.append(cam_entry)
-
-            env_path = f'{view_path}/white_env_{env_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # === Save all camera info for this env in a single file ===
-        cameras_json_path = os.path.join(view_path, f'cameras.json')
-        json.dump(all_cams, open(cameras_json_path, 'w'), indent=4)
-
-        #* render the test views for white env lighting
-        all_cams_test = []
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            if not intrinsics_saved:
-                with stdout_redirected():
-                    render_depth_map(view_path, file_prefix=f'depth_{eye_idx}')
-                    render_normal_map(view_path)
-                    render_albedo_map(view_path)
-                # copy the depth map to a different name
-                depth_folder = os.path.join(view_path, 'depth')
-                os.makedirs(depth_folder, exist_ok=True)
-                depth_path = os.path.join(view_path, f'depth_{eye_idx}0001.exr')
-                depth_cam_path = os.path.join(depth_folder, f'depth_{eye_idx}.exr')
-                shutil.copy(depth_path, depth_cam_path)
-                # Transform normals to camera space
-                normals_path = os.path.join(view_path, 'normal0001.exr')
-                normal_folder = os.path.join(view_path, 'normal')
-                os.makedirs(normal_folder, exist_ok=True)
-                normals_cam_path = os.path.join(normal_folder, f'normal_cam_{eye_idx}.exr')
-                transform_normals_to_camera_space(normals_path, c2w, normals_cam_path)
-                albedo_path = os.path.join(view_path, 'albedo0001.png')
-                albedo_folder = os.path.join(view_path, 'albedo')
-                os.makedirs(albedo_folder, exist_ok=True)
-                albedo_cam_path = os.path.join(albedo_folder, f'albedo_cam_{eye_idx}.png')
-                shutil.copy(albedo_path, albedo_cam_path)
-                # clean up the files before they got moved:
-                os.remove(os.path.join(view_path, f'depth_{eye_idx}0001.exr'))
-                os.remove(os.path.join(view_path, 'normal0001.exr'))
-                os.remove(os.path.join(view_path, 'albedo0001.png'))
-                # remove ant files with "rgb_for_" prefix
-                for file in os.listdir(view_path):
-                    if file.startswith('rgb_for_'):
-                        os.remove(os.path.join(view_path, file))
-
-            # Instead of saving cam.json per view, collect the info:
-            cam_entry = {
+        # Save all camera info up front (a single file per split), so a resumed job renders the same views
+        for cams, cam_path in [(cameras, train_cam_path), (cameras_test, test_cam_path)]:
+            os.makedirs(os.path.dirname(cam_path), exist_ok=True)
+            atomic_json_dump([{
                 'eye_idx': eye_idx,
                 'c2w': mat2list(c2w),
                 'fov': fov,
-            }
-            all_cams_test.append(cam_entry)
-
-            env_path = f'{view_path}/white_env_{env_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
+            } for eye_idx, c2w, fov in cams], cam_path)
 
-            bpy.data.objects.remove(camera, do_unlink=True)
-            
-        # === Save all camera info for this env in a single file ===
-        cameras_json_path = os.path.join(view_path, f'cameras.json')
-        json.dump(all_cams_test, open(cameras_json_path, 'w'), indent=4)
-
-        # save the env map
-        json.dump({
-            'env_map': 'white_env_8k.exr',
-            'rotation_euler': rotation_euler,
-            'strength': strength,
-            }, open(f'{env_path}/white_env.json', 'w'), indent=4)
-
-        intrinsics_saved = True
-
-    #* 2.2 render the white point lighting
-    white_pls = gen_random_pts_around_origin(
-        seed=seed_white_pl,
-        N=args.num_white_pls,
-        min_dist_to_origin=3.5,
-        max_dist_to_origin=5.0,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-    for white_pl_idx in range(args.num_white_pls):
-        train_env_path = f'{res_dir}/train/white_pl_{white_pl_idx}'
-        test_env_path = f'{res_dir}/test/white_pl_{white_pl_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: white_pl_{white_pl_idx}")
-            continue
-
-        pl = white_pls[white_pl_idx]
-        power = random.uniform(500, 1500)
-        _point_light = create_point_light(pl, power)
-        
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/white_pl_{white_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for white point lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/white_pl_{white_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # save the point light info
-        json.dump({
-            'pos': array2list(pl),
-            'power': power,
-        }, open(f'{env_path}/white_pl.json', 'w'), indent=4)
-
-    #* 2.3 render the RGB point lighting
-    rgb_pls = gen_random_pts_around_origin(
-        seed=seed_rgb_pl,
-        N=args.num_rgb_pls,
-        min_dist_to_origin=4.0,
-        max_dist_to_origin=5.0,
-        min_theta_in_degree=0,
-        max_theta_in_degree=60
-    )
-    for rgb_pl_idx in range(args.num_rgb_pls):
-        train_env_path = f'{res_dir}/train/rgb_pl_{rgb_pl_idx}'
-        test_env_path = f'{res_dir}/test/rgb_pl_{rgb_pl_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: rgb_pl_{rgb_pl_idx}")
-            continue
-
-        pl = rgb_pls[rgb_pl_idx]
-        power = random.uniform(900, 1500)  # slightly brighter than white light
-        rgb = [random.uniform(0, 1) for _ in range(3)]
-        create_point_light(pl, power, rgb=rgb)
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/rgb_pl_{rgb_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for RGB point lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/rgb_pl_{rgb_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # save the RGB point light info
-        json.dump({
-            'pos': array2list(pl),
-            'power': power,
-            'color': rgb,
-        }, open(f'{env_path}/rgb_pl.json', 'w'), indent=4)
-
-    #* 2.4 render the multi point lighting
-    multi_pls = gen_random_pts_around_origin(
-        seed=seed_multi_pl,
-        N=args.num_multi_pls * args.max_pl_num,
-        min_dist_to_origin=3.0,
-        max_dist_to_origin=5.0,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-
-    for multi_pl_idx in range(args.num_multi_pls):
-        train_env_path = f'{res_dir}/train/multi_pl_{multi_pl_idx}'
-        test_env_path = f'{res_dir}/test/multi_pl_{multi_pl_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: multi_pl_{multi_pl_idx}")
-            continue
+    #* 1.3 prepare the lighting
+    def build_light_plan():
+        """
+        Sample the parameters of every lighting condition, in the same order as they are rendered. Each entry is
+        {'name': folder name, 'kind': light type (also the json file name), 'info': the light json content}.
+        """
+        # Load env map list
+        env_map_list = json.load(open(args.env_map_list_json, 'r'))
+        light_plan = []
+
+        # white env lighting
+        for env_idx in range(args.num_white_envs):
+            # Use the white environment map we created
+            light_plan.append({'name': f'white_env_{env_idx}', 'kind': 'white_env', 'info': {
+                'env_map': 'white_env_8k.exr',
+                'rotation_euler': [0, 0, random.uniform(-math.pi, math.pi)],
+                'strength': 1.0,
+            }})
+
+        # white point lighting
+        white_pls = gen_random_pts_around_origin(
+            seed=seed_white_pl,
+            N=args.num_white_pls,
+            min_dist_to_origin=3.5,
+            max_dist_to_origin=5.0,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
+        for white_pl_idx in range(args.num_white_pls):
+            light_plan.append({'name': f'white_pl_{white_pl_idx}', 'kind': 'white_pl', 'info': {
+                'pos': array2list(white_pls[white_pl_idx]),
+                'power': random.uniform(500, 1500),
+            }})
+
+        # RGB point lighting
+        rgb_pls = gen_random_pts_around_origin(
+            seed=seed_rgb_pl,
+            N=args.num_rgb_pls,
+            min_dist_to_origin=4.0,
+            max_dist_to_origin=5.0,
+            min_theta_in_degree=0,
+            max_theta_in_degree=60
+        )
+        for rgb_pl_idx in range(args.num_rgb_pls):
+            light_plan.append({'name': f'rgb_pl_{rgb_pl_idx}', 'kind': 'rgb_pl', 'info': {
+                'pos': array2list(rgb_pls[rgb_pl_idx]),
+                'power': random.uniform(900, 1500),  # slightly brighter than white light
+                'color': [random.uniform(0, 1) for _ in range(3)],
+            }})
+
+        # multi point lighting
+        multi_pls = gen_random_pts_around_origin(
+            seed=seed_multi_pl,
+            N=args.num_multi_pls * args.max_pl_num,
+            min_dist_to_origin=3.0,
+            max_dist_to_origin=5.0,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
 
-        pls = multi_pls[multi_pl_idx * args.max_pl_num: (multi_pl_idx + 1) * args.max_pl_num]
-        powers = [random.uniform(500, 1500) for _ in range(args.max_pl_num)]
-        colors = []
-        for pl_idx in range(args.max_pl_num):
-            if random.random() < 0.5:
-                rgb = [1.0, 1.0, 1.0]  # white
+        for multi_pl_idx in range(args.num_multi_pls):
+            pls = multi_pls[multi_pl_idx * args.max_pl_num: (multi_pl_idx + 1) * args.max_pl_num]
+            powers = [random.uniform(500, 1500) for _ in range(args.max_pl_num)]
+            colors = []
+            for pl_idx in range(args.max_pl_num):
+                if random.random() < 0.5:
+                    rgb = [1.0, 1.0, 1.0]  # white
+                else:
+                    rgb = [random.uniform(0.4, 1.0) for _ in range(3)]  # colored
+                colors.append(rgb)
+            light_plan.append({'name': f'multi_pl_{multi_pl_idx}', 'kind': 'multi_pl', 'info': {
+                'pos': mat2list(pls),
+                'power': powers,
+                'color': colors,
+            }})
+
+        # colored env lighting
+        for env_map_idx in range(args.num_env_lights):
+            light_plan.append({'name': f'env_{env_map_idx}', 'kind': 'env', 'info': {
+                'env_map': random.choice(env_map_list),
+                'rotation_euler': [0, 0, random.uniform(-math.pi, math.pi)],
+                'strength': 1.0,
+            }})
+
+        # area lighting
+        area_light_positions = gen_random_pts_around_origin(
+            seed=seed_area,
+            N=args.num_area_lights,
+            min_dist_to_origin=3.0,
+            max_dist_to_origin=6.0,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
+        for area_light_idx in range(args.num_area_lights):
+            area_light_power = random.uniform(700, 1500)
+            area_light_size = random.uniform(5., 10.)
+            if random.random() < 0.75:
+                color = [1.0, 1.0, 1.0]  # white
             else:
-                rgb = [random.uniform(0.4, 1.0) for _ in range(3)]  # colored
-            colors.append(rgb)
-            create_point_light(pls[pl_idx], powers[pl_idx], rgb=rgb, keep_other_lights=pl_idx > 0)
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/multi_pl_{multi_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for multi point lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/multi_pl_{multi_pl_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        # save the multi point light info
-        json.dump({
-            'pos': mat2list(pls),
-            'power': powers,
-            'color': colors,
-        }, open(f'{env_path}/multi_pl.json', 'w'), indent=4)
-
-    #* 2.5 render the colored env lighting
-    for env_map_idx in range(args.num_env_lights):
-        train_env_path = f'{res_dir}/train/env_{env_map_idx}'
-        test_env_path = f'{res_dir}/test/env_{env_map_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: env_{env_map_idx}")
-            continue
-
-        env_map = random.choice(env_map_list)
-        env_map_path = f'{args.env_map_dir_path}/{env_map}_8k.exr'
-        rotation_euler = [0, 0, random.uniform(-math.pi, math.pi)]
-        strength = 1.0
-        set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/env_{env_map_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
-
-        #* render the test views for colored env lighting
-        for eye_idx, c2w, fov in cameras_test:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/env_{env_map_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
+                color = [random.uniform(0.4, 1.0) for _ in range(3)]  # colored
+            light_plan.append({'name': f'area_{area_light_idx}', 'kind': 'area', 'info': {
+                'pos': array2list(area_light_positions[area_light_idx]),
+                'power': area_light_power,
+                'size': area_light_size,
+                'color': color,
+            }})
+
+        # combined lighting (progressive: env -> +point1 -> +point2 -> +area)
+        # Generate positions for point lights and area light
+        num_point_lights = min(2, args.max_pl_num)  # Use up to 2 point lights
+        combined_pls = gen_random_pts_around_origin(
+            seed=seed_combined,
+            N=num_point_lights,
+            min_dist_to_origin=3.5,
+            max_dist_to_origin=5.0,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
+        area_light_positions = gen_random_pts_around_origin(
+            seed=seed_combined + 100 if seed_combined is not None else None,
+            N=1,
+            min_dist_to_origin=3.0,
+            max_dist_to_origin=6.0,
+            min_theta_in_degree=0,
+            max_theta_in_degree=85
+        )
 
-        # save the env map
-        json.dump({
-            'env_map': env_map,
-            'rotation_euler': rotation_euler,
-            'strength': strength,
-        }, open(f'{env_path}/env.json', 'w'), indent=4)
-
-    #* 2.6 render the area lighting
-    area_light_positions = gen_random_pts_around_origin(
-        seed=seed_area,
-        N=args.num_area_lights,
-        min_dist_to_origin=3.0,
-        max_dist_to_origin=6.0,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-    for area_light_idx in range(args.num_area_lights):
-        train_env_path = f'{res_dir}/train/area_{area_light_idx}'
-        test_env_path = f'{res_dir}/test/area_{area_light_idx}'
-        
-        if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-            print(f"Skipping existing light: area_{area_light_idx}")
-            continue
+        if args.num_combined_lights > 0:
+            # Setup: Choose env map parameters (shared across all progressive stages)
+            env_map = random.choice(env_map_list)
+            rotation_euler = [0, 0, random.uniform(-math.pi, math.pi)]
+            strength = 1.0
+
+            # Generate light parameters
+            point_powers = [random.uniform(500, 1500) for _ in range(num_point_lights)]
+            point_colors = [[1.0, 1.0, 1.0] for _ in range(num_point_lights)]
+
+            area_light = {
+                'pos': array2list(area_light_positions[0]),
+                'power': random.uniform(700, 1500),
+                'size': random.uniform(5., 10.),
+                'color': [1.0, 1.0, 1.0],  # white area light
+            }
 
-        area_light_pos = area_light_positions[area_light_idx]
-        area_light_power = random.uniform(700, 1500)
-        area_light_size = random.uniform(5., 10.)
-        if random.random() < 0.75:
-            color = [1.0, 1.0, 1.0]  # white
+            # Progressive rendering stages
+            # Stage 0: env map only
+            # Stage 1: env + 1st point light
+            # Stage 2: env + 1st point + 2nd point light
+            # Stage 3: env + 1st point + 2nd point + area light
+            max_stages = 1 + num_point_lights + 1  # env + points + area
+            num_stages = min(args.num_combined_lights, max_stages)
+
+            for stage_idx in range(num_stages):
+                if stage_idx == 0:
+                    light_info = {'stage': 0, 'description': 'env_only'}
+                elif stage_idx < 1 + num_point_lights:
+                    light_info = {'stage': stage_idx, 'description': f'env + {stage_idx} point light' + ('s' if stage_idx > 1 else '')}
+                else:
+                    light_info = {'stage': 3, 'description': f'env + {num_point_lights} point lights + area light'}
+                light_info.update({
+                    'env_map': env_map,
+                    'rotation_euler': rotation_euler,
+                    'strength': strength,
+                })
+                if 0 < stage_idx < 1 + num_point_lights:
+                    light_info['point_lights'] = {
+                        'pos': [array2list(combined_pls[i]) for i in range(stage_idx)],
+                        'power': point_powers[:stage_idx],
+                        'color': point_colors[:stage_idx],
+                    }
+                elif stage_idx >= 1 + num_point_lights:
+                    light_info['point_lights'] = {
+                        'pos': [array2list(combined_pls[i]) for i in range(num_point_lights)],
+                        'power': point_powers[:num_point_lights],
+                        'color': point_colors[:num_point_lights],
+                    } if num_point_lights > 0 else None
+                    light_info['area_light'] = area_light
+                light_plan.append({'name': f'combined_{stage_idx}', 'kind': 'combined', 'info': light_info})
+
+        return light_plan
+
+    def apply_lighting(light):
+        """
+        Set up the blender lights for one entry of the light plan.
+        """
+        kind, info = light['kind'], light['info']
+        if kind == 'white_env':
+            set_env_light(f'{args.white_env_map_dir_path}/{info["env_map"]}', rotation_euler=info['rotation_euler'], strength=info['strength'])
+        elif kind == 'env':
+            set_env_light(f'{args.env_map_dir_path}/{info["env_map"]}_8k.exr', rotation_euler=info['rotation_euler'], strength=info['strength'])
+        elif kind == 'white_pl':
+            create_point_light(info['pos'], info['power'])
+        elif kind == 'rgb_pl':
+            create_point_light(info['pos'], info['power'], rgb=info['color'])
+        elif kind == 'multi_pl':
+            for pl_idx, (pos, power, rgb) in enumerate(zip(info['pos'], info['power'], info['color'])):
+                create_point_light(pos, power, rgb=rgb, keep_other_lights=pl_idx > 0)
+        elif kind == 'area':
+            create_area_light(info['pos'], info['power'], info['size'], color=info['color'])
+        elif kind == 'combined':
+            set_env_light(f'{args.env_map_dir_path}/{info["env_map"]}_8k.exr', rotation_euler=info['rotation_euler'], strength=info['strength'])
+            point_lights = info.get('point_lights') or {'pos': [], 'power': [], 'color': []}
+            for pos, power, rgb in zip(point_lights['pos'], point_lights['power'], point_lights['color']):
+                create_point_light(pos, power, rgb=rgb, keep_other_lights=True)
+            if 'area_light' in info:
+                area_light = info['area_light']
+                create_area_light(area_light['pos'], area_light['power'], area_light['size'], color=area_light['color'], keep_other_lights=True)
         else:
-            color = [random.uniform(0.4, 1.0) for _ in range(3)]  # colored
+            raise ValueError(f"Unknown light kind: {kind}")
 
-        _area_light = create_area_light(area_light_pos, area_light_power, area_light_size, color=color)
+    # The light parameters are persisted before any rendering, so a resumed job re-renders with the same lights
+    lights_json_path = os.path.join(res_dir, 'lights.json')
+    light_plan = load_json_or_none(lights_json_path)
+    if light_plan is None:
+        light_plan = build_light_plan()
+        atomic_json_dump(light_plan, lights_json_path)
 
-        for eye_idx, c2w, fov in cameras:
-            camera = create_camera(c2w, fov)
-            bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/train'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
-
-            env_path = f'{view_path}/area_{area_light_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
+    if args.prepare_only:
+        print(f"Prepared scene {res_dir}")
+        return
 
-            bpy.data.objects.remove(camera, do_unlink=True)
+    #& 2. start rendering
+    # Depth / normal / albedo do not depend on lighting, they are rendered (per missing view) together with the
+    # first white env lighting.
+    intrinsics_light = 'white_env_0' if args.save_intrinsics else None
+
+    splits = [('train', cameras), ('test', cameras_test)]
+    for light in light_plan:
+        light_name = light['name']
+        with_intrinsics = light_name == intrinsics_light
+
+        # Collect the (split, view) work items that are still missing for this lighting
+        pending = []
+        for split, split_cameras in splits:
+            view_path = f'{res_dir}/{split}'
+            env_path = f'{view_path}/{light_name}'
+            if os.path.exists(env_path + '.tar'):
+                continue
+            for eye_idx, c2w, fov in split_cameras:
+                need_rgb = not sink.exists(os.path.join(env_path, f'gt_{eye_idx}.png'))
+                need_intrinsics = with_intrinsics and not all(sink.exists(p) for p in intrinsics_paths(view_path, eye_idx))
+                if need_rgb or need_intrinsics:
+                    pending.append((split, eye_idx, c2w, fov, need_rgb, need_intrinsics))
+
+        # the light json goes next to the test views (and the train views for combined lighting)
+        json_splits = ['train', 'test'] if light['kind'] == 'combined' else ['test']
+        json_paths = [f'{res_dir}/{split}/{light_name}/{light["kind"]}.json' for split in json_splits]
+
+        if not pending and all(sink.exists(p) or os.path.exists(os.path.dirname(p) + '.tar') for p in json_paths):
+            print(f"Skipping existing light: {light_name}")
+            continue
+        if pending:
+            print(f"Rendering {len(pending)} missing views for light: {light_name}")
+            apply_lighting(light)
 
-        #* render the test views for area lighting
-        for eye_idx, c2w, fov in cameras_test:
+        for split, eye_idx, c2w, fov, need_rgb, need_intrinsics in pending:
+            # On preemption, stop between views; the finished views are kept and the rest resumes on requeue
+            exit_if_drain_requested(f'{res_dir} stopped at {light_name} {split} view {eye_idx}')
             camera = create_camera(c2w, fov)
             bpy.context.scene.camera = camera
-            view_path = f'{res_dir}/test'
-            if not os.path.exists(view_path):
-                os.makedirs(view_path)
+            view_path = f'{res_dir}/{split}'
 
-            env_path = f'{view_path}/area_{area_light_idx}'
-            os.makedirs(env_path, exist_ok=True)
-            with stdout_redirected():
-                render_rgb_and_hint(f'{env_path}', eye_idx)
-
-            bpy.data.objects.remove(camera, do_unlink=True)
+            if need_intrinsics:
+                render_intrinsics(view_path, eye_idx, c2w)
 
-        # save the area light info
-        json.dump({
-            'pos': array2list(area_light_pos),
-            'power': area_light_power,
-            'size': area_light_size,
-            'color': color,
-        }, open(f'{env_path}/area.json', 'w'), indent=4)
-
-    #* 2.7 render the combined lighting (progressive: env -> +point1 -> +point2 -> +area)
-    # Generate positions for point lights and area light
-    num_point_lights = min(2, args.max_pl_num)  # Use up to 2 point lights
-    combined_pls = gen_random_pts_around_origin(
-        seed=seed_combined,
-        N=num_point_lights,
-        min_dist_to_origin=3.5,
-        max_dist_to_origin=5.0,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-    area_light_positions = gen_random_pts_around_origin(
-        seed=seed_combined + 100 if seed_combined is not None else None,
-        N=1,
-        min_dist_to_origin=3.0,
-        max_dist_to_origin=6.0,
-        min_theta_in_degree=0,
-        max_theta_in_degree=85
-    )
-    
-    if args.num_combined_lights > 0:
-        # Setup: Choose env map parameters (shared across all progressive stages)
-        env_map = random.choice(env_map_list)
-        env_map_path = f'{args.env_map_dir_path}/{env_map}_8k.exr'
-        rotation_euler = [0, 0, random.uniform(-math.pi, math.pi)]
-        strength = 1.0
-        
-        # Generate light parameters
-        point_powers = [random.uniform(500, 1500) for _ in range(num_point_lights)]
-        point_colors = [[1.0, 1.0, 1.0] for _ in range(num_point_lights)]
-        
-        area_light_pos = area_light_positions[0]
-        area_light_power = random.uniform(700, 1500)
-        area_light_size = random.uniform(5., 10.)
-        area_light_color = [1.0, 1.0, 1.0]  # white area light
-        
-        # Progressive rendering stages
-        # Stage 0: env map only
-        # Stage 1: env + 1st point light
-        # Stage 2: env + 1st point + 2nd point light
-        # Stage 3: env + 1st point + 2nd point + area light
-        max_stages = 1 + num_point_lights + 1  # env + points + area
-        num_stages = min(args.num_combined_lights, max_stages)
-        
-        for stage_idx in range(num_stages):
-            train_env_path = f'{res_dir}/train/combined_{stage_idx}'
-            test_env_path = f'{res_dir}/test/combined_{stage_idx}'
-            
-            if is_folder_populated(train_env_path, len(cameras)) and is_folder_populated(test_env_path, len(cameras_test)):
-                print(f"Skipping existing light: combined_{stage_idx}")
-                continue
-            
-            # Stage 0: Set env light
-            if stage_idx == 0:
-                set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-                light_info = {
-                    'stage': 0,
-                    'description': 'env_only',
-                    'env_map': env_map,
-                    'rotation_euler': rotation_euler,
-                    'strength': strength,
-                }
-            
-            # Stage 1: Add 1st point light
-            elif stage_idx == 1:
-                set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-                create_point_light(combined_pls[0], point_powers[0], rgb=point_colors[0], keep_other_lights=True)
-                light_info = {
-                    'stage': 1,
-                    'description': 'env + 1 point light',
-                    'env_map': env_map,
-                    'rotation_euler': rotation_euler,
-                    'strength': strength,
-                    'point_lights': {
-                        'pos': [array2list(combined_pls[0])],
-                        'power': [point_powers[0]],
-                        'color': [point_colors[0]],
-                    }
-                }
-            
-            # Stage 2: Add 2nd point light (if available)
-            elif stage_idx == 2 and num_point_lights >= 2:
-                set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-                create_point_light(combined_pls[0], point_powers[0], rgb=point_colors[0], keep_other_lights=True)
-                create_point_light(combined_pls[1], point_powers[1], rgb=point_colors[1], keep_other_lights=True)
-                light_info = {
-                    'stage': 2,
-                    'description': 'env + 2 point lights',
-                    'env_map': env_map,
-                    'rotation_euler': rotation_euler,
-                    'strength': strength,
-                    'point_lights': {
-                        'pos': [array2list(combined_pls[0]), array2list(combined_pls[1])],
-                        'power': [point_powers[0], point_powers[1]],
-                        'color': [point_colors[0], point_colors[1]],
-                    }
-                }
-            
-            # Stage 3+: Add area light
-            elif stage_idx >= 3 or (stage_idx == 2 and num_point_lights < 2):
-                set_env_light(env_map_path, rotation_euler=rotation_euler, strength=strength)
-                # Add all available point lights
-                for pl_idx in range(num_point_lights):
-                    create_point_light(combined_pls[pl_idx], point_powers[pl_idx], rgb=point_colors[pl_idx], keep_other_lights=(pl_idx > 0 or True))
-                # Add area light
-                create_area_light(area_light_pos, area_light_power, area_light_size, color=area_light_color, keep_other_lights=True)
-                
-                point_lights_data = {
-                    'pos': [array2list(combined_pls[i]) for i in range(num_point_lights)],
-                    'power': point_powers[:num_point_lights],
-                    'color': point_colors[:num_point_lights],
-                } if num_point_lights > 0 else None
-                
-                light_info = {
-                    'stage': 3,
-                    'description': f'env + {num_point_lights} point lights + area light',
-                    'env_map': env_map,
-                    'rotation_euler': rotation_euler,
-                    'strength': strength,
-                    'point_lights': point_lights_data,
-                    'area_light': {
-                        'pos': array2list(area_light_pos),
-                        'power': area_light_power,
-                        'size': area_light_size,
-                        'color': area_light_color,
-                    }
-                }
-            
-            # Render train views
-            for eye_idx, c2w, fov in cameras:
-                camera = create_camera(c2w, fov)
-                bpy.context.scene.camera = camera
-                view_path = f'{res_dir}/train'
-                if not os.path.exists(view_path):
-                    os.makedirs(view_path)
-
-                env_path = f'{view_path}/combined_{stage_idx}'
-                os.makedirs(env_path, exist_ok=True)
-                with stdout_redirected():
-                    render_rgb_and_hint(f'{env_path}', eye_idx)
-
-                bpy.data.objects.remove(camera, do_unlink=True)
-
-            # Save light info for train
-            train_json_path = f'{res_dir}/train/combined_{stage_idx}'
-            json.dump(light_info, open(f'{train_json_path}/combined.json', 'w'), indent=4)
-
-            # Render test views
-            for eye_idx, c2w, fov in cameras_test:
-                camera = create_camera(c2w, fov)
-                bpy.context.scene.camera = camera
-                view_path = f'{res_dir}/test'
-                if not os.path.exists(view_path):
-                    os.makedirs(view_path)
-
-                env_path = f'{view_path}/combined_{stage_idx}'
-                os.makedirs(env_path, exist_ok=True)
+            if need_rgb:
+                env_path = f'{view_path}/{light_name}'
                 with stdout_redirected():
                     render_rgb_and_hint(f'{env_path}', eye_idx)
 
-                bpy.data.objects.remove(camera, do_unlink=True)
+            bpy.data.objects.remove(camera, do_unlink=True)
 
-            # Save light info for test
-            test_json_path = f'{res_dir}/test/combined_{stage_idx}'
-            json.dump(light_info, open(f'{test_json_path}/combined.json', 'w'), indent=4)
+        # save the light info
+        for json_path in json_paths:
+            if os.path.exists(os.path.dirname(json_path) + '.tar') or sink.exists(json_path):
+                continue
+            sink.commit_json(light['info'], json_path)
 
     # store a file indicating the end of the rendering
-    with open(os.path.join(res_dir, 'done.txt'), 'w') as f:
-        f.write('done')
-        f.close()
+    atomic_write_text('done', os.path.join(res_dir, 'done.txt'))
+    if os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
 
 
 if __name__ == '__main__':
@@ -1221,6 +1026,8 @@ if __name__ == '__main__':
         script_args = sys.argv[1:]
     
     args: Options = simple_parsing.parse(Options, args=script_args)
+    from bpy_helper.checkpoint import install_drain_handler, exit_if_drain_requested
+    install_drain_handler()
     if args.scene_seed is not None:
         random.seed(args.scene_seed)
         np.random.seed(args.scene_seed)
@@ -1250,48 +1057,65 @@ if __name__ == '__main__':
     # Preview
     print(f"Loaded {len(index_uid_list)} entries")
 
-    for i in range(args.group_start, args.group_end):
-        index, uid = index_uid_list[i]
-        # index = '000-027'
-        # uid = '20b23d4a703e4f7ebfb105b6b140b6fe'
-        model_path = os.path.join(dataset_path, index, f'{uid}.glb')
-        # model_path = os.path.join(dataset_path,'000-000', f'000074a334c541878360457c672b6c2e.glb')
-        args.three_d_model_path = model_path
+    # With --shard_output all scenes of this process share one shard series, finished (and fsynced) on exit,
+    # including a drain exit
+    sink = None
+    try:
+        for i in range(args.group_start, args.group_end):
+            index, uid = index_uid_list[i]
+            # index = '000-027'
+            # uid = '20b23d4a703e4f7ebfb105b6b140b6fe'
+            model_path = os.path.join(dataset_path, index, f'{uid}.glb')
+            # model_path = os.path.join(dataset_path,'000-000', f'000074a334c541878360457c672b6c2e.glb')
+            args.three_d_model_path = model_path
         
-        # Determine output directory
-        # If user specified output_dir via command line (not default), use it
-        if user_specified_output_dir != './output':
-            # User specified a custom output_dir, use it directly
-            args.output_dir = user_specified_output_dir
-            if not os.path.exists(args.output_dir):
-                os.makedirs(args.output_dir)
-        else:
-            # Use default behavior: replace 'glbs' with rendered_dir_name
-            if not os.path.exists(dataset_path.replace('glbs', args.rendered_dir_name)):
-                os.makedirs(dataset_path.replace('glbs', args.rendered_dir_name))
-            args.output_dir = os.path.join(dataset_path.replace('glbs', args.rendered_dir_name))
-        # Set the seed for reproducibility
-        if args.seed is not None:
-            random.seed(args.seed)
-            np.random.seed(args.seed)
-        # Render the model
-        print('Rendering model:', uid)
-        if uid in error_list:
-            print('skipping this model')
-            continue
-        for j in range(args.num_view_groups):
-            # if found a done.txt file, skip this model
-            print('rendering group:', j)
-            target_dir = os.path.join(args.output_dir, uid)
-            if os.path.exists(os.path.join(target_dir, 'done.txt')):
-                print(f"Skipping {uid} (done.txt found)")
+            # Determine output directory
+            # If user specified output_dir via command line (not default), use it
+            if user_specified_output_dir != './output':
+                # User specified a custom output_dir, use it directly
+                args.output_dir = user_specified_output_dir
+                if not os.path.exists(args.output_dir):
+                    os.makedirs(args.output_dir)
+            else:
+                # Use default behavior: replace 'glbs' with rendered_dir_name
+                if not os.path.exists(dataset_path.replace('glbs', args.rendered_dir_name)):
+                    os.makedirs(dataset_path.replace('glbs', args.rendered_dir_name))
+                args.output_dir = os.path.join(dataset_path.replace('glbs', args.rendered_dir_name))
+            # Set the seed for reproducibility
+            if args.seed is not None:
+                random.seed(args.seed)
+                np.random.seed(args.seed)
+            # Render the model
+            print('Rendering model:', uid)
+            if uid in error_list:
+                print('skipping this model')
                 continue
+            for j in range(args.num_view_groups):
+                # if found a done.txt file, skip this model
+                print('rendering group:', j)
+                target_dir = os.path.join(args.output_dir, uid)
+                if os.path.exists(os.path.join(target_dir, 'done.txt')):
+                    print(f"Skipping {uid} (done.txt found)")
+                    continue
             
-            # If not done, but directory exists, remove it to start fresh
-            if os.path.exists(target_dir):
-                print(f"Removing incomplete directory: {target_dir}")
-                shutil.rmtree(target_dir)
-
-            render_core(args, j)
-            print('render progress:', i, 'of range', args.group_start, '~', args.group_end)
+                # If not done but the scene composition was saved, resume it (only missing views are rendered).
+                # Otherwise nothing can be rebuilt, so remove the directory to start fresh.
+                if os.path.exists(os.path.join(target_dir, 'scene.json')):
+                    print(f"Resuming incomplete directory: {target_dir}")
+                elif os.path.exists(target_dir):
+                    print(f"Removing incomplete directory: {target_dir}")
+                    shutil.rmtree(target_dir)
+
+                exit_if_drain_requested(f'{target_dir} not started')
+                # (a --prepare_only process writes no outputs, and must not touch the shards of the render process)
+                if args.shard_output and not args.prepare_only and sink is None:
+                    from bpy_helper.shards import TarShardWriter, ShardSink
+                    writer = TarShardWriter(os.path.join(args.output_dir, 'shards'), f'scenes_{args.group_start:06d}_{args.group_end:06d}',
+                                            max_members=args.shard_max_members, max_bytes=args.shard_max_bytes)
+                    sink = ShardSink(args.output_dir, writer)
+                render_core(args, j, sink=sink)
+                print('render progress:', i, 'of range', args.group_start, '~', args.group_end)
+    finally:
+        if sink is not None:
+            sink.close()
         
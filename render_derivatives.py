@@ -0,0 +1,344 @@
+"""Derivatives of a rendered image, written at render time from the image in memory.
+
+The renderers write 512px RGBA renders; the white-background composites, downsamples and masks the training data
+needs are derived from the decoded render right after it is written, instead of by a second read / decode / encode
+pass over the dataset (neuralGaufferRendering/scripts/preprocess_rendered_image.py).
+
+A derivative is described by a spec ``kind[@size][=template]``:
+
+    white@256                      composite on a white background with the alpha mask, downsampled to 256 wide
+    rgba@128                       the RGB with the mask as alpha
+    alpha                          the mask as a grayscale image, full size
+    white@256={output_dir}/preprocessed/{object}/{name}
+
+Downsampling averages the covered pixel blocks (an area filter), so the size must divide the render width. The
+template is formatted with the fields given by the renderer (e.g. ``object``, ``view``) and ``dir``, ``name`` and
+``stem`` of the render, ``kind`` and ``size``; the default is ``{dir}/{kind}_{size}/{name}``.
+
+    writer = DerivativeWriter(parse_derivatives(['white@256', 'alpha@256']))
+    writer.submit(rgba, dir=view_dir, name='000_003.png')     # [H, W, 4] uint8, encoded in the background
+    writer.close()
+
+Only numpy and the standard library are needed (the PNG encoder is numpy + zlib), so the module runs in Blender's
+bundled Python.
+"""
+
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from bpy_helper.checkpoint import atomic_replace, tmp_path_for
+
+KINDS = ('white', 'rgba', 'alpha')
+DEFAULT_TEMPLATE = '{dir}/{kind}_{size}/{name}'
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLOR_TYPES = {1: 0, 3: 2, 4: 6}
+
+
+@dataclass(frozen=True)
+class DerivativeSpec:
+    """One derivative of every render: kind, output width (None keeps the render size) and path template."""
+    kind: str
+    size: Optional[int] = None
+    template: str = DEFAULT_TEMPLATE
+
+    @classmethod
+    def parse(cls, text: str) -> 'DerivativeSpec':
+        """
+        Parse a ``kind[@size][=template]`` spec.
+
+        :param text: spec
+        :return: DerivativeSpec
+        """
+
+        head, sep, template = text.partition('=')
+        kind, _, size = head.strip().partition('@')
+        if kind not in KINDS:
+            raise ValueError(f"Unknown derivative kind {kind!r} in {text!r}, expected one of {KINDS}")
+        if size and (not size.isdigit() or int(size) == 0):
+            raise ValueError(f"Bad derivative size {size!r} in {text!r}")
+        return cls(kind, int(size) if size else None, template.strip() if sep else DEFAULT_TEMPLATE)
+
+    def path(self, width: int, **fields) -> str:
+        """
+        Output path of the derivative of a render.
+
+        :param width: render width, the size of full-size derivatives
+        :param fields: template fields, ``name`` (the render file name) is required
+        :return: path
+        """
+
+        fields.setdefault('stem', os.path.splitext(fields['name'])[0])
+        return self.template.format(kind=self.kind, size=self.size or width, **fields)
+
+
+def parse_derivatives(texts) -> list:
+    """
+    Parse derivative specs.
+
+    :param texts: iterable of ``kind[@size][=template]`` specs
+    :return: list of DerivativeSpec
+    """
+
+    return [DerivativeSpec.parse(text) for text in texts if text.strip()]
+
+
+def area_downsample(img: np.ndarray, size: Optional[int]) -> np.ndarray:
+    """
+    Downsample an image by averaging blocks of pixels (uint8 averages are rounded).
+
+    :param img: [H, W] or [H, W, C] uint8 or float image
+    :param size: output width, must divide W (the height is scaled by the same factor); None keeps the size
+    :return: downsampled image, of the input dtype
+    """
+
+    h, w = img.shape[:2]
+    if size is None or size == w:
+        return img
+    factor = w // size
+    if size > w or w % size or h % factor:
+        raise ValueError(f"Cannot downsample a {w}x{h} image to width {size} by an integer factor")
+    blocks = img.reshape(h // factor, factor, w // factor, factor, *img.shape[2:])
+    n = factor * factor
+    if img.dtype == np.uint8:
+        sums = blocks.sum(axis=(1, 3), dtype=np.uint32)
+        return ((sums + n // 2) // n).astype(np.uint8)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def white_weights(alpha: np.ndarray) -> np.ndarray:
+    """
+    Fixed-point blend weights of :func:`white_composite` for a mask, computed once and shared by the images that use
+    the mask: a and 255 * (255 - a) + 127 (the white term and the rounding offset).
+
+    :param alpha: [H, W] uint8 mask
+    :return: [H, W, 2] uint16
+    """
+
+    a = alpha.astype(np.uint16)
+    return np.stack([a, 255 * (255 - a) + 127], axis=-1)
+
+
+def white_composite(rgb: np.ndarray, alpha: Optional[np.ndarray] = None, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    rgb * a + 255 * (1 - a), rounded, in uint16 fixed point (at most 255 * 255 + 127). Also the composite of
+    preprocess_rendered_image.
+
+    :param rgb: [H, W, 3] uint8
+    :param alpha: [H, W] uint8 mask
+    :param weights: :func:`white_weights` of the mask, instead of alpha
+    :return: [H, W, 3] uint8
+    """
+
+    if weights is None:
+        weights = white_weights(alpha)
+    out = rgb.astype(np.uint16)
+    out *= weights[..., :1]
+    out += weights[..., 1:]
+    out //= 255
+    return out.astype(np.uint8)
+
+
+def rgba_downsample(rgb: np.ndarray, alpha: np.ndarray, size: Optional[int]) -> np.ndarray:
+    """
+    Downsample an RGB image with an alpha mask without bleeding the background into the edges (the colors are
+    averaged premultiplied).
+
+    :param rgb: [H, W, 3] uint8
+    :param alpha: [H, W] uint8 mask
+    :param size: output width, None keeps the size
+    :return: [h, w, 4] uint8
+    """
+
+    if size is None or size == rgb.shape[1]:
+        return np.concatenate([rgb, alpha[..., None]], axis=-1)
+    weights = alpha.astype(np.float32) / 255.
+    premultiplied = area_downsample(rgb * weights[..., None], size)
+    coverage = area_downsample(weights, size)
+    colors = premultiplied / np.maximum(coverage, 1e-6)[..., None]
+    rgba = np.concatenate([colors, coverage[..., None] * 255.], axis=-1)
+    return np.rint(rgba).clip(0, 255).astype(np.uint8)
+
+
+def derive(spec: DerivativeSpec, rgb: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """
+    Compute one derivative of a render.
+
+    :param spec: derivative
+    :param rgb: [H, W, 3] uint8
+    :param alpha: [H, W] uint8 mask
+    :return: uint8 image
+    """
+
+    if spec.kind == 'white':
+        return area_downsample(white_composite(rgb, alpha), spec.size)
+    if spec.kind == 'rgba':
+        return rgba_downsample(rgb, alpha, spec.size)
+    return area_downsample(alpha, spec.size)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+def encode_png(img: np.ndarray, compression: int = 6) -> bytes:
+    """
+    Encode an 8-bit PNG. Every row gets the filter with the smallest sum of absolute differences, the heuristic of
+    libpng; all five filters are computed at once on the whole image.
+
+    :param img: [H, W], [H, W, 3] or [H, W, 4] uint8 image
+    :param compression: zlib level, 0-9
+    :return: PNG file content
+    """
+
+    if img.dtype != np.uint8:
+        raise ValueError(f"encode_png needs a uint8 image, got {img.dtype}")
+    h, w = img.shape[:2]
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    if channels not in PNG_COLOR_TYPES:
+        raise ValueError(f"Cannot encode an image with {channels} channels as PNG")
+
+    rows = img.reshape(h, w * channels).astype(np.int16)
+    left = np.zeros_like(rows)
+    left[:, channels:] = rows[:, :-channels]
+    up = np.zeros_like(rows)
+    up[1:] = rows[:-1]
+    up_left = np.zeros_like(rows)
+    up_left[1:, channels:] = rows[:-1, :-channels]
+    estimate = left + up - up_left
+    dist_left, dist_up, dist_up_left = np.abs(estimate - left), np.abs(estimate - up), np.abs(estimate - up_left)
+    paeth = np.where((dist_left <= dist_up) & (dist_left <= dist_up_left), left,
+                     np.where(dist_up <= dist_up_left, up, up_left))
+    # filter types 0-4: none, sub, up, average, paeth; the differences wrap around modulo 256
+    filtered = np.stack([rows, rows - left, rows - up, rows - ((left + up) >> 1), rows - paeth]).astype(np.uint8)
+    scores = np.abs(filtered.view(np.int8)).sum(axis=-1, dtype=np.int64)   # [5, H]
+    filter_types = scores.argmin(axis=0)
+    scanlines = np.empty((h, 1 + w * channels), dtype=np.uint8)
+    scanlines[:, 0] = filter_types
+    scanlines[:, 1:] = filtered[filter_types, np.arange(h)]
+
+    header = struct.pack('>IIBBBBB', w, h, 8, PNG_COLOR_TYPES[channels], 0, 0, 0)
+    return (PNG_SIGNATURE + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), compression)) + _png_chunk(b'IEND', b''))
+
+
+def write_png(path: str, img: np.ndarray, compression: int = 6) -> None:
+    """
+    Write an 8-bit PNG atomically (to a hidden temporary file first, then renamed).
+
+    :param path: output path
+    :param img: [H, W], [H, W, 3] or [H, W, 4] uint8 image
+    :param compression: zlib level, 0-9
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = tmp_path_for(os.path.abspath(path))
+    with open(tmp_path, 'wb') as f:
+        f.write(encode_png(img, compression))
+    atomic_replace(tmp_path, path)
+
+
+def write_derivatives(specs, rgb: np.ndarray, alpha: np.ndarray, compression: int = 6, **fields) -> list:
+    """
+    Compute and write derivatives of one render.
+
+    :param specs: DerivativeSpecs
+    :param rgb: [H, W, 3] uint8
+    :param alpha: [H, W] uint8 mask
+    :param compression: zlib level of the PNGs
+    :param fields: template fields, ``name`` (the render file name) is required
+    :return: written paths
+    """
+
+    paths = []
+    white = None
+    for spec in specs:
+        if spec.kind == 'white':
+            # the full-size composite is shared by the sizes
+            if white is None:
+                white = white_composite(rgb, alpha)
+            img = area_downsample(white, spec.size)
+        else:
+            img = derive(spec, rgb, alpha)
+        path = spec.path(rgb.shape[1], **fields)
+        write_png(path, img, compression)
+        paths.append(path)
+    return paths
+
+
+class DerivativeWriter:
+    """
+    Writes the derivatives of renders on background threads, so that computing and encoding them overlaps the next
+    render. Arrays are copied on submit, the caller may reuse its buffers. Errors are raised by :meth:`wait` and
+    :meth:`close`.
+    """
+
+    def __init__(self, specs, compression: int = 6, num_threads: int = 1):
+        """
+        :param specs: DerivativeSpecs (see :func:`parse_derivatives`)
+        :param compression: zlib level of the PNGs
+        :param num_threads: writer threads, 0 writes in the calling thread
+        """
+
+        self.specs = list(specs)
+        self.compression = compression
+        self.pool = ThreadPoolExecutor(max_workers=num_threads) if num_threads > 0 and self.specs else None
+        self.pending = []
+
+    def wants(self, *kinds) -> bool:
+        """Whether some derivative is of one of the kinds, i.e. whether the renders need to be read back."""
+        return any(spec.kind in kinds for spec in self.specs)
+
+    def submit(self, rgb: np.ndarray, alpha: Optional[np.ndarray] = None, kinds=KINDS, **fields) -> None:
+        """
+        Queue the derivatives of a render.
+
+        :param rgb: [H, W, 3] or [H, W, 4] uint8 render, top row first
+        :param alpha: [H, W] uint8 mask, default is the alpha channel of rgb (or opaque)
+        :param kinds: only write the derivatives of these kinds
+        :param fields: template fields, ``name`` (the render file name) is required
+        """
+
+        specs = [spec for spec in self.specs if spec.kind in kinds]
+        if not specs:
+            return
+        if alpha is None:
+            alpha = rgb[..., 3] if rgb.shape[-1] == 4 else np.full(rgb.shape[:2], 255, dtype=np.uint8)
+        rgb = np.array(rgb[..., :3], dtype=np.uint8)
+        alpha = np.array(alpha, dtype=np.uint8)
+        if self.pool is None:
+            write_derivatives(specs, rgb, alpha, self.compression, **fields)
+        else:
+            self.pending.append(self.pool.submit(write_derivatives, specs, rgb, alpha, self.compression, **fields))
+
+    def wait(self) -> list:
+        """
+        Wait for the queued derivatives.
+
+        :return: written paths
+        """
+
+        pending, self.pending = self.pending, []
+        return [path for future in pending for path in future.result()]
+
+    def close(self) -> list:
+        try:
+            return self.wait()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        elif self.pool is not None:
+            self.pool.shutdown()
@@ -18,6 +18,8 @@ import imageio
 import numpy as np
 import simple_parsing
 
+from render_derivatives import parse_derivatives, white_composite, write_derivatives
+
 error_list = []
 
 
@@ -32,6 +34,7 @@ class Options:
     seed: Optional[int] = None  # 随机种子
     group_start: int = 0  # 起始索引
     group_end: int = 10  # 结束索引
+    derivatives: str = ''  # 额外输出, 逗号分隔, 如 'white@256,alpha@256' (见 render_derivatives.py), 默认模板 {dir}/{kind}_{size}/{name}
 
 
 def render_preview(args: Options, model_path: str, uid: str):
@@ -60,15 +63,13 @@ def render_preview(args: Options, model_path: str, uid: str):
         bpy.ops.render.render(write_still=True)
         bpy.context.view_layer.update()
 
-        # 读取并处理图像（白色背景）
-        img = imageio.v3.imread(output_path) / 255.
-        if img.shape[-1] == 4:
-            rgb = img[..., :3]
-            alpha = img[..., 3:4]
-            # 将透明区域替换为白色背景
-            img = rgb * alpha + (1 - alpha) * 1.0  # 白色背景
-            img = img[..., :3]  # 移除 alpha 通道
-        imageio.v3.imwrite(output_path, (img * 255).clip(0, 255).astype(np.uint8))
+        # 读取并处理图像（白色背景），额外输出从同一张内存中的图像生成
+        img = imageio.v3.imread(output_path)
+        rgb = img[..., :3]
+        alpha = img[..., 3] if img.shape[-1] == 4 else np.full(img.shape[:2], 255, dtype=np.uint8)
+        write_derivatives(parse_derivatives(args.derivatives.split(',')), rgb, alpha,
+                          dir=os.path.dirname(output_path), name=os.path.basename(output_path))
+        imageio.v3.imwrite(output_path, white_composite(rgb, alpha))
 
     def configure_blender():
         """配置 Blender 渲染设置"""
@@ -7,9 +7,8 @@ the camera JSONs.
 
 For each mesh we:
     1. Reconstruct the HDR envmap from the (hdr_png, ldr_png) pair (mirroring
-       ``dataset_polyhaven.reconstruct_hdr_from_pngs``) and stage it as a
-       temporary ``.exr`` so Blender can load it; the temp file is removed
-       once the render is done.
+       ``dataset_polyhaven.reconstruct_hdr_from_pngs``) and hand the float32
+       array to Blender in memory (no intermediate ``.exr``).
     2. Load the glb. Optionally normalize with ``normalize_scene(...)`` when
        ``--normalize`` is set (bounding sphere radius ``--target_scale``).
        By default the mesh stays as-imported scale/position.
@@ -33,7 +32,7 @@ import json
 import math
 import os
 import sys
-import tempfile
+import time
 import traceback
 from dataclasses import dataclass
 from typing import List, Optional, Tuple
@@ -43,11 +42,12 @@ _script_dir = os.path.dirname(os.path.abspath(__file__))
 if _script_dir not in sys.path:
     sys.path.insert(0, _script_dir)
 
-import imageio
 import imageio.v3 as iio
 import numpy as np
 import simple_parsing
 
+import envmap_codec
+
 
 @dataclass
 class Options:
@@ -71,6 +71,12 @@ class Options:
     # context cameras so the lighting direction stays consistent with the
     # dataset. Disable to keep the env in identity Blender-world orientation.
     align_env: bool = True
+    # Batch mode: scenes are pulled from a shared queue by num_workers Blender
+    # worker processes. Each worker applies the render configuration once and
+    # purges the scene between meshes instead of reloading the startup file.
+    num_workers: int = 1
+    gpu_ids: Optional[str] = None  # comma-separated GPU ids, assigned round-robin to workers
+    report_path: Optional[str] = None  # JSON summary, default <data_root>/render_sf3d_report.json
 
 
 # --------------------------------------------------------------------------- #
@@ -81,24 +87,11 @@ class Options:
 def reconstruct_hdr_from_pair(hdr_png_path: str, ldr_path: str) -> np.ndarray:
     """Recover the linear HDR envmap from a (hdr_png, ldr_png/jpg) pair.
 
-    Mirrors ``dataset_polyhaven.reconstruct_hdr_from_pngs``:
+    Same codec as ``dataset_polyhaven.reconstruct_hdr_from_pngs`` (see ``envmap_codec``):
         ldr  = uint8( clip(raw, 0, 1) ** (1/2.2) * 255 )
         hdr  = uint8( log1p(10*raw) / max_log * 255 )
     """
-    hdr_png = iio.imread(hdr_png_path)[..., :3].astype(np.float64) / 255.0
-    ldr_png = iio.imread(ldr_path)[..., :3].astype(np.float64) / 255.0
-
-    ldr_linear = ldr_png ** 2.2
-    hdr_norm = hdr_png
-
-    non_sat = (ldr_linear > 0.01) & (ldr_linear < 0.95) & (hdr_norm > 0.01)
-    if non_sat.any():
-        max_log = np.median(np.log1p(10.0 * ldr_linear[non_sat]) / hdr_norm[non_sat])
-    else:
-        max_log = np.log1p(10.0)
-
-    raw_hdr = np.expm1(hdr_norm * max_log) / 10.0
-    return raw_hdr.astype(np.float32)
+    return envmap_codec.read_pair(hdr_png_path, ldr_path)
 
 
 def find_ldr_path(iter_dir: str, view_idx: int) -> Optional[str]:
@@ -111,27 +104,11 @@ def find_ldr_path(iter_dir: str, view_idx: int) -> Optional[str]:
     return None
 
 
-def write_exr(path: str, hdr: np.ndarray) -> None:
-    """Write a float32 HDR image as a 32-bit OpenEXR file."""
-    hdr = np.ascontiguousarray(hdr.astype(np.float32))
-    try:
-        iio.imwrite(path, hdr, extension=".exr")
-        return
-    except Exception:
-        pass
-    try:
-        imageio.plugins.freeimage.download()
-    except Exception:
-        pass
-    imageio.imwrite(path, hdr, flags=0x0001)  # PIZ compression
-
-
-def prepare_envmap_exr(iter_dir: str, view_idx: int) -> str:
-    """Reconstruct an HDR envmap and stage it as a tempfile ``.exr``.
+def load_envmap(iter_dir: str, view_idx: int) -> np.ndarray:
+    """Reconstruct the HDR envmap of a 1-indexed context view as a float32 array.
 
-    Blender's ``set_env_light`` requires an on-disk HDR file. The .exr lives in
-    the system temp dir and should be removed by the caller after rendering.
-    Returns the absolute path of the temp .exr.
+    The array goes straight to ``set_env_light``, which uploads it to Blender
+    in memory, so no intermediate ``.exr`` is written.
     """
     hdr_png = os.path.join(iter_dir, f"context_envhdr_view_{view_idx:02d}.png")
     ldr_path = find_ldr_path(iter_dir, view_idx)
@@ -141,14 +118,7 @@ def prepare_envmap_exr(iter_dir: str, view_idx: int) -> str:
         raise FileNotFoundError(
             f"Missing LDR file: {iter_dir}/context_envldr_view_{view_idx:02d}.(jpg|jpeg|png)"
         )
-
-    hdr = reconstruct_hdr_from_pair(hdr_png, ldr_path)
-    fd, tmp_path = tempfile.mkstemp(
-        prefix=f"sf3d_env_view_{view_idx:02d}_", suffix=".exr"
-    )
-    os.close(fd)
-    write_exr(tmp_path, hdr)
-    return os.path.abspath(tmp_path)
+    return reconstruct_hdr_from_pair(hdr_png, ldr_path)
 
 
 # --------------------------------------------------------------------------- #
@@ -333,24 +303,30 @@ def _render_and_premultiply(output_path: str) -> None:
 
 def _render_one_mesh_views(
     mesh_path: str,
-    exr_path: str,
+    envmap: np.ndarray,
     env_rotation_euler: Tuple[float, float, float],
     views: List[Tuple[str, np.ndarray, float, str]],
     args: Options,
+    configured: bool = False,
 ) -> None:
     """Load one mesh + env light once, then render every view in ``views``.
 
     Each entry in ``views`` is ``(label, c2w_4x4_blender, fov_deg, out_path)``.
+    With ``configured``, the render settings were already applied in this
+    Blender session: the scene is only purged, not reloaded and reconfigured.
     """
     import bpy
 
     from bpy_helper.camera import create_camera
     from bpy_helper.light import set_env_light
-    from bpy_helper.scene import import_3d_model, normalize_scene, reset_scene
+    from bpy_helper.scene import import_3d_model, normalize_scene, purge_scene, reset_scene
     from bpy_helper.utils import stdout_redirected
     from bpy_helper.material import clear_emission_and_alpha_nodes
 
-    reset_scene()
+    if configured:
+        purge_scene()
+    else:
+        reset_scene()
 
     with stdout_redirected():
         import_3d_model(mesh_path)
@@ -381,10 +357,11 @@ def _render_one_mesh_views(
 
     clear_emission_and_alpha_nodes()
 
-    _configure_blender(args.resolution, args.cycles_samples)
+    if not configured:
+        _configure_blender(args.resolution, args.cycles_samples)
 
     set_env_light(
-        exr_path,
+        envmap,
         strength=args.env_strength,
         rotation_euler=list(env_rotation_euler),
     )
@@ -538,7 +515,7 @@ def _build_views_for_mesh(
     return views, env_rotation_euler
 
 
-def render_scene(scene_dir: str, args: Options) -> None:
+def render_scene(scene_dir: str, args: Options, configured: bool = False) -> None:
     """Render both meshes (context + target views) for one scene directory."""
     iter_dir = os.path.join(scene_dir, args.iter_subdir)
     if not os.path.isdir(iter_dir):
@@ -560,8 +537,11 @@ def render_scene(scene_dir: str, args: Options) -> None:
     if not mesh_jobs:
         return
 
+    # Envmaps are decoded once per scene and shared by the meshes lit by the same view
+    envmaps = {}
     for mesh_idx, view_idx, mesh_path in mesh_jobs:
-        exr_path = prepare_envmap_exr(iter_dir, view_idx)
+        if view_idx not in envmaps:
+            envmaps[view_idx] = load_envmap(iter_dir, view_idx)
         views, env_euler = _build_views_for_mesh(
             iter_dir, mesh_idx, view_idx, args
         )
@@ -569,13 +549,9 @@ def render_scene(scene_dir: str, args: Options) -> None:
             f"[render] {os.path.basename(scene_dir)} mesh_{mesh_idx:02d} "
             f"<- env_view_{view_idx:02d} ({len(views)} view(s))"
         )
-        try:
-            _render_one_mesh_views(mesh_path, exr_path, env_euler, views, args)
-        finally:
-            try:
-                os.remove(exr_path)
-            except OSError:
-                pass
+        _render_one_mesh_views(
+            mesh_path, envmaps[view_idx], env_euler, views, args, configured=configured
+        )
 
 
 def iter_scene_dirs(data_root: str, scene_filter: Optional[str]):
@@ -590,6 +566,156 @@ def iter_scene_dirs(data_root: str, scene_filter: Optional[str]):
         yield path
 
 
+def _setup_worker_session(args: Options) -> None:
+    """Start a clean Blender session and apply the render configuration once."""
+    from bpy_helper.scene import reset_scene
+
+    reset_scene()
+    _configure_blender(args.resolution, args.cycles_samples)
+
+
+def _render_scene_timed(scene_dir: str, args: Options, worker_id: int) -> dict:
+    start = time.time()
+    error = None
+    try:
+        render_scene(scene_dir, args, configured=True)
+    except Exception as e:
+        traceback.print_exc()
+        error = repr(e)
+        print(f"[error] {scene_dir}: {e}")
+    return {
+        "scene": scene_dir,
+        "worker": worker_id,
+        "seconds": round(time.time() - start, 3),
+        "error": error,
+    }
+
+
+def _worker_main(worker_id: int, gpu: Optional[str], scene_queue, result_queue, args: Options) -> None:
+    """Batch worker: pull scene directories until the ``None`` sentinel."""
+    if gpu is not None:
+        # must be set before bpy (and Cycles) is imported in this process
+        os.environ["CUDA_VISIBLE_DEVICES"] = gpu
+    _setup_worker_session(args)
+    result_queue.put(("ready", worker_id, None))
+    while True:
+        scene_dir = scene_queue.get()
+        if scene_dir is None:
+            break
+        result_queue.put(("start", worker_id, scene_dir))
+        result_queue.put(("done", worker_id, _render_scene_timed(scene_dir, args, worker_id)))
+
+
+def _run_pool(scene_dirs: List[str], args: Options) -> List[dict]:
+    """Render the scenes with ``args.num_workers`` worker processes.
+
+    A worker that dies (e.g. a Blender crash) is replaced; the scene it was
+    rendering is reported as failed. Every worker gets its ``None`` sentinel
+    up front, so the pool ends once all workers have exited, and scenes that
+    no worker reported (e.g. a worker died between taking a scene and
+    announcing it) are reported as failed instead of being waited for.
+    """
+    import multiprocessing as mp
+    import queue as queue_lib
+
+    ctx = mp.get_context("spawn")
+    scene_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    for scene_dir in scene_dirs:
+        scene_queue.put(scene_dir)
+
+    gpus = [g.strip() for g in args.gpu_ids.split(",") if g.strip()] if args.gpu_ids else []
+    num_workers = max(1, min(args.num_workers, len(scene_dirs)))
+
+    def start_worker(worker_id):
+        gpu = gpus[worker_id % len(gpus)] if gpus else None
+        scene_queue.put(None)
+        proc = ctx.Process(
+            target=_worker_main,
+            args=(worker_id, gpu, scene_queue, result_queue, args),
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    workers = {worker_id: start_worker(worker_id) for worker_id in range(num_workers)}
+    started = set()  # workers that got through their session setup
+    in_flight = {}
+    results = []
+    next_worker_id = num_workers
+    while workers:
+        try:
+            kind, worker_id, payload = result_queue.get(timeout=5.0)
+        except queue_lib.Empty:
+            for worker_id, proc in list(workers.items()):
+                if proc.is_alive():
+                    continue
+                del workers[worker_id]
+                scene_dir = in_flight.pop(worker_id, None)
+                if proc.exitcode == 0:
+                    continue
+                error = f"worker died (exit code {proc.exitcode})"
+                print(f"[error] worker {worker_id}: {error}" + (f" on {scene_dir}" if scene_dir else ""))
+                if scene_dir is not None:
+                    results.append({"scene": scene_dir, "worker": worker_id, "seconds": None, "error": error})
+                # a worker that could not even set up its session would fail again
+                if worker_id in started and len(results) + len(in_flight) < len(scene_dirs):
+                    workers[next_worker_id] = start_worker(next_worker_id)
+                    next_worker_id += 1
+            continue
+        if kind == "ready":
+            started.add(worker_id)
+        elif kind == "start":
+            in_flight[worker_id] = payload
+        else:
+            in_flight.pop(worker_id, None)
+            results.append(payload)
+            print(
+                f"[{len(results)}/{len(scene_dirs)}] {os.path.basename(payload['scene'])} "
+                f"{'failed' if payload['error'] else 'done'} in {payload['seconds']:.1f}s "
+                f"(worker {worker_id})"
+            )
+
+    reported = {r["scene"] for r in results}
+    for scene_dir in scene_dirs:
+        if scene_dir not in reported:
+            print(f"[error] {scene_dir}: not rendered")
+            results.append({"scene": scene_dir, "worker": None, "seconds": None,
+                            "error": "not rendered (no worker left, or its worker died before reporting it)"})
+    return results
+
+
+def write_report(results: List[dict], args: Options, wall_seconds: float) -> str:
+    """Print the summary (timings and errors) and save it as JSON."""
+    errors = [r for r in results if r["error"]]
+    timed = [r["seconds"] for r in results if r["seconds"] is not None and not r["error"]]
+    summary = {
+        "num_scenes": len(results),
+        "num_failed": len(errors),
+        "num_workers": args.num_workers,
+        "wall_seconds": round(wall_seconds, 3),
+        "mean_scene_seconds": round(sum(timed) / len(timed), 3) if timed else None,
+        "scenes": sorted(results, key=lambda r: r["scene"]),
+    }
+    report_path = args.report_path or os.path.join(args.data_root, "render_sf3d_report.json")
+    with open(report_path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(
+        f"\nRendered {len(results) - len(errors)}/{len(results)} scene(s) in "
+        f"{wall_seconds:.1f}s with {args.num_workers} worker(s)"
+        + (f", {summary['mean_scene_seconds']:.1f}s per scene" if timed else "")
+    )
+    if errors:
+        print(f"Completed with {len(errors)} error(s):")
+        for r in errors:
+            print(f"  - {r['scene']}: {r['error']}")
+    else:
+        print("All scenes rendered successfully.")
+    print(f"Report: {report_path}")
+    return report_path
+
+
 def main() -> None:
     args: Options = simple_parsing.parse(Options)
     print(args)
@@ -597,26 +723,20 @@ def main() -> None:
     if not os.path.isdir(args.data_root):
         raise FileNotFoundError(f"data_root does not exist: {args.data_root}")
 
-    error_list = []
     scene_dirs = list(iter_scene_dirs(args.data_root, args.scene_filter))
     print(f"Found {len(scene_dirs)} scene(s) under {args.data_root}")
 
-    for idx, scene_dir in enumerate(scene_dirs):
-        print(f"\n=== [{idx + 1}/{len(scene_dirs)}] {scene_dir} ===")
-        try:
-            render_scene(scene_dir, args)
-        except Exception as e:
-            traceback.print_exc()
-            error_list.append((scene_dir, repr(e)))
-            print(f"[error] {scene_dir}: {e}")
-            continue
-
-    if error_list:
-        print(f"\nCompleted with {len(error_list)} error(s):")
-        for scene_dir, err in error_list:
-            print(f"  - {scene_dir}: {err}")
+    start = time.time()
+    if args.num_workers > 1 and len(scene_dirs) > 1:
+        results = _run_pool(scene_dirs, args)
     else:
-        print("\nAll scenes rendered successfully.")
+        # single worker: same batch session, in this process
+        _setup_worker_session(args)
+        results = []
+        for idx, scene_dir in enumerate(scene_dirs):
+            print(f"\n=== [{idx + 1}/{len(scene_dirs)}] {scene_dir} ===")
+            results.append(_render_scene_timed(scene_dir, args, 0))
+    write_report(results, args, time.time() - start)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 #!/bin/bash
 
 # 脚本用于运行对象采样程序
-# 从JSON和CSV文件中分别采样20个对象并复制到指定目录
+# 从JSON和CSV文件中分别采样20个对象并链接（或复制）到指定目录
+# 额外参数传给 sample_objects.py，例如 ./run_sampling.sh --link_mode symlink
 
 echo "开始运行对象采样脚本..."
 echo "当前工作目录: $(pwd)"
@@ -23,8 +24,8 @@ if [ ! -f "filtered_uids.csv" ]; then
     exit 1
 fi
 
-if [ ! -f "download.py" ]; then
-    echo "错误: 找不到 download.py 文件"
+if [ ! -f "asset_download.py" ]; then
+    echo "错误: 找不到 asset_download.py 文件"
     echo "请确保下载脚本存在以支持自动下载功能"
     exit 1
 fi
@@ -38,6 +39,6 @@ fi
 
 # 运行Python脚本
 echo "运行采样脚本..."
-python3 sample_objects.py
+python3 sample_objects.py "$@"
 
 echo "采样脚本执行完成!"
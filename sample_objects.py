@@ -1,17 +1,130 @@
 #!/usr/bin/env python3
 """
-脚本用于从两个不同的数据源中分别采样20个对象并复制到指定目录
+脚本用于从两个不同的数据源中分别采样20个对象并链接（或复制）到指定目录
 """
 
+import argparse
+import errno
+import fcntl
 import json
 import csv
 import random
 import os
 import shutil
-import subprocess
-import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from asset_download import AssetDownloader, object_path
+from bpy_helper.checkpoint import atomic_json_dump, atomic_replace, tmp_path_for
+
+# 与 download.py 默认的 --base_path 相同
+DOWNLOAD_DIR = "/projects/vig/Datasets/objaverse/hf-objaverse-v1/"
+
+# auto: 硬链接，不支持时写时复制克隆，都不行（例如跨设备）才复制
+# manifest: 不创建文件，只写 manifest.json
+LINK_MODES = ("auto", "hardlink", "reflink", "symlink", "copy", "manifest")
+MANIFEST_NAME = "manifest.json"
+FICLONE = 0x40049409  # linux/fs.h
+
+def reflink(source_path, target_path):
+    """写时复制克隆（btrfs、xfs 等），文件系统不支持或跨设备时抛出 OSError"""
+    with open(source_path, 'rb') as src, open(target_path, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(source_path, target_path)
+
+def symlink(source_path, target_path):
+    os.symlink(os.path.abspath(source_path), target_path)
+
+LINKERS = {
+    "hardlink": os.link,
+    "reflink": reflink,
+    "symlink": symlink,
+    "copy": shutil.copy2,
+}
+
+def is_up_to_date(source_path, target_path):
+    """目标是源文件的链接，或是大小和修改时间相同的副本"""
+    if not os.path.exists(target_path):
+        return False
+    if os.path.samefile(source_path, target_path):
+        return True
+    source_stat, target_stat = os.stat(source_path), os.stat(target_path)
+    return (source_stat.st_size, source_stat.st_mtime_ns) == (target_stat.st_size, target_stat.st_mtime_ns)
+
+def materialize(source_path, target_path, link_mode="auto"):
+    """在 target_path 创建 source_path 的硬链接、克隆、符号链接或副本
+
+    :param source_path: 数据集中的文件
+    :param target_path: 采样目录中的文件，先写入 .tmp_ 文件再原子替换
+    :param link_mode: LINK_MODES 之一（manifest 除外）
+    :return: 实际使用的方式，目标已是最新时为 "existing"
+    """
+    if link_mode != "symlink" and is_up_to_date(source_path, target_path):
+        return "existing"
+    if link_mode == "symlink" and os.path.islink(target_path) and \
+            os.readlink(target_path) == os.path.abspath(source_path):
+        return "existing"
+
+    methods = ["hardlink", "reflink", "copy"] if link_mode == "auto" else [link_mode]
+    tmp_path = tmp_path_for(target_path)
+    while True:
+        method = methods.pop(0)
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            LINKERS[method](source_path, tmp_path)
+        except OSError as e:
+            if not methods:
+                if os.path.lexists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            if e.errno == errno.EXDEV:
+                # 跨设备时链接和克隆都不可能，直接复制
+                methods = ["copy"]
+            continue
+        atomic_replace(tmp_path, target_path)
+        return method
+
+def link_samples(samples, target_dir, link_mode="auto", num_workers=8):
+    """把采样的文件放入 target_dir，并写 manifest.json（uid -> 源文件绝对路径）
+
+    manifest.json 可直接作为 distribute-general-rendering.py 的 --input_models_path。
+
+    :param samples: (uid, 源文件路径) 列表，源文件不存在的会被跳过
+    :param target_dir: 采样目录
+    :param link_mode: LINK_MODES 之一
+    :param num_workers: 并发的链接/复制数，复制大文件时有用
+    :return: 成功采样的文件数
+    """
+    existing = [(uid, source_path) for uid, source_path in samples if os.path.exists(source_path)]
+    for uid, source_path in samples:
+        if not os.path.exists(source_path):
+            print(f"警告: 源文件不存在 {source_path}")
+
+    manifest = {uid: os.path.abspath(source_path) for uid, source_path in existing}
+    atomic_json_dump(manifest, os.path.join(target_dir, MANIFEST_NAME), indent=2)
+    if link_mode == "manifest":
+        print(f"写入 {os.path.join(target_dir, MANIFEST_NAME)}: {len(manifest)} 个对象")
+        return len(manifest)
+
+    def link_one(sample):
+        uid, source_path = sample
+        try:
+            return materialize(source_path, os.path.join(target_dir, f"{uid}.glb"), link_mode)
+        except OSError as e:
+            print(f"警告: 无法{link_mode} {source_path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        methods = list(pool.map(link_one, existing))
+    for (uid, source_path), method in zip(existing, methods):
+        if method is not None:
+            print(f"{method}: {source_path} -> {uid}.glb")
+    counts = Counter(method for method in methods if method is not None)
+    print(f"方式统计: {dict(counts)}")
+    return sum(counts.values())
+
 def create_directories():
     """创建目标目录"""
     dirs = ['./filtered_from_json', './filtered_from_csv']
@@ -19,51 +132,32 @@ def create_directories():
         os.makedirs(dir_path, exist_ok=True)
         print(f"创建目录: {dir_path}")
 
-def download_missing_objects(missing_uids, source_type="json"):
-    """下载缺失的对象"""
-    if not missing_uids:
+def download_missing_objects(missing_paths):
+    """下载缺失的对象
+
+    :param missing_paths: uid -> 相对于 DOWNLOAD_DIR 的路径, 例如 "glbs/000-019/<uid>.glb"
+    :return: 是否全部下载成功
+    """
+    if not missing_paths:
         return True
     
-    print(f"发现 {len(missing_uids)} 个缺失的对象，开始下载...")
-    
-    # 创建临时文件来存储需要下载的UID
-    temp_file = f"temp_download_{source_type}.json"
-    temp_data = {uid: f"glbs/000-000/{uid}.glb" for uid in missing_uids}
-    
-    with open(temp_file, 'w') as f:
-        json.dump(temp_data, f)
+    print(f"发现 {len(missing_paths)} 个缺失的对象，开始下载...")
     
     try:
-        # 运行下载脚本
-        cmd = [
-            sys.executable, "download.py",
-            "--obj_list", temp_file,
-            "--begin_uid", "0",
-            "--end_uid", str(len(missing_uids))
-        ]
-        
-        print(f"执行下载命令: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=3600)  # 1小时超时
-        
-        if result.returncode == 0:
-            print("下载完成!")
-            return True
-        else:
-            print(f"下载失败: {result.stderr}")
-            return False
-            
-    except subprocess.TimeoutExpired:
-        print("下载超时!")
-        return False
+        # 在当前进程中下载（并发、断点续传、校验大小），不再通过临时文件调用 download.py
+        downloader = AssetDownloader(DOWNLOAD_DIR)
+        objects = downloader.download(missing_paths)
     except Exception as e:
         print(f"下载过程中出现错误: {e}")
         return False
-    finally:
-        # 清理临时文件
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
+    
+    if len(objects) == len(missing_paths):
+        print("下载完成!")
+        return True
+    print(f"下载失败: {sorted(set(missing_paths) - set(objects))}")
+    return False
 
-def sample_from_json(json_file, num_samples=20):
+def sample_from_json(json_file, num_samples=20, link_mode="auto", num_workers=8):
     """从JSON文件中采样对象"""
     print(f"从 {json_file} 中取前 {num_samples} 个对象...")
     
@@ -74,42 +168,32 @@ def sample_from_json(json_file, num_samples=20):
     all_keys = list(data.keys())
     sampled_keys = all_keys[:min(num_samples, len(all_keys))]
     
-    source_base = "/projects/vig/Datasets/objaverse/hf-objaverse-v1/"
+    source_base = DOWNLOAD_DIR
     target_dir = "./filtered_from_json"
     
     # 第一遍检查：找出缺失的文件
-    missing_uids = []
+    missing_paths = {}
     for key in sampled_keys:
         relative_path = data[key]  # 例如: "glbs/000-019/2d0dcf63909f40b0b4546726606414e7.glb"
         source_path = os.path.join(source_base, relative_path)
         if not os.path.exists(source_path):
-            missing_uids.append(key)
+            missing_paths[key] = relative_path
     
     # 如果有缺失的文件，尝试下载
-    if missing_uids:
-        print(f"发现 {len(missing_uids)} 个缺失的文件，尝试下载...")
-        download_success = download_missing_objects(missing_uids, "json")
+    if missing_paths:
+        print(f"发现 {len(missing_paths)} 个缺失的文件，尝试下载...")
+        download_success = download_missing_objects(missing_paths)
         if not download_success:
             print("下载失败，继续处理现有文件...")
     
-    # 第二遍：复制文件
-    copied_count = 0
-    for key in sampled_keys:
-        relative_path = data[key]  # 例如: "glbs/000-019/2d0dcf63909f40b0b4546726606414e7.glb"
-        source_path = os.path.join(source_base, relative_path)
-        target_path = os.path.join(target_dir, f"{key}.glb")
-        
-        if os.path.exists(source_path):
-            shutil.copy2(source_path, target_path)
-            copied_count += 1
-            print(f"复制: {relative_path} -> {key}.glb")
-        else:
-            print(f"警告: 源文件不存在 {source_path}")
+    # 第二遍：链接（或复制）文件
+    samples = [(key, os.path.join(source_base, data[key])) for key in sampled_keys]
+    sampled_count = link_samples(samples, target_dir, link_mode, num_workers)
     
-    print(f"从JSON成功复制了 {copied_count} 个文件到 {target_dir}")
-    return copied_count
+    print(f"从JSON成功采样了 {sampled_count} 个文件到 {target_dir}")
+    return sampled_count
 
-def sample_from_csv(csv_file, num_samples=20):
+def sample_from_csv(csv_file, num_samples=20, link_mode="auto", num_workers=8):
     """从CSV文件中采样对象"""
     print(f"从 {csv_file} 中取前 {num_samples} 个对象...")
     
@@ -120,11 +204,11 @@ def sample_from_csv(csv_file, num_samples=20):
     # 取前N个对象
     sampled_rows = rows[:min(num_samples, len(rows))]
     
-    source_base = "/projects/vig/Datasets/objaverse/hf-objaverse-v1/glbs/"
+    source_base = os.path.join(DOWNLOAD_DIR, "glbs")
     target_dir = "./filtered_from_csv"
     
     # 第一遍检查：找出缺失的文件
-    missing_uids = []
+    missing_paths = {}
     for row in sampled_rows:
         if len(row) >= 2:
             folder = row[0]  # 例如: "000-001"
@@ -133,39 +217,25 @@ def sample_from_csv(csv_file, num_samples=20):
             # 构建源文件路径
             source_path = os.path.join(source_base, folder, f"{uid}.glb")
             if not os.path.exists(source_path):
-                missing_uids.append(uid)
+                missing_paths[uid] = object_path(folder, uid)
     
     # 如果有缺失的文件，尝试下载
-    if missing_uids:
-        print(f"发现 {len(missing_uids)} 个缺失的文件，尝试下载...")
-        download_success = download_missing_objects(missing_uids, "csv")
+    if missing_paths:
+        print(f"发现 {len(missing_paths)} 个缺失的文件，尝试下载...")
+        download_success = download_missing_objects(missing_paths)
         if not download_success:
             print("下载失败，继续处理现有文件...")
     
-    # 第二遍：复制文件
-    copied_count = 0
-    for row in sampled_rows:
-        if len(row) >= 2:
-            folder = row[0]  # 例如: "000-001"
-            uid = row[1]     # 例如: "112c059282cf4511a01fd27211edcae8"
-            
-            # 构建源文件路径
-            source_path = os.path.join(source_base, folder, f"{uid}.glb")
-            target_path = os.path.join(target_dir, f"{uid}.glb")
-            
-            if os.path.exists(source_path):
-                shutil.copy2(source_path, target_path)
-                copied_count += 1
-                print(f"复制: {folder}/{uid}.glb -> {uid}.glb")
-            else:
-                print(f"警告: 源文件不存在 {source_path}")
+    # 第二遍：链接（或复制）文件
+    samples = [(row[1], os.path.join(source_base, row[0], f"{row[1]}.glb")) for row in sampled_rows if len(row) >= 2]
+    sampled_count = link_samples(samples, target_dir, link_mode, num_workers)
     
-    print(f"从CSV成功复制了 {copied_count} 个文件到 {target_dir}")
-    return copied_count
+    print(f"从CSV成功采样了 {sampled_count} 个文件到 {target_dir}")
+    return sampled_count
 
 def check_dependencies():
     """检查依赖文件是否存在"""
-    required_files = ["download.py", "all_objaverse_filtered_data.json", "filtered_uids.csv"]
+    required_files = ["asset_download.py", "all_objaverse_filtered_data.json", "filtered_uids.csv"]
     missing_files = []
     
     for file in required_files:
@@ -178,9 +248,18 @@ def check_dependencies():
     
     return True
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="从JSON和CSV文件中分别取前N个对象")
+    parser.add_argument("--num_samples", type=int, default=20, help="每个数据源取的对象数")
+    parser.add_argument("--link_mode", type=str, default="auto", choices=LINK_MODES,
+                        help="auto: 硬链接，不支持时克隆，跨设备时复制; manifest: 只写 manifest.json")
+    parser.add_argument("--num_workers", type=int, default=8, help="并发的链接/复制数")
+    return parser.parse_args()
+
 def main():
     """主函数"""
-    print("开始取前20个对象...")
+    args = parse_args()
+    print(f"开始取前{args.num_samples}个对象...")
     
     # 检查依赖文件
     if not check_dependencies():
@@ -192,7 +271,7 @@ def main():
     # 从JSON文件采样
     json_file = "all_objaverse_filtered_data.json"
     if os.path.exists(json_file):
-        json_count = sample_from_json(json_file, 20)
+        json_count = sample_from_json(json_file, args.num_samples, args.link_mode, args.num_workers)
     else:
         print(f"错误: 找不到文件 {json_file}")
         json_count = 0
@@ -202,16 +281,16 @@ def main():
     # 从CSV文件采样
     csv_file = "filtered_uids.csv"
     if os.path.exists(csv_file):
-        csv_count = sample_from_csv(csv_file, 20)
+        csv_count = sample_from_csv(csv_file, args.num_samples, args.link_mode, args.num_workers)
     else:
         print(f"错误: 找不到文件 {csv_file}")
         csv_count = 0
     
     print("-" * 50)
-    print(f"取前20个对象完成!")
-    print(f"从JSON复制了 {json_count} 个文件")
-    print(f"从CSV复制了 {csv_count} 个文件")
-    print(f"总计复制了 {json_count + csv_count} 个文件")
+    print(f"取前{args.num_samples}个对象完成!")
+    print(f"从JSON采样了 {json_count} 个文件")
+    print(f"从CSV采样了 {csv_count} 个文件")
+    print(f"总计采样了 {json_count + csv_count} 个文件")
 
 if __name__ == "__main__":
     main()
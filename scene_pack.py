@@ -0,0 +1,418 @@
+"""Packed, chunked array format for rendered scenes (one ``<uid>.npack`` file per scene).
+
+A rendered scene directory holds thousands of small files (``{split}/<lighting>/gt_{i}.png``, depth / normal EXRs,
+albedo PNGs, json). The pack stores them as named n-d arrays split into independently compressed chunks:
+
+    {split}/rgb      uint8   (views, lightings, H, W, C)   one chunk per image
+    {split}/valid    bool    (views, lightings)            False where the image was missing
+    {split}/depth    float32 (views, H, W)                 one chunk per view
+    {split}/normal   float32 (views, H, W, 3)
+    {split}/albedo   uint8   (views, H, W, C)
+    {split}/c2w      float32 (views, 4, 4)
+    {split}/fov      float32 (views,)
+    {split}/eye_idx  int32   (views,)
+
+The light plan (names, kinds and parameters) and normalize.json go into the pack attributes. Readers memory-map
+the file and decode only the chunks a slice touches, e.g. ``ScenePack(path)['train/rgb'][3, 1]``.
+
+File layout: ``MAGIC | chunk bytes ... | header json | uint64 header length | MAGIC``. The header lists for every
+array its dtype, shape, chunk shape, codec and the (offset, length) of every chunk.
+
+Convert a rendered directory:
+    python scene_pack.py --input_dir <rendered_dir> --output_dir <packs_dir> --num_workers 8
+"""
+
+import argparse
+import glob
+import io
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import tarfile
+import zlib
+
+import imageio.v3 as imageio
+import numpy as np
+
+import exr_io
+from bpy_helper.checkpoint import atomic_replace, tmp_path_for
+
+MAGIC = b'SCNPACK1'
+FOOTER = struct.Struct('<Q8s')
+CODECS = ('zlib', 'none')
+INTRINSICS = {
+    'depth': ('depth', 'depth_{}.exr'),
+    'normal': ('normal', 'normal_cam_{}.exr'),
+    'albedo': ('albedo', 'albedo_cam_{}.png'),
+}
+
+
+def _chunk_grid(shape, chunks):
+    return tuple((s + c - 1) // c for s, c in zip(shape, chunks))
+
+
+def _chunk_id(chunk_idx, grid):
+    return int(np.ravel_multi_index(chunk_idx, grid)) if grid else 0
+
+
+class ScenePackWriter:
+    """Write a scene pack chunk by chunk. The file appears at ``path`` only once ``close()`` wrote the header."""
+
+    def __init__(self, path, attrs=None):
+        self.path = path
+        self.tmp_path = tmp_path_for(path)
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(MAGIC)
+        self.attrs = dict(attrs or {})
+        self.arrays = {}
+
+    def create_array(self, name, shape, dtype, chunks=None, codec='zlib', level=1):
+        """Declare an array; chunks default to the whole array. Chunks that are never written read as zeros."""
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec}, expected one of {CODECS}")
+        shape = tuple(int(s) for s in shape)
+        chunks = tuple(max(1, int(c)) for c in (chunks or shape))
+        grid = _chunk_grid(shape, chunks)
+        self.arrays[name] = {
+            'dtype': np.dtype(dtype).str,
+            'shape': shape,
+            'chunks': chunks,
+            'codec': codec,
+            'level': level,
+            'index': [None] * int(np.prod(grid)),
+        }
+
+    def write_chunk(self, name, chunk_idx, data):
+        """Write one chunk. Edge chunks may be smaller than the chunk shape, they are padded with zeros."""
+        spec = self.arrays[name]
+        chunk = np.zeros(spec['chunks'], dtype=spec['dtype'])
+        data = np.asarray(data, dtype=spec['dtype'])
+        chunk[tuple(slice(0, s) for s in data.shape)] = data
+        raw = chunk.tobytes()
+        if spec['codec'] == 'zlib':
+            raw = zlib.compress(raw, spec['level'])
+        offset = self.file.tell()
+        self.file.write(raw)
+        grid = _chunk_grid(spec['shape'], spec['chunks'])
+        spec['index'][_chunk_id(tuple(chunk_idx), grid)] = [offset, len(raw)]
+
+    def add_array(self, name, data, chunks=None, codec='zlib', level=1):
+        """Write a whole in-memory array."""
+        data = np.asarray(data)
+        self.create_array(name, data.shape, data.dtype, chunks=chunks, codec=codec, level=level)
+        spec = self.arrays[name]
+        grid = _chunk_grid(spec['shape'], spec['chunks'])
+        for chunk_idx in itertools.product(*(range(g) for g in grid)):
+            region = tuple(slice(i * c, (i + 1) * c) for i, c in zip(chunk_idx, spec['chunks']))
+            self.write_chunk(name, chunk_idx, data[region])
+
+    def close(self):
+        header = json.dumps({'arrays': self.arrays, 'attrs': self.attrs}).encode()
+        self.file.write(header)
+        self.file.write(FOOTER.pack(len(header), MAGIC))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        atomic_replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.tmp_path)
+
+
+class PackedArray:
+    """A chunked array of a scene pack. Index it like a numpy array; only the chunks touched are decoded."""
+
+    def __init__(self, buffer, spec):
+        self.buffer = buffer
+        self.dtype = np.dtype(spec['dtype'])
+        self.shape = tuple(spec['shape'])
+        self.chunks = tuple(spec['chunks'])
+        self.codec = spec['codec']
+        self.index = spec['index']
+        self.grid = _chunk_grid(self.shape, self.chunks)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read_chunk(self, chunk_idx):
+        """Decode one chunk. Uncompressed chunks are returned as read-only views of the memory map."""
+        entry = self.index[_chunk_id(tuple(chunk_idx), self.grid)]
+        if entry is None:
+            return np.zeros(self.chunks, dtype=self.dtype)
+        offset, length = entry
+        if self.codec == 'none':
+            return np.frombuffer(self.buffer, dtype=self.dtype, count=int(np.prod(self.chunks)), offset=offset).reshape(self.chunks)
+        raw = zlib.decompress(self.buffer[offset:offset + length])
+        return np.frombuffer(raw, dtype=self.dtype).reshape(self.chunks)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        ranges, squeeze = [], []
+        for axis, (k, size) in enumerate(zip(key, self.shape)):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(size)
+                if step != 1:
+                    raise IndexError("PackedArray only supports contiguous slices")
+                ranges.append((start, max(start, stop)))
+            else:
+                k = int(k)
+                if k < 0:
+                    k += size
+                if not 0 <= k < size:
+                    raise IndexError(f"index {k} is out of bounds for axis {axis} with size {size}")
+                ranges.append((k, k + 1))
+                squeeze.append(axis)
+
+        out = np.empty([stop - start for start, stop in ranges], dtype=self.dtype)
+        chunk_ranges = [range(start // c, (stop + c - 1) // c) for (start, stop), c in zip(ranges, self.chunks)]
+        for chunk_idx in itertools.product(*chunk_ranges):
+            chunk = self.read_chunk(chunk_idx)
+            src, dst = [], []
+            for i, (start, stop), c in zip(chunk_idx, ranges, self.chunks):
+                lo, hi = max(start, i * c), min(stop, (i + 1) * c)
+                src.append(slice(lo - i * c, hi - i * c))
+                dst.append(slice(lo - start, hi - start))
+            out[tuple(dst)] = chunk[tuple(src)]
+        return out.squeeze(axis=tuple(squeeze)) if squeeze else out
+
+
+class ScenePack:
+    """Read-only, memory-mapped scene pack."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_len, magic = FOOTER.unpack(self.buffer[-FOOTER.size:])
+        if magic != MAGIC or self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a scene pack")
+        header_end = len(self.buffer) - FOOTER.size
+        header = json.loads(self.buffer[header_end - header_len:header_end])
+        self.attrs = header['attrs']
+        self.arrays = {name: PackedArray(self.buffer, spec) for name, spec in header['arrays'].items()}
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def close(self):
+        self.arrays = {}
+        self.buffer.close()
+
+
+class RenderedSceneReader:
+    """Read the outputs of one rendered scene from plain files, ``<lighting>.tar`` archives or tar shards."""
+
+    def __init__(self, res_dir, shard_members=None):
+        """``shard_members`` maps member names relative to the output dir to ``(shard_path, index_entry)``."""
+        self.res_dir = res_dir
+        self.shard_members = shard_members or {}
+        self.uid = os.path.basename(os.path.normpath(res_dir))
+        self._tar_members = {}
+
+    def has(self, rel_path):
+        """Whether ``res_dir/rel_path`` was rendered, without reading it."""
+        if os.path.exists(os.path.join(self.res_dir, rel_path)) or f'{self.uid}/{rel_path}' in self.shard_members:
+            return True
+        folder, name = os.path.split(rel_path)
+        members = self._members_of_tar(os.path.join(self.res_dir, folder + '.tar'))
+        return members is not None and name in members
+
+    def _members_of_tar(self, tar_path):
+        """Name -> (data offset, size) of the files in an uncompressed ``<lighting>.tar``, or None if there is no such
+        archive. Only this listing is kept; member contents are read on demand."""
+        if tar_path not in self._tar_members:
+            if not os.path.exists(tar_path):
+                return None
+            with tarfile.open(tar_path, 'r:') as tar:
+                self._tar_members[tar_path] = {os.path.basename(m.name): (m.offset_data, m.size)
+                                               for m in tar.getmembers() if m.isfile()}
+        return self._tar_members[tar_path]
+
+    def read_bytes(self, rel_path):
+        """Content of ``res_dir/rel_path``, or None if it was not rendered."""
+        path = os.path.join(self.res_dir, rel_path)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        member = self.shard_members.get(f'{self.uid}/{rel_path}')
+        if member is not None:
+            shard_path, entry = member
+            with open(shard_path, 'rb') as f:
+                f.seek(entry['data_offset'])
+                return f.read(entry['size'])
+        folder, name = os.path.split(rel_path)
+        tar_path = os.path.join(self.res_dir, folder + '.tar')
+        members = self._members_of_tar(tar_path)
+        if members is None or name not in members:
+            return None
+        offset, size = members[name]
+        with open(tar_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def read_image(self, rel_path):
+        data = self.read_bytes(rel_path)
+        if data is None:
+            return None
+        ext = os.path.splitext(rel_path)[1]
+        if ext == '.exr':
+            try:
+                return exr_io.read_exr(data)
+            except exr_io.UnsupportedCompression:
+                pass
+        return imageio.imread(io.BytesIO(data), extension=ext)
+
+    def read_json(self, rel_path):
+        data = self.read_bytes(rel_path)
+        return None if data is None else json.loads(data)
+
+    def light_plan(self, split):
+        """Light plan entries ({'name', 'kind', 'info'}) in render order."""
+        plan = self.read_json('lights.json')
+        if plan is None:
+            plan = (self.read_json('scene.json') or {}).get('lights')
+        if plan is None:
+            # older renders: every lighting folder (or tar) next to the cameras
+            split_dir = os.path.join(self.res_dir, split)
+            names = sorted({os.path.splitext(n)[0] for n in os.listdir(split_dir)} - {'cameras', 'depth', 'normal', 'albedo'})
+            plan = [{'name': name, 'kind': None, 'info': None} for name in names]
+        return plan
+
+
+def pack_scene(res_dir, out_path, splits=('train', 'test'), codec='zlib', level=1, shard_members=None):
+    """Convert one rendered scene directory to a scene pack."""
+    reader = RenderedSceneReader(res_dir, shard_members)
+    attrs = {'uid': reader.uid, 'normalize': reader.read_json('normalize.json'), 'splits': {}}
+
+    with ScenePackWriter(out_path, attrs) as writer:
+        for split in splits:
+            cameras = reader.read_json(f'{split}/cameras.json')
+            if cameras is None:
+                continue
+            plan = reader.light_plan(split)
+            attrs['splits'][split] = {
+                'lights': [light['name'] for light in plan],
+                'light_kinds': [light['kind'] for light in plan],
+                'light_info': [light['info'] for light in plan],
+            }
+            eye_ids = [cam['eye_idx'] for cam in cameras]
+            writer.add_array(f'{split}/eye_idx', np.array(eye_ids, dtype=np.int32))
+            writer.add_array(f'{split}/c2w', np.array([cam['c2w'] for cam in cameras], dtype=np.float32))
+            writer.add_array(f'{split}/fov', np.array([cam['fov'] for cam in cameras], dtype=np.float32))
+
+            valid = np.zeros((len(eye_ids), len(plan)), dtype=bool)
+            for view, eye_idx in enumerate(eye_ids):
+                for light_idx, light in enumerate(plan):
+                    img = reader.read_image(f'{split}/{light["name"]}/gt_{eye_idx}.png')
+                    if img is None:
+                        continue
+                    name = f'{split}/rgb'
+                    if name not in writer.arrays:
+                        writer.create_array(name, (len(eye_ids), len(plan)) + img.shape, np.uint8,
+                                            chunks=(1, 1) + img.shape, codec=codec, level=level)
+                    writer.write_chunk(name, (view, light_idx) + (0,) * img.ndim, img[None, None])
+                    valid[view, light_idx] = True
+            writer.add_array(f'{split}/valid', valid)
+
+            for key, (folder, pattern) in INTRINSICS.items():
+                name = f'{split}/{key}'
+                for view, eye_idx in enumerate(eye_ids):
+                    img = reader.read_image(f'{split}/{folder}/{pattern.format(eye_idx)}')
+                    if img is None:
+                        continue
+                    if key == 'depth' and img.ndim == 3:
+                        img = img[..., 0]
+                    if key == 'normal':
+                        img = img[..., :3]
+                    if name not in writer.arrays:
+                        dtype = np.uint8 if key == 'albedo' else np.float32
+                        writer.create_array(name, (len(eye_ids),) + img.shape, dtype,
+                                            chunks=(1,) + img.shape, codec=codec, level=level)
+                    writer.write_chunk(name, (view,) + (0,) * img.ndim, img[None])
+    return out_path
+
+
+_shard_members = None
+
+
+def _init_worker(shard_members):
+    global _shard_members
+    _shard_members = shard_members
+
+
+def load_shard_members(shard_dir):
+    """Map every member of the tar shards written by ``--shard_output`` renders to ``(shard_path, index_entry)``."""
+    from bpy_helper.shards import load_shard_index
+    members = {}
+    for shard_path in sorted(glob.glob(os.path.join(shard_dir, '*.tar'))):
+        for entry in load_shard_index(shard_path + '.idx'):
+            members[entry['name']] = (shard_path, entry)
+    return members
+
+
+def _pack_one(job):
+    res_dir, out_path, codec, level = job
+    try:
+        pack_scene(res_dir, out_path, codec=codec, level=level, shard_members=_shard_members)
+        return res_dir, None
+    except Exception as e:
+        return res_dir, str(e)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert rendered scene directories to scene packs")
+    parser.add_argument("--input_dir", type=str, required=True, help="Directory with one rendered scene per folder")
+    parser.add_argument("--output_dir", type=str, required=True, help="Where <uid>.npack files are written")
+    parser.add_argument("--codec", type=str, default="zlib", choices=CODECS)
+    parser.add_argument("--level", type=int, default=1, help="zlib compression level")
+    parser.add_argument("--num_workers", type=int, default=8)
+    parser.add_argument("--overwrite", action="store_true", help="Re-pack scenes that already have a pack")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = []
+    for done_path in sorted(glob.glob(os.path.join(args.input_dir, '*', 'done.txt'))):
+        res_dir = os.path.dirname(done_path)
+        out_path = os.path.join(args.output_dir, f'{os.path.basename(res_dir)}.npack')
+        if args.overwrite or not os.path.exists(out_path):
+            jobs.append((res_dir, out_path, args.codec, args.level))
+    print(f"Packing {len(jobs)} scenes")
+
+    # Outputs of --shard_output renders live in <input_dir>/shards
+    shard_members = load_shard_members(os.path.join(args.input_dir, 'shards'))
+
+    failed = []
+    with multiprocessing.Pool(args.num_workers, initializer=_init_worker, initargs=(shard_members,)) as pool:
+        for i, (res_dir, error) in enumerate(pool.imap_unordered(_pack_one, jobs)):
+            if error is not None:
+                print(f"Failed to pack {res_dir}: {error}")
+                failed.append(res_dir)
+            if (i + 1) % 100 == 0:
+                print(f"{i + 1}/{len(jobs)}")
+    print(f"Packed {len(jobs) - len(failed)}/{len(jobs)} scenes")
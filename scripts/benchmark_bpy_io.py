@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the bpy_helper.io pixel buffer API against the list-based pixel access it replaces.
+
+Needs the bpy module (or run inside Blender: blender -b -P scripts/benchmark_bpy_io.py -- --sizes 512 1024).
+
+  read   np.array(img.pixels[:])                  vs  PixelBuffer.read (foreach_get into a reused buffer)
+  write  concatenate alpha + pixels.foreach_set   vs  PixelBuffer.write (reused staging buffer)
+  exr    old _read/_write_exr_with_bpy            vs  the buffer-based versions
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Make bpy_helper importable when run as scripts/benchmark_bpy_io.py
+_proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _proj_root not in sys.path:
+    sys.path.insert(0, _proj_root)
+
+import bpy
+
+from bpy_helper.io import PixelBuffer, _read_exr_with_bpy, _write_exr_with_bpy
+
+
+def timeit(fn, repeat):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def old_read(img):
+    w, h = img.size
+    return np.array(img.pixels[:], dtype=np.float32).reshape((h, w, img.channels))
+
+
+def old_write(img, data):
+    h, w = data.shape[:2]
+    data = np.concatenate([data, np.ones((h, w, 1), dtype=np.float32)], axis=-1)
+    img.pixels.foreach_set(data.astype(np.float32).ravel())
+
+
+def old_read_exr(path):
+    img = bpy.data.images.load(path, check_existing=False)
+    arr = old_read(img)
+    bpy.data.images.remove(img, do_unlink=True)
+    return arr
+
+
+def report(name, size, old, new):
+    print(f"{name:<6} {size:>5}^2   old {old * 1e3:9.2f} ms   new {new * 1e3:9.2f} ms   x{old / new:6.1f}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the bpy_helper.io pixel buffer API")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    buffer = PixelBuffer()
+    tmp_dir = tempfile.mkdtemp(prefix="bpy_io_bench_")
+    for size in args.sizes:
+        img = bpy.data.images.new(f"bench_{size}", width=size, height=size, alpha=True, float_buffer=True)
+        data = np.random.rand(size, size, 3).astype(np.float32)
+        buffer.write(img, data)
+
+        report("read", size, timeit(lambda: old_read(img), args.repeat), timeit(lambda: buffer.read(img), args.repeat))
+        report("write", size, timeit(lambda: old_write(img, data), args.repeat), timeit(lambda: buffer.write(img, data), args.repeat))
+
+        exr_path = os.path.join(tmp_dir, f"bench_{size}.exr")
+        _write_exr_with_bpy(exr_path, data, out=buffer)
+        report("exr", size, timeit(lambda: old_read_exr(exr_path), args.repeat),
+               timeit(lambda: _read_exr_with_bpy(exr_path, out=buffer), args.repeat))
+        assert np.allclose(old_read_exr(exr_path), _read_exr_with_bpy(exr_path))
+
+        bpy.data.images.remove(img, do_unlink=True)
+        os.remove(exr_path)
+    os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:])
@@ -7,6 +7,15 @@ Usage:
   python scripts/distribute_render_3dmodels_dense_enhance.py \
     --num_gpus 1 --workers_per_gpu 4 \
     --group_start 0 --group_end 50
+
+With --views_per_shard N, each model is split into (lighting pass, split, view range) work items of at most N
+views. The models are first prepared (scene.json), the work items are rendered by all workers, and a merge step
+validates the outputs and writes cameras.json, the per-light json and done.txt. To spread the work items over
+several nodes, run the same command on every node with --num_nodes K --node_rank r.
+
+On SIGTERM (e.g. SLURM preemption) the dispatcher drains: no new work item is started, running renders stop after
+their current view, and whatever still runs --drain_timeout seconds later is killed. Rerunning the same command
+resumes from the missing views.
 """
 
 import argparse
@@ -14,7 +23,15 @@ import multiprocessing
 import os
 import random
 import signal
-import subprocess
+import sys
+
+# Make bpy_helper importable when run as scripts/distribute_render_3dmodels_dense_enhance.py
+_proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _proj_root not in sys.path:
+    sys.path.insert(0, _proj_root)
+
+from bpy_helper.checkpoint import DRAIN_EXIT_CODE
+from bpy_helper.dispatch import install_dispatcher_drain_handler, run_drainable, describe_returncode
 
 
 def sample_light_config(model_idx: int, args: argparse.Namespace) -> dict:
@@ -70,9 +87,84 @@ def sample_light_config(model_idx: int, args: argparse.Namespace) -> dict:
     return cfg
 
 
+def light_pass_names(light_cfg: dict, max_pl_num: int = 3) -> list:
+    """Names of the lighting passes render_3dmodels_dense_enhance.py renders for a lighting config, in order."""
+    names = []
+    for key, prefix in [
+        ("num_white_envs", "white_env"),
+        ("num_white_pls", "white_pl"),
+        ("num_rgb_pls", "rgb_pl"),
+        ("num_multi_pls", "multi_pl"),
+        ("num_env_lights", "env"),
+        ("num_area_lights", "area"),
+    ]:
+        names += [f"{prefix}_{i}" for i in range(light_cfg[key])]
+    # combined lighting has at most env + point lights + area stages
+    num_stages = min(light_cfg["num_combined_lights"], 1 + min(2, max_pl_num) + 1)
+    names += [f"combined_{i}" for i in range(num_stages)]
+    return names
+
+
+def get_light_config(model_idx: int, args: argparse.Namespace) -> dict:
+    if args.dynamic_lighting_counts:
+        return sample_light_config(model_idx, args)
+    return {
+        "num_white_envs": args.num_white_envs,
+        "num_env_lights": args.num_env_lights,
+        "num_white_pls": args.num_white_pls,
+        "num_rgb_pls": args.num_rgb_pls,
+        "num_multi_pls": args.num_multi_pls,
+        "num_area_lights": args.num_area_lights,
+        "num_combined_lights": args.num_combined_lights,
+    }
+
+
+def shard_work_items(model_idx: int, args: argparse.Namespace) -> list:
+    """Split one model into ("render", model_idx, light_name, split, view_start, view_end) work items."""
+    items = []
+    for light_name in light_pass_names(get_light_config(model_idx, args)):
+        for split, num_split_views in [("train", args.num_views), ("test", args.num_test_views)]:
+            for view_start in range(0, num_split_views, args.views_per_shard):
+                view_end = min(view_start + args.views_per_shard, num_split_views)
+                items.append(("render", model_idx, light_name, split, view_start, view_end))
+    return items
+
+
+def build_command(item: tuple, gpu: int, args: argparse.Namespace) -> str:
+    stage, model_idx = item[0], item[1]
+    light_cfg = get_light_config(model_idx, args)
+    command = (
+        f"CUDA_VISIBLE_DEVICES={gpu} "
+        f"python {args.proj_root}/render_3dmodels_dense_enhance.py "
+        f"--group_start {model_idx} --group_end {model_idx + 1} "
+        f"--num_views {args.num_views} "
+        f"--num_test_views {args.num_test_views} "
+        f"--num_white_envs {light_cfg['num_white_envs']} "
+        f"--num_env_lights {light_cfg['num_env_lights']} "
+        f"--num_white_pls {light_cfg['num_white_pls']} "
+        f"--num_rgb_pls {light_cfg['num_rgb_pls']} "
+        f"--num_multi_pls {light_cfg['num_multi_pls']} "
+        f"--num_area_lights {light_cfg['num_area_lights']} "
+        f"--num_combined_lights {light_cfg['num_combined_lights']} "
+        f"--rho_min {args.rho_min} "
+        f"--rho_max {args.rho_max} "
+        f"--rendered_dir_name {args.rendered_dir_name} "
+        f"--csv_path {args.csv_path} "
+        f"--stage {stage}"
+    )
+    if stage == "render":
+        _, _, light_name, split, view_start, view_end = item
+        command += (
+            f" --light_names {light_name} --split {split}"
+            f" --view_start {view_start} --view_end {view_end}"
+        )
+    return command
+
+
 def worker(
     queue: multiprocessing.JoinableQueue,
     count: multiprocessing.Value,
+    stop_event: multiprocessing.Event,
     gpu: int,
     args: argparse.Namespace,
 ) -> None:
@@ -83,49 +175,27 @@ def worker(
         if item is None:
             break
 
-        model_idx = item
-        if args.dynamic_lighting_counts:
-            light_cfg = sample_light_config(model_idx, args)
-        else:
-            light_cfg = {
-                "num_white_envs": args.num_white_envs,
-                "num_env_lights": args.num_env_lights,
-                "num_white_pls": args.num_white_pls,
-                "num_rgb_pls": args.num_rgb_pls,
-                "num_multi_pls": args.num_multi_pls,
-                "num_area_lights": args.num_area_lights,
-                "num_combined_lights": args.num_combined_lights,
-            }
-
-        print(f"[GPU {gpu}] Rendering model {model_idx} with lights: {light_cfg}", flush=True)
-
-        command = (
-            f"CUDA_VISIBLE_DEVICES={gpu} "
-            f"python {args.proj_root}/render_3dmodels_dense_enhance.py "
-            f"--group_start {model_idx} --group_end {model_idx + 1} "
-            f"--num_views {args.num_views} "
-            f"--num_test_views {args.num_test_views} "
-            f"--num_white_envs {light_cfg['num_white_envs']} "
-            f"--num_env_lights {light_cfg['num_env_lights']} "
-            f"--num_white_pls {light_cfg['num_white_pls']} "
-            f"--num_rgb_pls {light_cfg['num_rgb_pls']} "
-            f"--num_multi_pls {light_cfg['num_multi_pls']} "
-            f"--num_area_lights {light_cfg['num_area_lights']} "
-            f"--num_combined_lights {light_cfg['num_combined_lights']} "
-            f"--rho_min {args.rho_min} "
-            f"--rho_max {args.rho_max} "
-            f"--rendered_dir_name {args.rendered_dir_name} "
-            f"--csv_path {args.csv_path}"
-        )
+        if stop_event.is_set():
+            # Draining: leave the remaining work items to the requeued job
+            queue.task_done()
+            continue
+
+        # Whole-model items are plain indices, sharded items are (stage, model_idx, ...) tuples
+        if not isinstance(item, tuple):
+            item = ("all", item)
+        model_idx = item[1]
+        print(f"[GPU {gpu}] {item[0]} model {model_idx} with lights: {get_light_config(model_idx, args)} {item[2:]}", flush=True)
+        command = build_command(item, gpu, args)
 
         try:
-            subprocess.run(command, shell=True, check=True)
-            with count.get_lock():
-                count.value += 1
-        except subprocess.CalledProcessError as e:
-            print(f"[GPU {gpu}] Failed to render model {model_idx}: {e}", flush=True)
+            returncode = run_drainable(command, stop_event, args.drain_timeout)
+            if returncode == 0:
+                with count.get_lock():
+                    count.value += 1
+            else:
+                print(f"[GPU {gpu}] {item[0]} model {model_idx} {item[2:]} {describe_returncode(returncode)}", flush=True)
         except Exception as e:
-            print(f"[GPU {gpu}] Unexpected error for model {model_idx}: {e}", flush=True)
+            print(f"[GPU {gpu}] Unexpected error for model {model_idx} {item[2:]}: {e}", flush=True)
 
         queue.task_done()
 
@@ -155,6 +225,10 @@ def main():
     parser.add_argument("--rho_max", type=float, default=1.0)
     parser.add_argument("--rendered_dir_name", type=str, default="rendered_dense_enhance")
     parser.add_argument("--csv_path", type=str, default="test_obj.csv")
+    parser.add_argument("--views_per_shard", type=int, default=0, help="Split each model into work items of at most this many views (0: one item per model)")
+    parser.add_argument("--num_nodes", type=int, default=1, help="Number of nodes sharing the sharded work items")
+    parser.add_argument("--node_rank", type=int, default=0, help="Rank of this node among --num_nodes")
+    parser.add_argument("--drain_timeout", type=float, default=120, help="Seconds running renders get to finish their current view after SIGTERM")
     parser.add_argument(
         "--proj_root",
         type=str,
@@ -171,25 +245,48 @@ def main():
 
     queue = multiprocessing.JoinableQueue()
     count = multiprocessing.Value("i", 0)
+    stop_event = multiprocessing.Event()
+    install_dispatcher_drain_handler(stop_event)
     processes = []
 
     for gpu_i in range(args.num_gpus):
         for _worker_i in range(args.workers_per_gpu):
-            process = multiprocessing.Process(target=worker, args=(queue, count, gpu_i, args))
+            process = multiprocessing.Process(target=worker, args=(queue, count, stop_event, gpu_i, args))
             process.daemon = True
             process.start()
             processes.append(process)
 
-    try:
-        for model_idx in model_indices:
-            queue.put(model_idx)
-
+    def run_phase(items: list, name: str) -> None:
+        if stop_event.is_set():
+            return
+        with count.get_lock():
+            count.value = 0
+        for item in items:
+            queue.put(item)
         queue.join()
+        print(f"{name}: {count.value}/{len(items)} work items succeeded.")
+
+    try:
+        if args.views_per_shard <= 0:
+            run_phase(model_indices, "Render")
+        else:
+            # 1. describe each scene once, 2. render the work items on every worker (and node),
+            # 3. validate and finalize. A model whose work items were partly rendered by another node
+            #    fails to merge here and is finalized by the last node to finish.
+            node_models = model_indices[args.node_rank::args.num_nodes]
+            run_phase([("prepare", model_idx) for model_idx in node_models], "Prepare")
+            work_items = [item for model_idx in model_indices for item in shard_work_items(model_idx, args)]
+            run_phase(work_items[args.node_rank::args.num_nodes], "Render")
+            run_phase([("merge", model_idx) for model_idx in model_indices], "Merge")
 
         for _ in range(args.num_gpus * args.workers_per_gpu):
             queue.put(None)
 
-        print(f"All done! Rendered {count.value}/{total} models.")
+        if stop_event.is_set():
+            print("Drained. Rerun the same command to resume the remaining work.")
+            sys.exit(DRAIN_EXIT_CODE)
+
+        print(f"All done! Processed {total} models.")
 
     except KeyboardInterrupt:
         print("Received interrupt. Terminating workers.")
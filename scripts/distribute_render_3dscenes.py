@@ -7,20 +7,62 @@ Usage:
   python scripts/distribute_render_3dscenes.py \
     --num_gpus 1 --workers_per_gpu 4 \
     --group_start 0 --group_end 50
+
+With --prepare_queue_depth N, each GPU also gets a preparer process that composes upcoming scenes
+(render_3dscenes_dense.py --prepare_only: model import, placement, .blend snapshot) while the GPU
+workers render. At most N prepared scenes wait per GPU.
+
+On SIGTERM (e.g. SLURM preemption) the dispatcher drains: no new scene is started, running renders stop after
+their current view, and whatever still runs --drain_timeout seconds later is killed. The requeued job resumes
+the incomplete scenes from their missing views.
 """
 
 import argparse
 import json
 import multiprocessing
+import multiprocessing.queues
 import os
 import signal
-import subprocess
 import sys
 
+# Make bpy_helper importable when run as scripts/distribute_render_3dscenes.py
+_proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _proj_root not in sys.path:
+    sys.path.insert(0, _proj_root)
+
+from bpy_helper.checkpoint import DRAIN_EXIT_CODE
+from bpy_helper.dispatch import install_dispatcher_drain_handler, run_drainable, describe_returncode
+
+
+def build_command(scene_idx: int, gpu: int, args: argparse.Namespace, prepare_only: bool = False) -> str:
+    command = (
+        f"CUDA_VISIBLE_DEVICES={gpu} "
+        f"python {args.proj_root}/render_3dscenes_dense.py "
+        f"--group_start {scene_idx} --group_end {scene_idx + 1} "
+        f"--num_white_envs {args.num_white_envs} "
+        f"--num_env_lights {args.num_env_lights} "
+        f"--num_white_pls {args.num_white_pls} "
+        f"--num_rgb_pls {args.num_rgb_pls} "
+        f"--num_multi_pls {args.num_multi_pls} "
+        f"--num_area_lights {args.num_area_lights} "
+        f"--num_combined_lights {args.num_combined_lights} "
+        f"--model_lq_dir {args.model_lq_dir} "
+        f"--output_dir {args.output_dir} "
+        f"--texture_dir {args.texture_dir} "
+        f"--glb_list_path {args.glb_list_path} "
+        f"--glbs_root_path {args.glbs_root_path}"
+    )
+    if prepare_only:
+        command += " --prepare_only"
+    elif args.shard_output:
+        command += " --shard_output"
+    return command
+
 
 def worker(
     queue: multiprocessing.JoinableQueue,
     count: multiprocessing.Value,
+    stop_event: multiprocessing.Event,
     gpu: int,
     args: argparse.Namespace,
 ) -> None:
@@ -32,65 +74,67 @@ def worker(
             break
 
         scene_idx = item
+        if stop_event.is_set():
+            # Draining: leave the remaining scenes to the requeued job
+            if isinstance(queue, multiprocessing.queues.JoinableQueue):
+                queue.task_done()
+            continue
         print(f"[GPU {gpu}] Rendering scene {scene_idx}")
 
         # Build command
-        command = (
-            f"CUDA_VISIBLE_DEVICES={gpu} "
-            f"python {args.proj_root}/render_3dscenes_dense.py "
-            f"--group_start {scene_idx} --group_end {scene_idx + 1} "
-            f"--num_white_envs {args.num_white_envs} "
-            f"--num_env_lights {args.num_env_lights} "
-            f"--num_white_pls {args.num_white_pls} "
-            f"--num_rgb_pls {args.num_rgb_pls} "
-            f"--num_multi_pls {args.num_multi_pls} "
-            f"--num_area_lights {args.num_area_lights} "
-            f"--num_combined_lights {args.num_combined_lights} "
-            f"--model_lq_dir {args.model_lq_dir} "
-            f"--output_dir {args.output_dir} "
-            f"--texture_dir {args.texture_dir} "
-            f"--glb_list_path {args.glb_list_path} "
-            f"--glbs_root_path {args.glbs_root_path}"
-
-        )
+        command = build_command(scene_idx, gpu, args)
 
         try:
-            subprocess.run(command, shell=True, check=True)
-            with count.get_lock():
-                count.value += 1
-        except subprocess.CalledProcessError as e:
-            print(f"[GPU {gpu}] Failed to render scene {scene_idx}: {e}")
+            returncode = run_drainable(command, stop_event, args.drain_timeout)
+            if returncode == 0:
+                with count.get_lock():
+                    count.value += 1
+            else:
+                print(f"[GPU {gpu}] Scene {scene_idx} {describe_returncode(returncode)}")
         except Exception as e:
             print(f"[GPU {gpu}] Unexpected error for scene {scene_idx}: {e}")
 
-        queue.task_done()
+        if isinstance(queue, multiprocessing.queues.JoinableQueue):
+            queue.task_done()
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Multi-worker dispatcher for 3D scene rendering")
-    parser.add_argument("--workers_per_gpu", type=int, default=2, help="Number of workers per GPU")
-    parser.add_argument("--num_gpus", type=int, default=1, help="Number of GPUs to use")
-    parser.add_argument("--group_start", type=int, default=0, help="Start scene index")
-    parser.add_argument("--group_end", type=int, default=50, help="End scene index")
-    parser.add_argument("--output_dir", type=str, default="./output_scenes_dense")
-    parser.add_argument("--model_lq_dir", type=str, default="/projects/vig/Datasets/Polyhaven/polyhaven_models")
-    parser.add_argument("--texture_dir", type=str, default="/projects/vig/Datasets/Polyhaven/polyhaven_textures")
-    parser.add_argument("--glb_list_path", type=str, default="test_obj_curated.csv")
-    parser.add_argument("--glbs_root_path", type=str, default="/projects/vig/Datasets/objaverse/hf-objaverse-v1/glbs/")
-    parser.add_argument("--num_white_envs", type=int, default=1)
-    parser.add_argument("--num_env_lights", type=int, default=3)
-    parser.add_argument("--num_white_pls", type=int, default=0)
-    parser.add_argument("--num_rgb_pls", type=int, default=0)
-    parser.add_argument("--num_multi_pls", type=int, default=0)
-    parser.add_argument("--num_area_lights", type=int, default=0)
-    parser.add_argument("--num_combined_lights", type=int, default=0)
-    parser.add_argument("--proj_root", type=str, default="/projects/vig/yiwenc/ResearchProjects/lightingDiffusion/3dgs/render_objaverse")
-    args = parser.parse_args()
+def preparer(
+    scene_queue: multiprocessing.Queue,
+    ready_queue: multiprocessing.Queue,
+    stop_event: multiprocessing.Event,
+    gpu: int,
+    args: argparse.Namespace,
+) -> None:
+    """Preparer process: compose the next scenes for the workers of one GPU while they render."""
 
-    scene_indices = list(range(args.group_start, args.group_end))
-    total = len(scene_indices)
-    print(f"Distributing {total} scenes across {args.num_gpus} GPUs with {args.workers_per_gpu} workers each")
+    while True:
+        item = scene_queue.get()
+        if item is None:
+            break
+
+        scene_idx = item
+        if stop_event.is_set():
+            continue
+        print(f"[GPU {gpu}] Preparing scene {scene_idx}")
+        try:
+            returncode = run_drainable(build_command(scene_idx, gpu, args, prepare_only=True), stop_event, args.drain_timeout)
+            if returncode != 0:
+                print(f"[GPU {gpu}] Preparing scene {scene_idx} {describe_returncode(returncode)}")
+        except Exception as e:
+            # The render worker composes the scene itself if no snapshot was prepared
+            print(f"[GPU {gpu}] Failed to prepare scene {scene_idx}: {e}")
 
+        # Blocks while prepare_queue_depth scenes are already waiting for this GPU
+        ready_queue.put(scene_idx)
+
+    for _ in range(args.workers_per_gpu):
+        ready_queue.put(None)
+
+
+def run_queue(scene_indices: list, stop_event: multiprocessing.Event, args: argparse.Namespace) -> None:
+    """Render with all workers sharing one queue of scenes."""
+
+    total = len(scene_indices)
     queue = multiprocessing.JoinableQueue()
     count = multiprocessing.Value("i", 0)
     processes = []
@@ -98,7 +142,7 @@ def main():
     # Start workers
     for gpu_i in range(args.num_gpus):
         for worker_i in range(args.workers_per_gpu):
-            process = multiprocessing.Process(target=worker, args=(queue, count, gpu_i, args))
+            process = multiprocessing.Process(target=worker, args=(queue, count, stop_event, gpu_i, args))
             process.daemon = True
             process.start()
             processes.append(process)
@@ -123,5 +167,84 @@ def main():
             os.kill(p.pid, signal.SIGKILL)
 
 
+
+def run_pipelined(scene_indices: list, stop_event: multiprocessing.Event, args: argparse.Namespace) -> None:
+    """Render with one preparer per GPU feeding a bounded queue of prepared scenes to that GPU's workers."""
+
+    scene_queue = multiprocessing.Queue()
+    count = multiprocessing.Value("i", 0)
+    processes = []
+
+    for gpu_i in range(args.num_gpus):
+        ready_queue = multiprocessing.Queue(maxsize=args.prepare_queue_depth)
+        process = multiprocessing.Process(target=preparer, args=(scene_queue, ready_queue, stop_event, gpu_i, args))
+        process.daemon = True
+        process.start()
+        processes.append(process)
+        for worker_i in range(args.workers_per_gpu):
+            process = multiprocessing.Process(target=worker, args=(ready_queue, count, stop_event, gpu_i, args))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+
+    try:
+        # Preparers pull scenes as their GPU frees up, so the work stays balanced across GPUs
+        for scene_idx in scene_indices:
+            scene_queue.put(scene_idx)
+        for _ in range(args.num_gpus):
+            scene_queue.put(None)
+
+        for p in processes:
+            p.join()
+
+        print(f"All done! Rendered {count.value}/{len(scene_indices)} scenes.")
+
+    except KeyboardInterrupt:
+        print("Received interrupt. Terminating workers.")
+        for p in processes:
+            os.kill(p.pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker dispatcher for 3D scene rendering")
+    parser.add_argument("--workers_per_gpu", type=int, default=2, help="Number of workers per GPU")
+    parser.add_argument("--num_gpus", type=int, default=1, help="Number of GPUs to use")
+    parser.add_argument("--group_start", type=int, default=0, help="Start scene index")
+    parser.add_argument("--group_end", type=int, default=50, help="End scene index")
+    parser.add_argument("--output_dir", type=str, default="./output_scenes_dense")
+    parser.add_argument("--model_lq_dir", type=str, default="/projects/vig/Datasets/Polyhaven/polyhaven_models")
+    parser.add_argument("--texture_dir", type=str, default="/projects/vig/Datasets/Polyhaven/polyhaven_textures")
+    parser.add_argument("--glb_list_path", type=str, default="test_obj_curated.csv")
+    parser.add_argument("--glbs_root_path", type=str, default="/projects/vig/Datasets/objaverse/hf-objaverse-v1/glbs/")
+    parser.add_argument("--num_white_envs", type=int, default=1)
+    parser.add_argument("--num_env_lights", type=int, default=3)
+    parser.add_argument("--num_white_pls", type=int, default=0)
+    parser.add_argument("--num_rgb_pls", type=int, default=0)
+    parser.add_argument("--num_multi_pls", type=int, default=0)
+    parser.add_argument("--num_area_lights", type=int, default=0)
+    parser.add_argument("--num_combined_lights", type=int, default=0)
+    parser.add_argument("--proj_root", type=str, default="/projects/vig/yiwenc/ResearchProjects/lightingDiffusion/3dgs/render_objaverse")
+    parser.add_argument("--prepare_queue_depth", type=int, default=0, help="Scenes prepared ahead per GPU (0: no preparer)")
+    parser.add_argument("--shard_output", action="store_true", help="Stream the outputs of each scene into tar shards")
+    parser.add_argument("--drain_timeout", type=float, default=120, help="Seconds running renders get to finish their current view after SIGTERM")
+    args = parser.parse_args()
+
+    scene_indices = list(range(args.group_start, args.group_end))
+    total = len(scene_indices)
+    print(f"Distributing {total} scenes across {args.num_gpus} GPUs with {args.workers_per_gpu} workers each")
+
+    stop_event = multiprocessing.Event()
+    install_dispatcher_drain_handler(stop_event)
+
+    if args.prepare_queue_depth > 0:
+        run_pipelined(scene_indices, stop_event, args)
+    else:
+        run_queue(scene_indices, stop_event, args)
+
+    if stop_event.is_set():
+        print("Drained. Rerun the same command to resume the remaining scenes.")
+        sys.exit(DRAIN_EXIT_CODE)
+
+
 if __name__ == "__main__":
     main()
@@ -25,6 +25,8 @@ NORMALIZE="${NORMALIZE:-1}"
 SKIP_TARGET_VIEWS="${SKIP_TARGET_VIEWS:-0}"
 # 1 → keep env rotation as identity (no world-rotation R applied to env)
 NO_ALIGN_ENV="${NO_ALIGN_ENV:-0}"
+# Blender worker processes (batch mode), GPUs assigned round-robin
+NUM_WORKERS="${NUM_WORKERS:-1}"
 PYTHON_BIN="${PYTHON_BIN:-python}"
 
 EXTRA_ARGS=()
@@ -40,6 +42,9 @@ fi
 if [ "${NO_ALIGN_ENV}" = "1" ]; then
   EXTRA_ARGS+=(--align_env=False)
 fi
+if [ -n "${GPU_IDS:-}" ]; then
+  EXTRA_ARGS+=(--gpu_ids "${GPU_IDS}")
+fi
 
 echo "[render_sf3d_mesh] data_root=${DATA_ROOT} iter_subdir=${ITER_SUBDIR}"
 
@@ -53,4 +58,5 @@ echo "[render_sf3d_mesh] data_root=${DATA_ROOT} iter_subdir=${ITER_SUBDIR}"
   --env_strength "${ENV_STRENGTH}" \
   --target_scale "${TARGET_SCALE}" \
   --num_target_views "${NUM_TARGET_VIEWS}" \
+  --num_workers "${NUM_WORKERS}" \
   "${EXTRA_ARGS[@]}"
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline over Objaverse models: download -> preflight -> render -> pack -> preprocess.
+
+Every model flows through the stages on its own: a model is rendered as soon as it is downloaded and checked,
+packed as soon as its render is done, and so on. Each stage pool has its own concurrency limit (network slots for
+downloads, CPU slots for preflight / pack / preprocess, and num_gpus * workers_per_gpu render slots). Finished tasks
+are journaled, and a rerun only does the missing work. SIGTERM drains like the render dispatchers.
+
+Usage:
+  python scripts/run_pipeline.py \
+    --csv_path filtered_uids_lvis.csv --group_start 0 --group_end 100 \
+    --num_gpus 1 --workers_per_gpu 2 --network_slots 4 --cpu_slots 8
+
+Stages:
+  download   download_lvis.py for one csv row                      done: the .glb exists
+  preflight  check the GLB header and JSON chunk                   done: journaled
+  render     render_3dmodels_dense_enhance.py for one csv row      done: done.txt
+  pack       tar every lighting folder into <lighting>.tar         done: packed.txt
+  preprocess --preprocess_cmd, formatted with {uid} {index} {res_dir} {glb_path}, only if given
+             done: preprocessed.txt
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import shutil
+import struct
+import sys
+import tarfile
+
+# Make bpy_helper importable when run as scripts/run_pipeline.py
+_proj_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _proj_root not in sys.path:
+    sys.path.insert(0, _proj_root)
+
+from bpy_helper.checkpoint import DRAIN_EXIT_CODE, tmp_path_for, atomic_replace, atomic_write_text
+from bpy_helper.dispatch import install_dispatcher_drain_handler, run_drainable, describe_returncode
+from bpy_helper.pipeline import Stage, PipelineRunner
+
+# Lighting-independent folders next to the lighting folders of a split, they are not packed
+INTRINSICS_DIRS = ("depth", "normal", "albedo")
+
+
+def load_rows(csv_path: str) -> list:
+    """(row position, folder index, uid) for every row of a (folder, uid) csv, the position is what --group_start uses."""
+    rows = []
+    with open(csv_path, newline="") as csvfile:
+        for row in csv.reader(csvfile):
+            if len(row) == 2:
+                rows.append((len(rows), row[0].strip(), row[1].strip()))
+    return rows
+
+
+def glb_path(asset: tuple, args: argparse.Namespace) -> str:
+    _, index, uid = asset
+    return os.path.join(args.base_path, "objaverse", "hf-objaverse-v1", "glbs", index, f"{uid}.glb")
+
+
+def res_dir(asset: tuple, args: argparse.Namespace) -> str:
+    return os.path.join(args.base_path, "objaverse", "hf-objaverse-v1", args.rendered_dir_name, asset[2])
+
+
+def check_glb(path: str) -> str:
+    """Return why a .glb cannot be rendered, or an empty string if its header and JSON chunk are valid."""
+    if not os.path.exists(path):
+        return "missing"
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(20)
+        if len(header) < 20:
+            return f"truncated ({size} bytes)"
+        magic, version, length, chunk_length, chunk_type = struct.unpack("<4sIIII", header)
+        if magic != b"glTF":
+            return "not a binary glTF file"
+        if version != 2:
+            return f"unsupported glTF version {version}"
+        if length != size:
+            return f"header length {length} does not match the file size {size}"
+        if chunk_type != 0x4E4F534A or 20 + chunk_length > size:
+            return "invalid JSON chunk"
+        try:
+            import json
+            json.loads(f.read(chunk_length))
+        except ValueError as e:
+            return f"unreadable JSON chunk: {e}"
+    return ""
+
+
+def pack_lighting_folders(model_dir: str) -> None:
+    """Replace every <split>/<lighting> folder by <split>/<lighting>.tar, which the render resume logic accepts."""
+    for split in ("train", "test"):
+        split_dir = os.path.join(model_dir, split)
+        if not os.path.isdir(split_dir):
+            continue
+        for name in sorted(os.listdir(split_dir)):
+            folder = os.path.join(split_dir, name)
+            if name in INTRINSICS_DIRS or name.startswith(".") or not os.path.isdir(folder):
+                continue
+            tar_path = folder + ".tar"
+            if not os.path.exists(tar_path):
+                tmp_path = tmp_path_for(tar_path)
+                with tarfile.open(tmp_path, "w") as tar:
+                    tar.add(folder, arcname=name)
+                atomic_replace(tmp_path, tar_path)
+            shutil.rmtree(folder)
+    atomic_write_text("packed", os.path.join(model_dir, "packed.txt"))
+
+
+def build_stages(args: argparse.Namespace, stop_event: multiprocessing.Event) -> list:
+    def run_command(stage_name, asset, command):
+        returncode = run_drainable(command, stop_event, args.drain_timeout)
+        if returncode != 0:
+            print(f"[{stage_name}] {asset[2]} {describe_returncode(returncode)}", flush=True)
+        return returncode == 0
+
+    def download(asset, token):
+        position = asset[0]
+        command = (
+            f"python {args.proj_root}/download_lvis.py "
+            f"--csv_path {args.csv_path} --base_path {args.base_path} "
+            f"--begin_uid {position} --end_uid {position + 1} --download_processes 1"
+        )
+        return run_command("download", asset, command) and os.path.exists(glb_path(asset, args))
+
+    def preflight(asset, token):
+        error = check_glb(glb_path(asset, args))
+        if error:
+            print(f"[preflight] {asset[2]}: {error}", flush=True)
+        return not error
+
+    def render(asset, gpu):
+        position = asset[0]
+        command = (
+            f"CUDA_VISIBLE_DEVICES={gpu} "
+            f"python {args.proj_root}/render_3dmodels_dense_enhance.py "
+            f"--group_start {position} --group_end {position + 1} "
+            f"--csv_path {args.csv_path} --rendered_dir_name {args.rendered_dir_name} {args.render_args}"
+        )
+        return run_command("render", asset, command)
+
+    def pack(asset, token):
+        pack_lighting_folders(res_dir(asset, args))
+        return True
+
+    def preprocess(asset, token):
+        _, index, uid = asset
+        command = args.preprocess_cmd.format(uid=uid, index=index, res_dir=res_dir(asset, args), glb_path=glb_path(asset, args))
+        if not run_command("preprocess", asset, command):
+            return False
+        atomic_write_text("preprocessed", os.path.join(res_dir(asset, args), "preprocessed.txt"))
+        return True
+
+    def marker_exists(name):
+        return lambda asset: os.path.exists(os.path.join(res_dir(asset, args), name))
+
+    stages = {
+        "download": Stage("download", "network", download, is_done=lambda asset: os.path.exists(glb_path(asset, args))),
+        "preflight": Stage("preflight", "cpu", preflight),
+        "render": Stage("render", "render", render, is_done=marker_exists("done.txt")),
+        "pack": Stage("pack", "cpu", pack, is_done=marker_exists("packed.txt")),
+        "preprocess": Stage("preprocess", "cpu", preprocess, is_done=marker_exists("preprocessed.txt")),
+    }
+    enabled = [name for name in args.stages.split(",") if name]
+    if "preprocess" in enabled and not args.preprocess_cmd:
+        print("No --preprocess_cmd given, skipping the preprocess stage")
+        enabled.remove("preprocess")
+
+    # Every enabled stage depends on the previous enabled one
+    chain = []
+    for name in stages:
+        if name in enabled:
+            stage = stages[name]
+            stage.deps = (chain[-1].name,) if chain else ()
+            chain.append(stage)
+    return chain
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download, check, render, pack and preprocess Objaverse models")
+    parser.add_argument("--csv_path", type=str, default="filtered_uids_lvis.csv", help="(folder, uid) csv")
+    parser.add_argument("--group_start", type=int, default=0, help="Start row index")
+    parser.add_argument("--group_end", type=int, default=50, help="End row index")
+    parser.add_argument("--base_path", type=str, default="/projects/vig/Datasets", help="Objaverse root (without objaverse/), must match the render script")
+    parser.add_argument("--rendered_dir_name", type=str, default="rendered_dense_enhance")
+    parser.add_argument("--stages", type=str, default="download,preflight,render,pack,preprocess", help="Comma separated stages to run")
+    parser.add_argument("--render_args", type=str, default="", help="Extra arguments for render_3dmodels_dense_enhance.py")
+    parser.add_argument("--preprocess_cmd", type=str, default="", help="Per-model preprocess command template")
+    parser.add_argument("--num_gpus", type=int, default=1, help="Number of GPUs to use")
+    parser.add_argument("--workers_per_gpu", type=int, default=2, help="Number of render workers per GPU")
+    parser.add_argument("--network_slots", type=int, default=4, help="Concurrent downloads")
+    parser.add_argument("--cpu_slots", type=int, default=8, help="Concurrent preflight / pack / preprocess tasks")
+    parser.add_argument("--journal", type=str, default=None, help="Task journal (default: <rendered dir>/pipeline_journal.jsonl)")
+    parser.add_argument("--drain_timeout", type=float, default=120, help="Seconds running commands get to finish after SIGTERM")
+    parser.add_argument(
+        "--proj_root",
+        type=str,
+        default="/projects/vig/yiwenc/ResearchProjects/lightingDiffusion/3dgs/render_objaverse",
+    )
+    args = parser.parse_args()
+
+    assets = load_rows(args.csv_path)[args.group_start:args.group_end]
+    journal = args.journal or os.path.join(args.base_path, "objaverse", "hf-objaverse-v1", args.rendered_dir_name, "pipeline_journal.jsonl")
+    slots = {
+        "network": list(range(args.network_slots)),
+        "cpu": list(range(args.cpu_slots)),
+        "render": [gpu for gpu in range(args.num_gpus) for _ in range(args.workers_per_gpu)],
+    }
+    print(f"Running {len(assets)} models with slots: { {pool: len(tokens) for pool, tokens in slots.items()} }")
+
+    stop_event = multiprocessing.Event()
+    install_dispatcher_drain_handler(stop_event)
+
+    runner = PipelineRunner(build_stages(args, stop_event), slots, journal, stop_event=stop_event)
+    summary = runner.run(assets, key=lambda asset: asset[2])
+    for stage_name, counts in summary.items():
+        print(f"{stage_name}: {counts}")
+
+    if stop_event.is_set():
+        print("Drained. Rerun the same command to resume.")
+        sys.exit(DRAIN_EXIT_CODE)
+
+
+if __name__ == "__main__":
+    main()
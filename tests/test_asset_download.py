@@ -0,0 +1,104 @@
+import hashlib
+import os
+
+import pytest
+
+import asset_download
+from asset_download import AssetDownloader, VerificationError, object_path, serve_mirror
+
+NUM_FILES = 6
+FILE_SIZE = 300 << 10
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    """Mirror root with NUM_FILES random objects, and key -> relative path of them."""
+    root = tmp_path / 'mirror'
+    rel_paths = {f'obj{i}': object_path('000-000', f'obj{i}') for i in range(NUM_FILES)}
+    for i, rel_path in enumerate(rel_paths.values()):
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(FILE_SIZE + i))
+    return str(root), rel_paths
+
+
+@pytest.fixture
+def serve():
+    """serve_mirror, with the servers shut down after the test."""
+    servers = []
+
+    def start(root, max_bytes=None):
+        server, base_url = serve_mirror(root, max_bytes=max_bytes)
+        servers.append(server)
+        return base_url
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_resumes_interrupted_downloads(tmp_path, mirror, serve):
+    root, rel_paths = mirror
+    # every response is cut after a third of the file
+    base_url = serve(root, max_bytes=FILE_SIZE // 3)
+    downloader = AssetDownloader(str(tmp_path / 'download'), base_url=base_url, num_workers=4, retries=5,
+                                 report_interval=0, backoff=0)
+    paths = downloader.download(rel_paths)
+
+    assert sorted(paths) == sorted(rel_paths)
+    for key, rel_path in rel_paths.items():
+        assert sha256(paths[key]) == sha256(os.path.join(root, rel_path))
+        assert not os.path.exists(paths[key] + asset_download.PART_SUFFIX)
+        assert downloader.index[rel_path]['sha256'] == sha256(paths[key])
+    # resumed from the partial files instead of starting over
+    assert downloader.bytes_downloaded == sum(os.path.getsize(path) for path in paths.values())
+
+
+def test_second_run_skips_downloaded(tmp_path, mirror, serve):
+    root, rel_paths = mirror
+    base_url = serve(root)
+    download_dir = str(tmp_path / 'download')
+    paths = AssetDownloader(download_dir, base_url=base_url, report_interval=0, backoff=0).download(rel_paths)
+
+    # the index is read back from disk
+    downloader = AssetDownloader(download_dir, base_url=base_url, report_interval=0, backoff=0)
+    assert downloader.download(rel_paths) == paths
+    assert downloader.bytes_downloaded == 0
+
+    # a file changed on disk is downloaded again
+    with open(paths['obj0'], 'ab') as f:
+        f.write(b'x')
+    assert downloader.download(rel_paths) == paths
+    assert downloader.bytes_downloaded == os.path.getsize(paths['obj0'])
+    assert sha256(paths['obj0']) == sha256(os.path.join(root, rel_paths['obj0']))
+
+
+def test_rejects_wrong_hash(tmp_path, mirror, serve):
+    root, rel_paths = mirror
+    downloader = AssetDownloader(str(tmp_path / 'download'), base_url=serve(root), retries=0, report_interval=0,
+                                 backoff=0)
+    rel_path = rel_paths['obj0']
+    with pytest.raises(VerificationError):
+        downloader.fetch(rel_path, sha256='0' * 64)
+    assert not os.path.exists(downloader.local_path(rel_path))
+    assert not os.path.exists(downloader.local_path(rel_path) + asset_download.PART_SUFFIX)
+    assert rel_path not in downloader.index
+
+    # the download reports it as failed and leaves it out
+    hashes = {'obj0': '0' * 64, 'obj1': sha256(os.path.join(root, rel_paths['obj1']))}
+    paths = downloader.download(rel_paths, hashes=hashes)
+    assert sorted(paths) == sorted(set(rel_paths) - {'obj0'})
+
+
+def test_rejects_wrong_size(tmp_path, mirror, serve):
+    root, rel_paths = mirror
+    downloader = AssetDownloader(str(tmp_path / 'download'), base_url=serve(root), retries=0, report_interval=0,
+                                 backoff=0)
+    with pytest.raises(VerificationError):
+        downloader.fetch(rel_paths['obj0'], size=FILE_SIZE + 1)
+    assert not os.path.exists(downloader.local_path(rel_paths['obj0']))
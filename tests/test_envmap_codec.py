@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import envmap_codec
+
+
+def random_envmaps(num, height=16, width=32, seed=0):
+    """Linear HDR envmaps with a different dynamic range each: dark, mostly saturated and in between."""
+    rng = np.random.default_rng(seed)
+    scales = np.geomspace(0.05, 50.0, num)
+    return (rng.gamma(0.7, 1.0, size=(num, height, width, 3)) * scales[:, None, None, None]).astype(np.float32)
+
+
+def reference_max_log(hdr, ldr):
+    """max_log estimate of the module docstring, with np.median over the valid pixels."""
+    ldr_linear = (ldr[..., :3].astype(np.float64) / 255.0) ** envmap_codec.LDR_GAMMA
+    hdr_norm = hdr[..., :3].astype(np.float64) / 255.0
+    valid = ((ldr_linear > envmap_codec.LDR_LINEAR_LOW) & (ldr_linear < envmap_codec.LDR_LINEAR_HIGH)
+             & (hdr_norm > envmap_codec.HDR_NORM_MIN))
+    if not valid.any():
+        return envmap_codec.FALLBACK_MAX_LOG
+    return float(np.median(np.log1p(envmap_codec.HDR_SCALE * ldr_linear[valid]) / hdr_norm[valid]))
+
+
+def test_decode_batch_matches_decode():
+    hdr, ldr, _ = envmap_codec.encode_batch(random_envmaps(6))
+    # no valid pixel: falls back to FALLBACK_MAX_LOG
+    hdr[-1] = 0
+    batch = envmap_codec.decode_batch(hdr, ldr)
+    assert batch.dtype == np.float32 and batch.shape == hdr.shape
+    for i in range(len(hdr)):
+        np.testing.assert_array_equal(batch[i], envmap_codec.decode(hdr[i], ldr[i]))
+
+
+def test_decode_batch_drops_alpha():
+    hdr, ldr, _ = envmap_codec.encode_batch(random_envmaps(3))
+    alpha = np.full(hdr.shape[:-1] + (1,), 255, dtype=np.uint8)
+    hdr_rgba, ldr_rgba = np.concatenate([hdr, alpha], axis=-1), np.concatenate([ldr, alpha], axis=-1)
+    np.testing.assert_array_equal(envmap_codec.decode_batch(hdr_rgba, ldr_rgba), envmap_codec.decode_batch(hdr, ldr))
+    np.testing.assert_array_equal(envmap_codec.decode(hdr_rgba[0], ldr_rgba[0]), envmap_codec.decode(hdr[0], ldr[0]))
+
+
+@pytest.mark.parametrize('shape', [(16, 32), (15, 31)])
+def test_estimate_max_log_matches_median(shape):
+    for raw in random_envmaps(4, *shape, seed=1):
+        hdr, ldr, _ = envmap_codec.encode(raw)
+        assert envmap_codec.estimate_max_log(hdr, ldr) == pytest.approx(reference_max_log(hdr, ldr), rel=1e-12)
+
+
+def test_encode_batch_matches_encode():
+    raw = random_envmaps(4)
+    hdr, ldr, max_log = envmap_codec.encode_batch(raw)
+    for i in range(len(raw)):
+        hdr_i, ldr_i, max_log_i = envmap_codec.encode(raw[i])
+        np.testing.assert_array_equal(hdr[i], hdr_i)
+        np.testing.assert_array_equal(ldr[i], ldr_i)
+        assert max_log[i] == pytest.approx(max_log_i)
+
+
+def test_decode_recovers_max_log():
+    raw = random_envmaps(1, 64, 128, seed=2)[0]
+    hdr, ldr, max_log = envmap_codec.encode(raw)
+    assert envmap_codec.estimate_max_log(hdr, ldr) == pytest.approx(max_log, rel=0.05)
+
+
+def test_rejects_non_8bit():
+    hdr, ldr, _ = envmap_codec.encode(random_envmaps(1)[0])
+    with pytest.raises(ValueError):
+        envmap_codec.decode(hdr.astype(np.uint16), ldr)
+    with pytest.raises(ValueError):
+        envmap_codec.decode_batch(hdr[None], ldr[None].astype(np.float32))
@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+import pytest
+
+import envmap_sh
+
+ORDER = 5
+
+
+def random_rotations(num, seed=0):
+    q, r = np.linalg.qr(np.random.default_rng(seed).normal(size=(num, 3, 3)))
+    q = q * np.sign(np.diagonal(r, axis1=1, axis2=2))[:, None, :]
+    # proper rotations only
+    q[np.linalg.det(q) < 0, :, 0] *= -1
+    return q
+
+
+def random_directions(num, seed=1):
+    d = np.random.default_rng(seed).normal(size=(num, 3))
+    return d / np.linalg.norm(d, axis=-1, keepdims=True)
+
+
+def sphere_quadrature(order):
+    """Gauss-Legendre in z times uniform in phi, exact for the products of two bands up to ``order``."""
+    z, z_weights = np.polynomial.legendre.leggauss(order + 1)
+    num_phi = 2 * order + 2
+    phi = 2 * np.pi * np.arange(num_phi) / num_phi
+    z, phi = np.meshgrid(z, phi, indexing='ij')
+    r = np.sqrt(1 - z ** 2)
+    dirs = np.stack([r * np.cos(phi), r * np.sin(phi), z], axis=-1).reshape(-1, 3)
+    weights = np.repeat(z_weights, num_phi) * 2 * np.pi / num_phi
+    return dirs, weights
+
+
+def test_sh_basis_orthonormal():
+    dirs, weights = sphere_quadrature(2 * ORDER)
+    basis = envmap_sh.sh_basis(dirs, ORDER)
+    gram = basis.T @ (basis * weights[:, None])
+    np.testing.assert_allclose(gram, np.eye(envmap_sh.num_coeffs(ORDER)), atol=1e-12)
+
+
+def test_sh_basis_low_bands():
+    d = random_directions(16)
+    x, y, z = d.T
+    basis = envmap_sh.sh_basis(d, 1)
+    np.testing.assert_allclose(basis[:, 0], 0.5 / math.sqrt(math.pi))
+    # band 1 is (y, z, x), without the Condon-Shortley phase
+    np.testing.assert_allclose(basis[:, 1:], math.sqrt(3 / (4 * math.pi)) * np.stack([y, z, x], axis=-1), atol=1e-15)
+
+
+def test_rotation_matrices_rotate_basis():
+    rotations = random_rotations(8)
+    d = random_directions(64)
+    matrices = envmap_sh.rotation_matrices(rotations, ORDER)
+    assert matrices.shape == (8, envmap_sh.num_coeffs(ORDER), envmap_sh.num_coeffs(ORDER))
+    for rotation, matrix in zip(rotations, matrices):
+        # f'(d) = f(R^T d) with coeffs' = D(R) @ coeffs
+        np.testing.assert_allclose(envmap_sh.sh_basis(d, ORDER) @ matrix, envmap_sh.sh_basis(d @ rotation, ORDER),
+                                   atol=1e-10)
+        np.testing.assert_allclose(matrix @ matrix.T, np.eye(len(matrix)), atol=1e-10)
+        np.testing.assert_allclose(envmap_sh.rotation_matrices(rotation, ORDER), matrix)
+
+
+@pytest.mark.parametrize('order', [0, 1, 2])
+def test_rotation_matrices_low_orders(order):
+    rotation = random_rotations(1)[0]
+    d = random_directions(16)
+    matrix = envmap_sh.rotation_matrices(rotation, order)
+    np.testing.assert_allclose(envmap_sh.sh_basis(d, order) @ matrix, envmap_sh.sh_basis(d @ rotation, order),
+                               atol=1e-12)
+
+
+def test_rotate_matches_projection_of_rotated_envmap():
+    rotation = random_rotations(1, seed=3)[0]
+    coeffs = np.random.default_rng(4).normal(size=(envmap_sh.num_coeffs(3), 3))
+    view_dirs, _ = envmap_sh.envmap_directions(64, 128)
+    # envmap of f'(d) = f(R^T d), projected back
+    rotated = envmap_sh.sh_basis(view_dirs @ rotation, 3) @ coeffs
+    np.testing.assert_allclose(envmap_sh.rotate(coeffs, rotation), envmap_sh.project(rotated, order=3), atol=5e-3)
@@ -0,0 +1,133 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+
+import exr_io
+from bpy_helper.checkpoint import tmp_path_for
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def pattern(height, width, channels=3):
+    """Runs of constant values with sparse noise, exact in half and compressible by every codec.
+
+    tests/data/{rle,piz}_{half,float}.exr hold pattern(45, 19) written with the OpenEXR python bindings.
+    """
+    y, x, c = np.meshgrid(np.arange(height), np.arange(width), np.arange(channels), indexing='ij')
+    noise = ((x * 2654435761 + y * 40503 + c * 97) % 256) / 64
+    runs = ((x // 4) + (y // 4) + c * 3) / 16
+    return np.where((x % 9 == 4) & (y % 4 == 1), noise, runs).astype(np.float32)
+
+
+def compressed_chunks(path):
+    """Number of chunks of the file stored compressed, and the number of chunks."""
+    header = exr_io.read_header(path)
+    x_min, y_min, x_max, y_max = header['dataWindow']
+    width, height = x_max - x_min + 1, y_max - y_min + 1
+    line_size = width * sum(exr_io.PIXEL_TYPES[ch['type']].itemsize for ch in header['channels'])
+    lines_per_chunk = exr_io.LINES_PER_CHUNK[header['compression']]
+    num_chunks = (height + lines_per_chunk - 1) // lines_per_chunk
+    with open(path, 'rb') as f:
+        buf = f.read()
+    offsets = struct.unpack_from(f'<{num_chunks}Q', buf, header['_offset_table'])
+    compressed = 0
+    for offset in offsets:
+        y, size = struct.unpack_from('<ii', buf, offset)
+        compressed += size < min(lines_per_chunk, y_max - y + 1) * line_size
+    return compressed, num_chunks
+
+
+@pytest.mark.parametrize('compression', exr_io.WRITE_COMPRESSIONS)
+@pytest.mark.parametrize('pixel_type', ['half', 'float'])
+@pytest.mark.parametrize('shape', [(45, 19, 3), (1, 7, 4), (16, 5), (33, 8, 3)])
+def test_write_read_roundtrip(tmp_path, compression, pixel_type, shape):
+    img = pattern(shape[0], shape[1], shape[2] if len(shape) == 3 else 1)
+    if len(shape) == 2:
+        img = img[..., 0]
+    path = str(tmp_path / 'img.exr')
+    exr_io.write_exr(path, img, pixel_type=pixel_type, compression=compression)
+
+    header = exr_io.read_header(path)
+    assert header['compression'] == compression
+    assert header['dataWindow'] == (0, 0, shape[1] - 1, shape[0] - 1)
+    out = exr_io.read_exr(path, dtype=None)
+    assert out.dtype == (np.float16 if pixel_type == 'half' else np.float32)
+    np.testing.assert_array_equal(out, img)
+    np.testing.assert_array_equal(exr_io.read_exr(path, num_threads=1), img)
+    assert not os.path.exists(tmp_path_for(path))
+
+
+@pytest.mark.parametrize('compression', ['zips', 'zip'])
+def test_write_compresses_chunks(tmp_path, compression):
+    path = str(tmp_path / 'img.exr')
+    exr_io.write_exr(path, pattern(45, 19), compression=compression)
+    compressed, num_chunks = compressed_chunks(path)
+    assert compressed == num_chunks
+
+
+def test_channel_names(tmp_path):
+    img = pattern(9, 6, 2)
+    path = str(tmp_path / 'img.exr')
+    exr_io.write_exr(path, img, pixel_type='float', channel_names=['Z', 'A'])
+    channels = exr_io.read_exr_channels(path)
+    np.testing.assert_array_equal(channels['Z'], img[..., 0])
+    np.testing.assert_array_equal(channels['A'], img[..., 1])
+    assert list(exr_io.read_exr_channels(path, channels=['A'])) == ['A']
+    with pytest.raises(KeyError):
+        exr_io.read_exr_channels(path, channels=['R'])
+
+
+@pytest.mark.parametrize('compression', ['rle', 'piz'])
+@pytest.mark.parametrize('pixel_type', ['half', 'float'])
+def test_read_fixture(compression, pixel_type):
+    path = os.path.join(DATA_DIR, f'{compression}_{pixel_type}.exr')
+    assert exr_io.read_header(path)['compression'] == compression
+    # raw chunks would skip the decoder under test
+    compressed, num_chunks = compressed_chunks(path)
+    assert compressed == num_chunks
+
+    out = exr_io.read_exr(path, dtype=None)
+    assert out.dtype == (np.float16 if pixel_type == 'half' else np.float32)
+    np.testing.assert_array_equal(out, pattern(45, 19).astype(out.dtype))
+    with open(path, 'rb') as f:
+        np.testing.assert_array_equal(exr_io.read_exr(f.read(), num_threads=1), pattern(45, 19))
+
+
+def test_unsupported_compression(tmp_path):
+    with pytest.raises(ValueError):
+        exr_io.write_exr(str(tmp_path / 'img.exr'), pattern(4, 4), compression='piz')
+    path = str(tmp_path / 'img.exr')
+    exr_io.write_exr(path, pattern(4, 4), compression='none')
+    with open(path, 'rb') as f:
+        buf = bytearray(f.read())
+    tag = b'compression\0compression\0' + struct.pack('<i', 1)
+    buf[buf.index(tag) + len(tag)] = exr_io.COMPRESSION_IDS['pxr24']
+    with pytest.raises(exr_io.UnsupportedCompression):
+        exr_io.read_exr(bytes(buf))
+
+
+@pytest.mark.parametrize('compression', ['NO', 'RLE', 'ZIPS', 'ZIP', 'PIZ'])
+@pytest.mark.parametrize('pixel_type', ['half', 'float'])
+def test_read_openexr(tmp_path, compression, pixel_type):
+    OpenEXR = pytest.importorskip('OpenEXR')
+    img = pattern(45, 19).astype(np.float16 if pixel_type == 'half' else np.float32)
+    path = str(tmp_path / 'img.exr')
+    OpenEXR.File({'compression': getattr(OpenEXR, f'{compression}_COMPRESSION'), 'type': OpenEXR.scanlineimage},
+                 {'RGB': img}).write(path)
+    np.testing.assert_array_equal(exr_io.read_exr(path, dtype=None), img)
+
+
+@pytest.mark.parametrize('compression', exr_io.WRITE_COMPRESSIONS)
+@pytest.mark.parametrize('pixel_type', ['half', 'float'])
+def test_write_openexr(tmp_path, compression, pixel_type):
+    OpenEXR = pytest.importorskip('OpenEXR')
+    img = pattern(45, 19)
+    path = str(tmp_path / 'img.exr')
+    exr_io.write_exr(path, img, pixel_type=pixel_type, compression=compression)
+    with OpenEXR.File(path, separate_channels=True) as f:
+        channels = f.channels()
+        out = np.stack([channels[name].pixels for name in 'RGB'], axis=-1)
+    assert out.dtype == (np.float16 if pixel_type == 'half' else np.float32)
+    np.testing.assert_array_equal(out, img)
@@ -0,0 +1,89 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+plt = pytest.importorskip('matplotlib.pyplot')
+Image = pytest.importorskip('PIL.Image')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'neuralGaufferRendering',
+                                'scripts'))
+from preprocess_rendered_image import RenderedImagePreprocessor  # noqa: E402
+
+from render_derivatives import white_composite, white_weights  # noqa: E402
+
+SIZE = 512
+NUM_LIGHTINGS = 3
+
+
+def render(seed):
+    """A shaded, textured sphere with an antialiased silhouette, as an [H, W, 4] uint8 render."""
+    rng = np.random.default_rng(seed)
+    y, x = (np.mgrid[:SIZE, :SIZE] + 0.5) / SIZE * 2 - 1
+    r = np.sqrt(x ** 2 + y ** 2)
+    alpha = np.clip((0.8 - r) * SIZE / 2 + 0.5, 0, 1)
+    z = np.sqrt(np.clip(0.64 - r ** 2, 0, None)) / 0.8
+    light = rng.normal(size=3)
+    light /= np.linalg.norm(light)
+    shading = np.clip(x / 0.8 * light[0] + y / 0.8 * light[1] + z * light[2], 0.05, None)
+    texture = 0.75 + 0.25 * np.sin(40 * x + rng.uniform(0, 2 * np.pi)) * np.cos(30 * y)
+    rgb = shading[..., None] * texture[..., None] * rng.uniform(0.4, 1.0, size=3)
+    rgba = np.concatenate([rgb * alpha[..., None], alpha[..., None]], axis=-1)
+    return np.rint(np.clip(rgba, 0, 1) * 255).astype(np.uint8)
+
+
+def baseline(image_path, alpha_path, output_hw):
+    """The float path preprocess_rendered_image used before: plt.imread, float composite, PIL bilinear resize."""
+    target_mask = plt.imread(alpha_path)[..., -1]
+    img = plt.imread(image_path)
+    img = img[:, :, :3] * target_mask[:, :, None] + np.array([1., 1., 1.]) * (1 - target_mask[:, :, None])
+    img = Image.fromarray(np.uint8(img[:, :, :3] * 255.))
+    return np.asarray(img.resize(output_hw, Image.Resampling.BILINEAR))
+
+
+@pytest.fixture
+def rendered_object(tmp_path):
+    """Input dir with one object of one view and NUM_LIGHTINGS lightings, and the object's image names."""
+    folder = tmp_path / 'renders' / 'obj'
+    folder.mkdir(parents=True)
+    Image.fromarray(render(0)).save(folder / '000_alpha.png')
+    names = [f'000_{i:03d}_env{i}.png' for i in range(NUM_LIGHTINGS)]
+    for i, name in enumerate(names):
+        rgba = render(i + 1)
+        # the lightings share the silhouette of the alpha render
+        rgba[..., 3] = render(0)[..., 3]
+        Image.fromarray(rgba).save(folder / name)
+    return str(tmp_path / 'renders'), names
+
+
+def test_white_composite_exact():
+    rgb, alpha = np.meshgrid(np.arange(256, dtype=np.uint8), np.arange(256, dtype=np.uint8), indexing='ij')
+    rgb = np.repeat(rgb[..., None], 3, axis=-1)
+    exact = np.floor((rgb.astype(np.float64) * alpha[..., None] + 255. * (255 - alpha[..., None])) / 255. + 0.5)
+    np.testing.assert_array_equal(white_composite(rgb, alpha), exact)
+    np.testing.assert_array_equal(white_composite(rgb, weights=white_weights(alpha)), exact)
+
+
+@pytest.mark.parametrize('output_hw', [(SIZE, SIZE), (256, 256)])
+def test_matches_float_path(tmp_path, rendered_object, output_hw):
+    input_dir, names = rendered_object
+    output_dir = str(tmp_path / 'preprocessed')
+    worker = RenderedImagePreprocessor(input_dir, output_dir, total_view=1, lighting_per_view=NUM_LIGHTINGS,
+                                       output_hw=output_hw, io_threads=2)
+    assert worker('obj') == {'images': NUM_LIGHTINGS, 'missing': 0}
+
+    for name in names:
+        out = np.asarray(Image.open(os.path.join(output_dir, 'obj', name)).convert('RGB')).astype(np.int32)
+        expected = baseline(os.path.join(input_dir, 'obj', name), os.path.join(input_dir, 'obj', '000_alpha.png'),
+                            output_hw).astype(np.int32)
+        assert out.shape == expected.shape == (output_hw[1], output_hw[0], 3)
+        diff = np.abs(out - expected)
+        if output_hw == (SIZE, SIZE):
+            # the composite alone: rounded where the float path truncated
+            assert diff.max() <= 1
+        else:
+            # the area filter instead of PIL's antialiased bilinear differs on the silhouette and the texture
+            assert diff.mean() < 1
+            assert np.percentile(diff, 99) <= 16